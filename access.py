@@ -0,0 +1,189 @@
+"""
+Autenticación por token y permisos por rol.
+
+AuthMiddleware lee `Authorization: Bearer <token>` (el token de /login, ver
+tokens.py) y verifica la firma localmente. El usuario y su rol se buscan en la BD
+una sola vez cada AUTH_PRINCIPAL_TTL segundos por proceso (PrincipalCache), no en
+cada request. El resultado queda en request.state.principal (None sin token).
+
+Revocación: users.token_version se incrementa cuando cambian la contraseña, el
+email o el rol (UserCrud.update_user). Cada token lleva la versión con la que se
+emitió (`ver`); si no coincide con la del usuario, o el usuario ya no existe, la
+request responde 401. UserCrud.update_user y delete_user borran además al usuario
+de la caché del proceso, así que ahí la revocación es inmediata. En los demás
+workers se aplica cuando vence su entrada (a lo sumo AUTH_PRINCIPAL_TTL segundos).
+
+Las rutas de ADMIN_ROUTES exigen el rol de administrador: 401 sin token y 403 con
+un token de otro rol. Las de OWNER_ROUTES (editar un usuario, agregarle teléfonos)
+solo las puede usar ese mismo usuario o un administrador, y cambiar el rol solo un
+administrador (lo revisa el endpoint, que ve el cuerpo). El resto de la API no exige
+token, pero si llega uno inválido o revocado se responde 401 en vez de ignorarlo.
+"""
+import os
+import re
+import time
+
+from starlette.responses import JSONResponse
+
+from tokens import verify_token
+
+AUTH_ENABLED = os.getenv("AUTH_ENABLED", "1").lower() in ("1", "true", "yes")
+AUTH_PRINCIPAL_TTL = float(os.getenv("AUTH_PRINCIPAL_TTL", "30"))
+AUTH_PRINCIPAL_CACHE_SIZE = int(os.getenv("AUTH_PRINCIPAL_CACHE_SIZE", "10000"))
+
+# roles (migrations/0001_schema.sql)
+ADMIN_ROLE = 1
+
+# (método o None para todos, patrón del path, roles permitidos). /api/reports incluye
+# refresh, reconcile y freshness; los reportes personalizados van con su ruta original
+ADMIN_ROUTES = [
+    (None, re.compile(r"^/api/reports(/|$)"), (ADMIN_ROLE,)),
+    (None, re.compile(r"^/api/(reservas|ingresos|usuarios|promociones-aplicadas|cuantas-veces"
+                      r"|disponibilidad-canchas)/?$"), (ADMIN_ROLE,)),
+    (None, re.compile(r"^/api/export(/|$)"), (ADMIN_ROLE,)),
+    (None, re.compile(r"^/api/(db|cache|traces|limits)(/|$)"), (ADMIN_ROLE,)),
+    ("DELETE", re.compile(r"^/api/users/[^/]+/?$"), (ADMIN_ROLE,)),
+]
+
+# (método, patrón con el id del usuario): solo ese mismo usuario o un administrador
+OWNER_ROUTES = [
+    ("PUT", re.compile(r"^/api/users/([^/]+)/?$")),
+    ("POST", re.compile(r"^/api/users/([^/]+)/phones/?$")),
+]
+
+_MISSING = object()
+
+
+class PrincipalCache:
+    """
+    id_user -> {id_user, id_role, token_version} (o None si el usuario no existe),
+    con vencimiento. Se usa desde el event loop y se invalida desde cualquier hilo:
+    las operaciones de dict son atómicas, no hace falta lock. Al llenarse descarta
+    la entrada más antigua.
+    """
+    def __init__(self, ttl=AUTH_PRINCIPAL_TTL, maxsize=AUTH_PRINCIPAL_CACHE_SIZE):
+        self.ttl = ttl
+        self.maxsize = maxsize
+        self._entries = {}
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, id_user):
+        entry = self._entries.get(id_user)
+        if entry is None or entry[1] < time.monotonic():
+            self.misses += 1
+            return _MISSING
+        self.hits += 1
+        return entry[0]
+
+    def set(self, id_user, principal):
+        if len(self._entries) >= self.maxsize:
+            try:
+                self._entries.pop(next(iter(self._entries)))
+            except (StopIteration, KeyError, RuntimeError):
+                pass
+        self._entries[id_user] = (principal, time.monotonic() + self.ttl)
+
+    def invalidate(self, id_user):
+        self._entries.pop(id_user, None)
+
+    def clear(self):
+        self._entries.clear()
+
+    def stats(self):
+        return {"entries": len(self._entries), "hits": self.hits, "misses": self.misses, "ttl": self.ttl}
+
+
+principal_cache = PrincipalCache()
+
+
+def required_roles(method, path, rules=ADMIN_ROUTES):
+    for rule_method, pattern, roles in rules:
+        if (rule_method is None or rule_method == method) and pattern.match(path):
+            return roles
+    return None
+
+
+def owner_of(method, path, rules=OWNER_ROUTES):
+    """
+    Id de usuario (texto) del path si la ruta solo la puede usar ese usuario, o None.
+    """
+    for rule_method, pattern in rules:
+        match = pattern.match(path) if rule_method == method else None
+        if match:
+            return match.group(1)
+    return None
+
+
+def is_admin(principal):
+    return principal is not None and principal["id_role"] == ADMIN_ROLE
+
+
+def _bearer(headers):
+    for name, value in headers:
+        if name == b"authorization":
+            scheme, _, token = value.decode("latin-1").partition(" ")
+            return token.strip() if scheme.lower() == "bearer" else ""
+    return None
+
+
+class AuthMiddleware:
+    """
+    Middleware ASGI. `loader(id_user)` es una corrutina que retorna
+    {"success": True, "principal": dict o None}, o success False si la BD falló.
+    """
+    def __init__(self, app, loader, cache=principal_cache, rules=ADMIN_ROUTES, owner_rules=OWNER_ROUTES):
+        self.app = app
+        self.loader = loader
+        self.cache = cache
+        self.rules = rules
+        self.owner_rules = owner_rules
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        principal = None
+        token = _bearer(scope["headers"])
+        if token is not None:
+            claims = verify_token(token) if token else None
+            if claims is None:
+                await self._deny(scope, receive, send, 401, "Token inválido o vencido.")
+                return
+            principal = self.cache.get(claims["sub"])
+            if principal is _MISSING:
+                result = await self.loader(claims["sub"])
+                if not result["success"]:
+                    await self._deny(scope, receive, send, 503, "No se pudo verificar la sesión.")
+                    return
+                principal = result["principal"]
+                self.cache.set(claims["sub"], principal)
+            if principal is None or principal["token_version"] != claims.get("ver", 0):
+                await self._deny(scope, receive, send, 401, "Sesión revocada, inicie sesión de nuevo.")
+                return
+
+        roles = required_roles(scope["method"], scope["path"], self.rules)
+        if roles is not None:
+            if principal is None:
+                await self._deny(scope, receive, send, 401, "Se requiere iniciar sesión.")
+                return
+            if principal["id_role"] not in roles:
+                await self._deny(scope, receive, send, 403, "No tiene permiso para esta operación.")
+                return
+
+        owner = owner_of(scope["method"], scope["path"], self.owner_rules)
+        if owner is not None:
+            if principal is None:
+                await self._deny(scope, receive, send, 401, "Se requiere iniciar sesión.")
+                return
+            if str(principal["id_user"]) != owner and not is_admin(principal):
+                await self._deny(scope, receive, send, 403, "Solo puede modificar su propio usuario.")
+                return
+
+        scope.setdefault("state", {})["principal"] = principal
+        await self.app(scope, receive, send)
+
+    async def _deny(self, scope, receive, send, status, detail):
+        headers = {"WWW-Authenticate": "Bearer"} if status == 401 else None
+        await JSONResponse({"detail": detail}, status_code=status, headers=headers)(scope, receive, send)
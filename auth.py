@@ -1,5 +1,43 @@
+import psycopg
 import psycopg2
-from bd import Database
+from bd import AsyncDatabase, Database, Statement
+from cache import USERS, invalidate, invalidate_async
+from passwords import RETRY_AFTER, HasherBusy, hash_password, hash_password_async, verify_password, verify_password_async
+from tokens import AUTH_TOKEN_TTL, issue_token
+
+# Sin destino en ON CONFLICT cualquier índice único lo dispara: users_email_lower
+# (migración 0006) rechaza el email con otras mayúsculas y el UNIQUE de email, el exacto
+INSERT_USER = Statement("auth_insert_user", """
+    INSERT INTO users (name, last_name, email, password, id_role)
+    VALUES (%s, %s, %s, %s, %s)
+    ON CONFLICT DO NOTHING
+    RETURNING id_user, name, last_name, email, id_role;
+""", sensitive=True)
+
+LOGIN = Statement("auth_login", """
+    SELECT id_user, name, last_name, email, id_role, password, token_version
+    FROM users
+    WHERE lower(email) = lower(%s);
+""", sensitive=True)
+
+# Solo si nadie cambió la contraseña entre el login y ahora
+REHASH_PASSWORD = Statement("auth_rehash_password", """
+    UPDATE users SET password = %s WHERE id_user = %s AND password = %s;
+""", sensitive=True)
+
+EMAIL_TAKEN = "El email ya está registrado."
+WRONG_CREDENTIALS = "Credenciales incorrectas."
+
+
+def _busy(e):
+    return {"success": False, "error": str(e), "busy": True, "retry_after": RETRY_AFTER}
+
+
+def _session(user):
+    token = issue_token(user)
+    del user["token_version"]
+    return {"success": True, "user": user, "token": token, "expires_in": AUTH_TOKEN_TTL}
+
 
 class Auth:
     def __init__(self):
@@ -10,37 +48,79 @@ class Auth:
         Registra un nuevo usuario. Por defecto, el rol es 'client' (id_role=2).
         """
         try:
+            # El hash se calcula antes de pedir conexión, para no tenerla ocupada mientras tanto
+            password_hash = hash_password(password)
             with self.db.get_cursor() as cur:
-                # Verifica si el email ya existe
-                cur.execute("SELECT id_user FROM users WHERE email = %s;", (email,))
-                if cur.fetchone():
-                    return {"success": False, "error": "El email ya está registrado."}
-                # Inserta el usuario
-                cur.execute("""
-                    INSERT INTO users (name, last_name, email, password, id_role)
-                    VALUES (%s, %s, %s, %s, %s)
-                    RETURNING id_user, name, last_name, email, id_role;
-                """, (name, last_name, email, password, id_role))
+                cur.execute(INSERT_USER, (name, last_name, email, password_hash, id_role))
                 user = cur.fetchone()
-                return {"success": True, "user": user}
+            if not user:
+                return {"success": False, "error": EMAIL_TAKEN}
+            invalidate(USERS)
+            return {"success": True, "user": user}
+        except HasherBusy as e:
+            return _busy(e)
         except psycopg2.Error as e:
             return {"success": False, "error": str(e).split('\n')[0]}
 
     def login(self, email, password):
         """
-        Verifica usuario y contraseña. Retorna datos básicos si es correcto.
+        Verifica usuario y contraseña. Retorna sus datos básicos y un token de sesión.
         """
         try:
             with self.db.get_cursor() as cur:
-                cur.execute("""
-                    SELECT id_user, name, last_name, email, id_role
-                    FROM users
-                    WHERE email = %s AND password = %s;
-                """, (email, password))
+                cur.execute(LOGIN, (email,))
                 user = cur.fetchone()
-                if user:
-                    return {"success": True, "user": user}
-                else:
-                    return {"success": False, "error": "Credenciales incorrectas."}
+            # La conexión ya volvió al pool; la verificación corre en el pool de hash
+            stored = user.pop("password") if user else None
+            ok, new_hash = verify_password(stored, password)
+            if not ok:
+                return {"success": False, "error": WRONG_CREDENTIALS}
+            if new_hash:
+                with self.db.get_cursor() as cur:
+                    cur.execute(REHASH_PASSWORD, (new_hash, user["id_user"], stored))
+            return _session(user)
+        except HasherBusy as e:
+            return _busy(e)
         except psycopg2.Error as e:
             return {"success": False, "error": str(e).split('\n')[0]}
+
+
+class AsyncAuth:
+    """
+    Versión asyncio de Auth. Usa el mismo SQL sobre el pool asíncrono.
+    """
+    def __init__(self):
+        self.db = AsyncDatabase()
+
+    async def register(self, name, last_name, email, password, id_role=2):
+        try:
+            password_hash = await hash_password_async(password)
+            async with self.db.get_cursor() as cur:
+                await cur.execute(INSERT_USER, (name, last_name, email, password_hash, id_role))
+                user = await cur.fetchone()
+            if not user:
+                return {"success": False, "error": EMAIL_TAKEN}
+            await invalidate_async(USERS)
+            return {"success": True, "user": user}
+        except HasherBusy as e:
+            return _busy(e)
+        except psycopg.Error as e:
+            return {"success": False, "error": str(e).split('\n')[0]}
+
+    async def login(self, email, password):
+        try:
+            async with self.db.get_cursor() as cur:
+                await cur.execute(LOGIN, (email,))
+                user = await cur.fetchone()
+            stored = user.pop("password") if user else None
+            ok, new_hash = await verify_password_async(stored, password)
+            if not ok:
+                return {"success": False, "error": WRONG_CREDENTIALS}
+            if new_hash:
+                async with self.db.get_cursor() as cur:
+                    await cur.execute(REHASH_PASSWORD, (new_hash, user["id_user"], stored))
+            return _session(user)
+        except HasherBusy as e:
+            return _busy(e)
+        except psycopg.Error as e:
+            return {"success": False, "error": str(e).split('\n')[0]}
@@ -0,0 +1,276 @@
+"""
+Motor de disponibilidad: calcula los horarios libres de las canchas a partir del
+horario de apertura y del tamaño de slot, en vez de listar las filas de schedules
+que existan.
+
+Para cada cancha y día del rango se generan los slots dentro del horario de
+apertura (generate_series) y se descartan los que se solapan con una reserva no
+cancelada (NOT EXISTS sobre schedules, con el índice por cancha y fecha). Los
+slots libres consecutivos se unen en intervalos. Todo en una sola consulta,
+sea para una cancha, un tipo de cancha o todas.
+
+El horario de apertura se toma de court_opening_hours (una fila por cancha y día
+de la semana, 1 = lunes ... 7 = domingo; apertura = cierre marca el día cerrado)
+y, si una cancha no tiene fila para ese día, de AVAILABILITY_OPEN/AVAILABILITY_CLOSE.
+
+Uso:
+    python availability.py install    # crea court_opening_hours y los índices que usa
+"""
+import os
+import sys
+from datetime import date, time
+import psycopg
+import psycopg2
+from bd import AsyncDatabase, Database, Statement
+
+DEFAULT_OPEN = os.getenv("AVAILABILITY_OPEN", "06:00")
+DEFAULT_CLOSE = os.getenv("AVAILABILITY_CLOSE", "22:00")
+DEFAULT_SLOT_MINUTES = int(os.getenv("AVAILABILITY_SLOT_MINUTES", "60"))
+# Rango máximo de días por consulta, para acotar el tamaño de la respuesta
+MAX_DAYS = int(os.getenv("AVAILABILITY_MAX_DAYS", "31"))
+
+AVAILABILITY_DDL = """
+    CREATE TABLE IF NOT EXISTS court_opening_hours (
+        id_court   INTEGER NOT NULL REFERENCES courts(id_court) ON DELETE CASCADE,
+        weekday    SMALLINT NOT NULL CHECK (weekday BETWEEN 1 AND 7),
+        open_time  TIME NOT NULL,
+        close_time TIME NOT NULL CHECK (close_time >= open_time),
+        PRIMARY KEY (id_court, weekday)
+    );
+
+    CREATE INDEX IF NOT EXISTS schedules_court_date ON schedules (id_court, schedule_date, start_time);
+    CREATE INDEX IF NOT EXISTS booking_details_schedule ON booking_details (id_schedule);
+"""
+
+# Horario de apertura: la tabla si está instalada, o una relación vacía (todo por defecto)
+OPENING_HOURS = "court_opening_hours"
+NO_OPENING_HOURS = (
+    "(SELECT NULL::INTEGER AS id_court, NULL::SMALLINT AS weekday, "
+    "NULL::TIME AS open_time, NULL::TIME AS close_time WHERE FALSE)"
+)
+
+# Una reserva no cancelada de la cancha se solapa con [inicio, fin)
+OVERLAP = """
+    SELECT 1
+    FROM schedules s
+    JOIN booking_details bd ON bd.id_schedule = s.id_schedule
+    JOIN bookings b ON b.id_booking = bd.id_booking
+    WHERE s.id_court = {court}
+      AND s.schedule_date = {dia}
+      AND b.status <> 'cancelled'
+      AND s.schedule_date + s.start_time < {fin}
+      AND s.schedule_date + s.end_time > {inicio}
+"""
+
+# Parámetros: desde, hasta, id_court, id_type, hora_desde, hora_hasta, slot (minutos),
+# apertura y cierre por defecto. Cada uno aparece una sola vez (consulta preparada).
+FREE_SLOTS_SQL = """
+    WITH p AS (
+        SELECT %s::DATE AS desde, %s::DATE AS hasta, %s::INTEGER AS id_court, %s::INTEGER AS id_type,
+               %s::TIME AS hora_desde, %s::TIME AS hora_hasta, make_interval(mins => %s::INTEGER) AS slot,
+               %s::TIME AS apertura, %s::TIME AS cierre
+    ), horario AS (
+        SELECT c.id_court, c.description, ct.type_name, d::DATE AS dia, p.slot,
+               GREATEST(COALESCE(h.open_time, p.apertura), COALESCE(p.hora_desde, '00:00')) AS abre,
+               LEAST(COALESCE(h.close_time, p.cierre), COALESCE(p.hora_hasta, '24:00')) AS cierra
+        FROM p
+        JOIN courts c ON (p.id_court IS NULL OR c.id_court = p.id_court)
+                     AND (p.id_type IS NULL OR c.id_type = p.id_type)
+        JOIN court_types ct ON ct.id_type = c.id_type
+        CROSS JOIN generate_series(p.desde, p.hasta, INTERVAL '1 day') d
+        LEFT JOIN {opening_hours} h ON h.id_court = c.id_court AND h.weekday = EXTRACT(ISODOW FROM d)::SMALLINT
+    ), libres AS (
+        SELECT ho.id_court, ho.description, ho.type_name, ho.dia, ho.slot, inicio, inicio + ho.slot AS fin
+        FROM horario ho
+        CROSS JOIN generate_series(ho.dia + ho.abre, ho.dia + ho.cierra - ho.slot, ho.slot) inicio
+        WHERE NOT EXISTS ({overlap})
+    ), islas AS (
+        -- Slots consecutivos comparten (inicio - n * slot): así se agrupan en intervalos
+        SELECT *, inicio - ROW_NUMBER() OVER (PARTITION BY id_court, dia ORDER BY inicio) * slot AS grupo
+        FROM libres
+    )
+    SELECT id_court, description, type_name, dia AS fecha,
+           -- Como texto: un intervalo hasta medianoche termina en 24:00:00, que datetime.time no representa
+           MIN(inicio)::TIME::TEXT AS hora_inicio,
+           CASE WHEN MAX(fin)::DATE > dia THEN '24:00:00' ELSE MAX(fin)::TIME::TEXT END AS hora_fin,
+           COUNT(*) AS slots
+    FROM islas
+    GROUP BY id_court, description, type_name, dia, grupo
+    ORDER BY fecha, id_court, hora_inicio;
+"""
+
+# Parámetros: fecha, hora_inicio, hora_fin, id_type, apertura y cierre por defecto
+FREE_COURTS_SQL = """
+    WITH p AS (
+        SELECT %s::DATE AS dia, %s::TIME AS hora_inicio, %s::TIME AS hora_fin, %s::INTEGER AS id_type,
+               %s::TIME AS apertura, %s::TIME AS cierre
+    )
+    SELECT c.id_court, c.description, c.price_per_hour, ct.type_name
+    FROM p
+    JOIN courts c ON p.id_type IS NULL OR c.id_type = p.id_type
+    JOIN court_types ct ON ct.id_type = c.id_type
+    LEFT JOIN {opening_hours} h ON h.id_court = c.id_court AND h.weekday = EXTRACT(ISODOW FROM p.dia)::SMALLINT
+    WHERE COALESCE(h.open_time, p.apertura) <= p.hora_inicio
+      AND COALESCE(h.close_time, p.cierre) >= p.hora_fin
+      AND NOT EXISTS ({overlap})
+    ORDER BY c.id_court;
+"""
+
+_FREE_SLOTS_OVERLAP = OVERLAP.format(court="ho.id_court", dia="ho.dia", inicio="inicio", fin="inicio + ho.slot")
+_FREE_COURTS_OVERLAP = OVERLAP.format(
+    court="c.id_court", dia="p.dia", inicio="p.dia + p.hora_inicio", fin="p.dia + p.hora_fin"
+)
+
+FREE_SLOTS = Statement("availability_free_slots", FREE_SLOTS_SQL.format(
+    opening_hours=OPENING_HOURS, overlap=_FREE_SLOTS_OVERLAP))
+FREE_SLOTS_DEFAULT_HOURS = Statement("availability_free_slots_default_hours", FREE_SLOTS_SQL.format(
+    opening_hours=NO_OPENING_HOURS, overlap=_FREE_SLOTS_OVERLAP))
+FREE_COURTS = Statement("availability_free_courts", FREE_COURTS_SQL.format(
+    opening_hours=OPENING_HOURS, overlap=_FREE_COURTS_OVERLAP))
+FREE_COURTS_DEFAULT_HOURS = Statement("availability_free_courts_default_hours", FREE_COURTS_SQL.format(
+    opening_hours=NO_OPENING_HOURS, overlap=_FREE_COURTS_OVERLAP))
+
+
+def _parse_date(value, name):
+    if isinstance(value, date):
+        return value
+    try:
+        return date.fromisoformat(value)
+    except (TypeError, ValueError):
+        raise ValueError(f"{name} debe tener formato YYYY-MM-DD")
+
+
+def _parse_time(value, name):
+    if value is None:
+        return None
+    if isinstance(value, time):
+        return value.isoformat()
+    if value in ("24:00", "24:00:00"):
+        return "24:00:00"
+    try:
+        return time.fromisoformat(value).isoformat()
+    except (TypeError, ValueError):
+        raise ValueError(f"{name} debe tener formato HH:MM")
+
+
+def free_slots_params(fecha_inicio, fecha_fin=None, id_court=None, id_type=None,
+                      hora_inicio=None, hora_fin=None, slot_minutes=None):
+    """
+    Valida los filtros y retorna los parámetros de FREE_SLOTS. Lanza ValueError si no son válidos.
+    """
+    desde = _parse_date(fecha_inicio, "fecha_inicio")
+    hasta = _parse_date(fecha_fin, "fecha_fin") if fecha_fin else desde
+    if hasta < desde:
+        raise ValueError("fecha_fin no puede ser anterior a fecha_inicio")
+    if (hasta - desde).days + 1 > MAX_DAYS:
+        raise ValueError(f"El rango no puede superar {MAX_DAYS} días")
+    slot = DEFAULT_SLOT_MINUTES if slot_minutes is None else int(slot_minutes)
+    if not 5 <= slot <= 24 * 60:
+        raise ValueError("slot debe estar entre 5 y 1440 minutos")
+    return (
+        desde, hasta, id_court, id_type,
+        _parse_time(hora_inicio, "hora_inicio"), _parse_time(hora_fin, "hora_fin"), slot,
+        DEFAULT_OPEN, DEFAULT_CLOSE,
+    )
+
+
+def free_courts_params(fecha, hora_inicio, hora_fin, id_type=None):
+    dia = _parse_date(fecha, "fecha")
+    inicio = _parse_time(hora_inicio, "hora_inicio")
+    fin = _parse_time(hora_fin, "hora_fin")
+    if inicio is None or fin is None or fin <= inicio:
+        raise ValueError("hora_fin debe ser posterior a hora_inicio")
+    return (dia, inicio, fin, id_type, DEFAULT_OPEN, DEFAULT_CLOSE)
+
+
+class Availability:
+    def __init__(self):
+        self.db = Database()
+
+    def _query(self, query, fallback, params):
+        """
+        Ejecuta la consulta con court_opening_hours; si la tabla no está instalada,
+        repite con el horario por defecto.
+        """
+        try:
+            with self.db.get_cursor() as cur:
+                try:
+                    cur.execute(query, params)
+                except psycopg2.errors.UndefinedTable:
+                    cur.connection.rollback()
+                    cur.execute(fallback, params)
+                data = cur.fetchall()
+                return {"success": True, "data": data}
+        except psycopg2.Error as e:
+            return {"success": False, "error": str(e).split('\n')[0]}
+
+    def free_slots(self, fecha_inicio, fecha_fin=None, id_court=None, id_type=None,
+                   hora_inicio=None, hora_fin=None, slot_minutes=None):
+        """
+        Intervalos libres por cancha y día en el rango de fechas, opcionalmente
+        limitados a una cancha, un tipo de cancha y una franja horaria.
+        """
+        try:
+            params = free_slots_params(fecha_inicio, fecha_fin, id_court, id_type, hora_inicio, hora_fin, slot_minutes)
+        except ValueError as e:
+            return {"success": False, "error": str(e)}
+        return self._query(FREE_SLOTS, FREE_SLOTS_DEFAULT_HOURS, params)
+
+    def free_courts(self, fecha, hora_inicio, hora_fin, id_type=None):
+        """
+        Canchas abiertas y sin reservas en toda la franja [hora_inicio, hora_fin) de esa fecha.
+        """
+        try:
+            params = free_courts_params(fecha, hora_inicio, hora_fin, id_type)
+        except ValueError as e:
+            return {"success": False, "error": str(e)}
+        return self._query(FREE_COURTS, FREE_COURTS_DEFAULT_HOURS, params)
+
+    def install(self):
+        with self.db.get_cursor() as cur:
+            cur.execute(AVAILABILITY_DDL)
+
+
+class AsyncAvailability:
+    """
+    Versión asyncio de Availability. Usa el mismo SQL sobre el pool asíncrono.
+    """
+    def __init__(self):
+        self.db = AsyncDatabase()
+
+    async def _query(self, query, fallback, params):
+        try:
+            async with self.db.get_cursor() as cur:
+                try:
+                    await cur.execute(query, params)
+                except psycopg.errors.UndefinedTable:
+                    await cur.connection.rollback()
+                    await cur.execute(fallback, params)
+                data = await cur.fetchall()
+                return {"success": True, "data": data}
+        except psycopg.Error as e:
+            return {"success": False, "error": str(e).split('\n')[0]}
+
+    async def free_slots(self, fecha_inicio, fecha_fin=None, id_court=None, id_type=None,
+                         hora_inicio=None, hora_fin=None, slot_minutes=None):
+        try:
+            params = free_slots_params(fecha_inicio, fecha_fin, id_court, id_type, hora_inicio, hora_fin, slot_minutes)
+        except ValueError as e:
+            return {"success": False, "error": str(e)}
+        return await self._query(FREE_SLOTS, FREE_SLOTS_DEFAULT_HOURS, params)
+
+    async def free_courts(self, fecha, hora_inicio, hora_fin, id_type=None):
+        try:
+            params = free_courts_params(fecha, hora_inicio, hora_fin, id_type)
+        except ValueError as e:
+            return {"success": False, "error": str(e)}
+        return await self._query(FREE_COURTS, FREE_COURTS_DEFAULT_HOURS, params)
+
+
+if __name__ == "__main__":
+    if sys.argv[1:2] == ["install"]:
+        Availability().install()
+        print("Instalado: court_opening_hours, schedules_court_date, booking_details_schedule")
+    else:
+        print(__doc__)
+        sys.exit(1)
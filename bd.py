@@ -1,31 +1,1049 @@
+import asyncio
+import contextvars
 import os
+import queue
+import threading
+import time
+from collections import deque
 from dotenv import load_dotenv
+import psycopg
 import psycopg2
+from psycopg2 import errors, extensions
 from psycopg2.extras import RealDictCursor
-from contextlib import contextmanager
+from psycopg.rows import dict_row
+from psycopg_pool import AsyncConnectionPool
+from contextlib import asynccontextmanager, contextmanager
+from cancellation import current_cancel
+from replicas import REPLICA_LAG, REPLICA_TIMEOUT, recent_writes, replica_set
+from querystats import ENABLED as QUERY_STATS_ENABLED, fingerprint, query_stats
+from tracing import TRACING_ENABLED, current_span, record as record_span
 
-class Database:
+load_dotenv()
+
+
+class PoolTimeout(psycopg2.OperationalError):
+    """
+    No se pudo obtener una conexión del pool dentro del tiempo de espera.
+    Hereda de psycopg2.Error para que los CRUD la manejen como cualquier error de BD.
+    """
+
+
+class Statement(str):
+    """
+    Consulta fija con nombre. Se comporta como el texto SQL, pero los cursores de
+    Database la preparan una sola vez por conexión (PREPARE) y luego solo envían
+    EXECUTE con los parámetros, evitando que PostgreSQL la vuelva a parsear y planificar.
+    `sensitive` evita que sus parámetros (p. ej. contraseñas) aparezcan en el log de
+    consultas lentas.
+    """
+    def __new__(cls, name, sql, sensitive=False):
+        if name in STATEMENTS and STATEMENTS[name] != sql:
+            raise ValueError(f"Ya existe otra consulta registrada como '{name}'")
+        obj = super().__new__(cls, sql)
+        obj.name = name
+        obj.sensitive = sensitive
+        body = sql.strip().rstrip(";")
+        # psycopg2 usa %s; PREPARE necesita $1, $2, ...
+        parts = body.split("%s")
+        obj.param_count = len(parts) - 1
+        obj.prepare_sql = f"PREPARE {name} AS " + "".join(
+            part + (f"${i + 1}" if i < obj.param_count else "") for i, part in enumerate(parts)
+        )
+        obj.execute_sql = f"EXECUTE {name}"
+        if obj.param_count:
+            obj.execute_sql += " (" + ", ".join(["%s"] * obj.param_count) + ")"
+        STATEMENTS[name] = obj
+        return obj
+
+
+class SensitiveQuery(str):
+    """
+    Consulta armada a mano (sin nombre, no se prepara) cuyos parámetros no deben
+    aparecer en el log de consultas lentas, como un Statement con sensitive=True.
+    """
+    sensitive = True
+
+
+# Registro de todas las consultas con nombre: nombre -> Statement
+STATEMENTS = {}
+
+
+def statement_stats():
+    """
+    Cuántas conexiones del pool tienen preparada cada consulta y cuántas veces se ha ejecutado.
+    """
+    with _stats_lock:
+        return {
+            name: {"prepares": _prepare_counts.get(name, 0), "executions": _execute_counts.get(name, 0)}
+            for name in STATEMENTS
+        }
+
+
+_stats_lock = threading.Lock()
+_prepare_counts = {}
+_execute_counts = {}
+
+
+class PooledConnection(extensions.connection):
+    """
+    Conexión de psycopg2 con los metadatos que necesita el pool.
+    `prepared` guarda los nombres de las consultas ya preparadas en esta sesión;
+    una conexión nueva (p. ej. tras reconectar) empieza vacía y las vuelve a preparar.
+    """
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.created_at = time.monotonic()
+        self.last_used = self.created_at
+        self.prepared = set()
+
+
+class _PreparedExecute:
+    """
+    Ejecuta los Statement con PREPARE/EXECUTE; se combina con una clase de cursor de psycopg2.
+    """
+    def execute(self, query, vars=None):
+        if not isinstance(query, Statement):
+            return super().execute(query, vars)
+        conn = self.connection
+        first_in_transaction = conn.get_transaction_status() == extensions.TRANSACTION_STATUS_IDLE
+        self._prepare(query)
+        try:
+            result = super().execute(query.execute_sql, vars)
+        except errors.InvalidSqlStatementName:
+            # Alguien hizo DEALLOCATE/DISCARD en la sesión. Si no había nada más en la
+            # transacción se reintenta de forma transparente; si no, se prepara en el próximo uso.
+            conn.prepared.clear()
+            if not first_in_transaction:
+                raise
+            conn.rollback()
+            self._prepare(query)
+            result = super().execute(query.execute_sql, vars)
+        with _stats_lock:
+            _execute_counts[query.name] = _execute_counts.get(query.name, 0) + 1
+        return result
+
+    def _prepare(self, query):
+        conn = self.connection
+        if query.name in conn.prepared:
+            return
+        super().execute(query.prepare_sql)
+        conn.prepared.add(query.name)
+        with _stats_lock:
+            _prepare_counts[query.name] = _prepare_counts.get(query.name, 0) + 1
+
+
+class PreparedCursor(_PreparedExecute, RealDictCursor):
+    """
+    RealDictCursor que ejecuta los Statement con PREPARE/EXECUTE.
+    """
+
+
+class PreparedTupleCursor(_PreparedExecute, extensions.cursor):
+    """
+    Igual que PreparedCursor pero con filas como tuplas, sin armar un dict por fila.
+    """
+
+
+def _observe_query(query, seconds, rows, params, error=None):
+    """
+    Registra una consulta en querystats y, si hay una traza en curso, como span.
+    """
+    if QUERY_STATS_ENABLED:
+        query_stats.record(query, seconds, rows, params, error)
+    if current_span.get() is not None:
+        key, sql = fingerprint(query)
+        record_span(f"db.query {key}", seconds, error, **{"db.statement": sql, "db.rows": rows})
+
+
+def _observe_acquire(pool, seconds):
+    if QUERY_STATS_ENABLED:
+        query_stats.record_acquire(pool, seconds)
+    record_span("db.acquire", seconds)
+
+
+def _observe_fetch(seconds, rows):
+    record_span("db.fetch", seconds, **{"db.rows": len(rows)})
+
+
+class _TimedExecute:
+    """
+    Mide cada execute (incluido el PREPARE de la primera vez) con las filas que
+    devolvió o modificó, y las lecturas de filas cuando hay una traza en curso.
+    """
+    def execute(self, query, vars=None):
+        start = time.perf_counter()
+        try:
+            result = super().execute(query, vars)
+        except Exception as e:
+            _observe_query(query, time.perf_counter() - start, None, vars, e)
+            raise
+        _observe_query(query, time.perf_counter() - start, self.rowcount, vars)
+        return result
+
+    def fetchall(self):
+        if current_span.get() is None:
+            return super().fetchall()
+        start = time.perf_counter()
+        rows = super().fetchall()
+        _observe_fetch(time.perf_counter() - start, rows)
+        return rows
+
+    def fetchmany(self, size=None):
+        if current_span.get() is None:
+            return super().fetchmany(size)
+        start = time.perf_counter()
+        rows = super().fetchmany(size)
+        _observe_fetch(time.perf_counter() - start, rows)
+        return rows
+
+
+class InstrumentedCursor(_TimedExecute, PreparedCursor):
+    pass
+
+
+class InstrumentedTupleCursor(_TimedExecute, PreparedTupleCursor):
+    pass
+
+
+# Cursores que usa Database: los instrumentados solo si DB_QUERY_STATS, DB_SLOW_QUERY_MS
+# o TRACING están activos, para no sumar nada por consulta cuando no se miden
+INSTRUMENTED = QUERY_STATS_ENABLED or TRACING_ENABLED
+CURSOR_FACTORY = InstrumentedCursor if INSTRUMENTED else PreparedCursor
+TUPLE_CURSOR_FACTORY = InstrumentedTupleCursor if INSTRUMENTED else PreparedTupleCursor
+
+
+# Carriles: cada uno con su pool, su espera máxima y su statement_timeout, para que
+# los reportes pesados nunca dejen sin conexiones a las reservas, usuarios y login
+OLTP = "oltp"
+ANALYTICS = "analytics"
+# Scripts (migraciones, seed, index_advisor): sentencias largas a propósito
+MAINTENANCE = "maintenance"
+LANES = (OLTP, ANALYTICS, MAINTENANCE)
+
+
+def lane_config(lane):
+    """
+    Tamaño del pool, segundos de espera por una conexión y statement_timeout en ms
+    (0 = sin límite) de un carril, desde las variables de entorno.
+    """
+    if lane == OLTP:
+        return {
+            "min": int(os.getenv("DB_POOL_MIN", "1")),
+            "max": int(os.getenv("DB_POOL_MAX", "20")),
+            "timeout": float(os.getenv("DB_POOL_TIMEOUT", "10")),
+            "statement_timeout": int(os.getenv("DB_STATEMENT_TIMEOUT", "10000")),
+        }
+    if lane == ANALYTICS:
+        return {
+            "min": int(os.getenv("DB_ANALYTICS_POOL_MIN", "1")),
+            "max": int(os.getenv("DB_ANALYTICS_POOL_MAX", "5")),
+            "timeout": float(os.getenv("DB_ANALYTICS_POOL_TIMEOUT", "30")),
+            "statement_timeout": int(os.getenv("DB_ANALYTICS_STATEMENT_TIMEOUT", "60000")),
+        }
+    if lane == MAINTENANCE:
+        return {
+            "min": 0,
+            "max": int(os.getenv("DB_POOL_MAX", "20")),
+            "timeout": float(os.getenv("DB_POOL_TIMEOUT", "10")),
+            "statement_timeout": 0,
+        }
+    raise ValueError(f"Carril desconocido: {lane} (usar {', '.join(LANES)})")
+
+
+def _acquire_label(mode, lane):
+    # El carril OLTP conserva el nombre de siempre en querystats y /metrics
+    return mode if lane == OLTP else f"{mode}:{lane}"
+
+
+# set_config(..., true) dura hasta el fin de la transacción, como SET LOCAL, pero
+# acepta parámetros
+SET_STATEMENT_TIMEOUT = "SELECT set_config('statement_timeout', %s, true);"
+
+
+def db_error(e):
+    """
+    Resultado de error de los CRUD: la primera línea del mensaje y, si la consulta se
+    cortó por statement_timeout o se canceló, `timeout` (la API responde 504).
+    """
+    result = {"success": False, "error": str(e).split('\n')[0]}
+    if isinstance(e, (errors.QueryCanceled, psycopg.errors.QueryCanceled)):
+        result["timeout"] = True
+    return result
+
+
+class AcquireWaits:
+    """
+    Cuánto se está esperando por una conexión ahora mismo en un carril (sync o async).
+    Lo usa el descarte de carga de limits.py, así que no depende de DB_QUERY_STATS.
+
+    current() es el mayor entre la espera más antigua todavía en curso y la última
+    espera terminada, que se reduce a la mitad cada DECAY segundos: sube apenas el pool
+    se satura y baja solo cuando las esperas vuelven a ser cortas.
+    """
+    DECAY = 1.0
+
+    def __init__(self):
+        self._pending = {}
+        self._next = 0
+        self._recent = 0.0
+        self._recent_at = 0.0
+        self._lock = threading.Lock()
+
+    def begin(self):
+        with self._lock:
+            self._next += 1
+            self._pending[self._next] = time.monotonic()
+            return self._next
+
+    def end(self, token):
+        """
+        Marca la espera `token` como terminada. Llamarlo de nuevo no hace nada.
+        """
+        now = time.monotonic()
+        with self._lock:
+            start = self._pending.pop(token, None)
+            if start is not None:
+                self._recent = max(self._decayed(now), now - start)
+                self._recent_at = now
+
+    def current(self):
+        now = time.monotonic()
+        with self._lock:
+            oldest = min(self._pending.values(), default=now)
+            return max(now - oldest, self._decayed(now))
+
+    def _decayed(self, now):
+        return self._recent * 0.5 ** ((now - self._recent_at) / self.DECAY)
+
+
+acquire_waits = {lane: AcquireWaits() for lane in LANES}
+
+
+class _Waiter:
+    """
+    Hilo esperando una conexión. El pool se la entrega directamente (en orden de
+    llegada) para que los hilos que devuelven y piden en bucle no acaparen el pool.
+    """
+    __slots__ = ("event", "conn")
+
+    def __init__(self):
+        self.event = threading.Event()
+        self.conn = None
+
+
+# Marca entregada a un _Waiter cuando se libera un cupo y debe abrir su propia conexión
+_NEW_CONNECTION = object()
+
+
+class ConnectionPool:
+    """
+    Pool de conexiones acotado y seguro entre hilos.
+
+    - Mantiene entre `minconn` y `maxconn` conexiones abiertas.
+    - Si no hay conexiones libres espera (en orden FIFO) hasta `timeout` segundos y luego lanza PoolTimeout.
+    - Al entregar una conexión verifica que siga viva (con un SELECT 1 si estuvo
+      inactiva más de `check_idle` segundos).
+    - Descarta las conexiones con más de `max_lifetime` segundos de vida o rotas.
+    """
+    def __init__(self, minconn, maxconn, timeout, max_lifetime, check_idle, lane=OLTP, **connect_kwargs):
+        self.lane = lane
+        self.minconn = minconn
+        self.maxconn = maxconn
+        self.timeout = timeout
+        self.max_lifetime = max_lifetime
+        self.check_idle = check_idle
+        self.connect_kwargs = connect_kwargs
+        self.pid = os.getpid()
+        self._idle = deque()
+        self._waiters = deque()
+        self._size = 0
+        self._in_use = 0
+        self._lock = threading.Lock()
+        self._stats = {
+            "checkouts": 0,
+            "waits": 0,
+            "timeouts": 0,
+            "wait_time_total": 0.0,
+            "wait_time_max": 0.0,
+            "connections_created": 0,
+            "connections_discarded": 0,
+        }
+        for _ in range(minconn):
+            conn = self._connect()
+            with self._lock:
+                self._size += 1
+                self._idle.append(conn)
+
+    def _connect(self):
+        conn = psycopg2.connect(connection_factory=PooledConnection, **self.connect_kwargs)
+        with self._lock:
+            self._stats["connections_created"] += 1
+        return conn
+
+    def _expired(self, conn, now):
+        return self.max_lifetime and now - conn.created_at > self.max_lifetime
+
+    def _healthy(self, conn, now):
+        if conn.closed or conn.get_transaction_status() != extensions.TRANSACTION_STATUS_IDLE:
+            return False
+        if now - conn.last_used < self.check_idle:
+            return True
+        try:
+            with conn.cursor() as cur:
+                cur.execute("SELECT 1;")
+            conn.rollback()
+            return True
+        except psycopg2.Error:
+            return False
+
+    def _release_slot(self):
+        """
+        Libera el cupo de una conexión cerrada. Si alguien espera, le cede el cupo
+        para que abra una conexión nueva. Debe llamarse con el lock tomado.
+        """
+        if self._waiters:
+            waiter = self._waiters.popleft()
+            waiter.conn = _NEW_CONNECTION
+            waiter.event.set()
+        else:
+            self._size -= 1
+
+    def _discard(self, conn):
+        try:
+            conn.close()
+        except psycopg2.Error:
+            pass
+        with self._lock:
+            self._stats["connections_discarded"] += 1
+            self._release_slot()
+
+    def _wait(self, deadline):
+        """
+        Encola al hilo actual y espera a que le entreguen una conexión o un cupo.
+        """
+        waiter = _Waiter()
+        with self._lock:
+            self._waiters.append(waiter)
+        waiter.event.wait(max(deadline - time.monotonic(), 0))
+        with self._lock:
+            if waiter.conn is None:
+                self._waiters.remove(waiter)
+                self._stats["timeouts"] += 1
+                raise PoolTimeout(
+                    f"No hay conexiones disponibles en el pool después de {self.timeout}s."
+                )
+            return waiter.conn
+
+    def getconn(self):
+        waits = acquire_waits[self.lane]
+        waiting = waits.begin()
+        try:
+            return self._getconn()
+        finally:
+            waits.end(waiting)
+
+    def _getconn(self):
+        start = time.monotonic()
+        deadline = start + self.timeout
+        waited = False
+        while True:
+            conn = None
+            with self._lock:
+                if self._idle and not self._waiters:
+                    conn = self._idle.pop()
+                elif self._size < self.maxconn:
+                    self._size += 1
+                    conn = _NEW_CONNECTION
+            if conn is None:
+                waited = True
+                conn = self._wait(deadline)
+            now = time.monotonic()
+            if conn is _NEW_CONNECTION:
+                try:
+                    conn = self._connect()
+                except psycopg2.Error:
+                    with self._lock:
+                        self._release_slot()
+                    raise
+            elif self._expired(conn, now) or not self._healthy(conn, now):
+                self._discard(conn)
+                continue
+            wait_time = time.monotonic() - start
+            if INSTRUMENTED:
+                _observe_acquire(_acquire_label("sync", self.lane), wait_time)
+            with self._lock:
+                self._in_use += 1
+                self._stats["checkouts"] += 1
+                self._stats["wait_time_total"] += wait_time
+                self._stats["wait_time_max"] = max(self._stats["wait_time_max"], wait_time)
+                if waited:
+                    self._stats["waits"] += 1
+            return conn
+
+    def putconn(self, conn):
+        with self._lock:
+            self._in_use -= 1
+        if not conn.closed and conn.get_transaction_status() != extensions.TRANSACTION_STATUS_IDLE:
+            # Deja la conexión limpia para el siguiente uso
+            try:
+                conn.rollback()
+            except psycopg2.Error:
+                pass
+        now = time.monotonic()
+        if conn.closed or conn.get_transaction_status() != extensions.TRANSACTION_STATUS_IDLE \
+                or self._expired(conn, now):
+            self._discard(conn)
+            return
+        conn.last_used = now
+        with self._lock:
+            if self._waiters:
+                waiter = self._waiters.popleft()
+                waiter.conn = conn
+                waiter.event.set()
+            else:
+                self._idle.append(conn)
+
+    def closeall(self):
+        with self._lock:
+            while self._idle:
+                conn = self._idle.pop()
+                self._size -= 1
+                conn.close()
+
+    def stats(self):
+        with self._lock:
+            stats = dict(self._stats)
+            stats.update({
+                "min_size": self.minconn,
+                "max_size": self.maxconn,
+                "size": self._size,
+                "idle": len(self._idle),
+                "in_use": self._in_use,
+                "waiting": len(self._waiters),
+                "timeout": self.timeout,
+            })
+        checkouts = stats["checkouts"]
+        stats["wait_time_avg"] = stats["wait_time_total"] / checkouts if checkouts else 0.0
+        return stats
+
+
+def _options(config):
+    # statement_timeout por defecto de las conexiones del carril (parámetro de conexión)
+    return f"-c statement_timeout={config['statement_timeout']}"
+
+
+def _pool_key(lane, replica):
+    return lane if replica is None else (lane, replica.name)
+
+
+def _pool_config(lane, replica):
+    """
+    lane_config del carril; los pools de una réplica abren conexiones recién al usarse
+    y esperan a lo sumo DB_REPLICA_TIMEOUT segundos, para pasar pronto al primario.
+    """
+    config = lane_config(lane)
+    if replica is not None:
+        config["min"] = 0
+        config["timeout"] = min(config["timeout"], REPLICA_TIMEOUT)
+    return config
+
+
+def _server(replica):
+    if replica is None:
+        return {"host": os.getenv("DB_HOST"), "port": os.getenv("DB_PORT")}
+    # libpq no acepta connect_timeout menor a 2 segundos
+    return {"host": replica.host, "port": replica.port, "connect_timeout": max(2, int(REPLICA_TIMEOUT))}
+
+
+_pools = {}
+_pool_lock = threading.Lock()
+
+
+def get_pool(lane=OLTP, replica=None):
+    """
+    Devuelve el pool del carril (en el primario o en la réplica `replica`) compartido
+    por todo el proceso, creándolo en el primer uso (y de nuevo tras un fork, para no
+    compartir sockets entre workers).
+    """
+    key = _pool_key(lane, replica)
+    pool = _pools.get(key)
+    if pool is None or pool.pid != os.getpid():
+        with _pool_lock:
+            pool = _pools.get(key)
+            if pool is None or pool.pid != os.getpid():
+                config = _pool_config(lane, replica)
+                pool = _pools[key] = ConnectionPool(
+                    minconn=config["min"],
+                    maxconn=config["max"],
+                    timeout=config["timeout"],
+                    max_lifetime=float(os.getenv("DB_POOL_MAX_LIFETIME", "1800")),
+                    check_idle=float(os.getenv("DB_POOL_CHECK_IDLE", "30")),
+                    lane=lane,
+                    database=os.getenv("DB_NAME"),
+                    user=os.getenv("DB_USER"),
+                    password=os.getenv("DB_PASSWORD"),
+                    options=_options(config),
+                    **_server(replica)
+                )
+    return pool
+
+
+def pool_stats(lane=OLTP, replica=None):
+    """
+    Estadísticas del pool del carril, o None si todavía no se ha creado.
+    """
+    pool = _pools.get(_pool_key(lane, replica))
+    if pool is None or pool.pid != os.getpid():
+        return None
+    return pool.stats()
+
+
+_async_pools = {}
+_async_pool_lock = asyncio.Lock()
+
+
+async def get_async_pool(lane=OLTP, replica=None):
+    """
+    Devuelve el pool asíncrono (psycopg 3) del carril, en el primario o en la réplica
+    `replica`, abriéndolo en el primer uso. Usa las mismas variables que el pool
+    síncrono (ver lane_config).
+    """
+    key = _pool_key(lane, replica)
+    if key not in _async_pools:
+        async with _async_pool_lock:
+            if key not in _async_pools:
+                config = _pool_config(lane, replica)
+                pool = AsyncConnectionPool(
+                    conninfo=psycopg.conninfo.make_conninfo(
+                        dbname=os.getenv("DB_NAME"),
+                        user=os.getenv("DB_USER"),
+                        password=os.getenv("DB_PASSWORD"),
+                        options=_options(config),
+                        **_server(replica)
+                    ),
+                    min_size=config["min"],
+                    max_size=config["max"],
+                    timeout=config["timeout"],
+                    max_lifetime=float(os.getenv("DB_POOL_MAX_LIFETIME", "1800")),
+                    check=AsyncConnectionPool.check_connection,
+                    configure=_configure_async_connection,
+                    name=lane if replica is None else f"{lane}@{replica.name}",
+                    open=False
+                )
+                await pool.open()
+                _async_pools[key] = pool
+    return _async_pools[key]
+
+
+async def close_async_pool():
+    while _async_pools:
+        _, pool = _async_pools.popitem()
+        await pool.close()
+
+
+def async_pool_stats(lane=OLTP, replica=None):
+    """
+    Estadísticas del pool asíncrono del carril, o None si no se ha abierto.
+    """
+    pool = _async_pools.get(_pool_key(lane, replica))
+    if pool is None:
+        return None
+    return pool.get_stats()
+
+
+# Filas que se traen por vuelta al leer con un cursor del lado del servidor
+STREAM_BATCH_SIZE = int(os.getenv("DB_STREAM_BATCH_SIZE", "1000"))
+
+# Tamaño de los bloques que entrega COPY ... TO STDOUT y cuántos pueden esperar en cola
+COPY_CHUNK_SIZE = 64 * 1024
+COPY_QUEUE_SIZE = 8
+
+_COPY_DONE = object()
+
+
+def copy_csv_sql(query):
+    """
+    COPY de una consulta ya con sus parámetros interpolados, en CSV con encabezado.
+    """
+    return f"COPY ({query.strip().rstrip(';')}) TO STDOUT WITH (FORMAT csv, HEADER)"
+
+
+class _CopyAborted(Exception):
+    pass
+
+
+class _CopyPipe:
+    """
+    Archivo de solo escritura para copy_expert: junta lo que escribe el COPY en bloques
+    de COPY_CHUNK_SIZE y los pasa por una cola acotada a quien los va leyendo.
+    """
     def __init__(self):
+        self.chunks = queue.Queue(maxsize=COPY_QUEUE_SIZE)
+        self.stopped = threading.Event()
+        self._buffer = bytearray()
+
+    def offer(self, item):
+        # Espera lugar en la cola, salvo que el lector ya haya abandonado
+        while not self.stopped.is_set():
+            try:
+                self.chunks.put(item, timeout=0.1)
+                return
+            except queue.Full:
+                pass
+        raise _CopyAborted()
+
+    def write(self, data):
+        self._buffer += data
+        if len(self._buffer) >= COPY_CHUNK_SIZE:
+            self.flush()
+
+    def flush(self):
+        if self._buffer:
+            self.offer(bytes(self._buffer))
+            self._buffer.clear()
+
+
+def _set_timeout(cur, timeout):
+    if timeout is not None:
+        cur.execute(SET_STATEMENT_TIMEOUT, (str(int(timeout)),))
+
+
+def _use_replica(read_only, tags):
+    """
+    True si la lectura puede ir a una réplica: es de solo lectura, hay réplicas y
+    ninguno de sus tags se escribió hace poco (ver replicas.py).
+    """
+    if not read_only or replica_set is None:
+        return False
+    if recent_writes.recent(tags):
+        replica_set.record_primary("recent_write")
+        return False
+    return True
+
+
+async def _use_replica_async(read_only, tags):
+    """
+    _use_replica para AsyncDatabase: con marcas de escritura en sqlite las lee en un hilo.
+    """
+    if not read_only or replica_set is None:
+        return False
+    if recent_writes.blocking:
+        recent = await asyncio.to_thread(recent_writes.recent, tags)
+    else:
+        recent = recent_writes.recent(tags)
+    if recent:
+        replica_set.record_primary("recent_write")
+        return False
+    return True
+
+
+def _sync_in_use(lane):
+    def in_use(replica):
+        stats = pool_stats(lane, replica)
+        return stats["in_use"] if stats else 0
+    return in_use
+
+
+def _async_in_use(lane):
+    def in_use(replica):
+        stats = async_pool_stats(lane, replica)
+        return stats.get("pool_size", 0) - stats.get("pool_available", 0) if stats else 0
+    return in_use
+
+
+class Database:
+    """
+    Acceso a la BD por el pool del carril `lane` (OLTP, ANALYTICS o MAINTENANCE). Cada
+    conexión trae el statement_timeout del carril; `timeout` (ms, 0 = sin límite) en
+    get_cursor, stream y copy_csv lo cambia solo para esa transacción.
+
+    Con read_only=True (en el constructor o en get_connection/get_cursor) la conexión
+    sale de una réplica si hay (replicas.py); `tags` son los tags de caché de lo que se
+    lee, para volver al primario si se escribieron hace poco.
+    """
+    def __init__(self, lane=OLTP, read_only=False):
         load_dotenv()
+        self.lane = lane
+        self.read_only = read_only
+
+    def _replica_checkout(self):
+        """
+        (pool, conexión) de la primera réplica que entrega una conexión y no está
+        atrasada, o None para usar el primario.
+        """
+        for replica in replica_set.candidates(_sync_in_use(self.lane)):
+            pool = get_pool(self.lane, replica)
+            conn = None
+            try:
+                conn = pool.getconn()
+                if replica_set.claim_lag_check(replica):
+                    with conn.cursor() as cur:
+                        cur.execute(REPLICA_LAG)
+                        lag = cur.fetchone()[0]
+                    conn.rollback()
+                    if not replica_set.record_lag(replica, lag):
+                        pool.putconn(conn)
+                        continue
+            except psycopg2.OperationalError as e:
+                # Caída o sin conexiones libres (PoolTimeout); putconn descarta la conexión rota
+                if conn is not None:
+                    pool.putconn(conn)
+                replica_set.mark_down(replica, e)
+                continue
+            replica_set.record_read(replica)
+            return pool, conn
+        replica_set.record_primary("fallback")
+        return None
 
     @contextmanager
-    def get_connection(self):
-        conn = psycopg2.connect(
-            host=os.getenv("DB_HOST"),
-            port=os.getenv("DB_PORT"),
-            database=os.getenv("DB_NAME"),
-            user=os.getenv("DB_USER"),
-            password=os.getenv("DB_PASSWORD")
-        )
+    def get_connection(self, read_only=None, tags=()):
+        checkout = None
+        if _use_replica(self.read_only if read_only is None else read_only, tags):
+            checkout = self._replica_checkout()
+        if checkout is None:
+            pool = get_pool(self.lane)
+            checkout = pool, pool.getconn()
+        pool, conn = checkout
+        # Para que CancelOnDisconnectMiddleware pueda cancelar la consulta en curso
+        cancel_scope = current_cancel.get()
+        if cancel_scope is not None:
+            cancel_scope.add(conn)
         try:
             yield conn
         finally:
-            conn.close()
+            if cancel_scope is not None:
+                cancel_scope.discard(conn)
+            pool.putconn(conn)
 
     @contextmanager
-    def get_cursor(self):
-        with self.get_connection() as conn:
-            with conn.cursor(cursor_factory=RealDictCursor) as cur:
+    def get_cursor(self, timeout=None, read_only=None, tags=()):
+        with self.get_connection(read_only, tags) as conn:
+            with conn.cursor(cursor_factory=CURSOR_FACTORY) as cur:
+                _set_timeout(cur, timeout)
                 yield cur
                 conn.commit()
 
+    def stream(self, query, params=None, batch_size=STREAM_BATCH_SIZE, timeout=None):
+        """
+        Ejecuta la consulta con un cursor con nombre (del lado del servidor) y entrega
+        las filas en lotes de batch_size, sin cargar el resultado completo en memoria.
+        La conexión queda tomada hasta que se agota o se cierra el generador.
+        """
+        with self.get_connection() as conn:
+            try:
+                if timeout is not None:
+                    with conn.cursor() as cur:
+                        _set_timeout(cur, timeout)
+                with conn.cursor(name="stream", cursor_factory=RealDictCursor) as cur:
+                    cur.execute(query, params)
+                    while True:
+                        rows = cur.fetchmany(batch_size)
+                        if not rows:
+                            break
+                        yield rows
+            finally:
+                # Solo lectura: cerrar la transacción libera el cursor del servidor
+                conn.rollback()
+
+    def copy_csv(self, query, params=None, timeout=None):
+        """
+        Exporta el resultado de la consulta con COPY ... TO STDOUT (CSV con encabezado)
+        y lo entrega en bloques de bytes a medida que llega. psycopg2 solo sabe volcar
+        un COPY en un archivo, así que corre en otro hilo que escribe en una cola
+        acotada: si el cliente lee lento el COPY espera, y la memoria usada no depende
+        de cuántas filas tenga el resultado.
+        """
+        pipe = _CopyPipe()
+
+        def run():
+            try:
+                with self.get_connection() as conn:
+                    with conn.cursor() as cur:
+                        _set_timeout(cur, timeout)
+                        sql = cur.mogrify(query, params).decode(extensions.encodings[conn.encoding])
+                        cur.copy_expert(copy_csv_sql(sql), pipe, size=COPY_CHUNK_SIZE)
+                    pipe.flush()
+                    conn.rollback()
+                pipe.offer(_COPY_DONE)
+            except _CopyAborted:
+                # El lector se fue a mitad del COPY; putconn descarta la conexión si quedó sucia
+                pass
+            except Exception as e:
+                try:
+                    pipe.offer(e)
+                except _CopyAborted:
+                    pass
+
+        # El hilo del COPY corre en el contexto de la request: get_connection anota la
+        # conexión en su CancelScope (se cancela si el cliente se va) y en su traza
+        context = contextvars.copy_context()
+        threading.Thread(target=context.run, args=(run,), name="copy-csv", daemon=True).start()
+        try:
+            while True:
+                item = pipe.chunks.get()
+                if item is _COPY_DONE:
+                    return
+                if isinstance(item, Exception):
+                    raise item
+                yield item
+        finally:
+            pipe.stopped.set()
+
+    def pool_stats(self):
+        return pool_stats(self.lane)
+
+
+class PreparedAsyncCursor(psycopg.AsyncCursor):
+    """
+    Cursor asíncrono que pide a psycopg 3 preparar los Statement en el servidor.
+    psycopg lleva la cuenta de qué consultas tiene preparadas cada conexión.
+    """
+    async def execute(self, query, params=None, **kwargs):
+        if isinstance(query, Statement):
+            kwargs.setdefault("prepare", True)
+        return await super().execute(query, params, **kwargs)
+
+
+class InstrumentedAsyncCursor(PreparedAsyncCursor):
+    """
+    PreparedAsyncCursor que registra cada execute, y las lecturas si hay una traza.
+    """
+    async def execute(self, query, params=None, **kwargs):
+        if not query:
+            # Verificación de salud del pool (check_connection ejecuta "")
+            return await super().execute(query, params, **kwargs)
+        start = time.perf_counter()
+        try:
+            result = await super().execute(query, params, **kwargs)
+        except Exception as e:
+            _observe_query(query, time.perf_counter() - start, None, params, e)
+            raise
+        _observe_query(query, time.perf_counter() - start, self.rowcount, params)
+        return result
+
+    async def fetchall(self):
+        if current_span.get() is None:
+            return await super().fetchall()
+        start = time.perf_counter()
+        rows = await super().fetchall()
+        _observe_fetch(time.perf_counter() - start, rows)
+        return rows
+
+    async def fetchmany(self, size=0):
+        if current_span.get() is None:
+            return await super().fetchmany(size)
+        start = time.perf_counter()
+        rows = await super().fetchmany(size)
+        _observe_fetch(time.perf_counter() - start, rows)
+        return rows
+
+
+ASYNC_CURSOR_FACTORY = InstrumentedAsyncCursor if INSTRUMENTED else PreparedAsyncCursor
+
+
+async def _configure_async_connection(conn):
+    conn.cursor_factory = ASYNC_CURSOR_FACTORY
+
+
+class AsyncDatabase:
+    """
+    Equivalente asyncio de Database: las consultas no bloquean el event loop. Si la
+    tarea se cancela, psycopg 3 cancela también la consulta en el servidor.
+    """
+    def __init__(self, lane=OLTP, read_only=False):
+        load_dotenv()
+        self.lane = lane
+        self.read_only = read_only
+
+    async def _replica_checkout(self):
+        for replica in replica_set.candidates(_async_in_use(self.lane)):
+            pool = await get_async_pool(self.lane, replica)
+            conn = None
+            try:
+                conn = await pool.getconn()
+                if replica_set.claim_lag_check(replica):
+                    cur = await conn.execute(REPLICA_LAG)
+                    lag = (await cur.fetchone())[0]
+                    await conn.rollback()
+                    if not replica_set.record_lag(replica, lag):
+                        await pool.putconn(conn)
+                        continue
+            except psycopg.OperationalError as e:
+                # También psycopg_pool.PoolTimeout: la réplica no abrió conexiones a tiempo
+                if conn is not None:
+                    await pool.putconn(conn)
+                replica_set.mark_down(replica, e)
+                continue
+            replica_set.record_read(replica)
+            return pool, conn
+        replica_set.record_primary("fallback")
+        return None
+
+    @asynccontextmanager
+    async def get_connection(self, read_only=None, tags=()):
+        start = time.monotonic()
+        waits = acquire_waits[self.lane]
+        waiting = waits.begin()
+        try:
+            checkout = None
+            if await _use_replica_async(self.read_only if read_only is None else read_only, tags):
+                checkout = await self._replica_checkout()
+            if checkout is None:
+                pool = await get_async_pool(self.lane)
+                checkout = pool, await pool.getconn()
+        finally:
+            waits.end(waiting)
+        pool, conn = checkout
+        if INSTRUMENTED:
+            _observe_acquire(_acquire_label("async", self.lane), time.monotonic() - start)
+        try:
+            # Hace commit al salir sin errores y rollback si hubo una excepción
+            async with conn:
+                yield conn
+        finally:
+            await pool.putconn(conn)
+
+    @asynccontextmanager
+    async def get_cursor(self, timeout=None, read_only=None, tags=()):
+        async with self.get_connection(read_only, tags) as conn:
+            async with conn.cursor(row_factory=dict_row) as cur:
+                if timeout is not None:
+                    await cur.execute(SET_STATEMENT_TIMEOUT, (str(int(timeout)),))
+                yield cur
+
+    async def stream(self, query, params=None, batch_size=STREAM_BATCH_SIZE, timeout=None):
+        """
+        Equivalente asíncrono de Database.stream: generador asíncrono de lotes de filas.
+        """
+        async with self.get_connection() as conn:
+            if timeout is not None:
+                await conn.execute(SET_STATEMENT_TIMEOUT, (str(int(timeout)),))
+            async with conn.cursor(name="stream", row_factory=dict_row) as cur:
+                await cur.execute(query, params)
+                while True:
+                    rows = await cur.fetchmany(batch_size)
+                    if not rows:
+                        break
+                    yield rows
+
+    async def copy_csv(self, query, params=None, timeout=None):
+        """
+        Equivalente asíncrono de Database.copy_csv; psycopg 3 ya entrega el COPY por partes.
+        """
+        async with self.get_connection() as conn:
+            if timeout is not None:
+                await conn.execute(SET_STATEMENT_TIMEOUT, (str(int(timeout)),))
+            sql = psycopg.AsyncClientCursor(conn).mogrify(query, params)
+            async with conn.cursor() as cur:
+                async with cur.copy(copy_csv_sql(sql)) as copy:
+                    buffer = bytearray()
+                    async for data in copy:
+                        buffer += data
+                        if len(buffer) >= COPY_CHUNK_SIZE:
+                            yield bytes(buffer)
+                            buffer.clear()
+                    if buffer:
+                        yield bytes(buffer)
+
+    def pool_stats(self):
+        return async_pool_stats(self.lane)
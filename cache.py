@@ -0,0 +1,504 @@
+"""
+Caché de lecturas para las clases CRUD y de reportes.
+
+Hay dos backends con la misma interfaz (CacheBackend), elegidos con CACHE_BACKEND:
+
+- "memory" (default): diccionario en memoria del proceso. Con varios workers de
+  uvicorn cada uno tiene su copia y las invalidaciones no se propagan.
+- "sqlite": archivo SQLite compartido por todos los workers del host (por defecto
+  en un directorio privado del usuario, ver localfiles.py). Se llena una sola vez y
+  una invalidación la ven todos de inmediato.
+
+Cada entrada vence a los CACHE_TTL segundos y, al superar CACHE_MAX_ENTRIES, se
+descarta la menos usada recientemente. Las entradas llevan tags (tabla, usuario,
+cancha) y las escrituras de crud.py/userCrud.py invalidan los tags que tocan,
+después del commit. Solo se cachean respuestas exitosas.
+"""
+import asyncio
+import hashlib
+import os
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+
+import orjson
+
+from localfiles import default_path, prepare
+from rendering import dumps
+from replicas import recent_writes
+
+CACHE_ENABLED = os.getenv("CACHE_ENABLED", "1") != "0"
+CACHE_BACKEND = os.getenv("CACHE_BACKEND", "memory").lower()
+CACHE_TTL = float(os.getenv("CACHE_TTL", "60"))
+CACHE_MAX_ENTRIES = int(os.getenv("CACHE_MAX_ENTRIES", "1024"))
+CACHE_SQLITE_PATH = os.getenv("CACHE_SQLITE_PATH") or default_path("canchas-cache.sqlite3")
+
+# Tags de catálogos
+COURTS = "courts"
+COURT_TYPES = "court_types"
+PROMOTIONS = "promotions"
+# Tags de datos que cambian con las escrituras de la API
+USERS = "users"
+SCHEDULES = "schedules"
+
+
+def user_tag(id_user):
+    return f"user:{id_user}"
+
+
+def user_bookings_tag(id_user):
+    return f"user_bookings:{id_user}"
+
+
+def court_schedules_tag(id_court):
+    return f"court_schedules:{id_court}"
+
+
+_MISSING = object()
+
+
+class CacheBackend:
+    """
+    Interfaz común de los backends. Las subclases implementan get, set, invalidate,
+    clear, generation y stats; get_or_load está resuelto acá sobre esas operaciones.
+
+    `generation(tags)` es una marca de las invalidaciones de esos tags: se toma antes
+    de consultar la base y se pasa a set(), que no guarda el valor si algún tag se
+    invalidó mientras tanto (el valor pudo leerse antes de la escritura).
+
+    `blocking` indica que las operaciones hacen E/S que puede esperar (sqlite, con
+    BEGIN IMMEDIATE y busy timeout): get_or_load_async e invalidate_async las corren
+    en un hilo para no frenar el event loop.
+    """
+    enabled = True
+    blocking = False
+
+    def get(self, key, default=None):
+        raise NotImplementedError
+
+    def set(self, key, value, tags=(), ttl=None, generation=None):
+        raise NotImplementedError
+
+    def invalidate(self, *tags):
+        raise NotImplementedError
+
+    def clear(self):
+        raise NotImplementedError
+
+    def generation(self, tags):
+        raise NotImplementedError
+
+    def stats(self):
+        raise NotImplementedError
+
+    def get_or_load(self, key, loader, tags=()):
+        """
+        Retorna el valor cacheado o llama a `loader()` y guarda su resultado si fue exitoso.
+        """
+        if not self.enabled:
+            return loader()
+        value = self.get(key, _MISSING)
+        if value is _MISSING:
+            generation = self.generation(tags)
+            value = loader()
+            if value.get("success"):
+                self.set(key, value, tags, generation=generation)
+        return value
+
+    async def get_or_load_async(self, key, loader, tags=()):
+        if not self.enabled:
+            return await loader()
+        value = await self._run(self.get, key, _MISSING)
+        if value is _MISSING:
+            generation = await self._run(self.generation, tags)
+            value = await loader()
+            if value.get("success"):
+                await self._run(self.set, key, value, tags, generation=generation)
+        return value
+
+    async def _run(self, fn, *args, **kwargs):
+        if self.blocking:
+            return await asyncio.to_thread(fn, *args, **kwargs)
+        return fn(*args, **kwargs)
+
+
+class TTLCache(CacheBackend):
+    """
+    Backend en memoria: diccionario con vencimiento por entrada, tamaño máximo con
+    desalojo LRU e invalidación por tags. Seguro entre hilos.
+    """
+    def __init__(self, maxsize=CACHE_MAX_ENTRIES, ttl=CACHE_TTL, enabled=CACHE_ENABLED):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self.enabled = enabled
+        self._entries = OrderedDict()   # key -> (value, expires_at, tags)
+        self._tags = {}                  # tag -> set(keys)
+        self._generations = {}           # tag -> contador de invalidaciones
+        self._epoch = 0                  # se incrementa con clear()
+        self._lock = threading.Lock()
+        self._hits = 0
+        self._misses = 0
+        self._evictions = 0
+        self._expirations = 0
+        self._invalidations = 0
+
+    def get(self, key, default=None):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                self._misses += 1
+                return default
+            if entry[1] <= time.monotonic():
+                self._remove(key)
+                self._expirations += 1
+                self._misses += 1
+                return default
+            self._entries.move_to_end(key)
+            self._hits += 1
+            return entry[0]
+
+    def set(self, key, value, tags=(), ttl=None, generation=None):
+        if not self.enabled:
+            return
+        expires_at = time.monotonic() + (self.ttl if ttl is None else ttl)
+        with self._lock:
+            if generation is not None and generation != self._generation(tags):
+                return
+            if key in self._entries:
+                self._remove(key)
+            self._entries[key] = (value, expires_at, tuple(tags))
+            for tag in tags:
+                self._tags.setdefault(tag, set()).add(key)
+            while len(self._entries) > self.maxsize:
+                self._remove(next(iter(self._entries)))
+                self._evictions += 1
+
+    def invalidate(self, *tags):
+        """
+        Borra todas las entradas con alguno de los tags. Retorna cuántas borró.
+        """
+        with self._lock:
+            keys = set()
+            for tag in tags:
+                keys |= self._tags.get(tag, set())
+            for key in keys:
+                self._remove(key)
+            for tag in tags:
+                self._generations[tag] = self._generations.get(tag, 0) + 1
+            self._invalidations += len(keys)
+            return len(keys)
+
+    def clear(self):
+        with self._lock:
+            count = len(self._entries)
+            self._epoch += 1
+            self._invalidations += count
+            self._entries.clear()
+            self._tags.clear()
+            return count
+
+    def generation(self, tags):
+        with self._lock:
+            return self._generation(tags)
+
+    def _generation(self, tags):
+        return (self._epoch,) + tuple(self._generations.get(tag, 0) for tag in tags)
+
+    def _remove(self, key):
+        _, _, tags = self._entries.pop(key)
+        for tag in tags:
+            keys = self._tags.get(tag)
+            if keys is not None:
+                keys.discard(key)
+                if not keys:
+                    del self._tags[tag]
+
+    def stats(self):
+        with self._lock:
+            lookups = self._hits + self._misses
+            return {
+                "backend": "memory",
+                "enabled": self.enabled,
+                "entries": len(self._entries),
+                "maxsize": self.maxsize,
+                "ttl": self.ttl,
+                "hits": self._hits,
+                "misses": self._misses,
+                "hit_ratio": round(self._hits / lookups, 4) if lookups else None,
+                "evictions": self._evictions,
+                "expirations": self._expirations,
+                "invalidations": self._invalidations,
+            }
+
+
+SQLITE_SCHEMA = """
+    CREATE TABLE IF NOT EXISTS entries (
+        key        TEXT PRIMARY KEY,
+        value      BLOB NOT NULL,
+        expires_at REAL NOT NULL,
+        last_used  REAL NOT NULL
+    );
+    CREATE TABLE IF NOT EXISTS entry_tags (
+        tag TEXT NOT NULL,
+        key TEXT NOT NULL,
+        PRIMARY KEY (tag, key)
+    ) WITHOUT ROWID;
+    CREATE INDEX IF NOT EXISTS entry_tags_key ON entry_tags (key);
+    CREATE TABLE IF NOT EXISTS tag_versions (
+        tag     TEXT PRIMARY KEY,
+        version INTEGER NOT NULL
+    );
+"""
+
+# Tag implícito de todas las entradas, para que clear() también invalide cargas en curso
+_ALL = "*"
+
+
+class SQLiteCache(CacheBackend):
+    """
+    Backend compartido entre procesos sobre un archivo SQLite (modo WAL). Los valores
+    se guardan como JSON, con las mismas conversiones que la respuesta (Decimal como
+    número, fechas y horas en ISO 8601): leer el archivo nunca ejecuta código, y lo
+    que sale de la caché se serializa igual que lo que salió de la base. Las
+    versiones de tags también viven en el archivo, así que una invalidación en un
+    worker descarta las cargas en curso de los demás.
+
+    Los contadores de aciertos/fallos son del proceso; las entradas son globales.
+    """
+    # Solo se actualiza last_used si pasó al menos esto desde el último uso (evita
+    # una escritura por cada acierto)
+    TOUCH_INTERVAL = 1.0
+    blocking = True
+
+    def __init__(self, path=CACHE_SQLITE_PATH, maxsize=CACHE_MAX_ENTRIES, ttl=CACHE_TTL, enabled=CACHE_ENABLED):
+        self.path = path
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self.enabled = enabled
+        self._local = threading.local()
+        self._lock = threading.Lock()
+        self._hits = 0
+        self._misses = 0
+        self._evictions = 0
+        self._expirations = 0
+        self._invalidations = 0
+        if enabled:
+            self._conn().executescript(SQLITE_SCHEMA)
+
+    def _conn(self):
+        # Una conexión por hilo (y por proceso, por si el módulo se importó antes de un fork)
+        conn = getattr(self._local, "conn", None)
+        if conn is None or self._local.pid != os.getpid():
+            prepare(self.path)
+            conn = sqlite3.connect(self.path, timeout=5, isolation_level=None, check_same_thread=False)
+            conn.execute("PRAGMA journal_mode=WAL;")
+            conn.execute("PRAGMA synchronous=OFF;")
+            self._local.conn = conn
+            self._local.pid = os.getpid()
+        return conn
+
+    def _count(self, name, n=1):
+        with self._lock:
+            setattr(self, name, getattr(self, name) + n)
+
+    def _write(self, conn, fn):
+        """
+        Ejecuta fn(conn) dentro de BEGIN IMMEDIATE ... COMMIT (ROLLBACK si falla).
+        """
+        conn.execute("BEGIN IMMEDIATE;")
+        try:
+            result = fn(conn)
+            conn.execute("COMMIT;")
+            return result
+        except BaseException:
+            conn.execute("ROLLBACK;")
+            raise
+
+    def get(self, key, default=None):
+        conn = self._conn()
+        k = repr(key)
+        row = conn.execute(
+            "SELECT value, expires_at, last_used FROM entries WHERE key = ?;", (k,)
+        ).fetchone()
+        now = time.time()
+        if row is None:
+            self._count("_misses")
+            return default
+        value, expires_at, last_used = row
+        if expires_at <= now:
+            def expire(conn):
+                conn.execute("DELETE FROM entries WHERE key = ? AND expires_at <= ?;", (k, now))
+                conn.execute("DELETE FROM entry_tags WHERE key = ?;", (k,))
+            self._write(conn, expire)
+            self._count("_expirations")
+            self._count("_misses")
+            return default
+        if now - last_used > self.TOUCH_INTERVAL:
+            conn.execute("UPDATE entries SET last_used = ? WHERE key = ?;", (now, k))
+        try:
+            value = orjson.loads(value)
+        except orjson.JSONDecodeError:
+            # Entrada de un formato anterior: se trata como fallo y set() la reemplaza
+            self._count("_misses")
+            return default
+        self._count("_hits")
+        return value
+
+    def set(self, key, value, tags=(), ttl=None, generation=None):
+        if not self.enabled:
+            return
+        k = repr(key)
+        blob = dumps(value)
+
+        def store(conn):
+            if generation is not None and generation != self._generation(conn, tags):
+                return 0
+            now = time.time()
+            conn.execute(
+                "INSERT OR REPLACE INTO entries (key, value, expires_at, last_used) VALUES (?, ?, ?, ?);",
+                (k, blob, now + (self.ttl if ttl is None else ttl), now),
+            )
+            conn.execute("DELETE FROM entry_tags WHERE key = ?;", (k,))
+            conn.executemany(
+                "INSERT INTO entry_tags (tag, key) VALUES (?, ?);", [(tag, k) for tag in set(tags)]
+            )
+            return self._evict(conn, now)
+
+        evicted = self._write(self._conn(), store)
+        if evicted:
+            self._count("_evictions", evicted)
+
+    def _evict(self, conn, now):
+        conn.execute("DELETE FROM entries WHERE expires_at <= ?;", (now,))
+        (count,) = conn.execute("SELECT COUNT(*) FROM entries;").fetchone()
+        evicted = 0
+        if count > self.maxsize:
+            evicted = conn.execute("""
+                DELETE FROM entries WHERE key IN (
+                    SELECT key FROM entries ORDER BY last_used LIMIT ?
+                );
+            """, (count - self.maxsize,)).rowcount
+        conn.execute("DELETE FROM entry_tags WHERE key NOT IN (SELECT key FROM entries);")
+        return evicted
+
+    def invalidate(self, *tags):
+        if not tags:
+            return 0
+        marks = ", ".join("?" for _ in tags)
+
+        def drop(conn):
+            removed = conn.execute(f"""
+                DELETE FROM entries WHERE key IN (
+                    SELECT key FROM entry_tags WHERE tag IN ({marks})
+                );
+            """, tags).rowcount
+            conn.execute("DELETE FROM entry_tags WHERE key NOT IN (SELECT key FROM entries);")
+            self._bump(conn, tags)
+            return removed
+
+        removed = self._write(self._conn(), drop)
+        self._count("_invalidations", removed)
+        return removed
+
+    def clear(self):
+        def drop_all(conn):
+            removed = conn.execute("DELETE FROM entries;").rowcount
+            conn.execute("DELETE FROM entry_tags;")
+            self._bump(conn, (_ALL,))
+            return removed
+
+        removed = self._write(self._conn(), drop_all)
+        self._count("_invalidations", removed)
+        return removed
+
+    def _bump(self, conn, tags):
+        conn.executemany("""
+            INSERT INTO tag_versions (tag, version) VALUES (?, 1)
+            ON CONFLICT (tag) DO UPDATE SET version = version + 1;
+        """, [(tag,) for tag in tags])
+
+    def generation(self, tags):
+        return self._generation(self._conn(), tags)
+
+    def _generation(self, conn, tags):
+        tags = (_ALL,) + tuple(tags)
+        marks = ", ".join("?" for _ in tags)
+        versions = dict(conn.execute(
+            f"SELECT tag, version FROM tag_versions WHERE tag IN ({marks});", tags
+        ).fetchall())
+        return tuple(versions.get(tag, 0) for tag in tags)
+
+    def stats(self):
+        entries = self._conn().execute("SELECT COUNT(*) FROM entries;").fetchone()[0] if self.enabled else 0
+        with self._lock:
+            lookups = self._hits + self._misses
+            return {
+                "backend": "sqlite",
+                "path": self.path,
+                "enabled": self.enabled,
+                "entries": entries,
+                "maxsize": self.maxsize,
+                "ttl": self.ttl,
+                "hits": self._hits,
+                "misses": self._misses,
+                "hit_ratio": round(self._hits / lookups, 4) if lookups else None,
+                "evictions": self._evictions,
+                "expirations": self._expirations,
+                "invalidations": self._invalidations,
+            }
+
+
+def make_cache(backend=CACHE_BACKEND):
+    if backend == "memory":
+        return TTLCache()
+    if backend == "sqlite":
+        return SQLiteCache()
+    raise ValueError(f"CACHE_BACKEND desconocido: {backend} (usar memory o sqlite)")
+
+
+# Caché compartida por las clases CRUD/reportes del proceso
+query_cache = make_cache()
+
+
+def invalidate(*tags):
+    """
+    Hook para las escrituras: borra las entradas con esos tags (sin tags, todo).
+    Llamarlo después del commit; si no, otra request podría volver a cachear el dato viejo.
+    Con réplicas de lectura además anota los tags como recién escritos, para que las
+    lecturas que los usan vayan al primario mientras las réplicas se ponen al día.
+    Retorna cuántas entradas borró.
+    """
+    if recent_writes is not None:
+        recent_writes.mark(*tags)
+    if not tags:
+        return query_cache.clear()
+    return query_cache.invalidate(*tags)
+
+
+async def invalidate_async(*tags):
+    """
+    invalidate para los caminos asíncronos (AsyncCourtCrud, AsyncUserCrud, AsyncAuth y
+    los endpoints): con el backend sqlite, de la caché o de las marcas de escritura,
+    corre en un hilo.
+    """
+    if query_cache.blocking or (recent_writes is not None and recent_writes.blocking):
+        return await asyncio.to_thread(invalidate, *tags)
+    return invalidate(*tags)
+
+
+def etag_for(body):
+    """
+    ETag débil derivado del contenido ya serializado.
+    """
+    return 'W/"' + hashlib.sha1(body).hexdigest()[:20] + '"'
+
+
+def etag_matches(if_none_match, etag):
+    if not if_none_match:
+        return False
+    if if_none_match.strip() == "*":
+        return True
+    candidates = [tag.strip() for tag in if_none_match.split(",")]
+    # La comparación de If-None-Match es débil: se ignora el prefijo W/
+    return etag.removeprefix("W/") in [c.removeprefix("W/") for c in candidates]
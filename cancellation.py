@@ -0,0 +1,123 @@
+"""
+Cancelación de consultas cuando el cliente HTTP se desconecta.
+
+CancelOnDisconnectMiddleware corre el endpoint en su propia tarea y, mientras tanto,
+espera el http.disconnect del servidor. Si el cliente se va antes de recibir la
+respuesta:
+
+- en modo async cancela la tarea; psycopg 3 cancela la consulta en el servidor al
+  recibir el CancelledError;
+- en modo sync la consulta corre en el threadpool, donde cancelar la tarea no la
+  detiene: Database.get_connection anota sus conexiones en el CancelScope de la
+  request (current_cancel, que los hilos de run_in_threadpool heredan) y el
+  middleware les envía un pedido de cancelación (connection.cancel()).
+
+Solo se aplica a las requests que `match(method, path)` elige (en main.py, los GET de
+reportes y disponibilidad): no tienen cuerpo y no escriben, así que cortarlas a la
+mitad no deja nada a medias.
+"""
+import asyncio
+import threading
+from contextvars import ContextVar
+
+current_cancel = ContextVar("current_cancel", default=None)
+
+
+class CancelScope:
+    """
+    Conexiones psycopg2 que está usando una request. Se anotan desde los hilos del
+    threadpool y se cancelan desde el event loop.
+    """
+    def __init__(self):
+        self.cancelled = False
+        self._conns = set()
+        self._lock = threading.Lock()
+
+    def add(self, conn):
+        with self._lock:
+            self._conns.add(conn)
+
+    def discard(self, conn):
+        with self._lock:
+            self._conns.discard(conn)
+
+    def cancel(self):
+        with self._lock:
+            self.cancelled = True
+            conns = list(self._conns)
+        for conn in conns:
+            try:
+                conn.cancel()
+            except Exception:
+                # La conexión pudo cerrarse o terminar la consulta mientras tanto
+                pass
+
+
+class CancelOnDisconnectMiddleware:
+    """
+    Middleware ASGI. Debe quedar por dentro de los demás para que la tarea que se
+    cancela sea solo la del endpoint.
+    """
+    def __init__(self, app, match):
+        self.app = app
+        self.match = match
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http" or not self.match(scope["method"], scope["path"]):
+            await self.app(scope, receive, send)
+            return
+
+        # Se lee el cuerpo (vacío en un GET) antes de empezar: después, lo único que
+        # puede llegar por receive es el http.disconnect
+        messages = []
+        while True:
+            message = await receive()
+            if message["type"] == "http.disconnect":
+                return
+            messages.append(message)
+            if not message.get("more_body"):
+                break
+
+        disconnected = asyncio.Event()
+        complete = False
+
+        async def app_receive():
+            if messages:
+                return messages.pop(0)
+            await disconnected.wait()
+            return {"type": "http.disconnect"}
+
+        async def app_send(message):
+            nonlocal complete
+            if message["type"] == "http.response.body" and not message.get("more_body"):
+                complete = True
+            await send(message)
+
+        cancel_scope = CancelScope()
+        token = current_cancel.set(cancel_scope)
+        try:
+            # La tarea copia el contexto actual, con el CancelScope ya puesto
+            task = asyncio.ensure_future(self.app(scope, app_receive, app_send))
+        finally:
+            current_cancel.reset(token)
+        watcher = asyncio.ensure_future(receive())
+        try:
+            await asyncio.wait((task, watcher), return_when=asyncio.FIRST_COMPLETED)
+        except asyncio.CancelledError:
+            task.cancel()
+            raise
+        finally:
+            if not watcher.done():
+                watcher.cancel()
+
+        if not task.done() and not complete:
+            # El servidor avisó que el cliente se fue (al terminar la respuesta también
+            # avisa, por eso se mira `complete`)
+            disconnected.set()
+            cancel_scope.cancel()
+            task.cancel()
+        try:
+            await task
+        except asyncio.CancelledError:
+            if not cancel_scope.cancelled:
+                raise
@@ -1,200 +1,669 @@
+import os
+from datetime import date, time, timedelta
+
+import psycopg
 import psycopg2
-from bd import Database
+from bd import AsyncDatabase, Database, Statement
+from cache import (
+    COURT_TYPES, COURTS, SCHEDULES, court_schedules_tag, invalidate, invalidate_async, query_cache, user_bookings_tag,
+)
+from rollups import apply_new_bookings, apply_new_bookings_async, move_booking_status, move_booking_status_async
+
+GET_ALL_COURTS = Statement("get_all_courts", """
+    SELECT c.id_court, c.description, c.price_per_hour, ct.type_name
+    FROM courts c
+    JOIN court_types ct ON c.id_type = ct.id_type
+    ORDER BY c.id_court;
+""")
+
+GET_COURTS_BY_TYPE = Statement("get_courts_by_type", """
+    SELECT c.id_court, c.description, c.price_per_hour, ct.type_name
+    FROM courts c
+    JOIN court_types ct ON c.id_type = ct.id_type
+    WHERE c.id_type = %s
+    ORDER BY c.id_court;
+""")
+
+GET_COURT_DETAILS = Statement("get_court_details", """
+    SELECT c.id_court, c.description, c.price_per_hour, ct.type_name
+    FROM courts c
+    JOIN court_types ct ON c.id_type = ct.id_type
+    WHERE c.id_court = %s;
+""")
+
+GET_UNAVAILABLE_SCHEDULES = Statement("get_unavailable_schedules", """
+    SELECT s.id_schedule, s.schedule_date, s.start_time, s.end_time
+    FROM schedules s
+    JOIN booking_details bd ON s.id_schedule = bd.id_schedule
+    JOIN bookings b ON bd.id_booking = b.id_booking
+    WHERE s.id_court = %s AND b.status <> 'cancelled'
+    ORDER BY s.schedule_date, s.start_time;
+""")
+
+INSERT_SCHEDULE = Statement("insert_schedule", """
+    INSERT INTO schedules (id_court, schedule_date, start_time, end_time)
+    VALUES (%s, %s, %s, %s)
+    RETURNING id_schedule;
+""")
+
+INSERT_BOOKING = Statement("insert_booking", """
+    INSERT INTO bookings (id_user, booking_date, status)
+    VALUES (%s, CURRENT_DATE, 'pending')
+    RETURNING id_booking;
+""")
+
+INSERT_BOOKING_DETAIL = Statement("insert_booking_detail", """
+    INSERT INTO booking_details (id_booking, id_schedule)
+    VALUES (%s, %s);
+""")
+
+# Serializa las reservas de una misma cancha y día: clave de dos enteros
+# (cancha, días desde 2000-01-01), liberada al terminar la transacción
+LOCK_COURT_DAY = Statement("lock_court_day", """
+    SELECT pg_advisory_xact_lock(%s, %s::DATE - DATE '2000-01-01');
+""")
+
+# Reservas no canceladas de la cancha que se solapan con [start_time, end_time)
+# Parámetros: id_court, schedule_date, end_time, start_time
+FIND_OVERLAPS = Statement("find_overlaps", """
+    SELECT b.id_booking, s.schedule_date, s.start_time, s.end_time
+    FROM schedules s
+    JOIN booking_details bd ON bd.id_schedule = s.id_schedule
+    JOIN bookings b ON b.id_booking = bd.id_booking
+    WHERE s.id_court = %s
+      AND s.schedule_date = %s
+      AND b.status <> 'cancelled'
+      AND s.start_time < %s
+      AND s.end_time > %s;
+""")
+
+# Canchas y días de una reserva, en orden fijo para tomar los locks sin deadlocks
+GET_BOOKING_COURT_DAYS = Statement("get_booking_court_days", """
+    SELECT DISTINCT s.id_court, s.schedule_date
+    FROM booking_details bd
+    JOIN schedules s ON bd.id_schedule = s.id_schedule
+    WHERE bd.id_booking = %s
+    ORDER BY s.id_court, s.schedule_date;
+""")
+
+# Otras reservas no canceladas que se solapan con los horarios de una reserva
+# Parámetros: id_booking, id_booking
+FIND_BOOKING_OVERLAPS = Statement("find_booking_overlaps", """
+    SELECT DISTINCT o.id_booking, os.schedule_date, os.start_time, os.end_time
+    FROM booking_details bd
+    JOIN schedules s ON s.id_schedule = bd.id_schedule
+    JOIN schedules os ON os.id_court = s.id_court
+                     AND os.schedule_date = s.schedule_date
+                     AND os.start_time < s.end_time
+                     AND os.end_time > s.start_time
+    JOIN booking_details obd ON obd.id_schedule = os.id_schedule
+    JOIN bookings o ON o.id_booking = obd.id_booking
+    WHERE bd.id_booking = %s AND o.id_booking <> %s AND o.status <> 'cancelled';
+""")
+
+# Versión por lotes de LOCK_COURT_DAY: un lock por día distinto, en orden
+# Parámetros: id_court, fechas[]
+LOCK_COURT_DAYS = Statement("lock_court_days", """
+    SELECT pg_advisory_xact_lock(%s, dia - DATE '2000-01-01')
+    FROM (SELECT DISTINCT dia FROM unnest(%s::DATE[]) AS dia ORDER BY dia) dias;
+""")
+
+# Reservas no canceladas que chocan con cada horario del lote (slot = posición en el lote)
+# Parámetros: fechas[], inicios[], fines[], id_court (las horas van como texto para admitir 24:00)
+FIND_BATCH_OVERLAPS = Statement("find_batch_overlaps", """
+    SELECT (x.ord - 1)::INT AS slot, b.id_booking, s.schedule_date, s.start_time, s.end_time
+    FROM unnest(%s::DATE[], %s::TEXT[]::TIME[], %s::TEXT[]::TIME[])
+         WITH ORDINALITY AS x(schedule_date, start_time, end_time, ord)
+    JOIN schedules s ON s.id_court = %s
+                    AND s.schedule_date = x.schedule_date
+                    AND s.start_time < x.end_time
+                    AND s.end_time > x.start_time
+    JOIN booking_details bd ON bd.id_schedule = s.id_schedule
+    JOIN bookings b ON b.id_booking = bd.id_booking
+    WHERE b.status <> 'cancelled'
+    ORDER BY slot, s.start_time;
+""")
+
+# Inserta horarios, reservas y detalles de todo el lote en una sola sentencia. Los
+# ids se piden antes a las secuencias para poder enlazar cada horario con su reserva.
+# Parámetros: fechas[], inicios[], fines[], slots[], id_court, id_user
+INSERT_BOOKINGS_BATCH = Statement("insert_bookings_batch", """
+    WITH lote AS MATERIALIZED (
+        SELECT x.schedule_date, x.start_time, x.end_time, x.slot,
+               nextval(pg_get_serial_sequence('schedules', 'id_schedule')) AS id_schedule,
+               nextval(pg_get_serial_sequence('bookings', 'id_booking')) AS id_booking
+        FROM unnest(%s::DATE[], %s::TEXT[]::TIME[], %s::TEXT[]::TIME[], %s::INT[])
+             AS x(schedule_date, start_time, end_time, slot)
+    ), horarios AS (
+        INSERT INTO schedules (id_schedule, id_court, schedule_date, start_time, end_time)
+        SELECT id_schedule, %s, schedule_date, start_time, end_time FROM lote
+    ), reservas AS (
+        INSERT INTO bookings (id_booking, id_user, booking_date, status)
+        SELECT id_booking, %s, CURRENT_DATE, 'pending' FROM lote
+    ), detalles AS (
+        INSERT INTO booking_details (id_booking, id_schedule)
+        SELECT id_booking, id_schedule FROM lote
+    )
+    SELECT slot, id_booking::INT, id_schedule::INT, schedule_date, start_time, end_time
+    FROM lote
+    ORDER BY slot;
+""")
+
+# Retorna también el estado anterior (para mover la reserva entre buckets de los
+# rollups), el usuario y las canchas (para invalidar la caché)
+UPDATE_BOOKING_STATUS = Statement("update_booking_status", """
+    WITH anterior AS (
+        SELECT id_booking, status FROM bookings WHERE id_booking = %s FOR UPDATE
+    )
+    UPDATE bookings b
+    SET status = %s
+    FROM anterior
+    WHERE b.id_booking = anterior.id_booking
+    RETURNING b.id_booking, b.status, anterior.status AS old_status, b.id_user,
+              ARRAY(
+                  SELECT DISTINCT s.id_court
+                  FROM booking_details bd
+                  JOIN schedules s ON bd.id_schedule = s.id_schedule
+                  WHERE bd.id_booking = b.id_booking
+              ) AS courts;
+""")
+
+
+def _parse_time(value):
+    if isinstance(value, time):
+        return value
+    if value in ("24:00", "24:00:00"):
+        return time.max
+    return time.fromisoformat(value)
+
+
+def _invalid_range(start_time, end_time):
+    """
+    Retorna un mensaje de error si el rango horario no es válido, o None.
+    """
+    try:
+        if _parse_time(end_time) <= _parse_time(start_time):
+            return "end_time debe ser posterior a start_time"
+    except (TypeError, ValueError):
+        return "start_time y end_time deben tener formato HH:MM"
+    return None
+
+
+# Máximo de horarios por lote en /bookings/batch
+BATCH_MAX_SLOTS = int(os.getenv("BOOKING_BATCH_MAX_SLOTS", "200"))
+
+
+def _parse_date(value, name):
+    if isinstance(value, date):
+        return value
+    try:
+        return date.fromisoformat(str(value))
+    except ValueError:
+        raise ValueError(f"{name} debe tener formato YYYY-MM-DD")
+
+
+def recurrence_slots(start_date, weeks, start_time, end_time, weekdays=None):
+    """
+    Expande una regla semanal ("todos los martes de 19:00 a 21:00 por 12 semanas")
+    a una lista de horarios (fecha, inicio, fin). weekdays usa 1 = lunes ... 7 = domingo
+    y por defecto es el día de start_date.
+    """
+    first = _parse_date(start_date, "start_date")
+    if not 1 <= weeks <= 104:
+        raise ValueError("weeks debe estar entre 1 y 104")
+    weekdays = set(weekdays or [first.isoweekday()])
+    if not weekdays <= set(range(1, 8)):
+        raise ValueError("weekdays debe contener días entre 1 (lunes) y 7 (domingo)")
+    days = (first + timedelta(days=i) for i in range(weeks * 7))
+    return [(day, start_time, end_time) for day in days if day.isoweekday() in weekdays]
+
+
+def batch_slots(slots):
+    """
+    Valida los horarios de un lote y los retorna como tres listas paralelas
+    (fechas, inicios, fines). Lanza ValueError si algún horario no es válido o si
+    dos horarios del mismo lote se solapan entre sí.
+    """
+    if not slots:
+        raise ValueError("El lote no tiene horarios")
+    if len(slots) > BATCH_MAX_SLOTS:
+        raise ValueError(f"El lote no puede tener más de {BATCH_MAX_SLOTS} horarios")
+    dates, starts, ends = [], [], []
+    for schedule_date, start_time, end_time in slots:
+        error = _invalid_range(start_time, end_time)
+        if error:
+            raise ValueError(f"{schedule_date} {start_time}-{end_time}: {error}")
+        dates.append(_parse_date(schedule_date, "schedule_date"))
+        starts.append(start_time)
+        ends.append(end_time)
+
+    order = sorted(range(len(slots)), key=lambda i: (dates[i], _parse_time(starts[i])))
+    for prev, cur in zip(order, order[1:]):
+        if dates[prev] == dates[cur] and _parse_time(starts[cur]) < _parse_time(ends[prev]):
+            raise ValueError(
+                f"Los horarios {dates[prev]} {starts[prev]}-{ends[prev]} y "
+                f"{starts[cur]}-{ends[cur]} del lote se solapan"
+            )
+    return dates, starts, ends
+
+
+def _conflict(conflicts):
+    return {
+        "success": False,
+        "conflict": True,
+        "error": "El horario se solapa con otra reserva de la cancha",
+        "conflicts": conflicts,
+    }
+
+
+def _batch_result(rows, conflicts, atomic):
+    """
+    Arma la respuesta de un lote a partir de las reservas creadas y los conflictos.
+    """
+    if conflicts and (atomic or not rows):
+        return _conflict(conflicts)
+    return {"success": True, "bookings": rows, "conflicts": conflicts}
+
+
+def _find_reactivation_conflicts(cur, id_booking):
+    """
+    Al sacar una reserva de 'cancelled' sus horarios vuelven a ocuparse: bloquea
+    sus canchas/días y busca reservas activas que se solapen con ellos.
+    """
+    cur.execute(GET_BOOKING_COURT_DAYS, (id_booking,))
+    for row in cur.fetchall():
+        cur.execute(LOCK_COURT_DAY, (row["id_court"], row["schedule_date"]))
+    cur.execute(FIND_BOOKING_OVERLAPS, (id_booking, id_booking))
+    return cur.fetchall()
+
+
+async def _find_reactivation_conflicts_async(cur, id_booking):
+    await cur.execute(GET_BOOKING_COURT_DAYS, (id_booking,))
+    for row in await cur.fetchall():
+        await cur.execute(LOCK_COURT_DAY, (row["id_court"], row["schedule_date"]))
+    await cur.execute(FIND_BOOKING_OVERLAPS, (id_booking, id_booking))
+    return await cur.fetchall()
+
+
+# Lecturas que pueden ir a una réplica (replicas.py). Los horarios y la disponibilidad
+# deciden si una reserva entra y se leen siempre del primario
+CATALOG = (COURTS, COURT_TYPES)
+
+
+def _user_bookings_tags(id_user):
+    # Incluye user_bookings:<id>: tras reservar, el usuario lee del primario (ver replicas.py)
+    return (user_bookings_tag(id_user),) + CATALOG
+
+
+def _booking_tags(result):
+    """
+    Saca de la fila de UPDATE_BOOKING_STATUS los campos internos y retorna los tags
+    de caché que afecta el cambio de estado.
+    """
+    id_user = result.pop("id_user")
+    courts = result.pop("courts")
+    return [user_bookings_tag(id_user)] + [court_schedules_tag(c) for c in courts]
+
+
+GET_USER_PENDING_BOOKINGS = Statement("get_user_pending_bookings", """
+    SELECT
+        b.id_booking,
+        s.schedule_date,
+        s.start_time,
+        s.end_time,
+        c.description AS court_description,
+        ct.type_name AS court_type
+    FROM bookings b
+    JOIN booking_details bd ON b.id_booking = bd.id_booking
+    JOIN schedules s ON bd.id_schedule = s.id_schedule
+    JOIN courts c ON s.id_court = c.id_court
+    JOIN court_types ct ON c.id_type = ct.id_type
+    WHERE b.id_user = %s AND b.status = 'pending'
+    ORDER BY s.schedule_date, s.start_time;
+""")
+
+GET_USER_CONFIRMED_BOOKINGS = Statement("get_user_confirmed_bookings", """
+    SELECT
+        b.id_booking,
+        s.schedule_date,
+        s.start_time,
+        s.end_time,
+        c.description AS court_description,
+        ct.type_name AS court_type
+    FROM bookings b
+    JOIN booking_details bd ON b.id_booking = bd.id_booking
+    JOIN schedules s ON bd.id_schedule = s.id_schedule
+    JOIN courts c ON s.id_court = c.id_court
+    JOIN court_types ct ON c.id_type = ct.id_type
+    WHERE b.id_user = %s AND b.status = 'confirmed'
+    ORDER BY s.schedule_date, s.start_time;
+""")
+
+GET_AVAILABLE_SCHEDULES = Statement("get_available_schedules", """
+    SELECT s.id_schedule, s.schedule_date, s.start_time, s.end_time
+    FROM schedules s
+    WHERE s.id_court = %s
+    AND NOT EXISTS (
+        SELECT 1
+        FROM booking_details bd
+        JOIN bookings b ON bd.id_booking = b.id_booking
+        WHERE bd.id_schedule = s.id_schedule AND b.status <> 'cancelled'
+    )
+    ORDER BY s.schedule_date, s.start_time;
+""")
+
+GET_ALL_COURT_TYPES = Statement("get_all_court_types", """
+    SELECT id_type, type_name
+    FROM court_types
+    ORDER BY id_type;
+""")
+
 
 class CourtCrud:
     def __init__(self):
         self.db = Database()
 
-    def get_all_courts(self):
+    def _fetch_all(self, query, params=None, tags=None):
+        """
+        Con `tags` (los de la entrada de caché) la lectura puede ir a una réplica, salvo
+        que alguno se haya escrito hace poco (ver replicas.py).
+        """
         try:
-            with self.db.get_cursor() as cur:
-                cur.execute("""
-                    SELECT c.id_court, c.description, c.price_per_hour, ct.type_name
-                    FROM courts c
-                    JOIN court_types ct ON c.id_type = ct.id_type
-                    ORDER BY c.id_court;
-                """)
+            with self.db.get_cursor(read_only=tags is not None, tags=tags or ()) as cur:
+                cur.execute(query, params)
                 data = cur.fetchall()
                 return {"success": True, "data": data}
         except psycopg2.Error as e:
             return {"success": False, "error": str(e).split('\n')[0]}
 
+    def get_all_courts(self):
+        return query_cache.get_or_load(
+            ("get_all_courts",), lambda: self._fetch_all(GET_ALL_COURTS, tags=CATALOG), CATALOG
+        )
+
     def get_courts_by_type(self, id_type):
-        try:
-            with self.db.get_cursor() as cur:
-                cur.execute("""
-                    SELECT c.id_court, c.description, c.price_per_hour, ct.type_name
-                    FROM courts c
-                    JOIN court_types ct ON c.id_type = ct.id_type
-                    WHERE c.id_type = %s
-                    ORDER BY c.id_court;
-                """, (id_type,))
-                data = cur.fetchall()
-                return {"success": True, "data": data}
-        except psycopg2.Error as e:
-            return {"success": False, "error": str(e).split('\n')[0]}
+        return query_cache.get_or_load(
+            ("get_courts_by_type", id_type), lambda: self._fetch_all(GET_COURTS_BY_TYPE, (id_type,), CATALOG), CATALOG
+        )
 
     def get_court_details(self, id_court):
         try:
-            with self.db.get_cursor() as cur:
-                cur.execute("""
-                    SELECT c.id_court, c.description, c.price_per_hour, ct.type_name
-                    FROM courts c
-                    JOIN court_types ct ON c.id_type = ct.id_type
-                    WHERE c.id_court = %s;
-                """, (id_court,))
+            with self.db.get_cursor(read_only=True, tags=CATALOG) as cur:
+                cur.execute(GET_COURT_DETAILS, (id_court,))
                 data = cur.fetchone()
                 return {"success": True, "data": data}
         except psycopg2.Error as e:
             return {"success": False, "error": str(e).split('\n')[0]}
 
     def get_unavailable_schedules(self, id_court):
-        try:
-            with self.db.get_cursor() as cur:
-                cur.execute("""
-                    SELECT s.id_schedule, s.schedule_date, s.start_time, s.end_time
-                    FROM schedules s
-                    JOIN booking_details bd ON s.id_schedule = bd.id_schedule
-                    JOIN bookings b ON bd.id_booking = b.id_booking
-                    WHERE s.id_court = %s AND b.status <> 'cancelled'
-                    ORDER BY s.schedule_date, s.start_time;
-                """, (id_court,))
-                data = cur.fetchall()
-                return {"success": True, "data": data}
-        except psycopg2.Error as e:
-            return {"success": False, "error": str(e).split('\n')[0]}
+        return query_cache.get_or_load(
+            ("get_unavailable_schedules", id_court),
+            lambda: self._fetch_all(GET_UNAVAILABLE_SCHEDULES, (id_court,)),
+            (SCHEDULES, court_schedules_tag(id_court))
+        )
 
     def make_booking_with_schedule(self, id_user, id_court, schedule_date, start_time, end_time):
         """
-        Crea un horario y luego una reserva asociada a ese horario.
+        Crea un horario y luego una reserva asociada a ese horario. Si el horario se
+        solapa con otra reserva no cancelada de la cancha retorna conflict=True.
         """
+        error = _invalid_range(start_time, end_time)
+        if error:
+            return {"success": False, "error": error}
         try:
             with self.db.get_cursor() as cur:
+                # 0. Bloquear la cancha ese día y verificar que el horario esté libre.
+                # La verificación va en otra sentencia para que vea lo que commiteó
+                # quien tenía el lock antes.
+                cur.execute(LOCK_COURT_DAY, (id_court, schedule_date))
+                cur.execute(FIND_OVERLAPS, (id_court, schedule_date, end_time, start_time))
+                conflicts = cur.fetchall()
+                if conflicts:
+                    return _conflict(conflicts)
+
                 # 1. Crear el horario
-                cur.execute("""
-                    INSERT INTO schedules (id_court, schedule_date, start_time, end_time)
-                    VALUES (%s, %s, %s, %s)
-                    RETURNING id_schedule;
-                """, (id_court, schedule_date, start_time, end_time))
+                cur.execute(INSERT_SCHEDULE, (id_court, schedule_date, start_time, end_time))
                 id_schedule = cur.fetchone()['id_schedule']
 
                 # 2. Crear la reserva
-                cur.execute("""
-                    INSERT INTO bookings (id_user, booking_date, status)
-                    VALUES (%s, CURRENT_DATE, 'pending')
-                    RETURNING id_booking;
-                """, (id_user,))
+                cur.execute(INSERT_BOOKING, (id_user,))
                 id_booking = cur.fetchone()['id_booking']
 
                 # 3. Asociar reserva y horario
-                cur.execute("""
-                    INSERT INTO booking_details (id_booking, id_schedule)
-                    VALUES (%s, %s);
-                """, (id_booking, id_schedule))
-
-                return {
-                    "success": True,
-                    "id_booking": id_booking,
-                    "id_schedule": id_schedule
-                }
+                cur.execute(INSERT_BOOKING_DETAIL, (id_booking, id_schedule))
+
+                # 4. Sumarla a los rollups de reportes (misma transacción)
+                apply_new_bookings(cur, [id_booking])
+
+            # 5. Ya con el commit hecho, invalidar lo cacheado de la cancha y del usuario
+            invalidate(court_schedules_tag(id_court), user_bookings_tag(id_user))
+            return {
+                "success": True,
+                "id_booking": id_booking,
+                "id_schedule": id_schedule
+            }
+        except psycopg2.Error as e:
+            return {"success": False, "error": str(e).split('\n')[0]}
+
+    def make_bookings_batch(self, id_user, id_court, slots, atomic=True):
+        """
+        Crea una reserva por cada horario de `slots` [(fecha, inicio, fin)] en una sola
+        transacción, con sentencias por lote en lugar de tres INSERT por horario.
+        Los horarios que chocan con otras reservas se informan en `conflicts` (con su
+        posición `slot` en el lote); si atomic=True basta uno para no reservar ninguno.
+        """
+        try:
+            dates, starts, ends = batch_slots(slots)
+        except ValueError as e:
+            return {"success": False, "error": str(e)}
+        try:
+            with self.db.get_cursor() as cur:
+                cur.execute(LOCK_COURT_DAYS, (id_court, dates))
+                cur.execute(FIND_BATCH_OVERLAPS, (dates, starts, ends, id_court))
+                conflicts = cur.fetchall()
+                taken = {row["slot"] for row in conflicts}
+                free = [i for i in range(len(dates)) if i not in taken]
+                rows = []
+                if free and not (conflicts and atomic):
+                    cur.execute(INSERT_BOOKINGS_BATCH, (
+                        [dates[i] for i in free], [starts[i] for i in free],
+                        [ends[i] for i in free], free, id_court, id_user,
+                    ))
+                    rows = cur.fetchall()
+                    apply_new_bookings(cur, [row["id_booking"] for row in rows])
+            if rows:
+                invalidate(court_schedules_tag(id_court), user_bookings_tag(id_user))
+            return _batch_result(rows, conflicts, atomic)
         except psycopg2.Error as e:
             return {"success": False, "error": str(e).split('\n')[0]}
 
     def update_booking_status(self, id_booking, new_status):
         try:
             with self.db.get_cursor() as cur:
-                cur.execute("""
-                    UPDATE bookings
-                    SET status = %s
-                    WHERE id_booking = %s
-                    RETURNING id_booking, status;
-                """, (new_status, id_booking))
+                cur.execute(UPDATE_BOOKING_STATUS, (id_booking, new_status))
                 result = cur.fetchone()
                 if result:
-                    return {"success": True, "booking": result}
-                else:
-                    return {"success": False, "error": "Reserva no encontrada"}
+                    old_status = result.pop("old_status")
+                    if old_status == "cancelled" and result["status"] != "cancelled":
+                        conflicts = _find_reactivation_conflicts(cur, id_booking)
+                        if conflicts:
+                            cur.connection.rollback()
+                            return _conflict(conflicts)
+                    move_booking_status(cur, id_booking, old_status, result["status"])
+            if not result:
+                return {"success": False, "error": "Reserva no encontrada"}
+            invalidate(*_booking_tags(result))
+            return {"success": True, "booking": result}
         except psycopg2.Error as e:
             return {"success": False, "error": str(e).split('\n')[0]}
 
     def get_user_pending_bookings(self, id_user):
+        return query_cache.get_or_load(
+            ("get_user_pending_bookings", id_user),
+            lambda: self._fetch_all(GET_USER_PENDING_BOOKINGS, (id_user,), _user_bookings_tags(id_user)),
+            _user_bookings_tags(id_user)
+        )
+
+    def get_user_confirmed_bookings(self, id_user):
+        return query_cache.get_or_load(
+            ("get_user_confirmed_bookings", id_user),
+            lambda: self._fetch_all(GET_USER_CONFIRMED_BOOKINGS, (id_user,), _user_bookings_tags(id_user)),
+            _user_bookings_tags(id_user)
+        )
+
+    def get_available_schedules(self, id_court):
+        return query_cache.get_or_load(
+            ("get_available_schedules", id_court),
+            lambda: self._fetch_all(GET_AVAILABLE_SCHEDULES, (id_court,)),
+            (SCHEDULES, court_schedules_tag(id_court))
+        )
+
+    def get_all_court_types(self):
+        return query_cache.get_or_load(
+            ("get_all_court_types",), lambda: self._fetch_all(GET_ALL_COURT_TYPES, tags=(COURT_TYPES,)), (COURT_TYPES,)
+        )
+
+
+class AsyncCourtCrud:
+    """
+    Versión asyncio de CourtCrud. Usa el mismo SQL sobre el pool asíncrono.
+    """
+    def __init__(self):
+        self.db = AsyncDatabase()
+
+    async def _fetch_all(self, query, params=None, tags=None):
         try:
-            with self.db.get_cursor() as cur:
-                cur.execute("""
-                    SELECT
-                        b.id_booking,
-                        s.schedule_date,
-                        s.start_time,
-                        s.end_time,
-                        c.description AS court_description,
-                        ct.type_name AS court_type
-                    FROM bookings b
-                    JOIN booking_details bd ON b.id_booking = bd.id_booking
-                    JOIN schedules s ON bd.id_schedule = s.id_schedule
-                    JOIN courts c ON s.id_court = c.id_court
-                    JOIN court_types ct ON c.id_type = ct.id_type
-                    WHERE b.id_user = %s AND b.status = 'pending'
-                    ORDER BY s.schedule_date, s.start_time;
-                """, (id_user,))
-                data = cur.fetchall()
+            async with self.db.get_cursor(read_only=tags is not None, tags=tags or ()) as cur:
+                await cur.execute(query, params)
+                data = await cur.fetchall()
                 return {"success": True, "data": data}
-        except psycopg2.Error as e:
+        except psycopg.Error as e:
             return {"success": False, "error": str(e).split('\n')[0]}
 
-    def get_user_confirmed_bookings(self, id_user):
+    async def get_all_courts(self):
+        return await query_cache.get_or_load_async(
+            ("get_all_courts",), lambda: self._fetch_all(GET_ALL_COURTS, tags=CATALOG), CATALOG
+        )
+
+    async def get_courts_by_type(self, id_type):
+        return await query_cache.get_or_load_async(
+            ("get_courts_by_type", id_type), lambda: self._fetch_all(GET_COURTS_BY_TYPE, (id_type,), CATALOG), CATALOG
+        )
+
+    async def get_court_details(self, id_court):
         try:
-            with self.db.get_cursor() as cur:
-                cur.execute("""
-                    SELECT
-                        b.id_booking,
-                        s.schedule_date,
-                        s.start_time,
-                        s.end_time,
-                        c.description AS court_description,
-                        ct.type_name AS court_type
-                    FROM bookings b
-                    JOIN booking_details bd ON b.id_booking = bd.id_booking
-                    JOIN schedules s ON bd.id_schedule = s.id_schedule
-                    JOIN courts c ON s.id_court = c.id_court
-                    JOIN court_types ct ON c.id_type = ct.id_type
-                    WHERE b.id_user = %s AND b.status = 'confirmed'
-                    ORDER BY s.schedule_date, s.start_time;
-                """, (id_user,))
-                data = cur.fetchall()
+            async with self.db.get_cursor(read_only=True, tags=CATALOG) as cur:
+                await cur.execute(GET_COURT_DETAILS, (id_court,))
+                data = await cur.fetchone()
                 return {"success": True, "data": data}
-        except psycopg2.Error as e:
+        except psycopg.Error as e:
             return {"success": False, "error": str(e).split('\n')[0]}
 
-    def get_available_schedules(self, id_court):
+    async def get_unavailable_schedules(self, id_court):
+        return await query_cache.get_or_load_async(
+            ("get_unavailable_schedules", id_court),
+            lambda: self._fetch_all(GET_UNAVAILABLE_SCHEDULES, (id_court,)),
+            (SCHEDULES, court_schedules_tag(id_court))
+        )
+
+    async def make_booking_with_schedule(self, id_user, id_court, schedule_date, start_time, end_time):
+        """
+        Crea un horario y luego una reserva asociada a ese horario. Si el horario se
+        solapa con otra reserva no cancelada de la cancha retorna conflict=True.
+        """
+        error = _invalid_range(start_time, end_time)
+        if error:
+            return {"success": False, "error": error}
         try:
-            with self.db.get_cursor() as cur:
-                cur.execute("""
-                    SELECT s.id_schedule, s.schedule_date, s.start_time, s.end_time
-                    FROM schedules s
-                    WHERE s.id_court = %s
-                    AND s.id_schedule NOT IN (
-                        SELECT bd.id_schedule
-                        FROM booking_details bd
-                        JOIN bookings b ON bd.id_booking = b.id_booking
-                        WHERE b.status <> 'cancelled'
-                    )
-                    ORDER BY s.schedule_date, s.start_time;
-                """, (id_court,))
-                data = cur.fetchall()
-                return {"success": True, "data": data}
-        except psycopg2.Error as e:
+            async with self.db.get_cursor() as cur:
+                await cur.execute(LOCK_COURT_DAY, (id_court, schedule_date))
+                await cur.execute(FIND_OVERLAPS, (id_court, schedule_date, end_time, start_time))
+                conflicts = await cur.fetchall()
+                if conflicts:
+                    return _conflict(conflicts)
+                await cur.execute(INSERT_SCHEDULE, (id_court, schedule_date, start_time, end_time))
+                id_schedule = (await cur.fetchone())['id_schedule']
+                await cur.execute(INSERT_BOOKING, (id_user,))
+                id_booking = (await cur.fetchone())['id_booking']
+                await cur.execute(INSERT_BOOKING_DETAIL, (id_booking, id_schedule))
+                await apply_new_bookings_async(cur, [id_booking])
+            await invalidate_async(court_schedules_tag(id_court), user_bookings_tag(id_user))
+            return {
+                "success": True,
+                "id_booking": id_booking,
+                "id_schedule": id_schedule
+            }
+        except psycopg.Error as e:
             return {"success": False, "error": str(e).split('\n')[0]}
 
-    def get_all_court_types(self):
+    async def make_bookings_batch(self, id_user, id_court, slots, atomic=True):
         try:
-            with self.db.get_cursor() as cur:
-                cur.execute("""
-                    SELECT id_type, type_name
-                    FROM court_types
-                    ORDER BY id_type;
-                """)
-                data = cur.fetchall()
-                return {"success": True, "data": data}
-        except psycopg2.Error as e:
+            dates, starts, ends = batch_slots(slots)
+        except ValueError as e:
+            return {"success": False, "error": str(e)}
+        try:
+            async with self.db.get_cursor() as cur:
+                await cur.execute(LOCK_COURT_DAYS, (id_court, dates))
+                await cur.execute(FIND_BATCH_OVERLAPS, (dates, starts, ends, id_court))
+                conflicts = await cur.fetchall()
+                taken = {row["slot"] for row in conflicts}
+                free = [i for i in range(len(dates)) if i not in taken]
+                rows = []
+                if free and not (conflicts and atomic):
+                    await cur.execute(INSERT_BOOKINGS_BATCH, (
+                        [dates[i] for i in free], [starts[i] for i in free],
+                        [ends[i] for i in free], free, id_court, id_user,
+                    ))
+                    rows = await cur.fetchall()
+                    await apply_new_bookings_async(cur, [row["id_booking"] for row in rows])
+            if rows:
+                await invalidate_async(court_schedules_tag(id_court), user_bookings_tag(id_user))
+            return _batch_result(rows, conflicts, atomic)
+        except psycopg.Error as e:
             return {"success": False, "error": str(e).split('\n')[0]}
 
+    async def update_booking_status(self, id_booking, new_status):
+        try:
+            async with self.db.get_cursor() as cur:
+                await cur.execute(UPDATE_BOOKING_STATUS, (id_booking, new_status))
+                result = await cur.fetchone()
+                if result:
+                    old_status = result.pop("old_status")
+                    if old_status == "cancelled" and result["status"] != "cancelled":
+                        conflicts = await _find_reactivation_conflicts_async(cur, id_booking)
+                        if conflicts:
+                            await cur.connection.rollback()
+                            return _conflict(conflicts)
+                    await move_booking_status_async(cur, id_booking, old_status, result["status"])
+            if not result:
+                return {"success": False, "error": "Reserva no encontrada"}
+            await invalidate_async(*_booking_tags(result))
+            return {"success": True, "booking": result}
+        except psycopg.Error as e:
+            return {"success": False, "error": str(e).split('\n')[0]}
+
+    async def get_user_pending_bookings(self, id_user):
+        return await query_cache.get_or_load_async(
+            ("get_user_pending_bookings", id_user),
+            lambda: self._fetch_all(GET_USER_PENDING_BOOKINGS, (id_user,), _user_bookings_tags(id_user)),
+            _user_bookings_tags(id_user)
+        )
+
+    async def get_user_confirmed_bookings(self, id_user):
+        return await query_cache.get_or_load_async(
+            ("get_user_confirmed_bookings", id_user),
+            lambda: self._fetch_all(GET_USER_CONFIRMED_BOOKINGS, (id_user,), _user_bookings_tags(id_user)),
+            _user_bookings_tags(id_user)
+        )
+
+    async def get_available_schedules(self, id_court):
+        return await query_cache.get_or_load_async(
+            ("get_available_schedules", id_court),
+            lambda: self._fetch_all(GET_AVAILABLE_SCHEDULES, (id_court,)),
+            (SCHEDULES, court_schedules_tag(id_court))
+        )
+
+    async def get_all_court_types(self):
+        return await query_cache.get_or_load_async(
+            ("get_all_court_types",), lambda: self._fetch_all(GET_ALL_COURT_TYPES, tags=(COURT_TYPES,)), (COURT_TYPES,)
+        )
@@ -1,249 +1,418 @@
-import psycopg2
-from bd import Database
-
-def get_time_range(horario_dia):
-    if not horario_dia:
-        return None, None
-    horario_dia = horario_dia.lower()
-    if horario_dia == "manana":
-        return "00:00:00", "12:00:00"
-    elif horario_dia == "tarde":
-        return "12:00:00", "18:00:00"
-    elif horario_dia == "noche":
-        return "18:00:00", "24:00:00"
-    return None, None
-
-class CustomReports:
-    def __init__(self):
-        self.db = Database()
-
-    def get_courts_type(self):
-        try:
-            with self.db.get_cursor() as cur:
-                cur.execute("""
-                    SELECT id_type, type_name FROM court_types ORDER BY id_type;
-                """)
-                return {"success": True, "data": cur.fetchall()}
-        except psycopg2.Error as e:
-            return {"success": False, "error": str(e).split('\n')[0]}
-
-    def get_promociones(self):
-        try:
-            with self.db.get_cursor() as cur:
-                cur.execute("""
-                    SELECT id_promotion, name, description, discount_percentage, start_date, end_date
-                    FROM promotions
-                    ORDER BY name;
-                """)
-                return {"success": True, "data": cur.fetchall()}
-        except psycopg2.Error as e:
-            return {"success": False, "error": str(e).split('\n')[0]}
-
-    def get_horarios(self):
-        return {
-            "success": True,
-            "data": [
-                {"nombre": "Manana", "inicio": "06:00", "fin": "12:00"},
-                {"nombre": "Tarde", "inicio": "12:00", "fin": "18:00"},
-                {"nombre": "Noche", "inicio": "18:00", "fin": "24:00"},
-            ]
-        }
-
-    def reservas(self, fecha_inicio=None, fecha_fin=None, canchas_tipo=None, estado=None):
-        try:
-            with self.db.get_cursor() as cur:
-                query = """
-                    SELECT u.name AS nombre_usuario, b.id_booking AS id_reserva, b.status AS estado, ct.type_name AS tipo_cancha
-                    FROM bookings b
-                    JOIN users u ON b.id_user = u.id_user
-                    JOIN booking_details bd ON b.id_booking = bd.id_booking
-                    JOIN schedules s ON bd.id_schedule = s.id_schedule
-                    JOIN courts c ON s.id_court = c.id_court
-                    JOIN court_types ct ON c.id_type = ct.id_type
-                    WHERE 1=1
-                """
-                params = []
-                if fecha_inicio:
-                    query += " AND s.schedule_date >= %s"
-                    params.append(fecha_inicio)
-                if fecha_fin:
-                    query += " AND s.schedule_date <= %s"
-                    params.append(fecha_fin)
-                if canchas_tipo:
-                    query += " AND ct.id_type = %s"
-                    params.append(canchas_tipo)
-                if estado:
-                    query += " AND b.status = %s"
-                    params.append(estado)
-                query += " ORDER BY s.schedule_date DESC"
-                cur.execute(query, tuple(params))
-                return {"success": True, "data": cur.fetchall()}
-        except psycopg2.Error as e:
-            return {"success": False, "error": str(e).split('\n')[0]}
-
-    def ingresos(self, fecha_inicio=None, fecha_fin=None, agrupar="dia", cancha_tipo=None):
-        try:
-            with self.db.get_cursor() as cur:
-                if agrupar == "mes":
-                    group_by = "DATE_TRUNC('month', s.schedule_date)"
-                    select_group = "DATE_TRUNC('month', s.schedule_date) AS periodo"
-                elif agrupar == "anio":
-                    group_by = "DATE_TRUNC('year', s.schedule_date)"
-                    select_group = "DATE_TRUNC('year', s.schedule_date) AS periodo"
-                else:
-                    group_by = "s.schedule_date"
-                    select_group = "s.schedule_date AS periodo"
-                query = f"""
-                    SELECT {select_group}, ct.type_name AS cancha_tipo, COUNT(b.id_booking) AS cant_reservas, COALESCE(SUM(i.total_amount),0) AS total_income
-                    FROM bookings b
-                    JOIN booking_details bd ON b.id_booking = bd.id_booking
-                    JOIN schedules s ON bd.id_schedule = s.id_schedule
-                    JOIN courts c ON s.id_court = c.id_court
-                    JOIN court_types ct ON c.id_type = ct.id_type
-                    LEFT JOIN invoices i ON b.id_booking = i.id_booking
-                    WHERE 1=1
-                """
-                params = []
-                if fecha_inicio:
-                    query += " AND s.schedule_date >= %s"
-                    params.append(fecha_inicio)
-                if fecha_fin:
-                    query += " AND s.schedule_date <= %s"
-                    params.append(fecha_fin)
-                if cancha_tipo:
-                    query += " AND ct.id_type = %s"
-                    params.append(cancha_tipo)
-                # Usa la expresión, no el alias, en el GROUP BY
-                query += f" GROUP BY {group_by}, ct.type_name ORDER BY {group_by} DESC"
-                cur.execute(query, tuple(params))
-                return {"success": True, "data": cur.fetchall()}
-        except psycopg2.Error as e:
-            return {"success": False, "error": str(e).split('\n')[0]}
-
-    def usuarios(self, fecha_inicio=None, fecha_fin=None, horario_dia=None, min_reservas=1):
-        try:
-            with self.db.get_cursor() as cur:
-                query = """
-                    SELECT u.name, COUNT(b.id_booking) AS cantidad_reservas,
-                        (SELECT ct.type_name
-                         FROM bookings b2
-                         JOIN booking_details bd2 ON b2.id_booking = bd2.id_booking
-                         JOIN schedules s2 ON bd2.id_schedule = s2.id_schedule
-                         JOIN courts c2 ON s2.id_court = c2.id_court
-                         JOIN court_types ct ON c2.id_type = ct.id_type
-                         WHERE b2.id_user = u.id_user
-                         GROUP BY ct.type_name
-                         ORDER BY COUNT(*) DESC
-                         LIMIT 1
-                        ) AS cancha_preferida
-                    FROM users u
-                    JOIN bookings b ON u.id_user = b.id_user
-                    JOIN booking_details bd ON b.id_booking = bd.id_booking
-                    JOIN schedules s ON bd.id_schedule = s.id_schedule
-                    WHERE 1=1
-                """
-                params = []
-                if fecha_inicio:
-                    query += " AND s.schedule_date >= %s"
-                    params.append(fecha_inicio)
-                if fecha_fin:
-                    query += " AND s.schedule_date <= %s"
-                    params.append(fecha_fin)
-                if horario_dia:
-                    start, end = get_time_range(horario_dia)
-                    if start and end:
-                        query += " AND s.start_time >= %s AND s.end_time < %s"
-                        params.extend([start, end])
-                query += " GROUP BY u.id_user, u.name"
-                if min_reservas and min_reservas > 0:
-                    query += " HAVING COUNT(b.id_booking) >= %s"
-                    params.append(min_reservas)
-                query += " ORDER BY cantidad_reservas DESC"
-                print(query)
-                print(params)
-                cur.execute(query, tuple(params))
-                print(query, tuple(params))
-                return {"success": True, "data": cur.fetchall()}
-        except psycopg2.Error as e:
-            return {"success": False, "error": str(e).split('\n')[0]}
-
-    def promociones_aplicadas(self, fecha_inicio=None, fecha_fin=None, nombre_promocion=None):
-        try:
-            with self.db.get_cursor() as cur:
-                query = """
-                    SELECT u.name AS nombre_usuario, b.id_booking AS id_reserva, p.discount_percentage AS porcentaje_desc
-                    FROM bookings b
-                    JOIN users u ON b.id_user = u.id_user
-                    JOIN booking_promotions bp ON b.id_booking = bp.id_booking
-                    JOIN promotions p ON bp.id_promotion = p.id_promotion
-                    WHERE 1=1
-                """
-                params = []
-                if fecha_inicio:
-                    query += " AND b.booking_date >= %s"
-                    params.append(fecha_inicio)
-                if fecha_fin:
-                    query += " AND b.booking_date <= %s"
-                    params.append(fecha_fin)
-                if nombre_promocion:
-                    query += " AND p.name ILIKE %s"
-                    params.append(f"%{nombre_promocion}%")
-                query += " ORDER BY b.id_booking DESC"
-                cur.execute(query, tuple(params))
-                return {"success": True, "data": cur.fetchall()}
-        except psycopg2.Error as e:
-            return {"success": False, "error": str(e).split('\n')[0]}
-
-    def cuantas_veces(self, nombre_promocion=None):
-        try:
-            with self.db.get_cursor() as cur:
-                query = """
-                    SELECT u.id_user, p.name AS promocion, COUNT(bp.id_booking) AS cant_usada
-                    FROM users u
-                    JOIN bookings b ON u.id_user = b.id_user
-                    JOIN booking_promotions bp ON b.id_booking = bp.id_booking
-                    JOIN promotions p ON bp.id_promotion = p.id_promotion
-                    WHERE 1=1
-                """
-                params = []
-                if nombre_promocion:
-                    query += " AND p.name ILIKE %s"
-                    params.append(f"%{nombre_promocion}%")
-                query += " GROUP BY u.id_user, p.name ORDER BY cant_usada DESC"
-                cur.execute(query, tuple(params))
-                return {"success": True, "data": cur.fetchall()}
-        except psycopg2.Error as e:
-            return {"success": False, "error": str(e).split('\n')[0]}
-
-    def disponibilidad_canchas(self, fecha_inicio=None, fecha_fin=None, tipo_cancha=None, horario_dia=None):
-        try:
-            with self.db.get_cursor() as cur:
-                query = """
-                    SELECT c.id_court, ct.type_name AS tipo_cancha, COUNT(bd.id_booking) AS veces_reservada
-                    FROM courts c
-                    JOIN court_types ct ON c.id_type = ct.id_type
-                    JOIN schedules s ON c.id_court = s.id_court
-                    JOIN booking_details bd ON s.id_schedule = bd.id_schedule
-                    WHERE 1=1
-                """
-                params = []
-                if fecha_inicio:
-                    query += " AND s.schedule_date >= %s"
-                    params.append(fecha_inicio)
-                if fecha_fin:
-                    query += " AND s.schedule_date <= %s"
-                    params.append(fecha_fin)
-                if tipo_cancha:
-                    query += " AND ct.id_type = %s"
-                    params.append(tipo_cancha)
-                if horario_dia:
-                    start, end = get_time_range(horario_dia)
-                    if start and end:
-                        query += " AND s.start_time >= %s AND s.end_time < %s"
-                        params.extend([start, end])
-                query += " GROUP BY c.id_court, ct.type_name ORDER BY veces_reservada DESC"
-                cur.execute(query, tuple(params))
-                return {"success": True, "data": cur.fetchall()}
-        except psycopg2.Error as e:
-            return {"success": False, "error": str(e).split('\n')[0]}
-
+import psycopg
+import psycopg2
+from bd import ANALYTICS, AsyncDatabase, Database, Statement, db_error
+from cache import COURT_TYPES, PROMOTIONS, query_cache
+from pagination import Keyset, paged
+from rendering import fetch_data, fetch_data_async
+from singleflight import coalesced
+from report_engine import Column, Filter, Report, Rollup, Source
+from rollups import rollups_enabled, rollups_enabled_async
+
+def get_time_range(horario_dia):
+    if not horario_dia:
+        return None, None
+    horario_dia = horario_dia.lower()
+    if horario_dia == "manana":
+        return "00:00:00", "12:00:00"
+    elif horario_dia == "tarde":
+        return "12:00:00", "18:00:00"
+    elif horario_dia == "noche":
+        return "18:00:00", "24:00:00"
+    return None, None
+
+GET_COURTS_TYPE = Statement("custom_get_courts_type", """
+    SELECT id_type, type_name FROM court_types ORDER BY id_type;
+""")
+
+GET_PROMOCIONES = Statement("custom_get_promociones", """
+    SELECT id_promotion, name, description, discount_percentage, start_date, end_date
+    FROM promotions
+    ORDER BY name;
+""")
+
+# Orden estable de los listados paginables (coincide con el ORDER BY de su reporte); los
+# desempates solo se seleccionan con paginado=True y no llegan a la respuesta
+RESERVAS_KEYSET = Keyset("fecha", "id_reserva", "id_horario", descending=True, hidden=("fecha", "id_horario"))
+PROMOCIONES_APLICADAS_KEYSET = Keyset("id_reserva", "id_promocion", descending=True, hidden=("id_promocion",))
+
+HORARIOS = [
+    {"nombre": "Manana", "inicio": "06:00", "fin": "12:00"},
+    {"nombre": "Tarde", "inicio": "12:00", "fin": "18:00"},
+    {"nombre": "Noche", "inicio": "18:00", "fin": "24:00"},
+]
+
+# Tablas de las que salen los reportes: cada join con las tablas de las que depende
+BOOKINGS = Source("bookings b", {
+    "u": ("JOIN users u ON b.id_user = u.id_user", ()),
+    "bd": ("JOIN booking_details bd ON b.id_booking = bd.id_booking", ()),
+    "s": ("JOIN schedules s ON bd.id_schedule = s.id_schedule", ("bd",)),
+    "c": ("JOIN courts c ON s.id_court = c.id_court", ("s",)),
+    "ct": ("JOIN court_types ct ON c.id_type = ct.id_type", ("c",)),
+    "i": ("LEFT JOIN invoices i ON b.id_booking = i.id_booking", ()),
+    "bp": ("JOIN booking_promotions bp ON b.id_booking = bp.id_booking", ()),
+    "p": ("JOIN promotions p ON bp.id_promotion = p.id_promotion", ("bp",)),
+})
+
+COURTS = Source("courts c", {
+    "ct": ("JOIN court_types ct ON c.id_type = ct.id_type", ()),
+    "s": ("JOIN schedules s ON c.id_court = s.id_court", ()),
+    "bd": ("JOIN booking_details bd ON s.id_schedule = bd.id_schedule", ("s",)),
+})
+
+# Reservas por día, cancha, tipo y estado (rollups.py); las filas que quedaron en cero
+# por cambios de estado no cuentan como grupo
+DAILY_ROLLUP = Rollup(Source("rollup_reservas_diarias r", {
+    "ct": ("JOIN court_types ct ON r.id_type = ct.id_type", ()),
+}), having="SUM(r.reservas) > 0")
+
+
+def _time_range(horario_dia):
+    start, end = get_time_range(horario_dia)
+    return [start, end] if start and end else None
+
+
+def _contains(text):
+    return [f"%{text}%"]
+
+
+def _date_filters(column, joins=(), rollup_column=None):
+    return [
+        Filter("fecha_inicio", f"{column} >= %s", joins, rollup=rollup_column and f"{rollup_column} >= %s"),
+        Filter("fecha_fin", f"{column} <= %s", joins, rollup=rollup_column and f"{rollup_column} <= %s"),
+    ]
+
+
+HORARIO_FILTER = Filter("horario_dia", "s.start_time >= %s AND s.end_time < %s", joins=("s",), params=_time_range)
+PROMOCION_FILTER = Filter("nombre_promocion", "p.name ILIKE %s", joins=("p",), params=_contains)
+
+RESERVAS = Report(
+    "reservas", BOOKINGS,
+    dimensions={
+        "nombre_usuario": Column("nombre_usuario", "u.name", ("u",)),
+        "id_reserva": Column("id_reserva", "b.id_booking"),
+        "estado": Column("estado", "b.status"),
+        "tipo_cancha": Column("tipo_cancha", "ct.type_name", ("ct",)),
+        "fecha": Column("fecha", "s.schedule_date", ("s",)),
+        "id_horario": Column("id_horario", "s.id_schedule", ("s",)),
+    },
+    default_dimensions=("nombre_usuario", "id_reserva", "estado", "tipo_cancha"),
+    filters=_date_filters("s.schedule_date", ("s",)) + [
+        Filter("canchas_tipo", "ct.id_type = %s", joins=("ct",)),
+        Filter("estado", "b.status = %s"),
+    ],
+    # Por expresión y no por alias: fecha e id_horario solo se seleccionan al paginar
+    # (tipo_cancha ya une schedules)
+    order_by=("s.schedule_date DESC", "b.id_booking DESC", "s.id_schedule DESC"),
+)
+
+# Dimensión de periodo según `agrupar`
+INGRESOS_PERIODOS = {"dia": "periodo_dia", "mes": "periodo_mes", "anio": "periodo_anio"}
+
+INGRESOS = Report(
+    "ingresos", BOOKINGS,
+    dimensions={
+        "periodo_dia": Column("periodo", "s.schedule_date", ("s",), rollup="r.schedule_date"),
+        "periodo_mes": Column("periodo", "DATE_TRUNC('month', s.schedule_date)", ("s",),
+                              rollup="DATE_TRUNC('month', r.schedule_date)"),
+        "periodo_anio": Column("periodo", "DATE_TRUNC('year', s.schedule_date)", ("s",),
+                               rollup="DATE_TRUNC('year', r.schedule_date)"),
+        "cancha_tipo": Column("cancha_tipo", "ct.type_name", ("ct",), rollup="ct.type_name", rollup_joins=("ct",)),
+    },
+    default_dimensions=("periodo_dia", "cancha_tipo"),
+    measures=[
+        Column("cant_reservas", "COUNT(b.id_booking)", ("bd",), rollup="SUM(r.reservas)::bigint"),
+        Column("total_income", "COALESCE(SUM(i.total_amount),0)", ("i",), rollup="COALESCE(SUM(r.ingresos),0)"),
+    ],
+    filters=_date_filters("s.schedule_date", ("s",), "r.schedule_date") + [
+        Filter("cancha_tipo", "ct.id_type = %s", joins=("ct",), rollup="r.id_type = %s"),
+    ],
+    order_by=("periodo DESC",),
+    rollup=DAILY_ROLLUP,
+)
+
+# Total de reservas y tipo de cancha preferido de cada usuario, ambos sobre las reservas
+# que cumplen los filtros y en una sola pasada: el reporte cuenta por (usuario, tipo), la
+# suma por ventana da el total y DISTINCT ON deja el tipo más reservado (empate: por nombre).
+USUARIOS = Report(
+    "usuarios", BOOKINGS,
+    dimensions={
+        "id_user": Column("id_user", "b.id_user"),
+        "type_name": Column("type_name", "ct.type_name", ("ct",)),
+    },
+    measures=[Column("reservas", "COUNT(*)")],
+    filters=_date_filters("s.schedule_date", ("s",)) + [
+        HORARIO_FILTER,
+        Filter("min_reservas", "p.cantidad_reservas >= %s", outer=True,
+               params=lambda value: [value] if value > 0 else None),
+    ],
+    wrap="""
+        WITH por_tipo AS (
+            {query}
+        ),
+        por_usuario AS (
+            SELECT DISTINCT ON (id_user) id_user, type_name AS cancha_preferida,
+                   (SUM(reservas) OVER (PARTITION BY id_user))::bigint AS cantidad_reservas
+            FROM por_tipo
+            ORDER BY id_user, reservas DESC, type_name
+        )
+        SELECT u.name, p.cantidad_reservas, p.cancha_preferida
+        FROM por_usuario p
+        JOIN users u ON p.id_user = u.id_user
+        {where}
+        ORDER BY p.cantidad_reservas DESC, p.id_user
+    """,
+)
+
+PROMOCIONES_APLICADAS = Report(
+    "promociones_aplicadas", BOOKINGS,
+    dimensions={
+        "nombre_usuario": Column("nombre_usuario", "u.name", ("u",)),
+        "id_reserva": Column("id_reserva", "b.id_booking"),
+        "porcentaje_desc": Column("porcentaje_desc", "p.discount_percentage", ("p",)),
+        "id_promocion": Column("id_promocion", "p.id_promotion", ("p",)),
+    },
+    default_dimensions=("nombre_usuario", "id_reserva", "porcentaje_desc"),
+    filters=_date_filters("b.booking_date") + [PROMOCION_FILTER],
+    order_by=("b.id_booking DESC", "p.id_promotion DESC"),
+)
+
+# bookings.id_user es NOT NULL con FK a users: no hace falta unir users para agrupar por usuario
+CUANTAS_VECES = Report(
+    "cuantas_veces", BOOKINGS,
+    dimensions={
+        "id_user": Column("id_user", "b.id_user"),
+        "promocion": Column("promocion", "p.name", ("p",)),
+    },
+    measures=[Column("cant_usada", "COUNT(bp.id_booking)", ("bp",))],
+    filters=[PROMOCION_FILTER],
+    order_by=("cant_usada DESC",),
+)
+
+# Desde el rollup diario solo si no se filtra por horario (el rollup no guarda la hora)
+DISPONIBILIDAD_CANCHAS = Report(
+    "disponibilidad_canchas", COURTS,
+    dimensions={
+        "id_court": Column("id_court", "c.id_court", rollup="r.id_court"),
+        "tipo_cancha": Column("tipo_cancha", "ct.type_name", ("ct",), rollup="ct.type_name", rollup_joins=("ct",)),
+    },
+    measures=[Column("veces_reservada", "COUNT(bd.id_booking)", ("bd",), rollup="SUM(r.reservas)::bigint")],
+    filters=_date_filters("s.schedule_date", ("s",), "r.schedule_date") + [
+        Filter("tipo_cancha", "ct.id_type = %s", joins=("ct",), rollup="r.id_type = %s"),
+        HORARIO_FILTER,
+    ],
+    order_by=("veces_reservada DESC",),
+    rollup=DAILY_ROLLUP,
+)
+
+# Cada build_* retorna (query, params) de su reporte sobre las tablas base, para
+# export.py y los scripts; los endpoints compilan con Report.compile y usan el rollup
+# cuando está instalado.
+
+def _base(report, values, dimensions=None):
+    query, params, _ = report.compile(values, dimensions)
+    return query, params
+
+def _paged_dimensions(report, keyset, paginado):
+    # Con paginado=True agrega las columnas de desempate que usa el keyset
+    return report.default_dimensions + keyset.hidden if paginado else None
+
+def _ingresos_values(fecha_inicio, fecha_fin, cancha_tipo):
+    return {"fecha_inicio": fecha_inicio, "fecha_fin": fecha_fin, "cancha_tipo": cancha_tipo}
+
+def _ingresos_dimensions(agrupar):
+    return (INGRESOS_PERIODOS.get(agrupar, "periodo_dia"), "cancha_tipo")
+
+def build_reservas(fecha_inicio=None, fecha_fin=None, canchas_tipo=None, estado=None, paginado=False):
+    return _base(RESERVAS, {"fecha_inicio": fecha_inicio, "fecha_fin": fecha_fin,
+                            "canchas_tipo": canchas_tipo, "estado": estado},
+                 _paged_dimensions(RESERVAS, RESERVAS_KEYSET, paginado))
+
+def build_ingresos(fecha_inicio=None, fecha_fin=None, agrupar="dia", cancha_tipo=None):
+    return _base(INGRESOS, _ingresos_values(fecha_inicio, fecha_fin, cancha_tipo), _ingresos_dimensions(agrupar))
+
+def build_usuarios(fecha_inicio=None, fecha_fin=None, horario_dia=None, min_reservas=1):
+    return _base(USUARIOS, {"fecha_inicio": fecha_inicio, "fecha_fin": fecha_fin,
+                            "horario_dia": horario_dia, "min_reservas": min_reservas})
+
+def build_promociones_aplicadas(fecha_inicio=None, fecha_fin=None, nombre_promocion=None, paginado=False):
+    return _base(PROMOCIONES_APLICADAS, {"fecha_inicio": fecha_inicio, "fecha_fin": fecha_fin,
+                                         "nombre_promocion": nombre_promocion},
+                 _paged_dimensions(PROMOCIONES_APLICADAS, PROMOCIONES_APLICADAS_KEYSET, paginado))
+
+def build_cuantas_veces(nombre_promocion=None):
+    return _base(CUANTAS_VECES, {"nombre_promocion": nombre_promocion})
+
+def _disponibilidad_values(fecha_inicio, fecha_fin, tipo_cancha, horario_dia):
+    return {"fecha_inicio": fecha_inicio, "fecha_fin": fecha_fin, "tipo_cancha": tipo_cancha,
+            "horario_dia": horario_dia}
+
+def build_disponibilidad_canchas(fecha_inicio=None, fecha_fin=None, tipo_cancha=None, horario_dia=None):
+    return _base(DISPONIBILIDAD_CANCHAS, _disponibilidad_values(fecha_inicio, fecha_fin, tipo_cancha, horario_dia))
+
+class CustomReports:
+    def __init__(self):
+        self.db = Database(ANALYTICS, read_only=True)
+
+    def _fetch_all(self, query, params=None, mode=None):
+        try:
+            with self.db.get_cursor() as cur:
+                return {"success": True, "data": fetch_data(cur, query, params, mode)}
+        except psycopg2.Error as e:
+            return db_error(e)
+
+    def _fetch_page(self, keyset, query, params, cursor, limit):
+        try:
+            query, params, limit = keyset.page_query(query, params, cursor, limit)
+        except ValueError as e:
+            return {"success": False, "error": str(e)}
+        return paged(self._fetch_all(query, params, mode="python"), keyset, limit)
+
+    def _fetch_report(self, report, values, dimensions=None):
+        """
+        Ejecuta el reporte desde su rollup si está instalado y la consulta lo permite;
+        la respuesta indica la fuente.
+        """
+        try:
+            with self.db.get_cursor() as cur:
+                query, params, fuente = report.compile(values, dimensions, use_rollup=rollups_enabled(cur))
+                return {"success": True, "data": fetch_data(cur, query, params), "fuente": fuente}
+        except psycopg2.Error as e:
+            return db_error(e)
+
+    def get_courts_type(self):
+        return query_cache.get_or_load(
+            ("get_courts_type",), lambda: self._fetch_all(GET_COURTS_TYPE, mode="python"), (COURT_TYPES,)
+        )
+
+    def get_promociones(self):
+        return query_cache.get_or_load(
+            ("get_promociones",), lambda: self._fetch_all(GET_PROMOCIONES, mode="python"), (PROMOTIONS,)
+        )
+
+    def get_horarios(self):
+        return {
+            "success": True,
+            "data": HORARIOS
+        }
+
+    @coalesced
+    def reservas(self, fecha_inicio=None, fecha_fin=None, canchas_tipo=None, estado=None, cursor=None, limit=None):
+        if cursor is None and limit is None:
+            return self._fetch_all(*build_reservas(fecha_inicio, fecha_fin, canchas_tipo, estado))
+        query, params = build_reservas(fecha_inicio, fecha_fin, canchas_tipo, estado, paginado=True)
+        return self._fetch_page(RESERVAS_KEYSET, query, params, cursor, limit)
+
+    def reservas_stream(self, fecha_inicio=None, fecha_fin=None, canchas_tipo=None, estado=None):
+        return self.db.stream(*build_reservas(fecha_inicio, fecha_fin, canchas_tipo, estado))
+
+    @coalesced
+    def ingresos(self, fecha_inicio=None, fecha_fin=None, agrupar="dia", cancha_tipo=None):
+        return self._fetch_report(INGRESOS, _ingresos_values(fecha_inicio, fecha_fin, cancha_tipo),
+                                  _ingresos_dimensions(agrupar))
+
+    @coalesced
+    def usuarios(self, fecha_inicio=None, fecha_fin=None, horario_dia=None, min_reservas=1):
+        return self._fetch_all(*build_usuarios(fecha_inicio, fecha_fin, horario_dia, min_reservas))
+
+    @coalesced
+    def promociones_aplicadas(self, fecha_inicio=None, fecha_fin=None, nombre_promocion=None, cursor=None, limit=None):
+        if cursor is None and limit is None:
+            return self._fetch_all(*build_promociones_aplicadas(fecha_inicio, fecha_fin, nombre_promocion))
+        query, params = build_promociones_aplicadas(fecha_inicio, fecha_fin, nombre_promocion, paginado=True)
+        return self._fetch_page(PROMOCIONES_APLICADAS_KEYSET, query, params, cursor, limit)
+
+    def promociones_aplicadas_stream(self, fecha_inicio=None, fecha_fin=None, nombre_promocion=None):
+        return self.db.stream(*build_promociones_aplicadas(fecha_inicio, fecha_fin, nombre_promocion))
+
+    @coalesced
+    def cuantas_veces(self, nombre_promocion=None):
+        return self._fetch_all(*build_cuantas_veces(nombre_promocion))
+
+    @coalesced
+    def disponibilidad_canchas(self, fecha_inicio=None, fecha_fin=None, tipo_cancha=None, horario_dia=None):
+        return self._fetch_report(DISPONIBILIDAD_CANCHAS,
+                                  _disponibilidad_values(fecha_inicio, fecha_fin, tipo_cancha, horario_dia))
+
+class AsyncCustomReports:
+    """
+    Versión asyncio de CustomReports. Usa los mismos reportes sobre el pool asíncrono.
+    """
+    def __init__(self):
+        self.db = AsyncDatabase(ANALYTICS, read_only=True)
+
+    async def _fetch_all(self, query, params=None, mode=None):
+        try:
+            async with self.db.get_cursor() as cur:
+                return {"success": True, "data": await fetch_data_async(cur, query, params, mode)}
+        except psycopg.Error as e:
+            return db_error(e)
+
+    async def _fetch_page(self, keyset, query, params, cursor, limit):
+        try:
+            query, params, limit = keyset.page_query(query, params, cursor, limit)
+        except ValueError as e:
+            return {"success": False, "error": str(e)}
+        return paged(await self._fetch_all(query, params, mode="python"), keyset, limit)
+
+    async def _fetch_report(self, report, values, dimensions=None):
+        try:
+            async with self.db.get_cursor() as cur:
+                use_rollup = await rollups_enabled_async(cur)
+                query, params, fuente = report.compile(values, dimensions, use_rollup=use_rollup)
+                return {"success": True, "data": await fetch_data_async(cur, query, params), "fuente": fuente}
+        except psycopg.Error as e:
+            return db_error(e)
+
+    async def get_courts_type(self):
+        return await query_cache.get_or_load_async(
+            ("get_courts_type",), lambda: self._fetch_all(GET_COURTS_TYPE, mode="python"), (COURT_TYPES,)
+        )
+
+    async def get_promociones(self):
+        return await query_cache.get_or_load_async(
+            ("get_promociones",), lambda: self._fetch_all(GET_PROMOCIONES, mode="python"), (PROMOTIONS,)
+        )
+
+    async def get_horarios(self):
+        return {
+            "success": True,
+            "data": HORARIOS
+        }
+
+    @coalesced
+    async def reservas(self, fecha_inicio=None, fecha_fin=None, canchas_tipo=None, estado=None, cursor=None, limit=None):
+        if cursor is None and limit is None:
+            return await self._fetch_all(*build_reservas(fecha_inicio, fecha_fin, canchas_tipo, estado))
+        query, params = build_reservas(fecha_inicio, fecha_fin, canchas_tipo, estado, paginado=True)
+        return await self._fetch_page(RESERVAS_KEYSET, query, params, cursor, limit)
+
+    def reservas_stream(self, fecha_inicio=None, fecha_fin=None, canchas_tipo=None, estado=None):
+        return self.db.stream(*build_reservas(fecha_inicio, fecha_fin, canchas_tipo, estado))
+
+    @coalesced
+    async def ingresos(self, fecha_inicio=None, fecha_fin=None, agrupar="dia", cancha_tipo=None):
+        return await self._fetch_report(INGRESOS, _ingresos_values(fecha_inicio, fecha_fin, cancha_tipo),
+                                        _ingresos_dimensions(agrupar))
+
+    @coalesced
+    async def usuarios(self, fecha_inicio=None, fecha_fin=None, horario_dia=None, min_reservas=1):
+        return await self._fetch_all(*build_usuarios(fecha_inicio, fecha_fin, horario_dia, min_reservas))
+
+    @coalesced
+    async def promociones_aplicadas(self, fecha_inicio=None, fecha_fin=None, nombre_promocion=None, cursor=None, limit=None):
+        if cursor is None and limit is None:
+            return await self._fetch_all(*build_promociones_aplicadas(fecha_inicio, fecha_fin, nombre_promocion))
+        query, params = build_promociones_aplicadas(fecha_inicio, fecha_fin, nombre_promocion, paginado=True)
+        return await self._fetch_page(PROMOCIONES_APLICADAS_KEYSET, query, params, cursor, limit)
+
+    def promociones_aplicadas_stream(self, fecha_inicio=None, fecha_fin=None, nombre_promocion=None):
+        return self.db.stream(*build_promociones_aplicadas(fecha_inicio, fecha_fin, nombre_promocion))
+
+    @coalesced
+    async def cuantas_veces(self, nombre_promocion=None):
+        return await self._fetch_all(*build_cuantas_veces(nombre_promocion))
+
+    @coalesced
+    async def disponibilidad_canchas(self, fecha_inicio=None, fecha_fin=None, tipo_cancha=None, horario_dia=None):
+        return await self._fetch_report(DISPONIBILIDAD_CANCHAS,
+                                        _disponibilidad_values(fecha_inicio, fecha_fin, tipo_cancha, horario_dia))
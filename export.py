@@ -0,0 +1,212 @@
+"""
+Exportación de los reportes a CSV o Parquet con memoria constante.
+
+CSV sale directo de PostgreSQL con COPY ... TO STDOUT (Database.copy_csv), sin pasar
+las filas por Python. Parquet se arma con pyarrow (dependencia opcional) a partir de
+los lotes de un cursor del lado del servidor, un row group por lote.
+
+Los reportes se exportan desde la consulta en vivo sobre las tablas base, no desde
+las vistas materializadas ni los rollups: el archivo refleja el estado actual (con
+réplicas de lectura, el de la réplica, a lo sumo DB_REPLICA_MAX_LAG segundos atrás).
+"""
+import inspect
+import os
+
+from bd import ANALYTICS, AsyncDatabase, Database
+from custom_reports import (
+    GET_COURTS_TYPE, GET_PROMOCIONES, build_cuantas_veces, build_disponibilidad_canchas,
+    build_ingresos, build_promociones_aplicadas, build_reservas, build_usuarios,
+)
+from reportsCrud import (
+    CANCHAS_MAS_RENTADAS, FACTURACION_POR_TIPO_CANCHA, FACTURACION_POR_USUARIO, INGRESOS_POR_DIA,
+    INGRESOS_TOTALES_POR_MES, PROMOCIONES_ACTIVAS_HOY, PROMOCIONES_MAS_USADAS,
+    RESERVAS_CANCELADAS_POR_USUARIO, RESERVAS_CON_PROMOCION, RESERVAS_CONFIRMADAS_POR_USUARIO,
+    RESERVAS_PENDIENTES_POR_USUARIO, RESERVAS_POR_CANCHA, RESERVAS_POR_DIA, RESERVAS_POR_ESTADO,
+    RESERVAS_POR_HORA, RESERVAS_POR_PROMOCION, RESERVAS_POR_RANGO_FECHAS, RESERVAS_POR_TIPO_CANCHA,
+    RESERVAS_POR_USUARIO, USUARIOS_CON_MAS_RESERVAS,
+)
+
+try:
+    import pyarrow
+    import pyarrow.parquet
+except ImportError:  # Parquet es opcional
+    pyarrow = None
+
+FORMATS = ("csv", "parquet")
+
+# statement_timeout (ms) de las exportaciones. En un COPY cuenta también el tiempo que
+# el cliente tarda en descargar, por eso es más largo que el del carril; si el cliente
+# se desconecta la consulta se cancela antes (cancellation.py)
+EXPORT_TIMEOUT = int(os.getenv("EXPORT_STATEMENT_TIMEOUT", "600000"))
+
+MEDIA_TYPES = {
+    "csv": "text/csv; charset=utf-8",
+    "parquet": "application/vnd.apache.parquet",
+}
+
+
+def _fixed(query):
+    return lambda: (query, None)
+
+
+def _reservas_por_rango_fechas(fecha_inicio, fecha_fin):
+    return RESERVAS_POR_RANGO_FECHAS, (fecha_inicio, fecha_fin)
+
+
+# Nombre del export (el mismo de su endpoint JSON) -> función que retorna (query, params)
+EXPORTS = {
+    "ingresos-mes": _fixed(INGRESOS_TOTALES_POR_MES),
+    "reservas-por-usuario": _fixed(RESERVAS_POR_USUARIO),
+    "reservas-por-estado": _fixed(RESERVAS_POR_ESTADO),
+    "reservas-por-tipo-cancha": _fixed(RESERVAS_POR_TIPO_CANCHA),
+    "reservas-por-cancha": _fixed(RESERVAS_POR_CANCHA),
+    "reservas-por-dia": _fixed(RESERVAS_POR_DIA),
+    "reservas-por-hora": _fixed(RESERVAS_POR_HORA),
+    "promociones-mas-usadas": _fixed(PROMOCIONES_MAS_USADAS),
+    "reservas-con-promocion": _fixed(RESERVAS_CON_PROMOCION),
+    "facturacion-por-usuario": _fixed(FACTURACION_POR_USUARIO),
+    "facturacion-por-tipo-cancha": _fixed(FACTURACION_POR_TIPO_CANCHA),
+    "reservas-canceladas-por-usuario": _fixed(RESERVAS_CANCELADAS_POR_USUARIO),
+    "reservas-pendientes-por-usuario": _fixed(RESERVAS_PENDIENTES_POR_USUARIO),
+    "reservas-confirmadas-por-usuario": _fixed(RESERVAS_CONFIRMADAS_POR_USUARIO),
+    "canchas-mas-rentadas": _fixed(CANCHAS_MAS_RENTADAS),
+    "usuarios-con-mas-reservas": _fixed(USUARIOS_CON_MAS_RESERVAS),
+    "promociones-activas-hoy": _fixed(PROMOCIONES_ACTIVAS_HOY),
+    "reservas-por-promocion": _fixed(RESERVAS_POR_PROMOCION),
+    "ingresos-por-dia": _fixed(INGRESOS_POR_DIA),
+    "reservas-por-rango-fechas": _reservas_por_rango_fechas,
+    "courts-type": _fixed(GET_COURTS_TYPE),
+    "promociones": _fixed(GET_PROMOCIONES),
+    "reservas": build_reservas,
+    "ingresos": build_ingresos,
+    "usuarios": build_usuarios,
+    "promociones-aplicadas": build_promociones_aplicadas,
+    "cuantas-veces": build_cuantas_veces,
+    "disponibilidad-canchas": build_disponibilidad_canchas,
+}
+
+# Filtros numéricos de los build_* (llegan como texto en el query string)
+INT_FILTERS = {"canchas_tipo", "cancha_tipo", "tipo_cancha", "min_reservas"}
+
+
+def export_query(reporte, filtros):
+    """
+    Retorna (query, params) del reporte con esos filtros. Lanza KeyError si el reporte
+    no existe y ValueError si los filtros no corresponden.
+    """
+    build = EXPORTS[reporte]
+    signature = inspect.signature(build)
+    unknown = set(filtros) - set(signature.parameters)
+    if unknown:
+        raise ValueError(f"Filtros no válidos para {reporte}: {', '.join(sorted(unknown))}")
+    missing = [
+        name for name, param in signature.parameters.items()
+        if param.default is inspect.Parameter.empty and name not in filtros
+    ]
+    if missing:
+        raise ValueError(f"Faltan filtros para {reporte}: {', '.join(missing)}")
+    kwargs = {}
+    for name, value in filtros.items():
+        try:
+            kwargs[name] = int(value) if name in INT_FILTERS else value
+        except ValueError:
+            raise ValueError(f"{name} debe ser un número")
+    return build(**kwargs)
+
+
+class _Sink:
+    """
+    Archivo de solo escritura para ParquetWriter; take() retorna lo escrito desde la
+    última vez, para mandarlo al cliente sin acumular el archivo entero.
+    """
+    closed = False
+
+    def __init__(self):
+        self._chunks = []
+
+    def write(self, data):
+        self._chunks.append(bytes(data))
+        return len(data)
+
+    def flush(self):
+        pass
+
+    def close(self):
+        self.closed = True
+
+    def take(self):
+        data = b"".join(self._chunks)
+        self._chunks.clear()
+        return data
+
+
+def _widen(field):
+    # El esquema sale del primer lote: se ensancha lo que un lote posterior podría no respetar
+    if pyarrow.types.is_null(field.type):
+        return field.with_type(pyarrow.string())
+    if pyarrow.types.is_decimal(field.type):
+        return field.with_type(pyarrow.decimal128(38, field.type.scale))
+    return field
+
+
+class ParquetEncoder:
+    """
+    Convierte lotes de filas (dicts) en un archivo Parquet entregado por partes.
+    """
+    def __init__(self):
+        if pyarrow is None:
+            raise ValueError("El formato parquet requiere pyarrow (pip install pyarrow)")
+        self._sink = _Sink()
+        self._writer = None
+        self._schema = None
+
+    def encode(self, rows):
+        if self._writer is None:
+            table = pyarrow.Table.from_pylist(rows)
+            self._schema = pyarrow.schema([_widen(field) for field in table.schema])
+            table = table.cast(self._schema)
+            self._writer = pyarrow.parquet.ParquetWriter(self._sink, self._schema)
+        else:
+            table = pyarrow.Table.from_pylist(rows, schema=self._schema)
+        self._writer.write_table(table)
+        return self._sink.take()
+
+    def close(self):
+        if self._writer is None:
+            self._writer = pyarrow.parquet.ParquetWriter(self._sink, pyarrow.schema([]))
+        self._writer.close()
+        return self._sink.take()
+
+
+class Exporter:
+    def __init__(self):
+        self.db = Database(ANALYTICS, read_only=True)
+
+    def export(self, reporte, filtros, formato):
+        """
+        Retorna (generador con los datos de la BD, encoder o None) para responder el
+        reporte en ese formato. Lanza KeyError si el reporte no existe y ValueError si
+        los filtros o el formato no son válidos.
+        """
+        if formato not in FORMATS:
+            raise ValueError(f"formato debe ser uno de {', '.join(FORMATS)}")
+        query, params = export_query(reporte, filtros)
+        if formato == "csv":
+            return self.db.copy_csv(query, params, timeout=EXPORT_TIMEOUT), None
+        return self.db.stream(query, params, timeout=EXPORT_TIMEOUT), ParquetEncoder()
+
+
+class AsyncExporter:
+    """
+    Versión asyncio de Exporter: los generadores que retorna son asíncronos.
+    """
+    def __init__(self):
+        self.db = AsyncDatabase(ANALYTICS, read_only=True)
+
+    def export(self, reporte, filtros, formato):
+        if formato not in FORMATS:
+            raise ValueError(f"formato debe ser uno de {', '.join(FORMATS)}")
+        query, params = export_query(reporte, filtros)
+        if formato == "csv":
+            return self.db.copy_csv(query, params, timeout=EXPORT_TIMEOUT), None
+        return self.db.stream(query, params, timeout=EXPORT_TIMEOUT), ParquetEncoder()
@@ -0,0 +1,344 @@
+"""
+Límite de requests por cliente (token bucket) y descarte de carga.
+
+LimitsMiddleware clasifica cada request por su ruta (ROUTE_CLASSES) y la rechaza antes
+de que llegue a la base en dos casos:
+
+- Descarte de carga, 503 con Retry-After: para las clases caras (SHED_LANES:
+  reportes y disponibilidad) cuando la espera por una conexión del carril que usan
+  (bd.acquire_waits) supera SHED_POOL_WAIT segundos (OLTP) o SHED_ANALYTICS_POOL_WAIT
+  (ANALYTICS), o cuando ya hay SHED_REPORTS_IN_FLIGHT reportes en curso en el proceso.
+  Las reservas y el resto de la API no se descartan: son las que se quiere proteger
+  durante un pico.
+- Límite por cliente, 429 con Retry-After: un balde de RATE_LIMIT_<CLASE> = "r/b"
+  (r solicitudes por segundo, ráfagas de hasta b) por clase de ruta y cliente. Por
+  defecto sólo se limitan reportes, disponibilidad y login/registro; el resto de la
+  API (DEFAULT), únicamente si se define RATE_LIMIT_DEFAULT. El cliente es el usuario
+  del token (request.state.principal, ver access.py) o, sin token, la IP que ve
+  uvicorn (con un proxy delante, usar --proxy-headers).
+
+Los baldes viven en memoria del proceso (RATE_LIMIT_BACKEND=memory) o en un archivo
+SQLite compartido por todos los workers del host (sqlite), igual que cache.py; con
+memory cada worker tiene sus propios baldes y el límite efectivo se multiplica por la
+cantidad de workers. Los reportes en curso se cuentan siempre por proceso, porque
+cada worker tiene su propio pool.
+"""
+import asyncio
+import math
+import os
+import re
+import sqlite3
+import threading
+import time
+
+from starlette.responses import JSONResponse
+
+from bd import ANALYTICS, OLTP, acquire_waits, lane_config
+from localfiles import default_path, prepare
+
+RATE_LIMIT_ENABLED = os.getenv("RATE_LIMIT_ENABLED", "1").lower() in ("1", "true", "yes")
+RATE_LIMIT_BACKEND = os.getenv("RATE_LIMIT_BACKEND", "memory").lower()
+RATE_LIMIT_SQLITE_PATH = os.getenv("RATE_LIMIT_SQLITE_PATH") or default_path("canchas-ratelimit.sqlite3")
+RATE_LIMIT_MAX_KEYS = int(os.getenv("RATE_LIMIT_MAX_KEYS", "100000"))
+
+SHED_ENABLED = os.getenv("SHED_ENABLED", "1").lower() in ("1", "true", "yes")
+SHED_POOL_WAIT = float(os.getenv("SHED_POOL_WAIT", "0.25"))
+SHED_ANALYTICS_POOL_WAIT = float(os.getenv("SHED_ANALYTICS_POOL_WAIT", "1"))
+# Por defecto el doble del pool de reportes: tantos esperando como ejecutándose
+SHED_REPORTS_IN_FLIGHT = int(os.getenv("SHED_REPORTS_IN_FLIGHT") or 2 * lane_config(ANALYTICS)["max"])
+SHED_RETRY_AFTER = int(os.getenv("SHED_RETRY_AFTER", "1"))
+
+REPORTS = "reports"
+AVAILABILITY = "availability"
+AUTH = "auth"
+DEFAULT = "default"
+
+# (clase, método o None para todos, patrón del path); gana la primera que coincide
+ROUTE_CLASSES = [
+    (REPORTS, None, re.compile(r"^/api/(reports|export)(/|$)")),
+    (REPORTS, None, re.compile(
+        r"^/api/(reservas|ingresos|usuarios|promociones-aplicadas|cuantas-veces|disponibilidad-canchas)/?$"
+    )),
+    (AVAILABILITY, None, re.compile(r"^/api/courts/[^/]+/(available|unavailable)/?$")),
+    (AVAILABILITY, None, re.compile(r"^/api/availability(/|$)")),
+    (AUTH, "POST", re.compile(r"^/api/(login|register)/?$")),
+]
+
+# Clases que se pueden descartar y el carril de la BD que usan
+SHED_LANES = {REPORTS: ANALYTICS, AVAILABILITY: OLTP}
+
+
+def parse_limit(spec):
+    """
+    "r/b" -> (r, b); "0", "off" o vacío -> None (sin límite).
+    """
+    spec = (spec or "").strip().lower()
+    if spec in ("", "0", "off"):
+        return None
+    rate, _, burst = spec.partition("/")
+    rate = float(rate)
+    return rate, float(burst) if burst else max(1.0, rate)
+
+
+# Un panel que pide los 19 reportes a la vez entra en la ráfaga; luego uno cada segundo.
+# El resto de la API (DEFAULT) no tiene límite salvo que se defina RATE_LIMIT_DEFAULT:
+# reservas y consultas de un cliente legítimo no deberían recibir 429.
+RATE_LIMITS = {
+    REPORTS: parse_limit(os.getenv("RATE_LIMIT_REPORTS", "1/30")),
+    AVAILABILITY: parse_limit(os.getenv("RATE_LIMIT_AVAILABILITY", "5/20")),
+    AUTH: parse_limit(os.getenv("RATE_LIMIT_AUTH", "1/10")),
+    DEFAULT: parse_limit(os.getenv("RATE_LIMIT_DEFAULT")),
+}
+
+
+def route_class(method, path, rules=ROUTE_CLASSES):
+    for name, rule_method, pattern in rules:
+        if (rule_method is None or rule_method == method) and pattern.match(path):
+            return name
+    return DEFAULT
+
+
+class TokenBuckets:
+    """
+    Baldes en memoria del proceso: key -> (fichas, última actualización, momento en
+    que vuelve a estar lleno). Solo se usan desde el event loop, no necesitan lock.
+    Al pasar de `max_keys` se descartan los baldes llenos (equivalen a no tenerlos)
+    y, si no alcanza, los más antiguos. `blocking` indica que take hace E/S que puede
+    esperar (sqlite): el middleware entonces la corre en un hilo.
+    """
+    backend = "memory"
+    blocking = False
+
+    def __init__(self, max_keys=RATE_LIMIT_MAX_KEYS):
+        self.max_keys = max_keys
+        self._buckets = {}
+
+    def take(self, key, rate, burst):
+        """
+        Saca una ficha del balde. Retorna 0 si se pudo, o los segundos hasta la próxima.
+        """
+        now = time.monotonic()
+        bucket = self._buckets.get(key)
+        tokens = burst if bucket is None else min(burst, bucket[0] + (now - bucket[1]) * rate)
+        if tokens < 1:
+            return (1 - tokens) / rate
+        tokens -= 1
+        if bucket is None and len(self._buckets) >= self.max_keys:
+            self._prune(now)
+        self._buckets[key] = (tokens, now, now + (burst - tokens) / rate)
+        return 0
+
+    def _prune(self, now):
+        for key in [key for key, bucket in self._buckets.items() if bucket[2] <= now]:
+            del self._buckets[key]
+        while len(self._buckets) >= self.max_keys:
+            self._buckets.pop(next(iter(self._buckets)))
+
+    def clear(self):
+        self._buckets.clear()
+
+    def stats(self):
+        return {"backend": self.backend, "keys": len(self._buckets)}
+
+
+SQLITE_SCHEMA = """
+    CREATE TABLE IF NOT EXISTS buckets (
+        key     TEXT PRIMARY KEY,
+        tokens  REAL NOT NULL,
+        updated REAL NOT NULL,
+        full_at REAL NOT NULL
+    );
+    CREATE INDEX IF NOT EXISTS buckets_full_at ON buckets (full_at);
+"""
+
+# Una sola sentencia: SQLite la aplica de forma atómica aunque varios workers saquen
+# del mismo balde a la vez. Sin fila en RETURNING el balde estaba vacío
+TAKE = """
+    INSERT INTO buckets (key, tokens, updated, full_at)
+    VALUES (:key, :burst - 1, :now, :now + 1 / :rate)
+    ON CONFLICT (key) DO UPDATE SET
+        tokens = min(:burst, tokens + (:now - updated) * :rate) - 1,
+        updated = :now,
+        full_at = :now + (1 + :burst - min(:burst, tokens + (:now - updated) * :rate)) / :rate
+    WHERE min(:burst, tokens + (:now - updated) * :rate) >= 1
+    RETURNING tokens;
+"""
+
+LEVEL = "SELECT min(:burst, tokens + (:now - updated) * :rate) FROM buckets WHERE key = :key;"
+
+
+class SQLiteTokenBuckets(TokenBuckets):
+    """
+    Baldes compartidos entre procesos sobre un archivo SQLite (modo WAL). Cada
+    PRUNE_INTERVAL segundos el proceso borra los baldes que ya se llenaron.
+    """
+    backend = "sqlite"
+    blocking = True
+    PRUNE_INTERVAL = 60.0
+
+    def __init__(self, path=RATE_LIMIT_SQLITE_PATH):
+        self.path = path
+        self._local = threading.local()
+        self._next_prune = 0.0
+        self._conn().executescript(SQLITE_SCHEMA)
+
+    def _conn(self):
+        # Una conexión por hilo y por proceso, como SQLiteCache
+        conn = getattr(self._local, "conn", None)
+        if conn is None or self._local.pid != os.getpid():
+            prepare(self.path)
+            conn = sqlite3.connect(self.path, timeout=5, isolation_level=None, check_same_thread=False)
+            conn.execute("PRAGMA journal_mode=WAL;")
+            conn.execute("PRAGMA synchronous=OFF;")
+            self._local.conn = conn
+            self._local.pid = os.getpid()
+        return conn
+
+    def take(self, key, rate, burst):
+        # Reloj de pared: los workers no comparten time.monotonic()
+        now = time.time()
+        conn = self._conn()
+        params = {"key": key, "rate": rate, "burst": burst, "now": now}
+        if now >= self._next_prune:
+            self._next_prune = now + self.PRUNE_INTERVAL
+            conn.execute("DELETE FROM buckets WHERE full_at <= ?;", (now,))
+        if conn.execute(TAKE, params).fetchone() is not None:
+            return 0
+        row = conn.execute(LEVEL, params).fetchone()
+        tokens = row[0] if row else burst
+        return max(0.0, (1 - tokens) / rate)
+
+    def clear(self):
+        self._conn().execute("DELETE FROM buckets;")
+
+    def stats(self):
+        return {"backend": self.backend, "path": self.path,
+                "keys": self._conn().execute("SELECT COUNT(*) FROM buckets;").fetchone()[0]}
+
+
+def make_buckets(backend=RATE_LIMIT_BACKEND):
+    if backend == "memory":
+        return TokenBuckets()
+    if backend == "sqlite":
+        return SQLiteTokenBuckets()
+    raise ValueError(f"RATE_LIMIT_BACKEND desconocido: {backend} (usar memory o sqlite)")
+
+
+class LoadShedder:
+    """
+    Decide si se descarta una request de una clase cara y cuenta los reportes en
+    curso. Solo se usa desde el event loop.
+    """
+    def __init__(self, pool_wait=None, reports_in_flight=SHED_REPORTS_IN_FLIGHT, lanes=SHED_LANES,
+                 waits=acquire_waits):
+        self.pool_wait = pool_wait or {OLTP: SHED_POOL_WAIT, ANALYTICS: SHED_ANALYTICS_POOL_WAIT}
+        self.reports_in_flight = reports_in_flight
+        self.lanes = lanes
+        self.waits = waits
+        self.in_flight = 0
+
+    def reason(self, name):
+        """
+        None si la request puede pasar, o el motivo del descarte.
+        """
+        if name not in self.lanes:
+            return None
+        if name == REPORTS and self.in_flight >= self.reports_in_flight:
+            return "reports_in_flight"
+        lane = self.lanes[name]
+        if self.waits[lane].current() > self.pool_wait[lane]:
+            return "pool_wait"
+        return None
+
+    def stats(self):
+        return {
+            "pool_wait": {lane: round(self.waits[lane].current(), 4) for lane in self.pool_wait},
+            "pool_wait_threshold": self.pool_wait,
+            "reports_in_flight": self.in_flight,
+            "reports_in_flight_threshold": self.reports_in_flight,
+        }
+
+
+# Baldes y descarte del proceso (None si están desactivados)
+rate_buckets = make_buckets() if RATE_LIMIT_ENABLED else None
+load_shedder = LoadShedder() if SHED_ENABLED else None
+
+
+class LimitsStats:
+    """
+    Requests rechazadas por clase de ruta y motivo (rate_limit, pool_wait,
+    reports_in_flight), para GET /limits y /metrics.
+    """
+    def __init__(self):
+        self.rejected = {}
+
+    def reject(self, name, reason):
+        key = (name, reason)
+        self.rejected[key] = self.rejected.get(key, 0) + 1
+
+
+limits_stats = LimitsStats()
+
+
+def _client(scope):
+    principal = scope.get("state", {}).get("principal")
+    if principal is not None:
+        return f"user:{principal['id_user']}"
+    client = scope.get("client")
+    return f"ip:{client[0] if client else '-'}"
+
+
+class LimitsMiddleware:
+    """
+    Middleware ASGI. Va por dentro de AuthMiddleware para conocer al usuario del token.
+    `buckets` None desactiva el límite por cliente y `shedder` None, el descarte.
+    """
+    def __init__(self, app, buckets=rate_buckets, shedder=load_shedder, limits=RATE_LIMITS, rules=ROUTE_CLASSES,
+                 stats=limits_stats):
+        self.app = app
+        self.buckets = buckets
+        self.shedder = shedder
+        self.limits = limits
+        self.rules = rules
+        self.stats = stats
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        name = route_class(scope["method"], scope["path"], self.rules)
+        if self.shedder is not None:
+            reason = self.shedder.reason(name)
+            if reason is not None:
+                self.stats.reject(name, reason)
+                await self._deny(scope, receive, send, 503, SHED_RETRY_AFTER,
+                                 "El servidor está ocupado, reintente en un momento.")
+                return
+
+        limit = self.limits.get(name)
+        if self.buckets is not None and limit is not None:
+            key = f"{name}:{_client(scope)}"
+            if self.buckets.blocking:
+                # El archivo puede estar bloqueado por otro worker: no frenar el event loop
+                wait = await asyncio.to_thread(self.buckets.take, key, *limit)
+            else:
+                wait = self.buckets.take(key, *limit)
+            if wait:
+                self.stats.reject(name, "rate_limit")
+                await self._deny(scope, receive, send, 429, math.ceil(wait),
+                                 "Demasiadas solicitudes, reintente en un momento.")
+                return
+
+        if name != REPORTS or self.shedder is None:
+            await self.app(scope, receive, send)
+            return
+        self.shedder.in_flight += 1
+        try:
+            await self.app(scope, receive, send)
+        finally:
+            self.shedder.in_flight -= 1
+
+    async def _deny(self, scope, receive, send, status, retry_after, detail):
+        headers = {"Retry-After": str(retry_after)}
+        await JSONResponse({"detail": detail}, status_code=status, headers=headers)(scope, receive, send)
@@ -0,0 +1,61 @@
+"""
+Archivos locales que comparten los workers del host: los backends sqlite de cache.py,
+limits.py y replicas.py.
+
+Por defecto van en un directorio privado del usuario del proceso: $XDG_RUNTIME_DIR/canchas
+o, si no está definido, /dev/shm/canchas-<uid> (el directorio temporal si no hay
+/dev/shm), creado con permisos 0700. Así otro usuario del host no puede crear el
+archivo antes que la app ni escribir en él.
+
+prepare(path) se llama antes de abrir cada archivo (también si la ruta viene de una
+variable de entorno) y lo rechaza con PermissionError si el archivo, o el directorio
+que lo contiene, es de otro usuario o lo pueden escribir otros.
+"""
+import os
+import stat
+import tempfile
+
+
+def default_path(filename):
+    runtime_dir = os.getenv("XDG_RUNTIME_DIR")
+    if runtime_dir:
+        return os.path.join(runtime_dir, "canchas", filename)
+    root = "/dev/shm" if os.path.isdir("/dev/shm") else tempfile.gettempdir()
+    return os.path.join(root, f"canchas-{os.getuid()}", filename)
+
+
+def _check(path, st, kind):
+    if st.st_uid != os.getuid():
+        raise PermissionError(f"{kind} {path} es de otro usuario (uid {st.st_uid}); no se usa")
+    if st.st_mode & (stat.S_IWGRP | stat.S_IWOTH):
+        raise PermissionError(f"{kind} {path} lo pueden escribir otros usuarios; no se usa")
+
+
+def prepare(path):
+    """
+    Crea el directorio (0700) y el archivo (0600) si faltan, y verifica que los dos
+    sean del usuario del proceso y que nadie más pueda escribirlos. Un directorio
+    compartido con sticky bit (como /tmp) se acepta: ahí nadie puede reemplazar un
+    archivo ajeno. Los -wal y -shm de SQLite se verifican si ya existen.
+    """
+    directory = os.path.dirname(os.path.abspath(path))
+    os.makedirs(directory, mode=0o700, exist_ok=True)
+    st = os.stat(directory)
+    if not st.st_mode & stat.S_ISVTX:
+        if st.st_uid not in (os.getuid(), 0):
+            raise PermissionError(f"El directorio {directory} es de otro usuario (uid {st.st_uid}); no se usa")
+        if st.st_mode & (stat.S_IWGRP | stat.S_IWOTH):
+            raise PermissionError(f"El directorio {directory} lo pueden escribir otros usuarios; no se usa")
+
+    fd = os.open(path, os.O_RDWR | os.O_CREAT | getattr(os, "O_NOFOLLOW", 0), 0o600)
+    try:
+        _check(path, os.fstat(fd), "El archivo")
+    finally:
+        os.close(fd)
+    for suffix in ("-wal", "-shm"):
+        try:
+            st = os.lstat(path + suffix)
+        except FileNotFoundError:
+            continue
+        _check(path + suffix, st, "El archivo")
+    return path
@@ -1,19 +1,82 @@
-from fastapi import FastAPI, APIRouter, HTTPException, Query
+import inspect
+import os
+import psycopg
+import psycopg2
+from contextlib import asynccontextmanager
+from fastapi import FastAPI, APIRouter, HTTPException, Query, Request, Response
+from fastapi.concurrency import run_in_threadpool
+from fastapi.encoders import jsonable_encoder
+from fastapi.responses import JSONResponse, StreamingResponse
 from fastapi.middleware.cors import CORSMiddleware
 from pydantic import BaseModel
-from typing import Optional
-from custom_reports import CustomReports
-
-from userCrud import UserCrud
-from auth import Auth
-from crud import CourtCrud
-from reportsCrud import Reports
+from typing import List, Optional
+from custom_reports import AsyncCustomReports, CustomReports
+
+from userCrud import AsyncUserCrud, UserCrud
+from auth import AsyncAuth, Auth
+from crud import AsyncCourtCrud, CourtCrud, recurrence_slots
+from availability import AsyncAvailability, Availability
+from export import EXPORTS, MEDIA_TYPES, AsyncExporter, Exporter
+from reportsCrud import AsyncReports, Reports
+from materialized import MaterializedViews, RefreshScheduler
+from rollups import Rollups
+from cache import etag_for, etag_matches, invalidate_async, query_cache
+from pagination import STREAM_FORMATS, JsonEncoder
+from rendering import dumps, mode_for, render_mode
+from querystats import query_stats
+from metrics import CONTENT_TYPE as METRICS_CONTENT_TYPE, METRICS_ENABLED, MetricsMiddleware, render_metrics
+from tracing import TRACING_ENABLED, TracingMiddleware, exporter as trace_exporter, span
+from access import AUTH_ENABLED, AuthMiddleware, is_admin, principal_cache
+from limits import (
+    AVAILABILITY, RATE_LIMIT_ENABLED, REPORTS, SHED_ENABLED, LimitsMiddleware, limits_stats, load_shedder, rate_buckets,
+    route_class,
+)
+from cancellation import CancelOnDisconnectMiddleware
+from replicas import recent_writes, replica_set
+from singleflight import single_flight
+from bd import (
+    ANALYTICS, OLTP, async_pool_stats, close_async_pool, get_async_pool, pool_stats, statement_stats,
+)
 
 API_PREFIX = "/api"
 
-app = FastAPI()
+# "sync": psycopg2 en el threadpool de Starlette. "async": psycopg 3 sobre el event loop.
+DB_MODE = os.getenv("DB_MODE", "sync").lower()
+ASYNC_DB = DB_MODE == "async"
+
+refresh_scheduler = RefreshScheduler()
+
+@asynccontextmanager
+async def lifespan(app):
+    if ASYNC_DB:
+        await get_async_pool(OLTP)
+        await get_async_pool(ANALYTICS)
+    refresh_scheduler.start()
+    yield
+    refresh_scheduler.stop()
+    await close_async_pool()
+
+app = FastAPI(lifespan=lifespan)
 router = APIRouter()
-custom_reports = CustomReports()
+
+# Reportes y disponibilidad: si el cliente se desconecta se cancela la consulta (ver
+# cancellation.py). Es el más interno, así solo se cancela el endpoint
+CANCEL_ON_DISCONNECT = os.getenv("CANCEL_ON_DISCONNECT", "1").lower() in ("1", "true", "yes")
+if CANCEL_ON_DISCONNECT:
+    app.add_middleware(
+        CancelOnDisconnectMiddleware,
+        match=lambda method, path: method == "GET" and route_class(method, path) in (REPORTS, AVAILABILITY),
+    )
+
+# Límite por cliente y descarte de carga (ver limits.py). Se agrega antes que Auth para
+# quedar por dentro de AuthMiddleware y poder limitar por usuario
+if RATE_LIMIT_ENABLED or SHED_ENABLED:
+    app.add_middleware(LimitsMiddleware)
+
+# Tokens de /login y rutas solo para administradores (ver access.py). Se agrega antes
+# que CORS para quedar por dentro: los 401/403 también llevan los encabezados CORS
+if AUTH_ENABLED:
+    app.add_middleware(AuthMiddleware, loader=lambda id_user: call_db(user_crud.get_principal, id_user))
 
 # CORS (opcional, para desarrollo)
 app.add_middleware(
@@ -24,10 +87,125 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
-user_crud = UserCrud()
-auth = Auth()
-court_crud = CourtCrud()
-reports = Reports()
+# Requests por ruta, latencia y en curso para GET /metrics
+if METRICS_ENABLED:
+    app.add_middleware(MetricsMiddleware)
+
+# Trazas muestreadas (ver tracing.py)
+if TRACING_ENABLED:
+    app.add_middleware(TracingMiddleware)
+
+if ASYNC_DB:
+    user_crud = AsyncUserCrud()
+    auth = AsyncAuth()
+    court_crud = AsyncCourtCrud()
+    availability = AsyncAvailability()
+    reports = AsyncReports()
+    custom_reports = AsyncCustomReports()
+    exporter = AsyncExporter()
+else:
+    user_crud = UserCrud()
+    auth = Auth()
+    court_crud = CourtCrud()
+    availability = Availability()
+    reports = Reports()
+    custom_reports = CustomReports()
+    exporter = Exporter()
+
+materialized_views = MaterializedViews()
+rollups = Rollups()
+
+
+async def call_db(method, *args, **kwargs):
+    """
+    Ejecuta un método de CRUD: con await si es asíncrono, o en el threadpool si es
+    síncrono (así el event loop nunca queda bloqueado por psycopg2).
+    """
+    with span(f"crud {method.__qualname__}"):
+        if inspect.iscoroutinefunction(method):
+            return await method(*args, **kwargs)
+        return await run_in_threadpool(method, *args, **kwargs)
+
+
+async def call_rendered(endpoint, method, *args):
+    """
+    call_db para los reportes: el CRUD lee las filas en el modo de render del endpoint
+    (ver rendering.py) y, salvo en modo "python", el resultado se serializa con orjson
+    sin pasar por jsonable_encoder.
+    """
+    mode = mode_for(endpoint)
+    token = render_mode.set(mode)
+    try:
+        result = await call_db(method, *args)
+    finally:
+        render_mode.reset(token)
+    if result.get("timeout"):
+        raise HTTPException(status_code=504, detail=result["error"])
+    if mode == "python":
+        return result
+    with span("serialize", mode=mode):
+        return Response(dumps(result), media_type="application/json")
+
+
+def etag_response(request, result):
+    """
+    Serializa el resultado igual que FastAPI y le agrega un ETag; si el cliente ya
+    tiene esa versión (If-None-Match) responde 304 sin cuerpo.
+    """
+    response = JSONResponse(jsonable_encoder(result), headers={"Cache-Control": "no-cache"})
+    etag = etag_for(response.body)
+    if etag_matches(request.headers.get("if-none-match"), etag):
+        return Response(status_code=304, headers={"ETag": etag, "Cache-Control": "no-cache"})
+    response.headers["ETag"] = etag
+    return response
+
+
+async def _next_chunk(source):
+    if inspect.isasyncgen(source):
+        return await anext(source, None)
+    return await run_in_threadpool(next, source, None)
+
+
+async def streaming_response(source, media_type, encoder=None, headers=None):
+    """
+    Responde a medida que el generador `source` (sync o async) entrega datos de la BD,
+    pasándolos por `encoder` si hay uno (encode(lote) / close()). El primer lote se
+    lee antes de responder para que un error de la consulta todavía se pueda devolver
+    como 500.
+    """
+    try:
+        first = await _next_chunk(source)
+    except (psycopg.errors.QueryCanceled, psycopg2.errors.QueryCanceled) as e:
+        raise HTTPException(status_code=504, detail=str(e).split('\n')[0])
+    except (psycopg.Error, psycopg2.Error) as e:
+        raise HTTPException(status_code=500, detail=str(e).split('\n')[0])
+
+    async def body():
+        # Si el cliente se desconecta Starlette abandona este generador; cerrar el de
+        # la BD en el finally devuelve la conexión al pool en vez de esperar al GC.
+        try:
+            chunk = first
+            while chunk is not None:
+                yield encoder.encode(chunk) if encoder else chunk
+                chunk = await _next_chunk(source)
+            if encoder:
+                yield encoder.close()
+        finally:
+            if inspect.isasyncgen(source):
+                await source.aclose()
+            else:
+                await run_in_threadpool(source.close)
+    return StreamingResponse(body(), media_type=media_type, headers=headers)
+
+
+async def stream_response(batches, formato):
+    """
+    Listado por partes (`stream=ndjson|json`) leído con un cursor del lado del servidor.
+    """
+    if formato not in STREAM_FORMATS:
+        raise HTTPException(status_code=400, detail=f"stream debe ser uno de {', '.join(STREAM_FORMATS)}")
+    encoder = JsonEncoder(formato)
+    return await streaming_response(batches, encoder.media_type, encoder)
 
 
 # --------- MODELOS ---------
@@ -58,42 +236,75 @@ class BookingRequest(BaseModel):
     start_time: str
     end_time: str
 
+class BookingSlot(BaseModel):
+    schedule_date: str
+    start_time: str
+    end_time: str
+
+class BookingRecurrence(BaseModel):
+    start_date: str
+    weeks: int
+    start_time: str
+    end_time: str
+    weekdays: Optional[List[int]] = None  # 1 = lunes ... 7 = domingo; por defecto el de start_date
+
+class BookingBatchRequest(BaseModel):
+    id_user: int
+    id_court: int
+    slots: Optional[List[BookingSlot]] = None
+    recurrence: Optional[BookingRecurrence] = None
+    atomic: bool = True  # con un solo conflicto no se reserva nada
+
 class UpdateBookingStatus(BaseModel):
     new_status: str
 
 # --------- ENDPOINTS ---------
 @router.get("/")
-def hola():
+async def hola():
     return "<h1>API!!</h1>"
 
 @router.post("/register")
-def register(user: UserRegister):
-    result = auth.register(user.name, user.last_name, user.email, user.password)
+async def register(user: UserRegister):
+    result = await call_db(auth.register, user.name, user.last_name, user.email, user.password)
+    if result.get("busy"):
+        raise HTTPException(status_code=503, detail=result["error"], headers={"Retry-After": str(result["retry_after"])})
     if not result["success"]:
         raise HTTPException(status_code=400, detail=result["error"])
     return result
 
 @router.post("/login")
-def login(user: UserLogin):
-    result = auth.login(user.email, user.password)
+async def login(user: UserLogin):
+    result = await call_db(auth.login, user.email, user.password)
+    if result.get("busy"):
+        raise HTTPException(status_code=503, detail=result["error"], headers={"Retry-After": str(result["retry_after"])})
     if not result["success"]:
         raise HTTPException(status_code=401, detail=result["error"])
     return result
 
 @router.get("/users")
-def get_all_users():
-    return user_crud.get_all_users()
+async def get_all_users(cursor: str = Query(None), limit: int = Query(None, ge=1), stream: str = Query(None)):
+    """
+    Sin parámetros retorna todos los usuarios. Con `limit`/`cursor` pagina por id_user
+    (seguir `next_cursor`); con `stream=ndjson|json` los envía por partes.
+    """
+    if stream:
+        return await stream_response(user_crud.get_all_users_stream(), stream)
+    return await call_db(user_crud.get_all_users, cursor, limit)
 
 @router.get("/users/{id_user}")
-def get_user(id_user: int):
-    result = user_crud.get_user_by_id(id_user)
+async def get_user(id_user: int):
+    result = await call_db(user_crud.get_user_by_id, id_user)
     if not result["success"]:
         raise HTTPException(status_code=404, detail=result["error"])
     return result
 
 @router.put("/users/{id_user}")
-def update_user(id_user: int, user: UpdateUser):
-    result = user_crud.update_user(
+async def update_user(id_user: int, user: UpdateUser, request: Request):
+    # AuthMiddleware ya verificó que sea el mismo usuario o un administrador
+    if AUTH_ENABLED and user.id_role is not None and not is_admin(request.state.principal):
+        raise HTTPException(status_code=403, detail="Solo un administrador puede cambiar el rol.")
+    result = await call_db(
+        user_crud.update_user,
         id_user,
         name=user.name,
         last_name=user.last_name,
@@ -101,220 +312,424 @@ def update_user(id_user: int, user: UpdateUser):
         password=user.password,
         id_role=user.id_role
     )
+    if result.get("busy"):
+        raise HTTPException(status_code=503, detail=result["error"], headers={"Retry-After": str(result["retry_after"])})
     if not result["success"]:
         raise HTTPException(status_code=400, detail=result["error"])
     return result
 
 @router.delete("/users/{id_user}")
-def delete_user(id_user: int):
-    result = user_crud.delete_user(id_user)
+async def delete_user(id_user: int):
+    result = await call_db(user_crud.delete_user, id_user)
     if not result["success"]:
         raise HTTPException(status_code=404, detail=result["error"])
     return result
 
 @router.post("/users/{id_user}/phones")
-def add_phone(id_user: int, phone: AddPhone):
-    result = user_crud.add_phone(id_user, phone.phone_number)
+async def add_phone(id_user: int, phone: AddPhone):
+    result = await call_db(user_crud.add_phone, id_user, phone.phone_number)
     if not result["success"]:
         raise HTTPException(status_code=400, detail=result["error"])
     return result
 
 @router.get("/users/{id_user}/phones")
-def get_phones(id_user: int):
-    return user_crud.get_phones(id_user)
+async def get_phones(id_user: int):
+    return await call_db(user_crud.get_phones, id_user)
 
 @router.get("/courts")
-def get_all_courts():
-    return court_crud.get_all_courts()
+async def get_all_courts(request: Request):
+    return etag_response(request, await call_db(court_crud.get_all_courts))
 
 @router.get("/courts/type/{id_type}")
-def get_courts_by_type(id_type: int):
-    return court_crud.get_courts_by_type(id_type)
+async def get_courts_by_type(id_type: int, request: Request):
+    return etag_response(request, await call_db(court_crud.get_courts_by_type, id_type))
 
 @router.get("/courts/{id_court}")
-def get_court_details(id_court: int):
-    return court_crud.get_court_details(id_court)
+async def get_court_details(id_court: int):
+    return await call_db(court_crud.get_court_details, id_court)
 
 @router.get("/courts/{id_court}/unavailable")
-def get_unavailable_schedules(id_court: int):
-    return court_crud.get_unavailable_schedules(id_court)
+async def get_unavailable_schedules(id_court: int):
+    return await call_db(court_crud.get_unavailable_schedules, id_court)
 
 @router.get("/courts/{id_court}/available")
-def get_available_schedules(id_court: int):
-    return court_crud.get_available_schedules(id_court)
+async def get_available_schedules(id_court: int):
+    return await call_db(court_crud.get_available_schedules, id_court)
+
+@router.get("/availability")
+async def get_free_slots(
+    fecha_inicio: str,
+    fecha_fin: Optional[str] = None,
+    id_court: Optional[int] = None,
+    id_type: Optional[int] = None,
+    hora_inicio: Optional[str] = None,
+    hora_fin: Optional[str] = None,
+    slot: Optional[int] = None,
+):
+    """
+    Intervalos libres por cancha y día, calculados desde el horario de apertura.
+    """
+    result = await call_db(
+        availability.free_slots, fecha_inicio, fecha_fin, id_court, id_type, hora_inicio, hora_fin, slot
+    )
+    if not result["success"]:
+        raise HTTPException(status_code=400, detail=result["error"])
+    return result
+
+@router.get("/availability/courts")
+async def get_free_courts(fecha: str, hora_inicio: str, hora_fin: str, id_type: Optional[int] = None):
+    """
+    Canchas libres durante toda la franja, p. ej. el sábado de 18:00 a 20:00.
+    """
+    result = await call_db(availability.free_courts, fecha, hora_inicio, hora_fin, id_type)
+    if not result["success"]:
+        raise HTTPException(status_code=400, detail=result["error"])
+    return result
 
 @router.post("/bookings")
-def make_booking(req: BookingRequest):
-    result = court_crud.make_booking_with_schedule(
+async def make_booking(req: BookingRequest):
+    result = await call_db(
+        court_crud.make_booking_with_schedule,
         req.id_user, req.id_court, req.schedule_date, req.start_time, req.end_time
     )
+    if result.get("conflict"):
+        raise HTTPException(status_code=409, detail=result["error"])
+    if not result["success"]:
+        raise HTTPException(status_code=400, detail=result["error"])
+    return result
+
+@router.post("/bookings/batch")
+async def make_bookings_batch(req: BookingBatchRequest):
+    """
+    Reserva varios horarios de una cancha de una vez: una lista de `slots` y/o una
+    regla semanal `recurrence`. Responde 409 con los conflictos por horario.
+    """
+    slots = [(s.schedule_date, s.start_time, s.end_time) for s in req.slots or []]
+    if req.recurrence:
+        r = req.recurrence
+        try:
+            slots += recurrence_slots(r.start_date, r.weeks, r.start_time, r.end_time, r.weekdays)
+        except ValueError as e:
+            raise HTTPException(status_code=400, detail=str(e))
+    result = await call_db(court_crud.make_bookings_batch, req.id_user, req.id_court, slots, req.atomic)
+    if result.get("conflict"):
+        return JSONResponse(status_code=409, content=jsonable_encoder(result))
     if not result["success"]:
         raise HTTPException(status_code=400, detail=result["error"])
     return result
 
 @router.put("/bookings/{id_booking}/status")
-def update_booking_status(id_booking: int, req: UpdateBookingStatus):
-    result = court_crud.update_booking_status(id_booking, req.new_status)
+async def update_booking_status(id_booking: int, req: UpdateBookingStatus):
+    result = await call_db(court_crud.update_booking_status, id_booking, req.new_status)
+    if result.get("conflict"):
+        raise HTTPException(status_code=409, detail=result["error"])
     if not result["success"]:
         raise HTTPException(status_code=400, detail=result["error"])
     return result
 
 @router.get("/users/{id_user}/bookings/pending")
-def get_user_pending_bookings(id_user: int):
-    return court_crud.get_user_pending_bookings(id_user)
+async def get_user_pending_bookings(id_user: int):
+    return await call_db(court_crud.get_user_pending_bookings, id_user)
 
 @router.get("/users/{id_user}/bookings/confirmed")
-def get_user_confirmed_bookings(id_user: int):
-    return court_crud.get_user_confirmed_bookings(id_user)
+async def get_user_confirmed_bookings(id_user: int):
+    return await call_db(court_crud.get_user_confirmed_bookings, id_user)
 
 @router.get("/court-types")
-def get_all_court_types():
-    result = court_crud.get_all_court_types()
+async def get_all_court_types(request: Request):
+    result = await call_db(court_crud.get_all_court_types)
     if not result["success"]:
         raise HTTPException(status_code=400, detail=result["error"])
-    return result
+    return etag_response(request, result)
 
 @router.get("/reports/ingresos-mes")
-def ingresos_totales_por_mes():
-    return reports.ingresos_totales_por_mes()
+async def ingresos_totales_por_mes():
+    return await call_rendered("ingresos-mes", reports.ingresos_totales_por_mes)
 
 @router.get("/reports/reservas-por-usuario")
-def reservas_por_usuario():
-    return reports.reservas_por_usuario()
+async def reservas_por_usuario():
+    return await call_rendered("reservas-por-usuario", reports.reservas_por_usuario)
 
 @router.get("/reports/reservas-por-estado")
-def reservas_por_estado():
-    return reports.reservas_por_estado()
+async def reservas_por_estado():
+    return await call_rendered("reservas-por-estado", reports.reservas_por_estado)
 
 @router.get("/reports/reservas-por-tipo-cancha")
-def reservas_por_tipo_cancha():
-    return reports.reservas_por_tipo_cancha()
+async def reservas_por_tipo_cancha():
+    return await call_rendered("reservas-por-tipo-cancha", reports.reservas_por_tipo_cancha)
 
 @router.get("/reports/reservas-por-cancha")
-def reservas_por_cancha():
-    return reports.reservas_por_cancha()
+async def reservas_por_cancha():
+    return await call_rendered("reservas-por-cancha", reports.reservas_por_cancha)
 
 @router.get("/reports/reservas-por-dia")
-def reservas_por_dia():
-    return reports.reservas_por_dia()
+async def reservas_por_dia():
+    return await call_rendered("reservas-por-dia", reports.reservas_por_dia)
 
 @router.get("/reports/reservas-por-hora")
-def reservas_por_hora():
-    return reports.reservas_por_hora()
+async def reservas_por_hora():
+    return await call_rendered("reservas-por-hora", reports.reservas_por_hora)
 
 @router.get("/reports/promociones-mas-usadas")
-def promociones_mas_usadas():
-    return reports.promociones_mas_usadas()
+async def promociones_mas_usadas():
+    return await call_rendered("promociones-mas-usadas", reports.promociones_mas_usadas)
 
 @router.get("/reports/reservas-con-promocion")
-def reservas_con_promocion():
-    return reports.reservas_con_promocion()
+async def reservas_con_promocion(cursor: str = Query(None), limit: int = Query(None, ge=1), stream: str = Query(None)):
+    if stream:
+        return await stream_response(reports.reservas_con_promocion_stream(), stream)
+    return await call_rendered("reservas-con-promocion", reports.reservas_con_promocion, cursor, limit)
 
 @router.get("/reports/facturacion-por-usuario")
-def facturacion_por_usuario():
-    return reports.facturacion_por_usuario()
+async def facturacion_por_usuario():
+    return await call_rendered("facturacion-por-usuario", reports.facturacion_por_usuario)
 
 @router.get("/reports/facturacion-por-tipo-cancha")
-def facturacion_por_tipo_cancha():
-    return reports.facturacion_por_tipo_cancha()
+async def facturacion_por_tipo_cancha():
+    return await call_rendered("facturacion-por-tipo-cancha", reports.facturacion_por_tipo_cancha)
 
 @router.get("/reports/reservas-canceladas-por-usuario")
-def reservas_canceladas_por_usuario():
-    return reports.reservas_canceladas_por_usuario()
+async def reservas_canceladas_por_usuario():
+    return await call_rendered("reservas-canceladas-por-usuario", reports.reservas_canceladas_por_usuario)
 
 @router.get("/reports/reservas-pendientes-por-usuario")
-def reservas_pendientes_por_usuario():
-    return reports.reservas_pendientes_por_usuario()
+async def reservas_pendientes_por_usuario():
+    return await call_rendered("reservas-pendientes-por-usuario", reports.reservas_pendientes_por_usuario)
 
 @router.get("/reports/reservas-confirmadas-por-usuario")
-def reservas_confirmadas_por_usuario():
-    return reports.reservas_confirmadas_por_usuario()
+async def reservas_confirmadas_por_usuario():
+    return await call_rendered("reservas-confirmadas-por-usuario", reports.reservas_confirmadas_por_usuario)
 
 @router.get("/reports/canchas-mas-rentadas")
-def canchas_mas_rentadas():
-    return reports.canchas_mas_rentadas()
+async def canchas_mas_rentadas():
+    return await call_rendered("canchas-mas-rentadas", reports.canchas_mas_rentadas)
 
 @router.get("/reports/usuarios-con-mas-reservas")
-def usuarios_con_mas_reservas():
-    return reports.usuarios_con_mas_reservas()
+async def usuarios_con_mas_reservas():
+    return await call_rendered("usuarios-con-mas-reservas", reports.usuarios_con_mas_reservas)
 
 @router.get("/reports/promociones-activas-hoy")
-def promociones_activas_hoy():
-    return reports.promociones_activas_hoy()
+async def promociones_activas_hoy(request: Request):
+    return etag_response(request, await call_db(reports.promociones_activas_hoy))
 
 @router.get("/reports/reservas-por-promocion")
-def reservas_por_promocion():
-    return reports.reservas_por_promocion()
+async def reservas_por_promocion():
+    return await call_rendered("reservas-por-promocion", reports.reservas_por_promocion)
 
 @router.get("/reports/ingresos-por-dia")
-def ingresos_por_dia():
-    return reports.ingresos_por_dia()
+async def ingresos_por_dia():
+    return await call_rendered("ingresos-por-dia", reports.ingresos_por_dia)
 
 @router.get("/reports/reservas-por-rango-fechas")
-def reservas_por_rango_fechas(fecha_inicio: str, fecha_fin: str):
-    return reports.reservas_por_rango_fechas(fecha_inicio, fecha_fin)
+async def reservas_por_rango_fechas(fecha_inicio: str, fecha_fin: str):
+    return await call_rendered("reservas-por-rango-fechas", reports.reservas_por_rango_fechas, fecha_inicio, fecha_fin)
+
+@router.get("/db/pool")
+async def get_pool_stats():
+    stats = async_pool_stats if ASYNC_DB else pool_stats
+    # "pool" es el carril OLTP, como antes de separar los carriles
+    result = {"success": True, "mode": DB_MODE, "pool": stats(OLTP),
+              "lanes": {OLTP: stats(OLTP), ANALYTICS: stats(ANALYTICS)}}
+    if replica_set is not None:
+        result["replicas"] = replica_set.stats(
+            lambda replica: {OLTP: stats(OLTP, replica), ANALYTICS: stats(ANALYTICS, replica)}
+        )
+        result["replicas"]["recent_writes"] = recent_writes.stats()
+    return result
+
+@router.get("/db/statements")
+async def get_statement_stats():
+    return {"success": True, "statements": statement_stats()}
+
+@router.get("/db/queries")
+async def get_query_stats():
+    """
+    Latencia, filas y errores por consulta, y espera de conexión del pool.
+    Solo acumula datos con DB_QUERY_STATS=1 o DB_SLOW_QUERY_MS > 0.
+    """
+    return {"success": True, **query_stats.snapshot()}
+
+@router.post("/db/queries/reset")
+async def reset_query_stats():
+    query_stats.reset()
+    return {"success": True}
+
+@router.get("/traces")
+async def get_traces():
+    """
+    Últimas trazas exportadas por este proceso (resumen), la más reciente primero.
+    """
+    return {"success": True, "enabled": TRACING_ENABLED, "traces": trace_exporter.summaries()}
+
+@router.get("/traces/{trace_id}")
+async def get_trace(trace_id: str):
+    trace = trace_exporter.get(trace_id)
+    if trace is None:
+        raise HTTPException(status_code=404, detail="Traza no encontrada (solo se guardan las últimas)")
+    return {"success": True, "trace": trace}
+
+@router.get("/cache")
+async def get_cache_stats():
+    return {"success": True, "cache": query_cache.stats(), "principals": principal_cache.stats(),
+            "coalescing": single_flight.stats()}
+
+@router.get("/limits")
+async def get_limits():
+    """
+    Estado del límite por cliente y del descarte de carga de este proceso, y cuántas
+    requests se rechazaron por clase de ruta y motivo.
+    """
+    return {
+        "success": True,
+        "rate_limit": rate_buckets.stats() if rate_buckets else None,
+        "shedding": load_shedder.stats() if load_shedder else None,
+        "rejected": [
+            {"class": name, "reason": reason, "count": count}
+            for (name, reason), count in sorted(limits_stats.rejected.items())
+        ],
+    }
+
+@router.post("/cache/invalidate")
+async def invalidate_cache(tag: list[str] = Query(None)):
+    """
+    Invalida las entradas de la caché con esos tags (courts, court_types, promotions,
+    users, schedules, ...), o todo si no se indica ninguno. Para usar después de
+    editar tablas a mano; las escrituras de la API invalidan solas lo que tocan.
+    """
+    return {"success": True, "invalidated": await invalidate_async(*(tag or []))}
+
+@router.get("/reports/freshness")
+async def reports_freshness():
+    return await call_db(materialized_views.freshness)
+
+@router.post("/reports/refresh")
+async def refresh_reports(vista: str = Query(None), concurrente: bool = Query(True)):
+    """
+    Refresca una vista materializada (o todas) a demanda.
+    """
+    try:
+        if vista:
+            refreshed = await call_db(materialized_views.refresh, vista, concurrente)
+            return {"success": True, "data": {vista: "ok" if refreshed else "ocupada"}}
+        return {"success": True, "data": await call_db(materialized_views.refresh_all, concurrente)}
+    except ValueError as e:
+        raise HTTPException(status_code=404, detail=str(e))
+    except psycopg2.Error as e:
+        raise HTTPException(status_code=500, detail=str(e).split('\n')[0])
+
+@router.post("/reports/reconcile")
+async def reconcile_rollups(reparar: bool = Query(False)):
+    """
+    Compara los rollups contra las tablas base y, si se pide, los reconstruye.
+    """
+    return await call_db(rollups.reconcile, reparar)
 
 @router.get("/courts-type")
-def get_courts_type():
-    return custom_reports.get_courts_type()
+async def get_courts_type(request: Request):
+    return etag_response(request, await call_db(custom_reports.get_courts_type))
 
 @router.get("/promociones")
-def get_promociones():
-    return custom_reports.get_promociones()
+async def get_promociones(request: Request):
+    return etag_response(request, await call_db(custom_reports.get_promociones))
 
 @router.get("/get_horarios")
-def get_horarios():
-    return custom_reports.get_horarios()
+async def get_horarios():
+    return await call_db(custom_reports.get_horarios)
 
 @router.get("/reservas")
-def reservas(
+async def reservas(
     fecha_inicio: str = Query(None),
     fecha_fin: str = Query(None),
     canchas_tipo: int = Query(None),
-    estado: str = Query(None)
+    estado: str = Query(None),
+    cursor: str = Query(None),
+    limit: int = Query(None, ge=1),
+    stream: str = Query(None)
 ):
-    return custom_reports.reservas(fecha_inicio, fecha_fin, canchas_tipo, estado)
+    if stream:
+        return await stream_response(
+            custom_reports.reservas_stream(fecha_inicio, fecha_fin, canchas_tipo, estado), stream
+        )
+    return await call_rendered("reservas", custom_reports.reservas, fecha_inicio, fecha_fin, canchas_tipo, estado, cursor, limit)
 
 @router.get("/ingresos")
-def ingresos(
+async def ingresos(
     fecha_inicio: str = Query(None),
     fecha_fin: str = Query(None),
     agrupar: str = Query("dia"),
     cancha_tipo: int = Query(None)
 ):
-    return custom_reports.ingresos(fecha_inicio, fecha_fin, agrupar, cancha_tipo)
+    return await call_rendered("ingresos", custom_reports.ingresos, fecha_inicio, fecha_fin, agrupar, cancha_tipo)
 
 @router.get("/usuarios")
-def usuarios(
+async def usuarios(
     fecha_inicio: str = Query(None),
     fecha_fin: str = Query(None),
     horario_dia: str = Query(None),
     min_reservas: int = Query(1)
 ):
-    return custom_reports.usuarios(fecha_inicio, fecha_fin, horario_dia, min_reservas)
+    return await call_rendered("usuarios", custom_reports.usuarios, fecha_inicio, fecha_fin, horario_dia, min_reservas)
 
 @router.get("/promociones-aplicadas")
-def promociones_aplicadas(
+async def promociones_aplicadas(
     fecha_inicio: str = Query(None),
     fecha_fin: str = Query(None),
-    nombre_promocion: str = Query(None)
+    nombre_promocion: str = Query(None),
+    cursor: str = Query(None),
+    limit: int = Query(None, ge=1),
+    stream: str = Query(None)
 ):
-    return custom_reports.promociones_aplicadas(fecha_inicio, fecha_fin, nombre_promocion)
+    if stream:
+        return await stream_response(
+            custom_reports.promociones_aplicadas_stream(fecha_inicio, fecha_fin, nombre_promocion), stream
+        )
+    return await call_rendered(
+        "promociones-aplicadas", custom_reports.promociones_aplicadas, fecha_inicio, fecha_fin, nombre_promocion, cursor, limit
+    )
 
 @router.get("/cuantas-veces")
-def cuantas_veces(
+async def cuantas_veces(
     nombre_promocion: str = Query(None)
 ):
-    return custom_reports.cuantas_veces(nombre_promocion)
+    return await call_rendered("cuantas-veces", custom_reports.cuantas_veces, nombre_promocion)
 
 @router.get("/disponibilidad-canchas")
-def disponibilidad_canchas(
+async def disponibilidad_canchas(
     fecha_inicio: str = Query(None),
     fecha_fin: str = Query(None),
     tipo_cancha: int = Query(None),
     horario_dia: str = Query(None)
 ):
-    return custom_reports.disponibilidad_canchas(fecha_inicio, fecha_fin, tipo_cancha, horario_dia)
+    return await call_rendered("disponibilidad-canchas", custom_reports.disponibilidad_canchas, fecha_inicio, fecha_fin, tipo_cancha, horario_dia)
+
+@router.get("/export")
+async def list_exports():
+    return {"success": True, "data": sorted(EXPORTS)}
+
+@router.get("/export/{reporte}")
+async def export_report(reporte: str, request: Request, formato: str = Query("csv")):
+    """
+    Descarga el reporte completo como CSV (COPY desde PostgreSQL) o Parquet, por partes
+    y con memoria constante. Los filtros son los mismos query params de su endpoint
+    JSON, p. ej. /export/reservas?estado=confirmed&formato=parquet.
+    """
+    filtros = {k: v for k, v in request.query_params.items() if k != "formato"}
+    try:
+        source, encoder = exporter.export(reporte, filtros, formato)
+    except KeyError:
+        raise HTTPException(status_code=404, detail=f"No existe el reporte {reporte}")
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    headers = {"Content-Disposition": f'attachment; filename="{reporte}.{formato}"'}
+    return await streaming_response(source, MEDIA_TYPES[formato], encoder, headers)
 
 # Monta el router con el prefijo
 app.include_router(router, prefix=API_PREFIX)
+
+@app.get("/metrics", include_in_schema=False)
+async def metrics():
+    """
+    Métricas del proceso en formato de texto de Prometheus (fuera de /api, donde las
+    busca el scraper por defecto).
+    """
+    return Response(render_metrics(DB_MODE), media_type=METRICS_CONTENT_TYPE)
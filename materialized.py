@@ -0,0 +1,224 @@
+"""
+Vistas materializadas para los reportes de /api/reports/*.
+
+Cada vista guarda un agregado que antes se recalculaba con un GROUP BY sobre toda
+la historia en cada request. Reports lee de estas vistas mientras estén frescas y
+vuelve a la consulta en vivo si no existen o si superan REPORTS_MAX_STALENESS.
+Los conteos por día/hora/estado y los ingresos diarios salen de rollups.py.
+
+Uso:
+    python materialized.py install      # crea las vistas y la tabla de control
+    python materialized.py refresh      # refresca todas (CONCURRENTLY)
+    python materialized.py refresh --full mv_reservas_por_cancha
+"""
+import logging
+import os
+import sys
+import threading
+import time
+import psycopg2
+from bd import ANALYTICS, Database, Statement
+
+logger = logging.getLogger(__name__)
+
+# Segundos que una vista puede tener sin refrescar antes de que Reports la ignore
+MAX_STALENESS = float(os.getenv("REPORTS_MAX_STALENESS", "900"))
+# Cada cuántos segundos el scheduler refresca las vistas (0 lo desactiva)
+REFRESH_INTERVAL = float(os.getenv("REPORTS_REFRESH_INTERVAL", "300"))
+
+REFRESH_TABLE = """
+    CREATE TABLE IF NOT EXISTS report_refreshes (
+        view_name    TEXT PRIMARY KEY,
+        refreshed_at TIMESTAMPTZ NOT NULL,
+        duration_ms  INTEGER NOT NULL
+    );
+"""
+
+# nombre -> (definición, columnas del índice único que exige REFRESH ... CONCURRENTLY)
+VIEWS = {
+    "mv_reservas_por_usuario": ("""
+        SELECT u.id_user, u.name, u.last_name,
+               COUNT(b.id_booking) AS total_reservas,
+               COUNT(b.id_booking) FILTER (WHERE b.status = 'pending') AS pendientes,
+               COUNT(b.id_booking) FILTER (WHERE b.status = 'confirmed') AS confirmadas,
+               COUNT(b.id_booking) FILTER (WHERE b.status = 'cancelled') AS canceladas
+        FROM users u
+        LEFT JOIN bookings b ON u.id_user = b.id_user
+        GROUP BY u.id_user, u.name, u.last_name
+    """, "id_user"),
+    "mv_reservas_por_cancha": ("""
+        SELECT c.id_court, c.description, ct.type_name, COUNT(bd.id_booking) AS total_reservas
+        FROM court_types ct
+        JOIN courts c ON ct.id_type = c.id_type
+        JOIN schedules s ON c.id_court = s.id_court
+        JOIN booking_details bd ON s.id_schedule = bd.id_schedule
+        GROUP BY c.id_court, c.description, ct.type_name
+    """, "id_court"),
+    "mv_reservas_por_promocion": ("""
+        SELECT p.name, COUNT(bp.id_booking) AS total_reservas
+        FROM promotions p
+        LEFT JOIN booking_promotions bp ON p.id_promotion = bp.id_promotion
+        GROUP BY p.name
+    """, "name"),
+    "mv_facturacion_por_usuario": ("""
+        SELECT u.id_user, u.name, u.last_name, SUM(i.total_amount) AS total_facturado
+        FROM users u
+        JOIN bookings b ON u.id_user = b.id_user
+        JOIN invoices i ON b.id_booking = i.id_booking
+        GROUP BY u.id_user, u.name, u.last_name
+    """, "id_user"),
+    "mv_facturacion_por_tipo_cancha": ("""
+        SELECT ct.type_name, SUM(i.total_amount) AS total_facturado
+        FROM court_types ct
+        JOIN courts c ON ct.id_type = c.id_type
+        JOIN schedules s ON c.id_court = s.id_court
+        JOIN booking_details bd ON s.id_schedule = bd.id_schedule
+        JOIN invoices i ON bd.id_booking = i.id_booking
+        GROUP BY ct.type_name
+    """, "type_name"),
+}
+
+GET_REFRESHED_AT = Statement("mv_get_refreshed_at", """
+    SELECT refreshed_at FROM report_refreshes WHERE view_name = %s;
+""")
+
+GET_ALL_REFRESHES = Statement("mv_get_all_refreshes", """
+    SELECT view_name, refreshed_at, duration_ms FROM report_refreshes ORDER BY view_name;
+""")
+
+SAVE_REFRESH = Statement("mv_save_refresh", """
+    INSERT INTO report_refreshes (view_name, refreshed_at, duration_ms)
+    VALUES (%s, now(), %s)
+    ON CONFLICT (view_name) DO UPDATE
+    SET refreshed_at = EXCLUDED.refreshed_at, duration_ms = EXCLUDED.duration_ms;
+""")
+
+
+def install_views(cur):
+    """
+    Crea la tabla de control y las vistas que falten (con datos) y registra su refresco.
+    """
+    cur.execute(REFRESH_TABLE)
+    for name, (definition, key) in VIEWS.items():
+        cur.execute(f"CREATE MATERIALIZED VIEW IF NOT EXISTS {name} AS {definition};")
+        cur.execute(f"CREATE UNIQUE INDEX IF NOT EXISTS {name}_key ON {name} ({key});")
+        cur.execute(SAVE_REFRESH, (name, 0))
+
+
+class MaterializedViews:
+    def __init__(self):
+        self.db = Database(ANALYTICS)
+
+    def install(self):
+        with self.db.get_cursor(timeout=0) as cur:
+            install_views(cur)
+
+    def refresh(self, name, concurrently=True):
+        """
+        Refresca una vista. CONCURRENTLY no bloquea las lecturas mientras corre; si la
+        vista no tiene datos todavía se hace un refresco completo. Solo un proceso
+        refresca cada vista a la vez (advisory lock); retorna False si otro la tenía.
+        """
+        if name not in VIEWS:
+            raise ValueError(f"Vista desconocida: {name}")
+        # Un refresco recorre las tablas completas: sin el statement_timeout del carril
+        with self.db.get_cursor(timeout=0) as cur:
+            cur.execute("SELECT pg_try_advisory_xact_lock(hashtext(%s)) AS locked;", (name,))
+            if not cur.fetchone()["locked"]:
+                return False
+            cur.execute(
+                "SELECT relispopulated FROM pg_class WHERE oid = to_regclass(%s);", (name,)
+            )
+            row = cur.fetchone()
+            if row is None:
+                raise ValueError(f"La vista {name} no está instalada (python materialized.py install)")
+            start = time.monotonic()
+            mode = "CONCURRENTLY " if concurrently and row["relispopulated"] else ""
+            cur.execute(f"REFRESH MATERIALIZED VIEW {mode}{name};")
+            cur.execute(SAVE_REFRESH, (name, int((time.monotonic() - start) * 1000)))
+        return True
+
+    def refresh_all(self, concurrently=True, max_age=None):
+        """
+        Refresca todas las vistas (o solo las que tengan más de `max_age` segundos).
+        Retorna {vista: "ok" | "ocupada" | "vigente" | error}.
+        """
+        ages = {row["view_name"]: row["age"] for row in self._ages()}
+        result = {}
+        for name in VIEWS:
+            if max_age is not None and name in ages and ages[name] < max_age:
+                result[name] = "vigente"
+                continue
+            try:
+                result[name] = "ok" if self.refresh(name, concurrently) else "ocupada"
+            except (psycopg2.Error, ValueError) as e:
+                result[name] = str(e).split('\n')[0]
+        return result
+
+    def _ages(self):
+        with self.db.get_cursor() as cur:
+            cur.execute("""
+                SELECT view_name, EXTRACT(EPOCH FROM now() - refreshed_at) AS age
+                FROM report_refreshes;
+            """)
+            return cur.fetchall()
+
+    def freshness(self):
+        try:
+            with self.db.get_cursor() as cur:
+                cur.execute(GET_ALL_REFRESHES)
+                return {"success": True, "data": cur.fetchall(), "max_staleness": MAX_STALENESS}
+        except psycopg2.Error as e:
+            return {"success": False, "error": str(e).split('\n')[0]}
+
+
+class RefreshScheduler:
+    """
+    Hilo de fondo que refresca (CONCURRENTLY) las vistas con más de `interval` segundos.
+    Con varios workers, el advisory lock de refresh() evita refrescos duplicados.
+    """
+    def __init__(self, interval=REFRESH_INTERVAL, concurrently=True):
+        self.interval = interval
+        self.concurrently = concurrently
+        self.views = MaterializedViews()
+        self._stop = threading.Event()
+        self._thread = None
+
+    def start(self):
+        if self.interval <= 0 or self._thread is not None:
+            return
+        self._thread = threading.Thread(target=self._run, name="mv-refresh", daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join(timeout=5)
+            self._thread = None
+
+    def _run(self):
+        while not self._stop.wait(self.interval):
+            try:
+                result = self.views.refresh_all(self.concurrently, max_age=self.interval)
+                failed = {k: v for k, v in result.items() if v not in ("ok", "ocupada", "vigente")}
+                if failed:
+                    logger.warning("No se pudieron refrescar vistas materializadas: %s", failed)
+            except psycopg2.Error as e:
+                logger.warning("Refresco de vistas materializadas falló: %s", str(e).split('\n')[0])
+
+
+if __name__ == "__main__":
+    args = sys.argv[1:]
+    views = MaterializedViews()
+    if args[:1] == ["install"]:
+        views.install()
+        print("Vistas instaladas:", ", ".join(VIEWS))
+    elif args[:1] == ["refresh"]:
+        full = "--full" in args
+        names = [a for a in args[1:] if not a.startswith("--")] or list(VIEWS)
+        for name in names:
+            views.refresh(name, concurrently=not full)
+            print("Refrescada:", name)
+    else:
+        print(__doc__)
+        sys.exit(1)
@@ -0,0 +1,270 @@
+"""
+Métricas en formato de texto de Prometheus para GET /metrics.
+
+MetricsMiddleware cuenta cada request HTTP por método, plantilla de la ruta
+(`/api/courts/{id_court}`, nunca el path con los valores) y código de estado, y
+acumula su latencia en un histograma. Así la cantidad de series depende de las rutas
+que declara la app y no de los ids que llegan. Las requests que no corresponden a
+ninguna ruta se agrupan en route="unmatched".
+
+Al exportar se agregan el estado de los pools de conexiones (uno por carril, ver
+bd.lane_config), las réplicas de lectura si hay (replicas.py), la caché de lecturas,
+la coalescencia de reportes (singleflight.py) y, si DB_QUERY_STATS o
+DB_SLOW_QUERY_MS están activos, las latencias por consulta de querystats.
+
+Las métricas son del proceso: con varios workers de uvicorn cada uno expone las suyas.
+"""
+import os
+import time
+
+from bd import ANALYTICS, OLTP, async_pool_stats, pool_stats
+from cache import query_cache
+from limits import limits_stats
+from replicas import replica_set
+from singleflight import single_flight
+from querystats import LATENCY_BUCKETS, Histogram, query_stats
+
+METRICS_ENABLED = os.getenv("METRICS_ENABLED", "1").lower() in ("1", "true", "yes")
+
+CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+
+UNMATCHED = "unmatched"
+
+
+class RequestMetrics:
+    """
+    Contadores y histogramas de las requests. Solo se actualizan desde el event loop
+    (el middleware corre ahí aunque el endpoint use el threadpool), así que no
+    necesitan lock.
+    """
+    def __init__(self):
+        self.requests = {}
+        self.latency = {}
+        self.in_flight = {}
+
+    def start(self, method):
+        self.in_flight[method] = self.in_flight.get(method, 0) + 1
+
+    def finish(self, method, route, status, seconds):
+        self.in_flight[method] -= 1
+        key = (method, route, str(status))
+        self.requests[key] = self.requests.get(key, 0) + 1
+        histogram = self.latency.get((method, route))
+        if histogram is None:
+            histogram = self.latency[(method, route)] = Histogram(LATENCY_BUCKETS)
+        histogram.observe(seconds)
+
+
+request_metrics = RequestMetrics()
+
+
+class MetricsMiddleware:
+    """
+    Middleware ASGI que registra cada request HTTP en `metrics`. La plantilla sale de
+    scope["route"], que el router de FastAPI deja puesto al elegir la ruta; la
+    latencia incluye el envío completo del cuerpo (también en las respuestas por stream).
+    """
+    def __init__(self, app, metrics=request_metrics):
+        self.app = app
+        self.metrics = metrics
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        method = scope["method"]
+        status = 500
+
+        async def send_with_status(message):
+            nonlocal status
+            if message["type"] == "http.response.start":
+                status = message["status"]
+            await send(message)
+
+        self.metrics.start(method)
+        start = time.perf_counter()
+        try:
+            await self.app(scope, receive, send_with_status)
+        finally:
+            route = scope.get("route")
+            template = getattr(route, "path", None) or UNMATCHED
+            self.metrics.finish(method, template, status, time.perf_counter() - start)
+
+
+def _escape(value):
+    return str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+def _labels(labels):
+    if not labels:
+        return ""
+    return "{" + ",".join(f'{name}="{_escape(value)}"' for name, value in labels.items()) + "}"
+
+
+def _number(value):
+    if value is None:
+        return "NaN"
+    if isinstance(value, float) and value.is_integer():
+        return str(int(value))
+    return str(value)
+
+
+class _Exposition:
+    """
+    Arma el texto de exposición: un bloque # HELP / # TYPE por métrica y sus series.
+    """
+    def __init__(self):
+        self.lines = []
+
+    def metric(self, name, kind, help_text, samples):
+        samples = list(samples)
+        if not samples:
+            return
+        self.lines.append(f"# HELP {name} {help_text}")
+        self.lines.append(f"# TYPE {name} {kind}")
+        for labels, value in samples:
+            self.lines.append(f"{name}{_labels(labels)} {_number(value)}")
+
+    def histogram(self, name, help_text, samples):
+        """
+        `samples`: (labels, snapshot de querystats.Histogram) con buckets acumulados.
+        """
+        samples = list(samples)
+        if not samples:
+            return
+        self.lines.append(f"# HELP {name} {help_text}")
+        self.lines.append(f"# TYPE {name} histogram")
+        for labels, snapshot in samples:
+            for bound, count in snapshot["buckets"]:
+                self.lines.append(f"{name}_bucket{_labels({**labels, 'le': bound})} {count}")
+            self.lines.append(f"{name}_sum{_labels(labels)} {_number(snapshot['sum'])}")
+            self.lines.append(f"{name}_count{_labels(labels)} {snapshot['count']}")
+
+    def text(self):
+        return "\n".join(self.lines) + "\n"
+
+
+def _pool(db_mode, lane):
+    """
+    Estado del pool del carril con los mismos nombres para psycopg2 (ConnectionPool) y
+    psycopg_pool.
+    """
+    if db_mode == "async":
+        stats = async_pool_stats(lane)
+        if stats is None:
+            return None
+        return {
+            "size": stats.get("pool_size", 0),
+            "max": stats.get("pool_max", 0),
+            "idle": stats.get("pool_available", 0),
+            "in_use": stats.get("pool_size", 0) - stats.get("pool_available", 0),
+            "waiting": stats.get("requests_waiting", 0),
+            "checkouts": stats.get("requests_num", 0),
+            "waits": stats.get("requests_queued", 0),
+            "timeouts": stats.get("requests_errors", 0),
+            "wait_seconds": stats.get("requests_wait_ms", 0) / 1000,
+        }
+    stats = pool_stats(lane)
+    if stats is None:
+        return None
+    return {
+        "size": stats["size"],
+        "max": stats["max_size"],
+        "idle": stats["idle"],
+        "in_use": stats["in_use"],
+        "waiting": stats["waiting"],
+        "checkouts": stats["checkouts"],
+        "waits": stats["waits"],
+        "timeouts": stats["timeouts"],
+        "wait_seconds": stats["wait_time_total"],
+    }
+
+
+def render_metrics(db_mode, metrics=request_metrics):
+    """
+    Texto de exposición de Prometheus con las métricas del proceso.
+    """
+    out = _Exposition()
+
+    out.metric("http_requests_total", "counter", "Requests HTTP por método, ruta y código de estado.", (
+        ({"method": method, "route": route, "status": status}, count)
+        for (method, route, status), count in sorted(metrics.requests.items())
+    ))
+    out.histogram("http_request_duration_seconds", "Latencia de las requests HTTP por método y ruta.", (
+        ({"method": method, "route": route}, histogram.snapshot())
+        for (method, route), histogram in sorted(metrics.latency.items())
+    ))
+    out.metric("http_requests_in_flight", "gauge", "Requests HTTP en curso.", (
+        ({"method": method}, count) for method, count in sorted(metrics.in_flight.items())
+    ))
+
+    out.metric("http_requests_rejected_total", "counter",
+               "Requests rechazadas por límite por cliente o descarte de carga, por clase de ruta y motivo.", (
+        ({"class": name, "reason": reason}, count) for (name, reason), count in sorted(limits_stats.rejected.items())
+    ))
+
+    pools = [({"mode": db_mode, "lane": lane}, _pool(db_mode, lane)) for lane in (OLTP, ANALYTICS)]
+    pools = [(labels, pool) for labels, pool in pools if pool is not None]
+    for key, help_text in (
+        ("size", "Conexiones abiertas en el pool."),
+        ("max", "Máximo de conexiones del pool."),
+        ("idle", "Conexiones libres en el pool."),
+        ("in_use", "Conexiones prestadas."),
+        ("waiting", "Pedidos esperando una conexión."),
+    ):
+        out.metric(f"db_pool_{key}", "gauge", help_text, [(labels, pool[key]) for labels, pool in pools])
+    for key, help_text in (
+        ("checkouts", "Conexiones entregadas por el pool."),
+        ("waits", "Pedidos que tuvieron que esperar una conexión."),
+        ("timeouts", "Pedidos que no obtuvieron conexión a tiempo."),
+    ):
+        out.metric(f"db_pool_{key}_total", "counter", help_text, [(labels, pool[key]) for labels, pool in pools])
+    out.metric("db_pool_wait_seconds_total", "counter", "Tiempo total esperando conexiones.",
+               [(labels, pool["wait_seconds"]) for labels, pool in pools])
+
+    if replica_set is not None:
+        replicas = replica_set.stats()
+        rows = [({"replica": replica["name"]}, replica) for replica in replicas["replicas"]]
+        out.metric("db_replica_up", "gauge", "1 si la réplica está en la rotación, 0 si se sacó por una falla.",
+                   [(labels, int(replica["up"])) for labels, replica in rows])
+        out.metric("db_replica_lag_seconds", "gauge", "Último retraso medido de la réplica.",
+                   [(labels, replica["lag"]) for labels, replica in rows])
+        out.metric("db_replica_reads_total", "counter", "Lecturas servidas por la réplica.",
+                   [(labels, replica["reads"]) for labels, replica in rows])
+        out.metric("db_replica_failures_total", "counter", "Veces que la réplica se sacó de la rotación.",
+                   [(labels, replica["failures"]) for labels, replica in rows])
+        out.metric("db_replica_primary_reads_total", "counter",
+                   "Lecturas de solo lectura que fueron al primario, por motivo (recent_write o fallback).",
+                   [({"reason": reason}, count) for reason, count in sorted(replicas["primary_reads"].items())])
+
+    cache = query_cache.stats()
+    labels = {"backend": cache["backend"]}
+    out.metric("cache_hits_total", "counter", "Aciertos de la caché de lecturas.", [(labels, cache["hits"])])
+    out.metric("cache_misses_total", "counter", "Fallos de la caché de lecturas.", [(labels, cache["misses"])])
+    out.metric("cache_hit_ratio", "gauge", "Aciertos sobre consultas a la caché desde que arrancó el proceso.",
+               [(labels, cache["hit_ratio"])])
+    out.metric("cache_entries", "gauge", "Entradas guardadas en la caché.", [(labels, cache["entries"])])
+    out.metric("cache_evictions_total", "counter", "Entradas desalojadas por tamaño.",
+               [(labels, cache["evictions"])])
+
+    coalescing = single_flight.stats()["reports"]
+    out.metric("report_calls_total", "counter", "Llamadas a los reportes por método.", (
+        ({"report": name}, counts["calls"]) for name, counts in coalescing.items()
+    ))
+    out.metric("report_calls_coalesced_total", "counter",
+               "Llamadas que recibieron el resultado de una ejecución en curso del mismo reporte.", (
+        ({"report": name}, counts["coalesced"]) for name, counts in coalescing.items()
+    ))
+
+    queries = query_stats.snapshot()
+    out.histogram("db_query_duration_seconds", "Latencia por consulta (huella de querystats).", (
+        ({"query": key}, entry["latency"]) for key, entry in sorted(queries["queries"].items())
+    ))
+    out.metric("db_query_errors_total", "counter", "Consultas que terminaron en error.", (
+        ({"query": key}, entry["errors"]) for key, entry in sorted(queries["queries"].items())
+    ))
+    out.histogram("db_pool_acquire_seconds", "Espera por una conexión del pool.", (
+        ({"mode": pool_name}, entry["histogram"]) for pool_name, entry in sorted(queries["acquire"].items())
+    ))
+    return out.text()
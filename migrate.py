@@ -0,0 +1,215 @@
+"""
+Migraciones versionadas del esquema.
+
+Cada archivo de migrations/ es una versión: NNNN_nombre.sql, o NNNN_nombre.py con una
+función up(cur). Se aplican en orden de versión, cada una en su propia transacción, y
+quedan registradas en schema_migrations con el checksum del archivo; si un archivo ya
+aplicado cambia, `status` lo marca como modificado (no se vuelve a aplicar).
+
+Un .sql cuya primera línea es `-- migrate: no-transaction` se ejecuta sentencia por
+sentencia en autocommit, para poder usar CREATE INDEX CONCURRENTLY. Esas sentencias
+deben ser idempotentes (IF NOT EXISTS): si la migración falla a mitad, se vuelve a
+correr completa.
+
+Uso:
+    python migrate.py status        # versiones aplicadas, pendientes y modificadas
+    python migrate.py up            # aplica todas las pendientes
+    python migrate.py up 0003       # aplica las pendientes hasta esa versión inclusive
+"""
+import hashlib
+import importlib.util
+import os
+import re
+import sys
+import time
+import psycopg2
+from bd import MAINTENANCE, Database, PreparedCursor
+
+MIGRATIONS_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "migrations")
+
+NO_TRANSACTION = "-- migrate: no-transaction"
+
+MIGRATIONS_TABLE = """
+    CREATE TABLE IF NOT EXISTS schema_migrations (
+        version     TEXT PRIMARY KEY,
+        name        TEXT NOT NULL,
+        checksum    TEXT NOT NULL,
+        applied_at  TIMESTAMPTZ NOT NULL DEFAULT now(),
+        duration_ms INTEGER NOT NULL
+    );
+"""
+
+GET_APPLIED = "SELECT version, name, checksum, applied_at FROM schema_migrations ORDER BY version;"
+
+SAVE_APPLIED = """
+    INSERT INTO schema_migrations (version, name, checksum, duration_ms)
+    VALUES (%s, %s, %s, %s);
+"""
+
+# Un solo proceso migra a la vez (varias réplicas del backend arrancando juntas)
+LOCK_KEY = "schema_migrations"
+
+_FILE_NAME = re.compile(r"^(\d+)_(\w+)\.(sql|py)$")
+
+
+class Migration:
+    def __init__(self, path):
+        match = _FILE_NAME.match(os.path.basename(path))
+        self.path = path
+        self.version, self.name, self.kind = match.groups()
+        with open(path, "rb") as f:
+            content = f.read()
+        self.checksum = hashlib.sha256(content).hexdigest()
+        self.source = content.decode()
+        self.transactional = not (self.kind == "sql" and self.source.startswith(NO_TRANSACTION))
+
+    def statements(self):
+        """
+        Sentencias del .sql para ejecutarlas una por una. Separa por ';' al final de
+        línea, suficiente para DDL sin funciones (las que llevan $$ van en transacción).
+        """
+        lines = [line for line in self.source.splitlines() if not line.strip().startswith("--")]
+        return [s.strip() for s in re.split(r";\s*$", "\n".join(lines), flags=re.M) if s.strip()]
+
+    def run(self, cur):
+        if self.kind == "py":
+            spec = importlib.util.spec_from_file_location(f"migration_{self.version}", self.path)
+            module = importlib.util.module_from_spec(spec)
+            spec.loader.exec_module(module)
+            module.up(cur)
+        elif self.transactional:
+            cur.execute(self.source)
+        else:
+            for statement in self.statements():
+                cur.execute(statement)
+
+
+def load_migrations(directory=MIGRATIONS_DIR):
+    """
+    Migraciones del directorio ordenadas por versión. Lanza ValueError si dos archivos
+    tienen la misma versión.
+    """
+    migrations = {}
+    for file_name in sorted(os.listdir(directory)):
+        if not _FILE_NAME.match(file_name):
+            continue
+        migration = Migration(os.path.join(directory, file_name))
+        if migration.version in migrations:
+            raise ValueError(f"Versión de migración repetida: {migration.version}")
+        migrations[migration.version] = migration
+    return [migrations[v] for v in sorted(migrations, key=int)]
+
+
+class Migrator:
+    def __init__(self, directory=MIGRATIONS_DIR):
+        self.db = Database(MAINTENANCE)
+        self.directory = directory
+
+    def _applied(self, cur):
+        cur.execute(MIGRATIONS_TABLE)
+        cur.execute(GET_APPLIED)
+        return {row["version"]: row for row in cur.fetchall()}
+
+    def status(self):
+        """
+        Retorna {"success", "applied", "pending", "modified"}: versiones aplicadas,
+        las que faltan y las aplicadas cuyo archivo cambió desde entonces.
+        """
+        try:
+            migrations = load_migrations(self.directory)
+            with self.db.get_cursor() as cur:
+                applied = self._applied(cur)
+            return {
+                "success": True,
+                "applied": [
+                    {"version": v, "name": row["name"], "applied_at": row["applied_at"]}
+                    for v, row in applied.items()
+                ],
+                "pending": [f"{m.version}_{m.name}" for m in migrations if m.version not in applied],
+                "modified": [
+                    f"{m.version}_{m.name}" for m in migrations
+                    if m.version in applied and applied[m.version]["checksum"] != m.checksum
+                ],
+            }
+        except (psycopg2.Error, ValueError) as e:
+            return {"success": False, "error": str(e).split('\n')[0]}
+
+    def up(self, target=None):
+        """
+        Aplica en orden las migraciones pendientes (hasta `target` inclusive si se da).
+        Se detiene en la primera que falle; las anteriores quedan aplicadas.
+        Retorna {"success", "applied": [...], "error"?}.
+        """
+        done = []
+        try:
+            migrations = load_migrations(self.directory)
+            with self.db.get_connection() as conn:
+                conn.autocommit = True
+                try:
+                    with conn.cursor(cursor_factory=PreparedCursor) as cur:
+                        cur.execute("SELECT pg_advisory_lock(hashtext(%s));", (LOCK_KEY,))
+                        try:
+                            applied = self._applied(cur)
+                            for migration in migrations:
+                                if target is not None and int(migration.version) > int(target):
+                                    break
+                                if migration.version in applied:
+                                    continue
+                                self._apply(conn, cur, migration)
+                                done.append(f"{migration.version}_{migration.name}")
+                        finally:
+                            cur.execute("SELECT pg_advisory_unlock(hashtext(%s));", (LOCK_KEY,))
+                finally:
+                    conn.autocommit = False
+            return {"success": True, "applied": done}
+        except (psycopg2.Error, ValueError) as e:
+            return {"success": False, "applied": done, "error": str(e).split('\n')[0]}
+
+    def _apply(self, conn, cur, migration):
+        start = time.monotonic()
+        if migration.transactional:
+            cur.execute("BEGIN;")
+            try:
+                migration.run(cur)
+                cur.execute(SAVE_APPLIED, (
+                    migration.version, migration.name, migration.checksum,
+                    int((time.monotonic() - start) * 1000),
+                ))
+                cur.execute("COMMIT;")
+            except Exception:
+                cur.execute("ROLLBACK;")
+                raise
+        else:
+            migration.run(cur)
+            cur.execute(SAVE_APPLIED, (
+                migration.version, migration.name, migration.checksum,
+                int((time.monotonic() - start) * 1000),
+            ))
+
+
+if __name__ == "__main__":
+    args = sys.argv[1:]
+    migrator = Migrator()
+    if args[:1] == ["status"]:
+        result = migrator.status()
+        if not result["success"]:
+            print("Error:", result["error"])
+            sys.exit(1)
+        for row in result["applied"]:
+            print(f"aplicada    {row['version']}_{row['name']}  ({row['applied_at']:%Y-%m-%d %H:%M})")
+        for name in result["pending"]:
+            print(f"pendiente   {name}")
+        for name in result["modified"]:
+            print(f"modificada  {name}  (el archivo cambió después de aplicarse)")
+    elif args[:1] == ["up"]:
+        result = migrator.up(args[1] if len(args) > 1 else None)
+        for name in result["applied"]:
+            print("Aplicada:", name)
+        if not result["success"]:
+            print("Error:", result["error"])
+            sys.exit(1)
+        if not result["applied"]:
+            print("Sin migraciones pendientes")
+    else:
+        print(__doc__)
+        sys.exit(1)
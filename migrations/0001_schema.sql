@@ -0,0 +1,83 @@
+-- Esquema base que usan crud.py, userCrud.py, auth.py y los reportes.
+-- IF NOT EXISTS: en una base creada antes de las migraciones esta versión solo se registra.
+
+CREATE TABLE IF NOT EXISTS roles (
+    id_role   SERIAL PRIMARY KEY,
+    role_name VARCHAR(50) NOT NULL
+);
+
+INSERT INTO roles (id_role, role_name)
+VALUES (1, 'admin'), (2, 'client')
+ON CONFLICT (id_role) DO NOTHING;
+
+SELECT setval(pg_get_serial_sequence('roles', 'id_role'), (SELECT MAX(id_role) FROM roles));
+
+CREATE TABLE IF NOT EXISTS users (
+    id_user   SERIAL PRIMARY KEY,
+    name      VARCHAR(100) NOT NULL,
+    last_name VARCHAR(100) NOT NULL,
+    email     VARCHAR(150) NOT NULL UNIQUE,
+    password  VARCHAR(255) NOT NULL,
+    id_role   INTEGER NOT NULL REFERENCES roles(id_role)
+);
+
+CREATE TABLE IF NOT EXISTS user_phones (
+    id_user_phone SERIAL PRIMARY KEY,
+    id_user       INTEGER NOT NULL REFERENCES users(id_user) ON DELETE CASCADE,
+    phone_number  VARCHAR(20) NOT NULL
+);
+
+CREATE TABLE IF NOT EXISTS court_types (
+    id_type   SERIAL PRIMARY KEY,
+    type_name VARCHAR(50) NOT NULL
+);
+
+CREATE TABLE IF NOT EXISTS courts (
+    id_court       SERIAL PRIMARY KEY,
+    description    VARCHAR(200),
+    price_per_hour NUMERIC(10, 2) NOT NULL,
+    id_type        INTEGER NOT NULL REFERENCES court_types(id_type)
+);
+
+CREATE TABLE IF NOT EXISTS schedules (
+    id_schedule   SERIAL PRIMARY KEY,
+    id_court      INTEGER NOT NULL REFERENCES courts(id_court),
+    schedule_date DATE NOT NULL,
+    start_time    TIME NOT NULL,
+    end_time      TIME NOT NULL
+);
+
+CREATE TABLE IF NOT EXISTS bookings (
+    id_booking   SERIAL PRIMARY KEY,
+    id_user      INTEGER NOT NULL REFERENCES users(id_user) ON DELETE CASCADE,
+    booking_date DATE NOT NULL DEFAULT CURRENT_DATE,
+    status       VARCHAR(20) NOT NULL DEFAULT 'pending'
+);
+
+CREATE TABLE IF NOT EXISTS booking_details (
+    id_booking_detail SERIAL PRIMARY KEY,
+    id_booking        INTEGER NOT NULL REFERENCES bookings(id_booking) ON DELETE CASCADE,
+    id_schedule       INTEGER NOT NULL REFERENCES schedules(id_schedule)
+);
+
+CREATE TABLE IF NOT EXISTS promotions (
+    id_promotion        SERIAL PRIMARY KEY,
+    name                VARCHAR(100) NOT NULL,
+    description         TEXT,
+    discount_percentage NUMERIC(5, 2) NOT NULL,
+    start_date          DATE NOT NULL,
+    end_date            DATE NOT NULL
+);
+
+CREATE TABLE IF NOT EXISTS booking_promotions (
+    id_booking   INTEGER NOT NULL REFERENCES bookings(id_booking) ON DELETE CASCADE,
+    id_promotion INTEGER NOT NULL REFERENCES promotions(id_promotion),
+    PRIMARY KEY (id_booking, id_promotion)
+);
+
+CREATE TABLE IF NOT EXISTS invoices (
+    id_invoice   SERIAL PRIMARY KEY,
+    id_booking   INTEGER NOT NULL REFERENCES bookings(id_booking) ON DELETE CASCADE,
+    issue_date   DATE NOT NULL DEFAULT CURRENT_DATE,
+    total_amount NUMERIC(10, 2) NOT NULL
+);
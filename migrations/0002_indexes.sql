@@ -0,0 +1,33 @@
+-- migrate: no-transaction
+-- Índices para los filtros y joins de los CRUD y reportes. CONCURRENTLY no bloquea las
+-- escrituras mientras se construyen, por eso esta migración corre fuera de transacción.
+
+-- Reservas de un usuario por estado (pendientes/confirmadas, reportes por usuario) y
+-- el ON DELETE CASCADE de users
+CREATE INDEX CONCURRENTLY IF NOT EXISTS bookings_user_status ON bookings (id_user, status);
+
+-- Reservas que ocupan horario: los chequeos de solapamiento y la disponibilidad solo
+-- miran las no canceladas, así el índice no crece con las canceladas
+CREATE INDEX CONCURRENTLY IF NOT EXISTS bookings_active ON bookings (id_booking)
+    WHERE status <> 'cancelled';
+
+-- Horarios de una reserva (solapamientos al reactivar, cambio de estado en los rollups)
+-- y el ON DELETE CASCADE de bookings
+CREATE INDEX CONCURRENTLY IF NOT EXISTS booking_details_booking ON booking_details (id_booking)
+    INCLUDE (id_schedule);
+
+-- Rangos de fechas de los reportes (reservas, ingresos, reservas-por-rango-fechas)
+CREATE INDEX CONCURRENTLY IF NOT EXISTS schedules_date ON schedules (schedule_date)
+    INCLUDE (id_court, start_time, end_time);
+
+-- Facturación por reserva (cubre el SUM de los reportes de facturación) y por fecha
+CREATE INDEX CONCURRENTLY IF NOT EXISTS invoices_booking ON invoices (id_booking)
+    INCLUDE (total_amount);
+CREATE INDEX CONCURRENTLY IF NOT EXISTS invoices_issue_date ON invoices (issue_date)
+    INCLUDE (total_amount);
+
+-- Reservas de una promoción (la PK empieza por id_booking)
+CREATE INDEX CONCURRENTLY IF NOT EXISTS booking_promotions_promotion ON booking_promotions (id_promotion);
+
+CREATE INDEX CONCURRENTLY IF NOT EXISTS user_phones_user ON user_phones (id_user);
+CREATE INDEX CONCURRENTLY IF NOT EXISTS courts_type ON courts (id_type);
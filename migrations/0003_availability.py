@@ -0,0 +1,9 @@
+"""
+Horario de apertura por cancha y los índices de schedules/booking_details que usan la
+disponibilidad y los chequeos de solapamiento (ver availability.py).
+"""
+from availability import AVAILABILITY_DDL
+
+
+def up(cur):
+    cur.execute(AVAILABILITY_DDL)
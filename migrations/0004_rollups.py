@@ -0,0 +1,8 @@
+"""
+Tablas de rollup, trigger de facturas y carga inicial desde las tablas base (ver rollups.py).
+"""
+from rollups import install_rollups
+
+
+def up(cur):
+    install_rollups(cur)
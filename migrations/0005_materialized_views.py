@@ -0,0 +1,8 @@
+"""
+Vistas materializadas de los reportes y su tabla de control (ver materialized.py).
+"""
+from materialized import install_views
+
+
+def up(cur):
+    install_views(cur)
@@ -0,0 +1,6 @@
+-- migrate: no-transaction
+-- Emails únicos sin importar mayúsculas. /login busca por lower(email) con este
+-- índice, y /register inserta con ON CONFLICT DO NOTHING en vez de consultar antes si
+-- el email existe. Falla si ya hay emails repetidos con otras mayúsculas: hay que
+-- unificarlos antes de aplicarla.
+CREATE UNIQUE INDEX CONCURRENTLY IF NOT EXISTS users_email_lower ON users (lower(email));
@@ -0,0 +1,4 @@
+-- Versión de las sesiones de cada usuario: UserCrud.update_user la incrementa al
+-- cambiar contraseña, email o rol, y los tokens emitidos con la versión anterior
+-- dejan de valer (ver access.py).
+ALTER TABLE users ADD COLUMN IF NOT EXISTS token_version INTEGER NOT NULL DEFAULT 0;
@@ -0,0 +1,9 @@
+"""
+Vuelve a crear el trigger de facturas de los rollups, que ahora bloquea la reserva
+antes de acumular el ingreso (ver rollup_apply_invoice en rollups.py).
+"""
+from rollups import ROLLUPS_DDL
+
+
+def up(cur):
+    cur.execute(ROLLUPS_DDL)
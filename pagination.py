@@ -0,0 +1,148 @@
+"""
+Paginación por clave (keyset) y serialización por partes para los listados sin límite.
+
+En lugar de OFFSET, cada página pide las filas que vienen después de la última clave
+vista. El costo no crece con el número de página, y las filas que se insertan entre
+una página y otra no hacen repetir ni saltar resultados. El cliente recibe la clave
+como un `next_cursor` opaco y lo devuelve tal cual para pedir la página siguiente.
+"""
+import base64
+import json
+import os
+from datetime import date, datetime, time, timedelta
+from decimal import Decimal
+
+PAGE_SIZE_DEFAULT = int(os.getenv("PAGE_SIZE_DEFAULT", "100"))
+PAGE_SIZE_MAX = int(os.getenv("PAGE_SIZE_MAX", "1000"))
+
+STREAM_FORMATS = ("ndjson", "json")
+
+
+def page_size(limit):
+    if limit is None:
+        return PAGE_SIZE_DEFAULT
+    return max(1, min(int(limit), PAGE_SIZE_MAX))
+
+
+def encode_cursor(values):
+    raw = json.dumps(values, default=str, separators=(",", ":")).encode()
+    return base64.urlsafe_b64encode(raw).decode().rstrip("=")
+
+
+def decode_cursor(cursor, size):
+    """
+    Retorna los valores de la clave guardados en el cursor. Lanza ValueError si el
+    cursor no es válido.
+    """
+    try:
+        raw = base64.urlsafe_b64decode(cursor + "=" * (-len(cursor) % 4))
+        values = json.loads(raw)
+    except (ValueError, TypeError):
+        raise ValueError("cursor inválido")
+    if not isinstance(values, list) or len(values) != size:
+        raise ValueError("cursor inválido")
+    return values
+
+
+class Keyset:
+    """
+    Orden estable de un listado para paginarlo por clave.
+
+    Las columnas son columnas de salida de la consulta, no nulas, que juntas
+    identifican una fila; la consulta ya debe ordenar por ellas en el mismo sentido.
+    `hidden` son las que la consulta solo selecciona para paginar (desempates que el
+    listado sin cursor no devuelve): page las quita de las filas después de armar el
+    cursor, así todas las respuestas tienen las mismas columnas.
+    """
+    def __init__(self, *columns, descending=False, hidden=()):
+        self.columns = columns
+        self.descending = descending
+        self.hidden = tuple(hidden)
+
+    def page_query(self, query, params=None, cursor=None, limit=None):
+        """
+        Envuelve la consulta para traer la página que sigue a `cursor` y retorna
+        (query, params, limit). Pide una fila de más para saber si hay otra página.
+        Lanza ValueError si el cursor no es válido.
+        """
+        limit = page_size(limit)
+        columns = ", ".join(self.columns)
+        direction = " DESC" if self.descending else ""
+        sql = f"SELECT * FROM ({query.strip().rstrip(';')}) AS pagina"
+        params = list(params or ())
+        if cursor:
+            values = decode_cursor(cursor, len(self.columns))
+            placeholders = ", ".join(["%s"] * len(values))
+            sql += f" WHERE ({columns}) {'<' if self.descending else '>'} ({placeholders})"
+            params.extend(values)
+        sql += f" ORDER BY {', '.join(c + direction for c in self.columns)} LIMIT %s"
+        params.append(limit + 1)
+        return sql, tuple(params), limit
+
+    def page(self, rows, limit):
+        """
+        Recorta la fila de más y retorna (filas, next_cursor); next_cursor es None en
+        la última página.
+        """
+        next_cursor = None
+        if len(rows) > limit:
+            rows = rows[:limit]
+            next_cursor = encode_cursor([rows[-1][column] for column in self.columns])
+        for row in rows:
+            for column in self.hidden:
+                row.pop(column, None)
+        return rows, next_cursor
+
+
+def paged(result, keyset, limit, key="data"):
+    """
+    Agrega `next_cursor` a un resultado {"success": True, key: filas} de page_query.
+    """
+    if result["success"]:
+        result[key], result["next_cursor"] = keyset.page(result[key], limit)
+    return result
+
+
+def json_default(value):
+    # Mismas conversiones que hace jsonable_encoder de FastAPI con estos tipos
+    if isinstance(value, (datetime, date, time)):
+        return value.isoformat()
+    if isinstance(value, Decimal):
+        return float(value)
+    if isinstance(value, timedelta):
+        return value.total_seconds()
+    if isinstance(value, (bytes, memoryview)):
+        return bytes(value).decode()
+    raise TypeError(f"{type(value).__name__} no es serializable a JSON")
+
+
+def _dumps(row):
+    return json.dumps(row, default=json_default, separators=(",", ":"), ensure_ascii=False)
+
+
+class JsonEncoder:
+    """
+    Serializa lotes de filas como NDJSON (una fila por línea) o como el mismo
+    {"success": true, "data": [...]} de siempre, enviado por partes.
+    """
+    def __init__(self, formato):
+        self.formato = formato
+        self._first = True
+
+    @property
+    def media_type(self):
+        return "application/x-ndjson" if self.formato == "ndjson" else "application/json"
+
+    def encode(self, rows):
+        if self.formato == "ndjson":
+            return "".join(_dumps(row) + "\n" for row in rows).encode()
+        body = ",".join(_dumps(row) for row in rows)
+        if self._first:
+            self._first = False
+            return ('{"success":true,"data":[' + body).encode()
+        return ("," + body).encode()
+
+    def close(self):
+        if self.formato == "ndjson":
+            return b""
+        return b'{"success":true,"data":[]}' if self._first else b"]}"
@@ -0,0 +1,117 @@
+"""
+Hash de contraseñas con argon2id.
+
+Un hash tarda decenas de milisegundos de CPU a propósito, así que no se calcula en
+el threadpool de las requests ni en el event loop: corre en un pool propio de
+PASSWORD_HASH_WORKERS hilos (argon2-cffi suelta el GIL mientras calcula, así que
+los hilos aprovechan todos los núcleos). A lo sumo PASSWORD_HASH_QUEUE pedidos más
+esperan turno; si el pool está lleno se lanza HasherBusy en vez de encolar sin
+límite, y la API responde 503 con Retry-After. Así un pico de logins no deja sin
+hilos ni conexiones al resto de los endpoints.
+
+Las contraseñas guardadas antes de usar hashes están en texto plano: se comparan en
+tiempo constante y verify_password retorna el hash nuevo para reemplazarlas. Lo
+mismo con los hashes hechos con parámetros anteriores (ARGON2_*), que se rehacen en
+el siguiente login correcto.
+"""
+import asyncio
+import hmac
+import os
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+from argon2 import PasswordHasher
+from argon2.exceptions import InvalidHashError, VerificationError
+
+# Mínimo recomendado por OWASP para argon2id (19 MiB, 2 pasadas). El paralelismo
+# interno es 1 porque la concurrencia ya la da el pool de hilos.
+ARGON2_TIME_COST = int(os.getenv("ARGON2_TIME_COST", "2"))
+ARGON2_MEMORY_KIB = int(os.getenv("ARGON2_MEMORY_KIB", "19456"))
+ARGON2_PARALLELISM = int(os.getenv("ARGON2_PARALLELISM", "1"))
+
+PASSWORD_HASH_WORKERS = int(os.getenv("PASSWORD_HASH_WORKERS", str(os.cpu_count() or 1)))
+PASSWORD_HASH_QUEUE = int(os.getenv("PASSWORD_HASH_QUEUE", str(4 * PASSWORD_HASH_WORKERS)))
+
+# Segundos que se sugieren al cliente en Retry-After cuando el pool está lleno
+RETRY_AFTER = 1
+
+HASH_PREFIX = "$argon2"
+
+hasher = PasswordHasher(
+    time_cost=ARGON2_TIME_COST, memory_cost=ARGON2_MEMORY_KIB, parallelism=ARGON2_PARALLELISM,
+)
+
+
+class HasherBusy(Exception):
+    """
+    El pool de hash tiene todos sus lugares ocupados.
+    """
+
+
+_executor = ThreadPoolExecutor(max_workers=PASSWORD_HASH_WORKERS, thread_name_prefix="password-hash")
+_slots = threading.BoundedSemaphore(PASSWORD_HASH_WORKERS + PASSWORD_HASH_QUEUE)
+_dummy = {}
+
+
+def _submit(fn, *args):
+    if not _slots.acquire(blocking=False):
+        raise HasherBusy("Demasiados inicios de sesión en curso, reintente en un momento.")
+    try:
+        future = _executor.submit(fn, *args)
+    except BaseException:
+        _slots.release()
+        raise
+    future.add_done_callback(lambda _: _slots.release())
+    return future
+
+
+def _dummy_hash():
+    # Para los emails que no existen: verificar contra un hash cualquiera tarda lo
+    # mismo que un login real, y el tiempo de respuesta no revela qué emails existen
+    if "hash" not in _dummy:
+        _dummy["hash"] = hasher.hash(os.urandom(16).hex())
+    return _dummy["hash"]
+
+
+def _verify(stored, password):
+    if stored is None:
+        try:
+            hasher.verify(_dummy_hash(), password)
+        except VerificationError:
+            pass
+        return False, None
+    if not stored.startswith(HASH_PREFIX):
+        # Contraseña heredada en texto plano
+        if hmac.compare_digest(stored.encode(), password.encode()):
+            return True, hasher.hash(password)
+        return False, None
+    try:
+        hasher.verify(stored, password)
+    except (VerificationError, InvalidHashError):
+        return False, None
+    return True, hasher.hash(password) if hasher.check_needs_rehash(stored) else None
+
+
+def hash_password(password):
+    """
+    Hash argon2id de la contraseña. Lanza HasherBusy si el pool está lleno.
+    """
+    return _submit(hasher.hash, password).result()
+
+
+def verify_password(stored, password):
+    """
+    Compara la contraseña con la guardada (`stored` None si el usuario no existe) y
+    retorna (correcta, hash_nuevo). hash_nuevo no es None cuando la guardada está en
+    texto plano o con parámetros anteriores y conviene reemplazarla.
+    Lanza HasherBusy si el pool está lleno.
+    """
+    return _submit(_verify, stored, password).result()
+
+
+async def hash_password_async(password):
+    return await asyncio.wrap_future(_submit(hasher.hash, password))
+
+
+async def verify_password_async(stored, password):
+    return await asyncio.wrap_future(_submit(_verify, stored, password))
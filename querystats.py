@@ -0,0 +1,251 @@
+"""
+Instrumentación de las consultas de bd.Database.
+
+Con DB_QUERY_STATS=1 los cursores de Database miden cada consulta y la agregan por
+huella (fingerprint): el nombre del Statement, o el SQL normalizado (literales
+reemplazados por ?, espacios colapsados) para las consultas armadas a mano. Por cada
+huella se guardan llamadas, errores e histogramas de latencia y de filas; aparte, un
+histograma de la espera para obtener una conexión del pool.
+
+Con DB_SLOW_QUERY_MS > 0 las consultas que tardan más que eso se registran en el log
+(logger "querystats", nivel WARNING) con la huella, el SQL normalizado, los
+parámetros y la duración como campos del registro (`extra={"query": ...}`), para que
+un formateador JSON los emita por separado. Los Statement marcados como `sensitive`
+y las bd.SensitiveQuery no registran sus parámetros.
+
+Si ninguna de las dos variables está activa, Database usa los cursores de siempre y
+nada de este módulo se ejecuta por consulta.
+"""
+import bisect
+import hashlib
+import logging
+import os
+import re
+import threading
+from functools import lru_cache
+
+logger = logging.getLogger(__name__)
+
+SLOW_QUERY_MS = float(os.getenv("DB_SLOW_QUERY_MS", "0"))
+ENABLED = os.getenv("DB_QUERY_STATS", "0").lower() in ("1", "true", "yes") or SLOW_QUERY_MS > 0
+
+# Límites superiores de los buckets (segundos y filas), acumulables al estilo Prometheus
+LATENCY_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30)
+ROW_BUCKETS = (0, 1, 10, 100, 1000, 10000, 100000, 1000000)
+
+# Cuánto de cada parámetro se escribe en el log de consultas lentas
+MAX_PARAM_LENGTH = 200
+MAX_PARAM_ITEMS = 20
+
+_STRING = re.compile(r"'(?:[^']|'')*'")
+_NUMBER = re.compile(r"(?<![\w$])-?\d+(?:\.\d+)?\b")
+_IN_LIST = re.compile(r"\(\s*(?:\?|%s)(?:\s*,\s*(?:\?|%s))+\s*\)")
+_COMMENT = re.compile(r"--[^\n]*")
+_SPACES = re.compile(r"\s+")
+
+
+@lru_cache(maxsize=2048)
+def normalize(sql):
+    """
+    SQL sin comentarios ni literales y con los espacios colapsados: dos consultas
+    que solo difieren en valores quedan iguales.
+    """
+    sql = _COMMENT.sub(" ", sql)
+    sql = _STRING.sub("?", sql)
+    sql = _NUMBER.sub("?", sql)
+    sql = _SPACES.sub(" ", sql).strip().rstrip(";").strip()
+    return _IN_LIST.sub("(...)", sql)
+
+
+def fingerprint(query):
+    """
+    (huella, SQL normalizado) de una consulta. Los Statement usan su nombre.
+    """
+    name = getattr(query, "name", None)
+    if name is not None:
+        return name, normalize(str(query))
+    if isinstance(query, bytes):
+        query = query.decode(errors="replace")
+    sql = normalize(query)
+    return _digest(sql), sql
+
+
+@lru_cache(maxsize=2048)
+def _digest(sql):
+    return "q_" + hashlib.sha1(sql.encode()).hexdigest()[:12]
+
+
+class Histogram:
+    """
+    Conteos por bucket (no acumulados), suma, cantidad y máximo. No es seguro entre
+    hilos por sí solo; QueryStats lo protege con su lock.
+    """
+    __slots__ = ("bounds", "counts", "sum", "count", "max")
+
+    def __init__(self, bounds):
+        self.bounds = bounds
+        self.counts = [0] * (len(bounds) + 1)
+        self.sum = 0.0
+        self.count = 0
+        self.max = 0
+
+    def observe(self, value):
+        self.counts[bisect.bisect_left(self.bounds, value)] += 1
+        self.sum += value
+        self.count += 1
+        if value > self.max:
+            self.max = value
+
+    def quantile(self, q):
+        """
+        Estimación del cuantil q interpolando dentro del bucket que lo contiene.
+        """
+        if not self.count:
+            return 0
+        rank = q * self.count
+        seen = 0
+        for i, count in enumerate(self.counts):
+            if count and seen + count >= rank:
+                lower = self.bounds[i - 1] if i else 0
+                upper = self.bounds[i] if i < len(self.bounds) else self.max
+                return min(lower + (upper - lower) * (rank - seen) / count, self.max)
+            seen += count
+        return self.max
+
+    def snapshot(self):
+        cumulative, total = [], 0
+        for bound, count in zip(self.bounds + ("+Inf",), self.counts):
+            total += count
+            cumulative.append([bound, total])
+        return {"count": self.count, "sum": self.sum, "max": self.max, "buckets": cumulative}
+
+
+class _QueryEntry:
+    __slots__ = ("sql", "calls", "errors", "latency", "rows")
+
+    def __init__(self, sql):
+        self.sql = sql
+        self.calls = 0
+        self.errors = 0
+        self.latency = Histogram(LATENCY_BUCKETS)
+        self.rows = Histogram(ROW_BUCKETS)
+
+
+class QueryStats:
+    """
+    Registro en memoria del proceso: huella -> llamadas, errores e histogramas, más
+    la espera de conexión por pool ("sync" o "async").
+    """
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._queries = {}
+        self._acquire = {}
+
+    def record(self, query, seconds, rows, params=None, error=None):
+        key, sql = fingerprint(query)
+        with self._lock:
+            entry = self._queries.get(key)
+            if entry is None:
+                entry = self._queries[key] = _QueryEntry(sql)
+            entry.calls += 1
+            if error is not None:
+                entry.errors += 1
+            entry.latency.observe(seconds)
+            if rows is not None and rows >= 0:
+                entry.rows.observe(rows)
+        if SLOW_QUERY_MS and seconds * 1000 >= SLOW_QUERY_MS:
+            self._log_slow(query, key, sql, seconds, rows, params, error)
+
+    def record_acquire(self, pool, seconds):
+        with self._lock:
+            histogram = self._acquire.get(pool)
+            if histogram is None:
+                histogram = self._acquire[pool] = Histogram(LATENCY_BUCKETS)
+            histogram.observe(seconds)
+
+    def _log_slow(self, query, key, sql, seconds, rows, params, error):
+        record = {
+            "fingerprint": key,
+            "sql": sql,
+            "params": "[oculto]" if getattr(query, "sensitive", False) else loggable_params(params),
+            "duration_ms": round(seconds * 1000, 1),
+            "rows": rows,
+        }
+        if error is not None:
+            record["error"] = str(error).split('\n')[0]
+        logger.warning("Consulta lenta %s: %.1f ms", key, record["duration_ms"], extra={"query": record})
+
+    def snapshot(self):
+        """
+        Por huella: SQL, llamadas, errores, latencia (ms: promedio, p50/p95/p99
+        estimados, máximo) y filas, ordenado por tiempo total descendente. También
+        la espera de conexión por pool y los histogramas completos.
+        """
+        with self._lock:
+            queries = {
+                key: {
+                    "sql": entry.sql,
+                    "calls": entry.calls,
+                    "errors": entry.errors,
+                    "total_ms": entry.latency.sum * 1000,
+                    "avg_ms": entry.latency.sum * 1000 / entry.calls if entry.calls else 0.0,
+                    "p50_ms": entry.latency.quantile(0.5) * 1000,
+                    "p95_ms": entry.latency.quantile(0.95) * 1000,
+                    "p99_ms": entry.latency.quantile(0.99) * 1000,
+                    "max_ms": entry.latency.max * 1000,
+                    "rows_avg": entry.rows.sum / entry.rows.count if entry.rows.count else 0.0,
+                    "rows_max": entry.rows.max,
+                    "latency": entry.latency.snapshot(),
+                    "rows": entry.rows.snapshot(),
+                }
+                for key, entry in self._queries.items()
+            }
+            acquire = {
+                pool: {
+                    "count": h.count,
+                    "avg_ms": h.sum * 1000 / h.count if h.count else 0.0,
+                    "p99_ms": h.quantile(0.99) * 1000,
+                    "max_ms": h.max * 1000,
+                    "histogram": h.snapshot(),
+                }
+                for pool, h in self._acquire.items()
+            }
+        return {
+            "enabled": ENABLED,
+            "slow_query_ms": SLOW_QUERY_MS,
+            "queries": dict(sorted(queries.items(), key=lambda item: -item[1]["total_ms"])),
+            "acquire": acquire,
+        }
+
+    def reset(self):
+        with self._lock:
+            self._queries.clear()
+            self._acquire.clear()
+
+
+def loggable_params(params):
+    """
+    Parámetros como valores JSON simples, recortando textos y listas largas.
+    """
+    if params is None:
+        return None
+    if isinstance(params, dict):
+        return {str(k): _loggable(v) for k, v in params.items()}
+    return [_loggable(v) for v in params]
+
+
+def _loggable(value):
+    if value is None or isinstance(value, (bool, int, float)):
+        return value
+    if isinstance(value, (list, tuple)):
+        items = [_loggable(v) for v in value[:MAX_PARAM_ITEMS]]
+        if len(value) > MAX_PARAM_ITEMS:
+            items.append(f"... ({len(value)} en total)")
+        return items
+    text = str(value)
+    if len(text) > MAX_PARAM_LENGTH:
+        text = text[:MAX_PARAM_LENGTH] + "..."
+    return text
+
+
+query_stats = QueryStats()
@@ -0,0 +1,107 @@
+"""
+Render rápido de las respuestas JSON de los reportes.
+
+Por defecto FastAPI recibe un dict por fila (RealDictCursor / dict_row) y lo recorre
+con jsonable_encoder, convirtiendo cada Decimal, date y time. Para los reportes
+grandes el modo se elige por endpoint:
+
+- "python": el camino original.
+- "orjson": las filas se leen como tuplas y orjson (que entiende date/time de forma
+  nativa) las serializa a bytes de una sola vez.
+- "db": PostgreSQL arma el arreglo con json_agg y solo se envuelve el texto resultante.
+
+En los dos modos rápidos los datos ya serializados van en la respuesta como
+orjson.Fragment y la respuesta completa se arma con orjson.
+"""
+import contextvars
+import os
+from datetime import timedelta
+from decimal import Decimal
+
+import orjson
+from psycopg.rows import tuple_row
+
+from bd import TUPLE_CURSOR_FACTORY, Statement
+
+RENDER_MODES = ("python", "orjson", "db")
+
+# Modo de los endpoints de reportes y, opcionalmente, uno distinto por endpoint:
+# JSON_RENDER_OVERRIDES="reservas=db,facturacion-por-usuario=python"
+JSON_RENDER = os.getenv("JSON_RENDER", "orjson")
+JSON_RENDER_OVERRIDES = dict(
+    item.strip().split("=", 1) for item in os.getenv("JSON_RENDER_OVERRIDES", "").split(",") if "=" in item
+)
+
+# Modo de la request en curso; lo fija main.py antes de llamar al CRUD
+render_mode = contextvars.ContextVar("render_mode", default="python")
+
+
+def mode_for(endpoint):
+    mode = JSON_RENDER_OVERRIDES.get(endpoint, JSON_RENDER)
+    if mode not in RENDER_MODES:
+        raise ValueError(f"Modo de render '{mode}' no válido para {endpoint}")
+    return mode
+
+
+def _default(value):
+    # Lo que orjson no serializa solo, con las mismas conversiones que jsonable_encoder
+    if isinstance(value, Decimal):
+        return float(value)
+    if isinstance(value, timedelta):
+        return value.total_seconds()
+    raise TypeError
+
+
+def dumps(value):
+    return orjson.dumps(value, default=_default)
+
+
+def _rows_fragment(description, rows):
+    columns = [column[0] for column in description]
+    return orjson.Fragment(dumps([dict(zip(columns, row)) for row in rows]))
+
+
+_json_statements = {}
+
+
+def json_agg_query(query):
+    """
+    La misma consulta devolviendo un único texto JSON con todas sus filas. Si la
+    consulta es un Statement, la variante también lo es (se prepara una vez).
+    """
+    sql = f"SELECT COALESCE(json_agg(q), '[]'::json)::text FROM ({query.strip().rstrip(';')}) AS q"
+    if not isinstance(query, Statement):
+        return sql
+    if query.name not in _json_statements:
+        _json_statements[query.name] = Statement(f"{query.name}_json", sql)
+    return _json_statements[query.name]
+
+
+def fetch_data(cur, query, params=None, mode=None):
+    """
+    Ejecuta la consulta en la conexión de `cur` y retorna las filas listas para la
+    respuesta según el modo (por defecto, el de la request en curso).
+    """
+    mode = mode or render_mode.get()
+    if mode == "python":
+        cur.execute(query, params)
+        return cur.fetchall()
+    with cur.connection.cursor(cursor_factory=TUPLE_CURSOR_FACTORY) as raw:
+        if mode == "db":
+            raw.execute(json_agg_query(query), params)
+            return orjson.Fragment(raw.fetchone()[0])
+        raw.execute(query, params)
+        return _rows_fragment(raw.description, raw.fetchall())
+
+
+async def fetch_data_async(cur, query, params=None, mode=None):
+    mode = mode or render_mode.get()
+    if mode == "python":
+        await cur.execute(query, params)
+        return await cur.fetchall()
+    async with cur.connection.cursor(row_factory=tuple_row) as raw:
+        if mode == "db":
+            await raw.execute(json_agg_query(query), params)
+            return orjson.Fragment((await raw.fetchone())[0])
+        await raw.execute(query, params)
+        return _rows_fragment(raw.description, await raw.fetchall())
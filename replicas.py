@@ -0,0 +1,296 @@
+"""
+Réplicas de lectura.
+
+Con DB_REPLICAS="host[:puerto],host[:puerto],..." (misma base, usuario y contraseña
+que el primario) las lecturas que se declaran de solo lectura, `Database(...,
+read_only=True)` o `get_cursor(read_only=True)`, van a una réplica en vez del
+primario. Son los reportes, las exportaciones, el catálogo de canchas y las
+reservas de cada usuario; los horarios, la disponibilidad, el login y todas las
+escrituras siguen en el primario. Sin DB_REPLICAS todo va al primario como antes.
+
+- Balanceo (DB_REPLICA_BALANCE): round_robin, o least_conn para la réplica con menos
+  conexiones prestadas en este proceso.
+- Caída: si una réplica no entrega una conexión en DB_REPLICA_TIMEOUT segundos (o la
+  conexión falla), se saca de la rotación por DB_REPLICA_RETRY segundos y la lectura
+  pasa a la siguiente réplica o al primario.
+- Retraso: cada DB_REPLICA_LAG_CHECK segundos se mide el retraso de la réplica en la
+  misma conexión que se va a usar (REPLICA_LAG); si supera DB_REPLICA_MAX_LAG no se
+  usa hasta la medición siguiente.
+- Leer lo propio: cache.invalidate, que las escrituras llaman después del commit con
+  los tags que tocaron, los anota en `recent_writes`. Una lectura que pasa tags
+  (por ejemplo user_bookings:<id>) va al primario mientras alguno se haya escrito
+  hace menos de DB_READ_YOUR_WRITES segundos (por defecto el retraso máximo más un
+  intervalo de medición): el usuario ve su reserva recién creada y la caché no se
+  vuelve a llenar con el dato viejo de una réplica atrasada.
+
+Las marcas de escritura viven en memoria del proceso (DB_READ_YOUR_WRITES_BACKEND=
+memory) o en un archivo SQLite compartido por los workers del host (sqlite), como
+los baldes de limits.py: con varios workers y memory, una lectura que cae en otro
+worker puede ver la réplica atrasada hasta DB_REPLICA_MAX_LAG segundos.
+"""
+import os
+import sqlite3
+import threading
+import time
+
+from localfiles import default_path, prepare
+
+ROUND_ROBIN = "round_robin"
+LEAST_CONN = "least_conn"
+
+REPLICA_BALANCE = os.getenv("DB_REPLICA_BALANCE", ROUND_ROBIN).lower()
+REPLICA_TIMEOUT = float(os.getenv("DB_REPLICA_TIMEOUT", "2"))
+REPLICA_RETRY = float(os.getenv("DB_REPLICA_RETRY", "10"))
+REPLICA_MAX_LAG = float(os.getenv("DB_REPLICA_MAX_LAG", "5"))
+REPLICA_LAG_CHECK = float(os.getenv("DB_REPLICA_LAG_CHECK", "1"))
+READ_YOUR_WRITES = float(os.getenv("DB_READ_YOUR_WRITES") or REPLICA_MAX_LAG + REPLICA_LAG_CHECK)
+READ_YOUR_WRITES_BACKEND = os.getenv("DB_READ_YOUR_WRITES_BACKEND", "memory").lower()
+READ_YOUR_WRITES_SQLITE_PATH = os.getenv("DB_READ_YOUR_WRITES_SQLITE_PATH") or default_path("canchas-writes.sqlite3")
+
+# Segundos de retraso de la réplica: 0 si ya aplicó todo lo que recibió (un primario
+# sin escrituras no hace parecer atrasada a la réplica) y 0 si no es una réplica. Al
+# reiniciar la réplica lo recibido vuelve al inicio del segmento, detrás de lo aplicado
+REPLICA_LAG = """
+    SELECT CASE
+        WHEN NOT pg_is_in_recovery() THEN 0
+        WHEN pg_last_wal_receive_lsn() <= pg_last_wal_replay_lsn() THEN 0
+        ELSE COALESCE(EXTRACT(EPOCH FROM now() - pg_last_xact_replay_timestamp()), 0)
+    END::float8;
+"""
+
+# Marca de "todo se escribió" (cache.invalidate sin tags)
+_ALL = "*"
+
+
+def parse_replicas(spec):
+    """
+    "host[:puerto],..." -> [Replica]; el puerto por defecto es el de DB_PORT.
+    """
+    replicas = []
+    for item in (spec or "").split(","):
+        item = item.strip()
+        if not item:
+            continue
+        host, _, port = item.rpartition(":") if ":" in item else (item, "", "")
+        replicas.append(Replica(host, port or os.getenv("DB_PORT") or "5432"))
+    return replicas
+
+
+class Replica:
+    """
+    Una réplica y lo que se sabe de ella en este proceso.
+    """
+    def __init__(self, host, port):
+        self.host = host
+        self.port = str(port)
+        self.name = f"{host}:{self.port}"
+        self.down_until = 0.0
+        self.last_error = None
+        self.lag = 0.0
+        self.lag_checked_at = None
+        self.reads = 0
+        self.failures = 0
+        self.lagging = 0
+
+
+class ReplicaSet:
+    """
+    Elige la réplica de cada lectura y lleva su estado (caída, retraso). Se usa desde
+    los hilos del threadpool y desde el event loop; el estado va bajo un lock.
+    """
+    def __init__(self, replicas, balance=REPLICA_BALANCE, retry=REPLICA_RETRY, max_lag=REPLICA_MAX_LAG,
+                 lag_check=REPLICA_LAG_CHECK):
+        if balance not in (ROUND_ROBIN, LEAST_CONN):
+            raise ValueError(f"DB_REPLICA_BALANCE desconocido: {balance} (usar {ROUND_ROBIN} o {LEAST_CONN})")
+        self.replicas = replicas
+        self.balance = balance
+        self.retry = retry
+        self.max_lag = max_lag
+        self.lag_check = lag_check
+        self._next = 0
+        self._lock = threading.Lock()
+        self.primary_reads = {"recent_write": 0, "fallback": 0}
+
+    def candidates(self, in_use=None):
+        """
+        Réplicas utilizables en el orden en que hay que probarlas. Una réplica atrasada
+        vuelve a ser candidata cuando toca medirla de nuevo. `in_use(replica)` da las
+        conexiones prestadas, para least_conn.
+        """
+        now = time.monotonic()
+        with self._lock:
+            start = self._next
+            self._next = (self._next + 1) % len(self.replicas)
+            usable = [replica for replica in self.replicas[start:] + self.replicas[:start]
+                      if replica.down_until <= now
+                      and (replica.lag <= self.max_lag or self._lag_due(replica, now))]
+        if self.balance == LEAST_CONN and in_use is not None:
+            # sorted es estable: entre empatadas sigue la rotación
+            usable.sort(key=in_use)
+        return usable
+
+    def _lag_due(self, replica, now):
+        return replica.lag_checked_at is None or now - replica.lag_checked_at >= self.lag_check
+
+    def claim_lag_check(self, replica):
+        """
+        True si a esta lectura le toca medir el retraso de la réplica (a una sola a la vez).
+        """
+        now = time.monotonic()
+        with self._lock:
+            if not self._lag_due(replica, now):
+                return False
+            replica.lag_checked_at = now
+            return True
+
+    def record_lag(self, replica, lag):
+        """
+        Guarda el retraso medido. Retorna False si la réplica está demasiado atrasada.
+        """
+        with self._lock:
+            replica.lag = lag
+            if lag > self.max_lag:
+                replica.lagging += 1
+                return False
+            return True
+
+    def mark_down(self, replica, error):
+        with self._lock:
+            replica.down_until = time.monotonic() + self.retry
+            replica.last_error = str(error).split('\n')[0]
+            replica.failures += 1
+
+    def record_read(self, replica):
+        with self._lock:
+            replica.reads += 1
+
+    def record_primary(self, reason):
+        with self._lock:
+            self.primary_reads[reason] += 1
+
+    def stats(self, pool_stats=None):
+        now = time.monotonic()
+        with self._lock:
+            return {
+                "balance": self.balance,
+                "max_lag": self.max_lag,
+                "read_your_writes": recent_writes.window if recent_writes is not None else None,
+                "primary_reads": dict(self.primary_reads),
+                "replicas": [{
+                    "name": replica.name,
+                    "up": replica.down_until <= now,
+                    "lag": round(replica.lag, 3),
+                    "reads": replica.reads,
+                    "failures": replica.failures,
+                    "lagging": replica.lagging,
+                    "last_error": replica.last_error,
+                    "pool": pool_stats(replica) if pool_stats else None,
+                } for replica in self.replicas],
+            }
+
+
+class RecentWrites:
+    """
+    Marcas en memoria del proceso: tag -> hasta cuándo las lecturas con ese tag van al
+    primario. Al pasar de `max_keys` se descartan las vencidas. `blocking` indica que
+    mark/recent hacen E/S (sqlite): en modo async se corren en un hilo.
+    """
+    backend = "memory"
+    blocking = False
+
+    def __init__(self, window=READ_YOUR_WRITES, max_keys=100000):
+        self.window = window
+        self.max_keys = max_keys
+        self._until = {}
+        self._lock = threading.Lock()
+
+    def mark(self, *tags):
+        until = time.monotonic() + self.window
+        with self._lock:
+            if len(self._until) >= self.max_keys:
+                now = time.monotonic()
+                self._until = {tag: t for tag, t in self._until.items() if t > now}
+            for tag in tags or (_ALL,):
+                self._until[tag] = until
+
+    def recent(self, tags):
+        now = time.monotonic()
+        until = self._until
+        return until.get(_ALL, 0) > now or any(until.get(tag, 0) > now for tag in tags)
+
+    def stats(self):
+        return {"backend": self.backend, "window": self.window, "keys": len(self._until)}
+
+
+SQLITE_SCHEMA = """
+    CREATE TABLE IF NOT EXISTS recent_writes (
+        tag   TEXT PRIMARY KEY,
+        until REAL NOT NULL
+    );
+"""
+
+
+class SQLiteRecentWrites(RecentWrites):
+    """
+    Marcas compartidas entre procesos sobre un archivo SQLite (modo WAL), con reloj de
+    pared. Cada PRUNE_INTERVAL segundos el proceso borra las vencidas.
+    """
+    backend = "sqlite"
+    blocking = True
+    PRUNE_INTERVAL = 60.0
+
+    def __init__(self, window=READ_YOUR_WRITES, path=READ_YOUR_WRITES_SQLITE_PATH):
+        self.window = window
+        self.path = path
+        self._local = threading.local()
+        self._next_prune = 0.0
+        self._conn().executescript(SQLITE_SCHEMA)
+
+    def _conn(self):
+        # Una conexión por hilo y por proceso, como SQLiteCache
+        conn = getattr(self._local, "conn", None)
+        if conn is None or self._local.pid != os.getpid():
+            prepare(self.path)
+            conn = sqlite3.connect(self.path, timeout=5, isolation_level=None, check_same_thread=False)
+            conn.execute("PRAGMA journal_mode=WAL;")
+            conn.execute("PRAGMA synchronous=OFF;")
+            self._local.conn = conn
+            self._local.pid = os.getpid()
+        return conn
+
+    def mark(self, *tags):
+        now = time.time()
+        conn = self._conn()
+        if now >= self._next_prune:
+            self._next_prune = now + self.PRUNE_INTERVAL
+            conn.execute("DELETE FROM recent_writes WHERE until <= ?;", (now,))
+        conn.executemany("""
+            INSERT INTO recent_writes (tag, until) VALUES (?, ?)
+            ON CONFLICT (tag) DO UPDATE SET until = excluded.until;
+        """, [(tag, now + self.window) for tag in tags or (_ALL,)])
+
+    def recent(self, tags):
+        tags = (_ALL,) + tuple(tags)
+        marks = ", ".join("?" for _ in tags)
+        return self._conn().execute(
+            f"SELECT 1 FROM recent_writes WHERE tag IN ({marks}) AND until > ? LIMIT 1;", tags + (time.time(),)
+        ).fetchone() is not None
+
+    def stats(self):
+        return {"backend": self.backend, "path": self.path, "window": self.window,
+                "keys": self._conn().execute("SELECT COUNT(*) FROM recent_writes;").fetchone()[0]}
+
+
+def make_recent_writes(backend=READ_YOUR_WRITES_BACKEND):
+    if backend == "memory":
+        return RecentWrites()
+    if backend == "sqlite":
+        return SQLiteRecentWrites()
+    raise ValueError(f"DB_READ_YOUR_WRITES_BACKEND desconocido: {backend} (usar memory o sqlite)")
+
+
+_replicas = parse_replicas(os.getenv("DB_REPLICAS"))
+
+# Réplicas del proceso y marcas de escritura (None sin DB_REPLICAS)
+replica_set = ReplicaSet(_replicas) if _replicas else None
+recent_writes = make_recent_writes() if _replicas else None
@@ -0,0 +1,201 @@
+"""
+Motor de los reportes personalizados de custom_reports.py.
+
+Cada reporte declara de qué tablas sale (Source, con joins con nombre y sus
+dependencias), sus dimensiones y medidas (Column) y sus filtros opcionales (Filter).
+Report.compile arma con eso una sola sentencia:
+
+- Incluye solo los joins que piden las columnas y los filtros usados, en el orden
+  declarado.
+- Agrupa por las dimensiones si hay medidas; las condiciones sobre medidas van en HAVING.
+- Si el reporte tiene un Rollup y todas las columnas y filtros pedidos tienen su
+  equivalente ahí, lee del rollup en vez de las tablas base.
+- Sin `WHERE 1=1` ni valores en el texto: los filtros agregan su condición con %s y
+  sus valores van como parámetros.
+
+El SQL depende solo de la forma del pedido (qué dimensiones, qué filtros presentes,
+base o rollup), no de los valores. Cada forma se compila una vez por proceso y queda
+registrada como Statement, así que cada conexión la prepara una sola vez y reutiliza
+el plan con cualquier valor de los filtros.
+"""
+import hashlib
+import threading
+
+from bd import Statement
+
+
+class Column:
+    """
+    Dimensión o medida del SELECT. `expr` es el SQL sobre las tablas base y `joins`
+    los joins que necesita; `rollup`/`rollup_joins` lo mismo sobre el rollup, o
+    None si la columna no se puede calcular desde ahí.
+    """
+    def __init__(self, alias, expr, joins=(), rollup=None, rollup_joins=()):
+        self.alias = alias
+        self.expr = expr
+        self.joins = joins
+        self.rollup = rollup
+        self.rollup_joins = rollup_joins
+
+
+class Filter:
+    """
+    Condición opcional del reporte. `expr` lleva un %s por parámetro y `params`
+    convierte el valor recibido en la lista de parámetros, o en None si el filtro no
+    aplica (queda fuera de la sentencia). `having` la evalúa después del GROUP BY y
+    `outer` en la consulta que envuelve al reporte (ver Report.wrap).
+    """
+    def __init__(self, name, expr, joins=(), rollup=None, rollup_joins=(), params=None, having=False, outer=False):
+        self.name = name
+        self.expr = expr
+        self.joins = joins
+        self.rollup = rollup
+        self.rollup_joins = rollup_joins
+        self.params = params or (lambda value: [value])
+        self.having = having
+        self.outer = outer
+
+
+class Source:
+    """
+    Tabla principal y joins disponibles: alias -> (SQL del join, alias de los que depende).
+    """
+    def __init__(self, table, joins=None):
+        self.table = table
+        self.joins = joins or {}
+
+    def join_clauses(self, needed):
+        pending = list(needed)
+        resolved = set()
+        while pending:
+            alias = pending.pop()
+            if alias in resolved:
+                continue
+            if alias not in self.joins:
+                raise ValueError(f"Join desconocido: {alias}")
+            resolved.add(alias)
+            pending.extend(self.joins[alias][1])
+        return [sql for alias, (sql, _) in self.joins.items() if alias in resolved]
+
+
+class Rollup:
+    """
+    Tabla pre-agregada desde la que se puede leer el reporte. `having` descarta los
+    grupos que quedaron en cero (un rollup conserva filas de reservas que cambiaron
+    de estado).
+    """
+    def __init__(self, source, having=None):
+        self.source = source
+        self.having = having
+
+
+class Report:
+    """
+    Reporte declarativo. `dimensions` es un dict nombre -> Column con todas las
+    dimensiones posibles y `default_dimensions` las que se usan si el pedido no elige;
+    `order_by` usa los alias de salida. `wrap`, si se da, es una plantilla con
+    {query} (el reporte) y {where} (los filtros `outer`) para los reportes que
+    necesitan una etapa más sobre el agregado.
+    """
+    def __init__(self, name, source, dimensions, measures=(), filters=(), order_by=(),
+                 default_dimensions=None, rollup=None, wrap=None):
+        self.name = name
+        self.source = source
+        self.dimensions = dimensions
+        self.default_dimensions = tuple(default_dimensions or dimensions)
+        self.measures = tuple(measures)
+        self.filters = {f.name: f for f in filters}
+        self.order_by = tuple(order_by)
+        self.rollup = rollup
+        self.wrap = wrap
+        self._compiled = {}
+        self._lock = threading.Lock()
+
+    def compile(self, values=None, dimensions=None, use_rollup=False):
+        """
+        Retorna (Statement, params, fuente) para los valores de los filtros en
+        `values` (los None o vacíos se omiten). `fuente` es "rollup" o "en_vivo".
+        Lanza ValueError si se pide una dimensión o un filtro que no existe.
+        """
+        values = values or {}
+        dimensions = tuple(dimensions or self.default_dimensions)
+        unknown = [name for name in dimensions if name not in self.dimensions]
+        unknown += [name for name in values if name not in self.filters]
+        if unknown:
+            raise ValueError(f"{self.name}: dimensiones o filtros desconocidos: {', '.join(unknown)}")
+
+        active, params = [], []
+        for name, value in values.items():
+            if value is None or value == "":
+                continue
+            filter_params = self.filters[name].params(value)
+            if filter_params is None:
+                continue
+            active.append(self.filters[name])
+            params.append((name, filter_params))
+        active_names = tuple(sorted(f.name for f in active))
+
+        rollup = use_rollup and self._fits_rollup(dimensions, active)
+        key = (dimensions, active_names, rollup)
+        statement = self._compiled.get(key)
+        if statement is None:
+            with self._lock:
+                statement = self._compiled.get(key)
+                if statement is None:
+                    statement = self._compiled[key] = self._build(dimensions, active_names, rollup)
+        # Los parámetros siguen el orden en que _build escribe las condiciones
+        by_name = dict(params)
+        ordered = []
+        for name in statement.filter_order:
+            ordered.extend(by_name[name])
+        return statement, tuple(ordered), "rollup" if rollup else "en_vivo"
+
+    def _fits_rollup(self, dimensions, active):
+        if self.rollup is None:
+            return False
+        columns = [self.dimensions[name] for name in dimensions] + list(self.measures)
+        return all(c.rollup is not None for c in columns) and \
+            all(f.rollup is not None or f.outer for f in active)
+
+    def _build(self, dimensions, active_names, rollup):
+        source = self.rollup.source if rollup else self.source
+        dims = [self.dimensions[name] for name in dimensions]
+        filters = [self.filters[name] for name in active_names]
+
+        def expr(item):
+            return item.rollup if rollup else item.expr
+
+        def joins(item):
+            return item.rollup_joins if rollup else item.joins
+
+        needed = set()
+        for item in dims + list(self.measures) + [f for f in filters if not f.outer]:
+            needed.update(joins(item))
+
+        where = [f for f in filters if not f.having and not f.outer]
+        having = [f for f in filters if f.having]
+        outer = [f for f in filters if f.outer]
+
+        select = ", ".join(f"{expr(c)} AS {c.alias}" for c in dims + list(self.measures))
+        lines = [f"SELECT {select}", f"FROM {source.table}"] + source.join_clauses(needed)
+        if where:
+            lines.append("WHERE " + " AND ".join(expr(f) for f in where))
+        if self.measures and dims:
+            lines.append("GROUP BY " + ", ".join(expr(c) for c in dims))
+        having_sql = [expr(f) for f in having]
+        if rollup and self.rollup.having:
+            having_sql.append(self.rollup.having)
+        if having_sql:
+            lines.append("HAVING " + " AND ".join(having_sql))
+        if self.order_by:
+            lines.append("ORDER BY " + ", ".join(self.order_by))
+        sql = "\n".join(lines)
+
+        if self.wrap:
+            outer_where = ("WHERE " + " AND ".join(f.expr for f in outer)) if outer else ""
+            sql = self.wrap.format(query=sql, where=outer_where)
+
+        digest = hashlib.sha1(sql.encode()).hexdigest()[:10]
+        statement = Statement(f"report_{self.name}_{digest}", sql)
+        statement.filter_order = [f.name for f in where + having + outer]
+        return statement
@@ -1,297 +1,572 @@
+import psycopg
 import psycopg2
-from bd import Database
+from datetime import date, datetime, timezone
+from bd import ANALYTICS, AsyncDatabase, Database, Statement, db_error
+from cache import PROMOTIONS, query_cache
+from materialized import GET_REFRESHED_AT, MAX_STALENESS
+from pagination import Keyset, paged
+from rendering import fetch_data, fetch_data_async
+from singleflight import coalesced
+
+INGRESOS_TOTALES_POR_MES = Statement("reports_ingresos_totales_por_mes", """
+    SELECT DATE_TRUNC('month', issue_date) AS mes,
+           SUM(total_amount) AS ingresos_totales
+    FROM INVOICES
+    GROUP BY mes
+    ORDER BY mes DESC;
+""")
+
+RESERVAS_POR_USUARIO = Statement("reports_reservas_por_usuario", """
+    SELECT u.id_user, u.name, u.last_name,
+           COUNT(b.id_booking) AS total_reservas
+    FROM USERS u
+    LEFT JOIN BOOKINGS b ON u.id_user = b.id_user
+    GROUP BY u.id_user, u.name, u.last_name
+    ORDER BY total_reservas DESC;
+""")
+
+RESERVAS_POR_ESTADO = Statement("reports_reservas_por_estado", """
+    SELECT status, COUNT(*) AS cantidad
+    FROM BOOKINGS
+    GROUP BY status;
+""")
+
+RESERVAS_POR_TIPO_CANCHA = Statement("reports_reservas_por_tipo_cancha", """
+    SELECT ct.type_name, COUNT(bd.id_booking) AS total_reservas
+    FROM COURT_TYPES ct
+    JOIN COURTS c ON ct.id_type = c.id_type
+    JOIN SCHEDULES s ON c.id_court = s.id_court
+    JOIN BOOKING_DETAILS bd ON s.id_schedule = bd.id_schedule
+    GROUP BY ct.type_name
+    ORDER BY total_reservas DESC;
+""")
+
+RESERVAS_POR_CANCHA = Statement("reports_reservas_por_cancha", """
+    SELECT c.id_court, c.description, COUNT(bd.id_booking) AS total_reservas
+    FROM COURTS c
+    JOIN SCHEDULES s ON c.id_court = s.id_court
+    JOIN BOOKING_DETAILS bd ON s.id_schedule = bd.id_schedule
+    GROUP BY c.id_court, c.description
+    ORDER BY total_reservas DESC;
+""")
+
+RESERVAS_POR_DIA = Statement("reports_reservas_por_dia", """
+    SELECT s.schedule_date, COUNT(bd.id_booking) AS total_reservas
+    FROM SCHEDULES s
+    JOIN BOOKING_DETAILS bd ON s.id_schedule = bd.id_schedule
+    GROUP BY s.schedule_date
+    ORDER BY s.schedule_date DESC;
+""")
+
+RESERVAS_POR_HORA = Statement("reports_reservas_por_hora", """
+    SELECT s.start_time, COUNT(bd.id_booking) AS total_reservas
+    FROM SCHEDULES s
+    JOIN BOOKING_DETAILS bd ON s.id_schedule = bd.id_schedule
+    GROUP BY s.start_time
+    ORDER BY s.start_time;
+""")
+
+PROMOCIONES_MAS_USADAS = Statement("reports_promociones_mas_usadas", """
+    SELECT p.name, COUNT(bp.id_booking) AS veces_usada
+    FROM PROMOTIONS p
+    LEFT JOIN BOOKING_PROMOTIONS bp ON p.id_promotion = bp.id_promotion
+    GROUP BY p.name
+    ORDER BY veces_usada DESC;
+""")
+
+RESERVAS_CON_PROMOCION_SQL = """
+    SELECT b.id_booking, u.name, u.last_name, p.name AS promocion{desempate}
+    FROM BOOKINGS b
+    JOIN USERS u ON b.id_user = u.id_user
+    JOIN BOOKING_PROMOTIONS bp ON b.id_booking = bp.id_booking
+    JOIN PROMOTIONS p ON bp.id_promotion = p.id_promotion
+    ORDER BY b.id_booking DESC, p.id_promotion DESC;
+"""
+RESERVAS_CON_PROMOCION = Statement("reports_reservas_con_promocion", RESERVAS_CON_PROMOCION_SQL.format(desempate=""))
+# Para paginar se selecciona también el desempate; Keyset.page lo quita de las filas
+RESERVAS_CON_PROMOCION_PAGINA = RESERVAS_CON_PROMOCION_SQL.format(desempate=", p.id_promotion")
+RESERVAS_CON_PROMOCION_KEYSET = Keyset("id_booking", "id_promotion", descending=True, hidden=("id_promotion",))
+
+FACTURACION_POR_USUARIO = Statement("reports_facturacion_por_usuario", """
+    SELECT u.id_user, u.name, u.last_name, SUM(i.total_amount) AS total_facturado
+    FROM USERS u
+    JOIN BOOKINGS b ON u.id_user = b.id_user
+    JOIN INVOICES i ON b.id_booking = i.id_booking
+    GROUP BY u.id_user, u.name, u.last_name
+    ORDER BY total_facturado DESC;
+""")
+
+FACTURACION_POR_TIPO_CANCHA = Statement("reports_facturacion_por_tipo_cancha", """
+    SELECT ct.type_name, SUM(i.total_amount) AS total_facturado
+    FROM COURT_TYPES ct
+    JOIN COURTS c ON ct.id_type = c.id_type
+    JOIN SCHEDULES s ON c.id_court = s.id_court
+    JOIN BOOKING_DETAILS bd ON s.id_schedule = bd.id_schedule
+    JOIN INVOICES i ON bd.id_booking = i.id_booking
+    GROUP BY ct.type_name
+    ORDER BY total_facturado DESC;
+""")
+
+RESERVAS_CANCELADAS_POR_USUARIO = Statement("reports_reservas_canceladas_por_usuario", """
+    SELECT u.id_user, u.name, u.last_name, COUNT(b.id_booking) AS canceladas
+    FROM USERS u
+    JOIN BOOKINGS b ON u.id_user = b.id_user
+    WHERE b.status = 'cancelled'
+    GROUP BY u.id_user, u.name, u.last_name
+    ORDER BY canceladas DESC;
+""")
+
+RESERVAS_PENDIENTES_POR_USUARIO = Statement("reports_reservas_pendientes_por_usuario", """
+    SELECT u.id_user, u.name, u.last_name, COUNT(b.id_booking) AS pendientes
+    FROM USERS u
+    JOIN BOOKINGS b ON u.id_user = b.id_user
+    WHERE b.status = 'pending'
+    GROUP BY u.id_user, u.name, u.last_name
+    ORDER BY pendientes DESC;
+""")
+
+RESERVAS_CONFIRMADAS_POR_USUARIO = Statement("reports_reservas_confirmadas_por_usuario", """
+    SELECT u.id_user, u.name, u.last_name, COUNT(b.id_booking) AS confirmadas
+    FROM USERS u
+    JOIN BOOKINGS b ON u.id_user = b.id_user
+    WHERE b.status = 'confirmed'
+    GROUP BY u.id_user, u.name, u.last_name
+    ORDER BY confirmadas DESC;
+""")
+
+CANCHAS_MAS_RENTADAS = Statement("reports_canchas_mas_rentadas", """
+    SELECT c.id_court, c.description, COUNT(bd.id_booking) AS veces_rentada
+    FROM COURTS c
+    JOIN SCHEDULES s ON c.id_court = s.id_court
+    JOIN BOOKING_DETAILS bd ON s.id_schedule = bd.id_schedule
+    GROUP BY c.id_court, c.description
+    ORDER BY veces_rentada DESC;
+""")
+
+USUARIOS_CON_MAS_RESERVAS = Statement("reports_usuarios_con_mas_reservas", """
+    SELECT u.id_user, u.name, u.last_name, COUNT(b.id_booking) AS total_reservas
+    FROM USERS u
+    JOIN BOOKINGS b ON u.id_user = b.id_user
+    GROUP BY u.id_user, u.name, u.last_name
+    ORDER BY total_reservas DESC
+    LIMIT 10;
+""")
+
+PROMOCIONES_ACTIVAS_HOY = Statement("reports_promociones_activas_hoy", """
+    SELECT id_promotion, name, description, discount_percentage
+    FROM PROMOTIONS
+    WHERE CURRENT_DATE BETWEEN start_date AND end_date;
+""")
+
+RESERVAS_POR_PROMOCION = Statement("reports_reservas_por_promocion", """
+    SELECT p.name AS promocion, COUNT(bp.id_booking) AS total_reservas
+    FROM PROMOTIONS p
+    LEFT JOIN BOOKING_PROMOTIONS bp ON p.id_promotion = bp.id_promotion
+    GROUP BY p.name
+    ORDER BY total_reservas DESC;
+""")
+
+INGRESOS_POR_DIA = Statement("reports_ingresos_por_dia", """
+    SELECT issue_date, SUM(total_amount) AS ingresos
+    FROM INVOICES
+    GROUP BY issue_date
+    ORDER BY issue_date DESC;
+""")
+
+RESERVAS_POR_RANGO_FECHAS = Statement("reports_reservas_por_rango_fechas", """
+    SELECT s.schedule_date, COUNT(bd.id_booking) AS total_reservas
+    FROM SCHEDULES s
+    JOIN BOOKING_DETAILS bd ON s.id_schedule = bd.id_schedule
+    WHERE s.schedule_date BETWEEN %s AND %s
+    GROUP BY s.schedule_date
+    ORDER BY s.schedule_date;
+""")
+
+
+# Lecturas equivalentes sobre las vistas materializadas de materialized.py
+
+
+MV_RESERVAS_POR_USUARIO = Statement("reports_mv_reservas_por_usuario", """
+    SELECT id_user, name, last_name, total_reservas
+    FROM mv_reservas_por_usuario
+    ORDER BY total_reservas DESC;
+""")
+
+
+MV_RESERVAS_POR_TIPO_CANCHA = Statement("reports_mv_reservas_por_tipo_cancha", """
+    SELECT type_name, SUM(total_reservas)::BIGINT AS total_reservas
+    FROM mv_reservas_por_cancha
+    GROUP BY type_name
+    ORDER BY total_reservas DESC;
+""")
+
+MV_RESERVAS_POR_CANCHA = Statement("reports_mv_reservas_por_cancha", """
+    SELECT id_court, description, total_reservas
+    FROM mv_reservas_por_cancha
+    ORDER BY total_reservas DESC;
+""")
+
+MV_PROMOCIONES_MAS_USADAS = Statement("reports_mv_promociones_mas_usadas", """
+    SELECT name, total_reservas AS veces_usada
+    FROM mv_reservas_por_promocion
+    ORDER BY veces_usada DESC;
+""")
+
+MV_FACTURACION_POR_USUARIO = Statement("reports_mv_facturacion_por_usuario", """
+    SELECT id_user, name, last_name, total_facturado
+    FROM mv_facturacion_por_usuario
+    ORDER BY total_facturado DESC;
+""")
+
+MV_FACTURACION_POR_TIPO_CANCHA = Statement("reports_mv_facturacion_por_tipo_cancha", """
+    SELECT type_name, total_facturado
+    FROM mv_facturacion_por_tipo_cancha
+    ORDER BY total_facturado DESC;
+""")
+
+MV_RESERVAS_CANCELADAS_POR_USUARIO = Statement("reports_mv_reservas_canceladas_por_usuario", """
+    SELECT id_user, name, last_name, canceladas
+    FROM mv_reservas_por_usuario
+    WHERE canceladas > 0
+    ORDER BY canceladas DESC;
+""")
+
+MV_RESERVAS_PENDIENTES_POR_USUARIO = Statement("reports_mv_reservas_pendientes_por_usuario", """
+    SELECT id_user, name, last_name, pendientes
+    FROM mv_reservas_por_usuario
+    WHERE pendientes > 0
+    ORDER BY pendientes DESC;
+""")
+
+MV_RESERVAS_CONFIRMADAS_POR_USUARIO = Statement("reports_mv_reservas_confirmadas_por_usuario", """
+    SELECT id_user, name, last_name, confirmadas
+    FROM mv_reservas_por_usuario
+    WHERE confirmadas > 0
+    ORDER BY confirmadas DESC;
+""")
+
+MV_CANCHAS_MAS_RENTADAS = Statement("reports_mv_canchas_mas_rentadas", """
+    SELECT id_court, description, total_reservas AS veces_rentada
+    FROM mv_reservas_por_cancha
+    ORDER BY veces_rentada DESC;
+""")
+
+MV_USUARIOS_CON_MAS_RESERVAS = Statement("reports_mv_usuarios_con_mas_reservas", """
+    SELECT id_user, name, last_name, total_reservas
+    FROM mv_reservas_por_usuario
+    WHERE total_reservas > 0
+    ORDER BY total_reservas DESC
+    LIMIT 10;
+""")
+
+MV_RESERVAS_POR_PROMOCION = Statement("reports_mv_reservas_por_promocion", """
+    SELECT name AS promocion, total_reservas
+    FROM mv_reservas_por_promocion
+    ORDER BY total_reservas DESC;
+""")
+
+
+# Lecturas sobre los rollups incrementales de rollups.py (siempre al día, sin refresco)
+
+ROLLUP_INGRESOS_TOTALES_POR_MES = Statement("reports_rollup_ingresos_totales_por_mes", """
+    SELECT DATE_TRUNC('month', issue_date) AS mes,
+           SUM(ingresos) AS ingresos_totales
+    FROM rollup_ingresos_diarios
+    WHERE facturas > 0
+    GROUP BY mes
+    ORDER BY mes DESC;
+""")
+
+ROLLUP_RESERVAS_POR_ESTADO = Statement("reports_rollup_reservas_por_estado", """
+    SELECT status, reservas AS cantidad
+    FROM rollup_reservas_por_estado
+    WHERE reservas > 0;
+""")
+
+ROLLUP_RESERVAS_POR_DIA = Statement("reports_rollup_reservas_por_dia", """
+    SELECT schedule_date, SUM(reservas)::BIGINT AS total_reservas
+    FROM rollup_reservas_diarias
+    GROUP BY schedule_date
+    HAVING SUM(reservas) > 0
+    ORDER BY schedule_date DESC;
+""")
+
+ROLLUP_RESERVAS_POR_HORA = Statement("reports_rollup_reservas_por_hora", """
+    SELECT start_time, reservas AS total_reservas
+    FROM rollup_reservas_por_hora
+    WHERE reservas > 0
+    ORDER BY start_time;
+""")
+
+ROLLUP_INGRESOS_POR_DIA = Statement("reports_rollup_ingresos_por_dia", """
+    SELECT issue_date, ingresos
+    FROM rollup_ingresos_diarios
+    WHERE facturas > 0
+    ORDER BY issue_date DESC;
+""")
+
+ROLLUP_RESERVAS_POR_RANGO_FECHAS = Statement("reports_rollup_reservas_por_rango_fechas", """
+    SELECT schedule_date, SUM(reservas)::BIGINT AS total_reservas
+    FROM rollup_reservas_diarias
+    WHERE schedule_date BETWEEN %s AND %s
+    GROUP BY schedule_date
+    HAVING SUM(reservas) > 0
+    ORDER BY schedule_date;
+""")
+
+# Marca para _read: la lectura rápida es un rollup y no necesita chequeo de frescura
+ROLLUP = "rollup"
+
+
+def _is_fresh(row):
+    return row is not None and (datetime.now(timezone.utc) - row["refreshed_at"]).total_seconds() <= MAX_STALENESS
+
 
 class Reports:
     def __init__(self):
-        self.db = Database()
+        self.db = Database(ANALYTICS, read_only=True)
 
-    def ingresos_totales_por_mes(self):
+    def _read(self, view, mv_query, live_query, params=None, mode=None):
+        """
+        Lee el reporte desde el rollup o la vista materializada (si está fresca); si no
+        existen, ejecuta la consulta en vivo. La respuesta indica de dónde salió y de cuándo es.
+        """
         try:
             with self.db.get_cursor() as cur:
-                cur.execute("""
-                    SELECT DATE_TRUNC('month', issue_date) AS mes,
-                           SUM(total_amount) AS ingresos_totales
-                    FROM INVOICES
-                    GROUP BY mes
-                    ORDER BY mes DESC;
-                """)
-                return {"success": True, "data": cur.fetchall()}
+                if view == ROLLUP:
+                    try:
+                        return {"success": True, "data": fetch_data(cur, mv_query, params, mode),
+                                "actualizado_en": datetime.now(timezone.utc), "fuente": "rollup"}
+                    except psycopg2.errors.UndefinedTable:
+                        # Rollups no instalados: se responde en vivo
+                        cur.connection.rollback()
+                elif view:
+                    try:
+                        cur.execute(GET_REFRESHED_AT, (view,))
+                        row = cur.fetchone()
+                        if _is_fresh(row):
+                            return {"success": True, "data": fetch_data(cur, mv_query, params, mode),
+                                    "actualizado_en": row["refreshed_at"], "fuente": "vista"}
+                    except psycopg2.errors.UndefinedTable:
+                        # Vistas no instaladas: se responde en vivo
+                        cur.connection.rollback()
+                return {"success": True, "data": fetch_data(cur, live_query, params, mode),
+                        "actualizado_en": datetime.now(timezone.utc), "fuente": "en_vivo"}
         except psycopg2.Error as e:
-            return {"success": False, "error": str(e).split('\n')[0]}
+            return db_error(e)
 
+    @coalesced
+    def ingresos_totales_por_mes(self):
+        return self._read(ROLLUP, ROLLUP_INGRESOS_TOTALES_POR_MES, INGRESOS_TOTALES_POR_MES)
+
+    @coalesced
     def reservas_por_usuario(self):
-        try:
-            with self.db.get_cursor() as cur:
-                cur.execute("""
-                    SELECT u.id_user, u.name, u.last_name,
-                           COUNT(b.id_booking) AS total_reservas
-                    FROM USERS u
-                    LEFT JOIN BOOKINGS b ON u.id_user = b.id_user
-                    GROUP BY u.id_user, u.name, u.last_name
-                    ORDER BY total_reservas DESC;
-                """)
-                return {"success": True, "data": cur.fetchall()}
-        except psycopg2.Error as e:
-            return {"success": False, "error": str(e).split('\n')[0]}
+        return self._read("mv_reservas_por_usuario", MV_RESERVAS_POR_USUARIO, RESERVAS_POR_USUARIO)
 
+    @coalesced
     def reservas_por_estado(self):
-        try:
-            with self.db.get_cursor() as cur:
-                cur.execute("""
-                    SELECT status, COUNT(*) AS cantidad
-                    FROM BOOKINGS
-                    GROUP BY status;
-                """)
-                return {"success": True, "data": cur.fetchall()}
-        except psycopg2.Error as e:
-            return {"success": False, "error": str(e).split('\n')[0]}
+        return self._read(ROLLUP, ROLLUP_RESERVAS_POR_ESTADO, RESERVAS_POR_ESTADO)
 
+    @coalesced
     def reservas_por_tipo_cancha(self):
-        try:
-            with self.db.get_cursor() as cur:
-                cur.execute("""
-                    SELECT ct.type_name, COUNT(bd.id_booking) AS total_reservas
-                    FROM COURT_TYPES ct
-                    JOIN COURTS c ON ct.id_type = c.id_type
-                    JOIN SCHEDULES s ON c.id_court = s.id_court
-                    JOIN BOOKING_DETAILS bd ON s.id_schedule = bd.id_schedule
-                    GROUP BY ct.type_name
-                    ORDER BY total_reservas DESC;
-                """)
-                return {"success": True, "data": cur.fetchall()}
-        except psycopg2.Error as e:
-            return {"success": False, "error": str(e).split('\n')[0]}
+        return self._read("mv_reservas_por_cancha", MV_RESERVAS_POR_TIPO_CANCHA, RESERVAS_POR_TIPO_CANCHA)
 
+    @coalesced
     def reservas_por_cancha(self):
-        try:
-            with self.db.get_cursor() as cur:
-                cur.execute("""
-                    SELECT c.id_court, c.description, COUNT(bd.id_booking) AS total_reservas
-                    FROM COURTS c
-                    JOIN SCHEDULES s ON c.id_court = s.id_court
-                    JOIN BOOKING_DETAILS bd ON s.id_schedule = bd.id_schedule
-                    GROUP BY c.id_court, c.description
-                    ORDER BY total_reservas DESC;
-                """)
-                return {"success": True, "data": cur.fetchall()}
-        except psycopg2.Error as e:
-            return {"success": False, "error": str(e).split('\n')[0]}
+        return self._read("mv_reservas_por_cancha", MV_RESERVAS_POR_CANCHA, RESERVAS_POR_CANCHA)
 
+    @coalesced
     def reservas_por_dia(self):
-        try:
-            with self.db.get_cursor() as cur:
-                cur.execute("""
-                    SELECT s.schedule_date, COUNT(bd.id_booking) AS total_reservas
-                    FROM SCHEDULES s
-                    JOIN BOOKING_DETAILS bd ON s.id_schedule = bd.id_schedule
-                    GROUP BY s.schedule_date
-                    ORDER BY s.schedule_date DESC;
-                """)
-                return {"success": True, "data": cur.fetchall()}
-        except psycopg2.Error as e:
-            return {"success": False, "error": str(e).split('\n')[0]}
+        return self._read(ROLLUP, ROLLUP_RESERVAS_POR_DIA, RESERVAS_POR_DIA)
 
+    @coalesced
     def reservas_por_hora(self):
-        try:
-            with self.db.get_cursor() as cur:
-                cur.execute("""
-                    SELECT s.start_time, COUNT(bd.id_booking) AS total_reservas
-                    FROM SCHEDULES s
-                    JOIN BOOKING_DETAILS bd ON s.id_schedule = bd.id_schedule
-                    GROUP BY s.start_time
-                    ORDER BY s.start_time;
-                """)
-                return {"success": True, "data": cur.fetchall()}
-        except psycopg2.Error as e:
-            return {"success": False, "error": str(e).split('\n')[0]}
+        return self._read(ROLLUP, ROLLUP_RESERVAS_POR_HORA, RESERVAS_POR_HORA)
 
+    @coalesced
     def promociones_mas_usadas(self):
-        try:
-            with self.db.get_cursor() as cur:
-                cur.execute("""
-                    SELECT p.name, COUNT(bp.id_booking) AS veces_usada
-                    FROM PROMOTIONS p
-                    LEFT JOIN BOOKING_PROMOTIONS bp ON p.id_promotion = bp.id_promotion
-                    GROUP BY p.name
-                    ORDER BY veces_usada DESC;
-                """)
-                return {"success": True, "data": cur.fetchall()}
-        except psycopg2.Error as e:
-            return {"success": False, "error": str(e).split('\n')[0]}
+        return self._read("mv_reservas_por_promocion", MV_PROMOCIONES_MAS_USADAS, PROMOCIONES_MAS_USADAS)
 
-    def reservas_con_promocion(self):
+    @coalesced
+    def reservas_con_promocion(self, cursor=None, limit=None):
+        if cursor is None and limit is None:
+            return self._read(None, None, RESERVAS_CON_PROMOCION)
         try:
-            with self.db.get_cursor() as cur:
-                cur.execute("""
-                    SELECT b.id_booking, u.name, u.last_name, p.name AS promocion
-                    FROM BOOKINGS b
-                    JOIN USERS u ON b.id_user = u.id_user
-                    JOIN BOOKING_PROMOTIONS bp ON b.id_booking = bp.id_booking
-                    JOIN PROMOTIONS p ON bp.id_promotion = p.id_promotion
-                    ORDER BY b.id_booking DESC;
-                """)
-                return {"success": True, "data": cur.fetchall()}
-        except psycopg2.Error as e:
-            return {"success": False, "error": str(e).split('\n')[0]}
+            query, params, limit = RESERVAS_CON_PROMOCION_KEYSET.page_query(RESERVAS_CON_PROMOCION_PAGINA, None, cursor, limit)
+        except ValueError as e:
+            return {"success": False, "error": str(e)}
+        return paged(self._read(None, None, query, params, mode="python"), RESERVAS_CON_PROMOCION_KEYSET, limit)
+
+    def reservas_con_promocion_stream(self):
+        return self.db.stream(RESERVAS_CON_PROMOCION)
 
+    @coalesced
     def facturacion_por_usuario(self):
-        try:
-            with self.db.get_cursor() as cur:
-                cur.execute("""
-                    SELECT u.id_user, u.name, u.last_name, SUM(i.total_amount) AS total_facturado
-                    FROM USERS u
-                    JOIN BOOKINGS b ON u.id_user = b.id_user
-                    JOIN INVOICES i ON b.id_booking = i.id_booking
-                    GROUP BY u.id_user, u.name, u.last_name
-                    ORDER BY total_facturado DESC;
-                """)
-                return {"success": True, "data": cur.fetchall()}
-        except psycopg2.Error as e:
-            return {"success": False, "error": str(e).split('\n')[0]}
+        return self._read("mv_facturacion_por_usuario", MV_FACTURACION_POR_USUARIO, FACTURACION_POR_USUARIO)
 
+    @coalesced
     def facturacion_por_tipo_cancha(self):
-        try:
-            with self.db.get_cursor() as cur:
-                cur.execute("""
-                    SELECT ct.type_name, SUM(i.total_amount) AS total_facturado
-                    FROM COURT_TYPES ct
-                    JOIN COURTS c ON ct.id_type = c.id_type
-                    JOIN SCHEDULES s ON c.id_court = s.id_court
-                    JOIN BOOKING_DETAILS bd ON s.id_schedule = bd.id_schedule
-                    JOIN INVOICES i ON bd.id_booking = i.id_booking
-                    GROUP BY ct.type_name
-                    ORDER BY total_facturado DESC;
-                """)
-                return {"success": True, "data": cur.fetchall()}
-        except psycopg2.Error as e:
-            return {"success": False, "error": str(e).split('\n')[0]}
+        return self._read("mv_facturacion_por_tipo_cancha", MV_FACTURACION_POR_TIPO_CANCHA, FACTURACION_POR_TIPO_CANCHA)
 
+    @coalesced
     def reservas_canceladas_por_usuario(self):
-        try:
-            with self.db.get_cursor() as cur:
-                cur.execute("""
-                    SELECT u.id_user, u.name, u.last_name, COUNT(b.id_booking) AS canceladas
-                    FROM USERS u
-                    JOIN BOOKINGS b ON u.id_user = b.id_user
-                    WHERE b.status = 'cancelled'
-                    GROUP BY u.id_user, u.name, u.last_name
-                    ORDER BY canceladas DESC;
-                """)
-                return {"success": True, "data": cur.fetchall()}
-        except psycopg2.Error as e:
-            return {"success": False, "error": str(e).split('\n')[0]}
+        return self._read("mv_reservas_por_usuario", MV_RESERVAS_CANCELADAS_POR_USUARIO, RESERVAS_CANCELADAS_POR_USUARIO)
 
+    @coalesced
     def reservas_pendientes_por_usuario(self):
-        try:
-            with self.db.get_cursor() as cur:
-                cur.execute("""
-                    SELECT u.id_user, u.name, u.last_name, COUNT(b.id_booking) AS pendientes
-                    FROM USERS u
-                    JOIN BOOKINGS b ON u.id_user = b.id_user
-                    WHERE b.status = 'pending'
-                    GROUP BY u.id_user, u.name, u.last_name
-                    ORDER BY pendientes DESC;
-                """)
-                return {"success": True, "data": cur.fetchall()}
-        except psycopg2.Error as e:
-            return {"success": False, "error": str(e).split('\n')[0]}
+        return self._read("mv_reservas_por_usuario", MV_RESERVAS_PENDIENTES_POR_USUARIO, RESERVAS_PENDIENTES_POR_USUARIO)
 
+    @coalesced
     def reservas_confirmadas_por_usuario(self):
-        try:
-            with self.db.get_cursor() as cur:
-                cur.execute("""
-                    SELECT u.id_user, u.name, u.last_name, COUNT(b.id_booking) AS confirmadas
-                    FROM USERS u
-                    JOIN BOOKINGS b ON u.id_user = b.id_user
-                    WHERE b.status = 'confirmed'
-                    GROUP BY u.id_user, u.name, u.last_name
-                    ORDER BY confirmadas DESC;
-                """)
-                return {"success": True, "data": cur.fetchall()}
-        except psycopg2.Error as e:
-            return {"success": False, "error": str(e).split('\n')[0]}
+        return self._read("mv_reservas_por_usuario", MV_RESERVAS_CONFIRMADAS_POR_USUARIO, RESERVAS_CONFIRMADAS_POR_USUARIO)
 
+    @coalesced
     def canchas_mas_rentadas(self):
-        try:
-            with self.db.get_cursor() as cur:
-                cur.execute("""
-                    SELECT c.id_court, c.description, COUNT(bd.id_booking) AS veces_rentada
-                    FROM COURTS c
-                    JOIN SCHEDULES s ON c.id_court = s.id_court
-                    JOIN BOOKING_DETAILS bd ON s.id_schedule = bd.id_schedule
-                    GROUP BY c.id_court, c.description
-                    ORDER BY veces_rentada DESC;
-                """)
-                return {"success": True, "data": cur.fetchall()}
-        except psycopg2.Error as e:
-            return {"success": False, "error": str(e).split('\n')[0]}
+        return self._read("mv_reservas_por_cancha", MV_CANCHAS_MAS_RENTADAS, CANCHAS_MAS_RENTADAS)
 
+    @coalesced
     def usuarios_con_mas_reservas(self):
-        try:
-            with self.db.get_cursor() as cur:
-                cur.execute("""
-                    SELECT u.id_user, u.name, u.last_name, COUNT(b.id_booking) AS total_reservas
-                    FROM USERS u
-                    JOIN BOOKINGS b ON u.id_user = b.id_user
-                    GROUP BY u.id_user, u.name, u.last_name
-                    ORDER BY total_reservas DESC
-                    LIMIT 10;
-                """)
-                return {"success": True, "data": cur.fetchall()}
-        except psycopg2.Error as e:
-            return {"success": False, "error": str(e).split('\n')[0]}
+        return self._read("mv_reservas_por_usuario", MV_USUARIOS_CON_MAS_RESERVAS, USUARIOS_CON_MAS_RESERVAS)
 
+    @coalesced
     def promociones_activas_hoy(self):
-        try:
-            with self.db.get_cursor() as cur:
-                cur.execute("""
-                    SELECT id_promotion, name, description, discount_percentage
-                    FROM PROMOTIONS
-                    WHERE CURRENT_DATE BETWEEN start_date AND end_date;
-                """)
-                return {"success": True, "data": cur.fetchall()}
-        except psycopg2.Error as e:
-            return {"success": False, "error": str(e).split('\n')[0]}
+        # La fecha va en la clave: al cambiar el día la entrada anterior deja de usarse
+        return query_cache.get_or_load(
+            ("promociones_activas_hoy", date.today()),
+            lambda: self._read(None, None, PROMOCIONES_ACTIVAS_HOY, mode="python"), (PROMOTIONS,)
+        )
 
+    @coalesced
     def reservas_por_promocion(self):
-        try:
-            with self.db.get_cursor() as cur:
-                cur.execute("""
-                    SELECT p.name AS promocion, COUNT(bp.id_booking) AS total_reservas
-                    FROM PROMOTIONS p
-                    LEFT JOIN BOOKING_PROMOTIONS bp ON p.id_promotion = bp.id_promotion
-                    GROUP BY p.name
-                    ORDER BY total_reservas DESC;
-                """)
-                return {"success": True, "data": cur.fetchall()}
-        except psycopg2.Error as e:
-            return {"success": False, "error": str(e).split('\n')[0]}
+        return self._read("mv_reservas_por_promocion", MV_RESERVAS_POR_PROMOCION, RESERVAS_POR_PROMOCION)
 
+    @coalesced
     def ingresos_por_dia(self):
-        try:
-            with self.db.get_cursor() as cur:
-                cur.execute("""
-                    SELECT issue_date, SUM(total_amount) AS ingresos
-                    FROM INVOICES
-                    GROUP BY issue_date
-                    ORDER BY issue_date DESC;
-                """)
-                return {"success": True, "data": cur.fetchall()}
-        except psycopg2.Error as e:
-            return {"success": False, "error": str(e).split('\n')[0]}
+        return self._read(ROLLUP, ROLLUP_INGRESOS_POR_DIA, INGRESOS_POR_DIA)
 
+    @coalesced
     def reservas_por_rango_fechas(self, fecha_inicio, fecha_fin):
+        return self._read(ROLLUP, ROLLUP_RESERVAS_POR_RANGO_FECHAS, RESERVAS_POR_RANGO_FECHAS, (fecha_inicio, fecha_fin))
+
+
+class AsyncReports:
+    """
+    Versión asyncio de Reports. Usa el mismo SQL sobre el pool asíncrono.
+    """
+    def __init__(self):
+        self.db = AsyncDatabase(ANALYTICS, read_only=True)
+
+    async def _read(self, view, mv_query, live_query, params=None, mode=None):
         try:
-            with self.db.get_cursor() as cur:
-                cur.execute("""
-                    SELECT s.schedule_date, COUNT(bd.id_booking) AS total_reservas
-                    FROM SCHEDULES s
-                    JOIN BOOKING_DETAILS bd ON s.id_schedule = bd.id_schedule
-                    WHERE s.schedule_date BETWEEN %s AND %s
-                    GROUP BY s.schedule_date
-                    ORDER BY s.schedule_date;
-                """, (fecha_inicio, fecha_fin))
-                return {"success": True, "data": cur.fetchall()}
-        except psycopg2.Error as e:
-            return {"success": False, "error": str(e).split('\n')[0]}
+            async with self.db.get_cursor() as cur:
+                if view == ROLLUP:
+                    try:
+                        return {"success": True, "data": await fetch_data_async(cur, mv_query, params, mode),
+                                "actualizado_en": datetime.now(timezone.utc), "fuente": "rollup"}
+                    except psycopg.errors.UndefinedTable:
+                        await cur.connection.rollback()
+                elif view:
+                    try:
+                        await cur.execute(GET_REFRESHED_AT, (view,))
+                        row = await cur.fetchone()
+                        if _is_fresh(row):
+                            return {"success": True, "data": await fetch_data_async(cur, mv_query, params, mode),
+                                    "actualizado_en": row["refreshed_at"], "fuente": "vista"}
+                    except psycopg.errors.UndefinedTable:
+                        await cur.connection.rollback()
+                return {"success": True, "data": await fetch_data_async(cur, live_query, params, mode),
+                        "actualizado_en": datetime.now(timezone.utc), "fuente": "en_vivo"}
+        except psycopg.Error as e:
+            return db_error(e)
+
+    @coalesced
+    async def ingresos_totales_por_mes(self):
+        return await self._read(ROLLUP, ROLLUP_INGRESOS_TOTALES_POR_MES, INGRESOS_TOTALES_POR_MES)
+
+    @coalesced
+    async def reservas_por_usuario(self):
+        return await self._read("mv_reservas_por_usuario", MV_RESERVAS_POR_USUARIO, RESERVAS_POR_USUARIO)
+
+    @coalesced
+    async def reservas_por_estado(self):
+        return await self._read(ROLLUP, ROLLUP_RESERVAS_POR_ESTADO, RESERVAS_POR_ESTADO)
+
+    @coalesced
+    async def reservas_por_tipo_cancha(self):
+        return await self._read("mv_reservas_por_cancha", MV_RESERVAS_POR_TIPO_CANCHA, RESERVAS_POR_TIPO_CANCHA)
+
+    @coalesced
+    async def reservas_por_cancha(self):
+        return await self._read("mv_reservas_por_cancha", MV_RESERVAS_POR_CANCHA, RESERVAS_POR_CANCHA)
+
+    @coalesced
+    async def reservas_por_dia(self):
+        return await self._read(ROLLUP, ROLLUP_RESERVAS_POR_DIA, RESERVAS_POR_DIA)
+
+    @coalesced
+    async def reservas_por_hora(self):
+        return await self._read(ROLLUP, ROLLUP_RESERVAS_POR_HORA, RESERVAS_POR_HORA)
+
+    @coalesced
+    async def promociones_mas_usadas(self):
+        return await self._read("mv_reservas_por_promocion", MV_PROMOCIONES_MAS_USADAS, PROMOCIONES_MAS_USADAS)
+
+    @coalesced
+    async def reservas_con_promocion(self, cursor=None, limit=None):
+        if cursor is None and limit is None:
+            return await self._read(None, None, RESERVAS_CON_PROMOCION)
+        try:
+            query, params, limit = RESERVAS_CON_PROMOCION_KEYSET.page_query(RESERVAS_CON_PROMOCION_PAGINA, None, cursor, limit)
+        except ValueError as e:
+            return {"success": False, "error": str(e)}
+        return paged(await self._read(None, None, query, params, mode="python"), RESERVAS_CON_PROMOCION_KEYSET, limit)
+
+    def reservas_con_promocion_stream(self):
+        return self.db.stream(RESERVAS_CON_PROMOCION)
+
+    @coalesced
+    async def facturacion_por_usuario(self):
+        return await self._read("mv_facturacion_por_usuario", MV_FACTURACION_POR_USUARIO, FACTURACION_POR_USUARIO)
+
+    @coalesced
+    async def facturacion_por_tipo_cancha(self):
+        return await self._read("mv_facturacion_por_tipo_cancha", MV_FACTURACION_POR_TIPO_CANCHA, FACTURACION_POR_TIPO_CANCHA)
+
+    @coalesced
+    async def reservas_canceladas_por_usuario(self):
+        return await self._read("mv_reservas_por_usuario", MV_RESERVAS_CANCELADAS_POR_USUARIO, RESERVAS_CANCELADAS_POR_USUARIO)
+
+    @coalesced
+    async def reservas_pendientes_por_usuario(self):
+        return await self._read("mv_reservas_por_usuario", MV_RESERVAS_PENDIENTES_POR_USUARIO, RESERVAS_PENDIENTES_POR_USUARIO)
+
+    @coalesced
+    async def reservas_confirmadas_por_usuario(self):
+        return await self._read("mv_reservas_por_usuario", MV_RESERVAS_CONFIRMADAS_POR_USUARIO, RESERVAS_CONFIRMADAS_POR_USUARIO)
+
+    @coalesced
+    async def canchas_mas_rentadas(self):
+        return await self._read("mv_reservas_por_cancha", MV_CANCHAS_MAS_RENTADAS, CANCHAS_MAS_RENTADAS)
+
+    @coalesced
+    async def usuarios_con_mas_reservas(self):
+        return await self._read("mv_reservas_por_usuario", MV_USUARIOS_CON_MAS_RESERVAS, USUARIOS_CON_MAS_RESERVAS)
+
+    @coalesced
+    async def promociones_activas_hoy(self):
+        return await query_cache.get_or_load_async(
+            ("promociones_activas_hoy", date.today()),
+            lambda: self._read(None, None, PROMOCIONES_ACTIVAS_HOY, mode="python"), (PROMOTIONS,)
+        )
+
+    @coalesced
+    async def reservas_por_promocion(self):
+        return await self._read("mv_reservas_por_promocion", MV_RESERVAS_POR_PROMOCION, RESERVAS_POR_PROMOCION)
+
+    @coalesced
+    async def ingresos_por_dia(self):
+        return await self._read(ROLLUP, ROLLUP_INGRESOS_POR_DIA, INGRESOS_POR_DIA)
 
+    @coalesced
+    async def reservas_por_rango_fechas(self, fecha_inicio, fecha_fin):
+        return await self._read(ROLLUP, ROLLUP_RESERVAS_POR_RANGO_FECHAS, RESERVAS_POR_RANGO_FECHAS, (fecha_inicio, fecha_fin))
@@ -0,0 +1,406 @@
+"""
+Tablas de rollup diarias que se mantienen de forma incremental.
+
+En vez de recalcular los conteos e ingresos desde bookings/schedules/invoices en
+cada reporte, CourtCrud actualiza estos acumulados en la misma transacción en que
+crea una reserva o le cambia el estado, UserCrud descuenta las reservas de un usuario
+antes de borrarlo, y un trigger hace lo mismo con las facturas.
+Los reportes por día/hora/estado leen O(días) filas en lugar de O(reservas).
+
+Uso:
+    python rollups.py install               # crea tablas y trigger, y las llena desde cero
+    python rollups.py reconcile             # compara los rollups contra las tablas base
+    python rollups.py reconcile --repair    # y los reconstruye si hay diferencias
+"""
+import json
+import sys
+import time
+import psycopg2
+from bd import ANALYTICS, Database, Statement
+
+# Las facturas no se escriben desde la API, así que sus ingresos se acumulan con un trigger
+ROLLUPS_DDL = """
+    CREATE TABLE IF NOT EXISTS rollup_reservas_diarias (
+        schedule_date DATE NOT NULL,
+        id_court      INTEGER NOT NULL,
+        id_type       INTEGER NOT NULL,
+        status        VARCHAR(20) NOT NULL,
+        reservas      BIGINT NOT NULL DEFAULT 0,
+        ingresos      NUMERIC(14, 2) NOT NULL DEFAULT 0,
+        PRIMARY KEY (schedule_date, id_court, id_type, status)
+    );
+
+    CREATE TABLE IF NOT EXISTS rollup_reservas_por_hora (
+        start_time TIME PRIMARY KEY,
+        reservas   BIGINT NOT NULL DEFAULT 0
+    );
+
+    CREATE TABLE IF NOT EXISTS rollup_reservas_por_estado (
+        status   VARCHAR(20) PRIMARY KEY,
+        reservas BIGINT NOT NULL DEFAULT 0
+    );
+
+    CREATE TABLE IF NOT EXISTS rollup_ingresos_diarios (
+        issue_date DATE PRIMARY KEY,
+        ingresos   NUMERIC(14, 2) NOT NULL DEFAULT 0,
+        facturas   BIGINT NOT NULL DEFAULT 0
+    );
+
+    CREATE OR REPLACE FUNCTION rollup_apply_invoice(inv invoices, signo INTEGER) RETURNS void AS $$
+        -- Bloquea la reserva antes que los rollups, en el mismo orden que un cambio de
+        -- estado (UPDATE bookings y luego MOVE_BOOKING_DAYS): si el cambio llegó antes,
+        -- se espera a que termine y el INSERT de abajo, con una foto nueva, lee el estado
+        -- nuevo; si llegó después, el cambio espera y su MOVE_BOOKING_DAYS ya suma esta
+        -- factura. Sin el bloqueo, el ingreso quedaba en el estado anterior.
+        SELECT 1 FROM bookings WHERE id_booking = inv.id_booking FOR SHARE;
+
+        INSERT INTO rollup_ingresos_diarios (issue_date, ingresos, facturas)
+        VALUES (inv.issue_date, signo * inv.total_amount, signo)
+        ON CONFLICT (issue_date) DO UPDATE
+        SET ingresos = rollup_ingresos_diarios.ingresos + EXCLUDED.ingresos,
+            facturas = rollup_ingresos_diarios.facturas + EXCLUDED.facturas;
+
+        INSERT INTO rollup_reservas_diarias (schedule_date, id_court, id_type, status, reservas, ingresos)
+        SELECT s.schedule_date, c.id_court, c.id_type, b.status, 0, signo * inv.total_amount * COUNT(*)
+        FROM bookings b
+        JOIN booking_details bd ON b.id_booking = bd.id_booking
+        JOIN schedules s ON bd.id_schedule = s.id_schedule
+        JOIN courts c ON s.id_court = c.id_court
+        WHERE b.id_booking = inv.id_booking
+        GROUP BY s.schedule_date, c.id_court, c.id_type, b.status
+        ON CONFLICT (schedule_date, id_court, id_type, status) DO UPDATE
+        SET ingresos = rollup_reservas_diarias.ingresos + EXCLUDED.ingresos;
+    $$ LANGUAGE sql;
+
+    CREATE OR REPLACE FUNCTION rollup_invoices() RETURNS trigger AS $$
+    BEGIN
+        IF TG_OP IN ('UPDATE', 'DELETE') THEN
+            PERFORM rollup_apply_invoice(OLD, -1);
+        END IF;
+        IF TG_OP IN ('INSERT', 'UPDATE') THEN
+            PERFORM rollup_apply_invoice(NEW, 1);
+        END IF;
+        RETURN NULL;
+    END;
+    $$ LANGUAGE plpgsql;
+
+    DROP TRIGGER IF EXISTS invoices_rollup ON invoices;
+    CREATE TRIGGER invoices_rollup
+    AFTER INSERT OR UPDATE OR DELETE ON invoices
+    FOR EACH ROW EXECUTE FUNCTION rollup_invoices();
+"""
+
+# Contenido esperado de cada rollup calculado desde las tablas base
+EXPECTED = {
+    "rollup_reservas_diarias": ("""
+        SELECT s.schedule_date, c.id_court, c.id_type, b.status,
+               COUNT(*) AS reservas, COALESCE(SUM(inv.total), 0) AS ingresos
+        FROM bookings b
+        JOIN booking_details bd ON b.id_booking = bd.id_booking
+        JOIN schedules s ON bd.id_schedule = s.id_schedule
+        JOIN courts c ON s.id_court = c.id_court
+        LEFT JOIN (
+            SELECT id_booking, SUM(total_amount) AS total FROM invoices GROUP BY id_booking
+        ) inv ON inv.id_booking = b.id_booking
+        GROUP BY s.schedule_date, c.id_court, c.id_type, b.status
+    """, ("schedule_date", "id_court", "id_type", "status"), ("reservas", "ingresos")),
+    "rollup_reservas_por_hora": ("""
+        SELECT s.start_time, COUNT(*) AS reservas
+        FROM booking_details bd
+        JOIN schedules s ON bd.id_schedule = s.id_schedule
+        GROUP BY s.start_time
+    """, ("start_time",), ("reservas",)),
+    "rollup_reservas_por_estado": ("""
+        SELECT status, COUNT(*) AS reservas
+        FROM bookings
+        GROUP BY status
+    """, ("status",), ("reservas",)),
+    "rollup_ingresos_diarios": ("""
+        SELECT issue_date, SUM(total_amount) AS ingresos, COUNT(*) AS facturas
+        FROM invoices
+        GROUP BY issue_date
+    """, ("issue_date",), ("ingresos", "facturas")),
+}
+
+# Suma al rollup las reservas recién creadas (lista de id_booking) en estado inicial.
+# La sentencia principal (por estado) se ejecuta antes que los CTE que no lee, así que
+# el orden es el mismo que el de move_booking_status (ver MOVE_BOOKING_STATUS)
+APPLY_NEW_BOOKINGS = Statement("rollup_apply_new_bookings", """
+    WITH detalle AS (
+        SELECT s.schedule_date, s.start_time, c.id_court, c.id_type, b.status
+        FROM bookings b
+        JOIN booking_details bd ON b.id_booking = bd.id_booking
+        JOIN schedules s ON bd.id_schedule = s.id_schedule
+        JOIN courts c ON s.id_court = c.id_court
+        WHERE b.id_booking = ANY(%s)
+    ), diarias AS (
+        INSERT INTO rollup_reservas_diarias (schedule_date, id_court, id_type, status, reservas)
+        SELECT schedule_date, id_court, id_type, status, COUNT(*)
+        FROM detalle
+        GROUP BY schedule_date, id_court, id_type, status
+        ORDER BY schedule_date, id_court, id_type, status
+        ON CONFLICT (schedule_date, id_court, id_type, status) DO UPDATE
+        SET reservas = rollup_reservas_diarias.reservas + EXCLUDED.reservas
+    ), por_hora AS (
+        INSERT INTO rollup_reservas_por_hora (start_time, reservas)
+        SELECT start_time, COUNT(*)
+        FROM detalle
+        GROUP BY start_time
+        ORDER BY start_time
+        ON CONFLICT (start_time) DO UPDATE
+        SET reservas = rollup_reservas_por_hora.reservas + EXCLUDED.reservas
+    )
+    INSERT INTO rollup_reservas_por_estado (status, reservas)
+    SELECT status, COUNT(*)
+    FROM bookings
+    WHERE id_booking = ANY(%s)
+    GROUP BY status
+    ORDER BY status
+    ON CONFLICT (status) DO UPDATE
+    SET reservas = rollup_reservas_por_estado.reservas + EXCLUDED.reservas;
+""")
+
+# Mueve una reserva del estado anterior al nuevo en rollup_reservas_por_estado.
+# Las sentencias que modifican varias filas de un rollup lo hacen ordenadas por la
+# clave, y los rollups se tocan siempre en el mismo orden (por estado, diarias, por
+# hora): dos transacciones que cambian estados en sentidos opuestos (pending ->
+# confirmed y confirmed -> pending) bloquean las filas en el mismo orden y no se
+# bloquean mutuamente. Parámetros: estado anterior, estado nuevo
+MOVE_BOOKING_STATUS = Statement("rollup_move_booking_status", """
+    INSERT INTO rollup_reservas_por_estado (status, reservas)
+    SELECT status, delta
+    FROM (VALUES (%s, -1), (%s, 1)) AS v (status, delta)
+    ORDER BY status
+    ON CONFLICT (status) DO UPDATE
+    SET reservas = rollup_reservas_por_estado.reservas + EXCLUDED.reservas;
+""")
+
+# Mueve los conteos e ingresos diarios de la reserva del estado anterior al nuevo.
+# Parámetros: id_booking, id_booking, estado anterior, estado nuevo
+MOVE_BOOKING_DAYS = Statement("rollup_move_booking_days", """
+    WITH detalle AS (
+        SELECT s.schedule_date, c.id_court, c.id_type,
+               COUNT(*) AS reservas, COALESCE(SUM(inv.total), 0) AS ingresos
+        FROM booking_details bd
+        JOIN schedules s ON bd.id_schedule = s.id_schedule
+        JOIN courts c ON s.id_court = c.id_court
+        LEFT JOIN (
+            SELECT SUM(total_amount) AS total FROM invoices WHERE id_booking = %s
+        ) inv ON TRUE
+        WHERE bd.id_booking = %s
+        GROUP BY s.schedule_date, c.id_court, c.id_type
+    )
+    INSERT INTO rollup_reservas_diarias (schedule_date, id_court, id_type, status, reservas, ingresos)
+    SELECT d.schedule_date, d.id_court, d.id_type, v.status, v.signo * d.reservas, v.signo * d.ingresos
+    FROM detalle d
+    CROSS JOIN (VALUES (%s, -1), (%s, 1)) AS v (status, signo)
+    ORDER BY d.schedule_date, d.id_court, d.id_type, v.status
+    ON CONFLICT (schedule_date, id_court, id_type, status) DO UPDATE
+    SET reservas = rollup_reservas_diarias.reservas + EXCLUDED.reservas,
+        ingresos = rollup_reservas_diarias.ingresos + EXCLUDED.ingresos;
+""")
+
+# Bloquea al usuario antes de descontar sus reservas: una reserva nueva para él
+# (que toma FOR KEY SHARE sobre users) espera hasta que se borre
+LOCK_USER = Statement("rollup_lock_user", "SELECT id_user FROM users WHERE id_user = %s FOR UPDATE;")
+
+# Descuenta de los rollups las reservas de un usuario que se va a borrar (el DELETE de
+# users las borra en cascada). FOR UPDATE lee el estado vigente de cada reserva aunque
+# otra transacción lo esté cambiando. Los ingresos diarios por fecha de factura los
+# descuenta el trigger de invoices al borrarse en cascada. Parámetro: id_user
+REMOVE_USER_BOOKINGS = Statement("rollup_remove_user_bookings", """
+    WITH reservas AS (
+        SELECT id_booking, status FROM bookings WHERE id_user = %s FOR UPDATE
+    ), detalle AS (
+        SELECT s.schedule_date, s.start_time, c.id_court, c.id_type, r.status,
+               COALESCE(inv.total, 0) AS ingresos
+        FROM reservas r
+        JOIN booking_details bd ON r.id_booking = bd.id_booking
+        JOIN schedules s ON bd.id_schedule = s.id_schedule
+        JOIN courts c ON s.id_court = c.id_court
+        LEFT JOIN (
+            SELECT id_booking, SUM(total_amount) AS total
+            FROM invoices
+            WHERE id_booking IN (SELECT id_booking FROM reservas)
+            GROUP BY id_booking
+        ) inv ON inv.id_booking = r.id_booking
+    ), diarias AS (
+        INSERT INTO rollup_reservas_diarias (schedule_date, id_court, id_type, status, reservas, ingresos)
+        SELECT schedule_date, id_court, id_type, status, -COUNT(*), -SUM(ingresos)
+        FROM detalle
+        GROUP BY schedule_date, id_court, id_type, status
+        ORDER BY schedule_date, id_court, id_type, status
+        ON CONFLICT (schedule_date, id_court, id_type, status) DO UPDATE
+        SET reservas = rollup_reservas_diarias.reservas + EXCLUDED.reservas,
+            ingresos = rollup_reservas_diarias.ingresos + EXCLUDED.ingresos
+    ), por_hora AS (
+        INSERT INTO rollup_reservas_por_hora (start_time, reservas)
+        SELECT start_time, -COUNT(*)
+        FROM detalle
+        GROUP BY start_time
+        ORDER BY start_time
+        ON CONFLICT (start_time) DO UPDATE
+        SET reservas = rollup_reservas_por_hora.reservas + EXCLUDED.reservas
+    )
+    INSERT INTO rollup_reservas_por_estado (status, reservas)
+    SELECT status, -COUNT(*)
+    FROM reservas
+    GROUP BY status
+    ORDER BY status
+    ON CONFLICT (status) DO UPDATE
+    SET reservas = rollup_reservas_por_estado.reservas + EXCLUDED.reservas;
+""")
+
+CHECK_INSTALLED = "SELECT to_regclass('rollup_reservas_por_estado') IS NOT NULL AS installed;"
+
+# Cada cuántos segundos se vuelve a verificar si los rollups están instalados
+_CHECK_INTERVAL = 30.0
+_installed = {"value": None, "checked_at": 0.0}
+
+
+def _needs_check():
+    return _installed["value"] is None or time.monotonic() - _installed["checked_at"] > _CHECK_INTERVAL
+
+
+def _remember(value):
+    _installed["value"] = value
+    _installed["checked_at"] = time.monotonic()
+    return value
+
+
+def rollups_enabled(cur):
+    """
+    Indica si las tablas de rollup existen (resultado cacheado unos segundos), para
+    que las reservas sigan funcionando en una base donde todavía no se instalaron.
+    """
+    if _needs_check():
+        cur.execute(CHECK_INSTALLED)
+        _remember(cur.fetchone()["installed"])
+    return _installed["value"]
+
+
+async def rollups_enabled_async(cur):
+    if _needs_check():
+        await cur.execute(CHECK_INSTALLED)
+        _remember((await cur.fetchone())["installed"])
+    return _installed["value"]
+
+
+def apply_new_bookings(cur, booking_ids):
+    if rollups_enabled(cur):
+        cur.execute(APPLY_NEW_BOOKINGS, (list(booking_ids), list(booking_ids)))
+
+
+def move_booking_status(cur, id_booking, old_status, new_status):
+    if old_status != new_status and rollups_enabled(cur):
+        cur.execute(MOVE_BOOKING_STATUS, (old_status, new_status))
+        cur.execute(MOVE_BOOKING_DAYS, (id_booking, id_booking, old_status, new_status))
+
+
+def remove_user_bookings(cur, id_user):
+    if rollups_enabled(cur):
+        cur.execute(LOCK_USER, (id_user,))
+        cur.execute(REMOVE_USER_BOOKINGS, (id_user,))
+
+
+async def apply_new_bookings_async(cur, booking_ids):
+    if await rollups_enabled_async(cur):
+        await cur.execute(APPLY_NEW_BOOKINGS, (list(booking_ids), list(booking_ids)))
+
+
+async def move_booking_status_async(cur, id_booking, old_status, new_status):
+    if old_status != new_status and await rollups_enabled_async(cur):
+        await cur.execute(MOVE_BOOKING_STATUS, (old_status, new_status))
+        await cur.execute(MOVE_BOOKING_DAYS, (id_booking, id_booking, old_status, new_status))
+
+
+async def remove_user_bookings_async(cur, id_user):
+    if await rollups_enabled_async(cur):
+        await cur.execute(LOCK_USER, (id_user,))
+        await cur.execute(REMOVE_USER_BOOKINGS, (id_user,))
+
+
+def rebuild_rollups(cur):
+    """
+    Reconstruye todos los rollups desde cero. Bloquea las escrituras a los rollups
+    mientras corre, así que una reserva concurrente se suma antes o después, nunca se pierde.
+    """
+    cur.execute(f"LOCK TABLE {', '.join(EXPECTED)} IN EXCLUSIVE MODE;")
+    for table, (query, key, values) in EXPECTED.items():
+        columns = ", ".join(key + values)
+        cur.execute(f"DELETE FROM {table};")
+        cur.execute(f"INSERT INTO {table} ({columns}) SELECT {columns} FROM ({query}) e;")
+
+
+def install_rollups(cur):
+    """
+    Crea las tablas y el trigger, y las llena desde las tablas base.
+    """
+    cur.execute(ROLLUPS_DDL)
+    rebuild_rollups(cur)
+
+
+class Rollups:
+    def __init__(self):
+        self.db = Database(ANALYTICS)
+
+    # Reconstruir o comparar recorre las tablas base completas: sin el statement_timeout
+    # del carril
+    def install(self):
+        with self.db.get_cursor(timeout=0) as cur:
+            install_rollups(cur)
+
+    def rebuild(self):
+        with self.db.get_cursor(timeout=0) as cur:
+            rebuild_rollups(cur)
+
+    def reconcile(self, repair=False):
+        """
+        Compara cada rollup con lo que debería contener según las tablas base.
+        Los buckets en cero se consideran equivalentes a que no existan.
+        Retorna {"success", "ok", "differences": {tabla: [filas distintas]}, "repaired"}.
+        """
+        try:
+            differences = {}
+            with self.db.get_cursor(timeout=0) as cur:
+                for table, (query, key, values) in EXPECTED.items():
+                    join = " AND ".join(f"r.{k} = e.{k}" for k in key)
+                    differs = " OR ".join(
+                        f"COALESCE(r.{v}, 0) <> COALESCE(e.{v}, 0)" for v in values
+                    )
+                    select = ", ".join(
+                        [f"COALESCE(r.{k}, e.{k}) AS {k}" for k in key]
+                        + [f"r.{v} AS rollup_{v}, e.{v} AS esperado_{v}" for v in values]
+                    )
+                    cur.execute(f"""
+                        SELECT {select}
+                        FROM {table} r
+                        FULL OUTER JOIN ({query}) e ON {join}
+                        WHERE {differs}
+                        LIMIT 100;
+                    """)
+                    rows = cur.fetchall()
+                    if rows:
+                        differences[table] = rows
+            repaired = False
+            if differences and repair:
+                self.rebuild()
+                repaired = True
+            return {"success": True, "ok": not differences, "differences": differences, "repaired": repaired}
+        except psycopg2.Error as e:
+            return {"success": False, "error": str(e).split('\n')[0]}
+
+
+if __name__ == "__main__":
+    args = sys.argv[1:]
+    rollups = Rollups()
+    if args[:1] == ["install"]:
+        rollups.install()
+        print("Rollups instalados:", ", ".join(EXPECTED))
+    elif args[:1] == ["reconcile"]:
+        result = rollups.reconcile(repair="--repair" in args)
+        print(json.dumps(result, default=str, indent=2))
+        sys.exit(0 if result.get("ok") or result.get("repaired") else 1)
+    else:
+        print(__doc__)
+        sys.exit(1)
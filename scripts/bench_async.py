@@ -0,0 +1,74 @@
+"""
+Compara el modo síncrono (psycopg2 en el threadpool) contra el modo asíncrono
+(psycopg 3 en el event loop) levantando un uvicorn por modo y midiendo req/s y p99.
+
+Uso (desde la raíz del repo, con el .env apuntando a una BD con datos):
+
+    python -m scripts.bench_async --concurrency 200 --duration 20 --path /api/courts/1
+"""
+import argparse
+import asyncio
+import os
+import subprocess
+import sys
+import time
+
+from access import required_roles
+from scripts.loadgen import HttpClient, admin_headers, format_summary, run_load
+
+
+def start_server(mode, port, extra_env=None):
+    env = dict(os.environ, DB_MODE=mode, **(extra_env or {}))
+    # Los benchmarks mandan todo desde un mismo cliente: sin límite ni descarte salvo
+    # que se pidan explícitamente (ver limits.py)
+    env.setdefault("RATE_LIMIT_ENABLED", "0")
+    env.setdefault("SHED_ENABLED", "0")
+    proc = subprocess.Popen(
+        [sys.executable, "-m", "uvicorn", "main:app", "--port", str(port), "--log-level", "warning"],
+        env=env,
+    )
+    deadline = time.monotonic() + 20
+    while time.monotonic() < deadline:
+        try:
+            status, _, _ = asyncio.run(HttpClient("127.0.0.1", port).request("GET", "/api/"))
+            if status == 200:
+                return proc
+        except OSError:
+            time.sleep(0.2)
+    proc.terminate()
+    raise RuntimeError(f"uvicorn en modo {mode} no respondió en el puerto {port}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--path", action="append", help="Ruta a medir (se puede repetir)")
+    parser.add_argument("--concurrency", type=int, default=200)
+    parser.add_argument("--duration", type=float, default=15.0)
+    parser.add_argument("--port", type=int, default=8765)
+    parser.add_argument("--modes", default="sync,async")
+    args = parser.parse_args()
+    paths = args.path or ["/api/courts/1"]
+    routes = [(path, 1, "GET", path, None) for path in paths]
+
+    for mode in args.modes.split(","):
+        proc = start_server(mode, args.port)
+        try:
+            # Las rutas de administrador (/api/reports) necesitan token
+            headers = None
+            if any(required_roles("GET", path) for path in paths):
+                headers = asyncio.run(admin_headers(args.port))
+            # Calentamiento para abrir las conexiones del pool
+            asyncio.run(run_load("127.0.0.1", args.port, routes, concurrency=10, duration=2, headers=headers))
+            result = asyncio.run(run_load("127.0.0.1", args.port, routes, args.concurrency, args.duration,
+                                          headers=headers))
+        finally:
+            proc.terminate()
+            proc.wait()
+        print(format_summary(f"[{mode}] total", result["total"]))
+        if len(paths) > 1:
+            for name, summary in result["routes"].items():
+                print(format_summary(f"  {name}", summary))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,96 @@
+"""
+Mide cuánto agrega AuthMiddleware (access.py) a cada request, sin red ni BD: llama
+al middleware directamente con una app ASGI que responde 200 vacío y resta lo que
+tarda esa app sola.
+
+Casos:
+- sin token, ruta pública: solo el chequeo de ADMIN_ROUTES.
+- token, ruta pública: verificar la firma y leer el principal de la caché.
+- token admin, /api/reports/...: lo mismo más el chequeo de rol.
+- token, caché vencida: cada request llama al loader (acá uno falso, sin BD); se
+  muestra como referencia y no cuenta para el presupuesto.
+
+Termina con código 1 si alguno de los tres primeros supera --budget microsegundos.
+
+    python -m scripts.bench_auth
+    python -m scripts.bench_auth --requests 200000 --budget 50
+"""
+import argparse
+import asyncio
+import sys
+import time
+
+from access import ADMIN_ROLE, AuthMiddleware, PrincipalCache
+from tokens import issue_token
+
+USER = {"id_user": 42, "id_role": ADMIN_ROLE, "token_version": 0}
+
+
+async def app(scope, receive, send):
+    await send({"type": "http.response.start", "status": 200, "headers": []})
+    await send({"type": "http.response.body", "body": b""})
+
+
+async def loader(id_user):
+    return {"success": True, "principal": dict(USER, id_user=id_user)}
+
+
+async def receive():
+    return {"type": "http.request", "body": b""}
+
+
+async def send(message):
+    pass
+
+
+def scope_for(method, path, token=None):
+    headers = [(b"host", b"localhost")]
+    if token:
+        headers.append((b"authorization", f"Bearer {token}".encode()))
+    return {"type": "http", "method": method, "path": path, "headers": headers}
+
+
+async def timed(handler, scope, requests):
+    start = time.perf_counter()
+    for _ in range(requests):
+        # Copia superficial: el middleware escribe scope["state"]
+        await handler(dict(scope), receive, send)
+    return (time.perf_counter() - start) / requests
+
+
+async def run(requests):
+    token = issue_token(USER)
+    warm = AuthMiddleware(app, loader, cache=PrincipalCache(ttl=3600))
+    cold = AuthMiddleware(app, loader, cache=PrincipalCache(ttl=-1))
+    cases = [
+        ("sin token, ruta pública", warm, scope_for("GET", "/api/courts"), True),
+        ("token, ruta pública", warm, scope_for("GET", "/api/courts", token), True),
+        ("token admin, /api/reports", warm, scope_for("GET", "/api/reports/ingresos-mes", token), True),
+        ("token, caché vencida", cold, scope_for("GET", "/api/courts", token), False),
+    ]
+    base = min([await timed(app, scope_for("GET", "/api/courts"), requests) for _ in range(3)])
+    results = []
+    for name, handler, scope, counted in cases:
+        # Mejor de tres corridas, para no medir ruido del sistema
+        best = min([await timed(handler, scope, requests) for _ in range(3)])
+        results.append((name, (best - base) * 1e6, counted))
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--requests", type=int, default=50_000)
+    parser.add_argument("--budget", type=float, default=50.0, help="Microsegundos por request (default 50)")
+    args = parser.parse_args()
+
+    over = 0
+    for name, overhead_us, counted in asyncio.run(run(args.requests)):
+        flag = ""
+        if counted and overhead_us > args.budget:
+            flag, over = "  SUPERA EL PRESUPUESTO", over + 1
+        print(f"{name:<28} {overhead_us:8.2f} µs/request{flag}")
+    sys.exit(1 if over else 0)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,121 @@
+"""
+Compara reservar N horarios de a uno (make_booking_with_schedule en un bucle, una
+transacción y tres INSERT por horario) contra una sola llamada a make_bookings_batch.
+
+Usa una fecha lejana al azar para no chocar con datos reales y cancela las reservas
+creadas al terminar (salvo --keep).
+
+Uso (desde la raíz del repo, con el .env apuntando a una BD con datos):
+
+    python -m scripts.bench_bookings --slots 12 --repeat 20
+    python -m scripts.bench_bookings --slots 100 --repeat 5 --mode async
+"""
+import argparse
+import asyncio
+import random
+import statistics
+import time
+from datetime import date, timedelta
+
+from bd import close_async_pool
+from crud import AsyncCourtCrud, CourtCrud
+
+SLOTS_PER_DAY = 8
+
+
+def make_slots(n, first_day):
+    slots = []
+    for i in range(n):
+        day = first_day + timedelta(days=7 * (i // SLOTS_PER_DAY))
+        hour = 6 + 2 * (i % SLOTS_PER_DAY)
+        slots.append((day.isoformat(), f"{hour:02d}:00", f"{hour + 1:02d}:00"))
+    return slots
+
+
+def random_day(used):
+    while True:
+        day = date(2100, 1, 1) + timedelta(days=random.randrange(0, 300 * 365))
+        if day not in used:
+            used.add(day)
+            return day
+
+
+def bench_sync(args, crud, used):
+    loop_times, batch_times, ids = [], [], []
+    for _ in range(args.repeat):
+        slots = make_slots(args.slots, random_day(used))
+        start = time.perf_counter()
+        for schedule_date, start_time, end_time in slots:
+            result = crud.make_booking_with_schedule(args.user, args.court, schedule_date, start_time, end_time)
+            assert result["success"], result
+            ids.append(result["id_booking"])
+        loop_times.append(time.perf_counter() - start)
+
+        slots = make_slots(args.slots, random_day(used))
+        start = time.perf_counter()
+        result = crud.make_bookings_batch(args.user, args.court, slots)
+        batch_times.append(time.perf_counter() - start)
+        assert result["success"], result
+        ids += [row["id_booking"] for row in result["bookings"]]
+    return loop_times, batch_times, ids
+
+
+async def bench_async(args, crud, used):
+    loop_times, batch_times, ids = [], [], []
+    try:
+        for _ in range(args.repeat):
+            slots = make_slots(args.slots, random_day(used))
+            start = time.perf_counter()
+            for schedule_date, start_time, end_time in slots:
+                result = await crud.make_booking_with_schedule(
+                    args.user, args.court, schedule_date, start_time, end_time
+                )
+                assert result["success"], result
+                ids.append(result["id_booking"])
+            loop_times.append(time.perf_counter() - start)
+
+            slots = make_slots(args.slots, random_day(used))
+            start = time.perf_counter()
+            result = await crud.make_bookings_batch(args.user, args.court, slots)
+            batch_times.append(time.perf_counter() - start)
+            assert result["success"], result
+            ids += [row["id_booking"] for row in result["bookings"]]
+    finally:
+        await close_async_pool()
+    return loop_times, batch_times, ids
+
+
+def report(name, times, slots):
+    median = statistics.median(times)
+    print(f"{name:<8} mediana {median * 1000:8.1f} ms   {slots / median:8.0f} horarios/s")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--slots", type=int, default=12, help="Horarios por reserva")
+    parser.add_argument("--repeat", type=int, default=10)
+    parser.add_argument("--mode", choices=["sync", "async"], default="sync")
+    parser.add_argument("--user", type=int, default=1)
+    parser.add_argument("--court", type=int, default=1)
+    parser.add_argument("--keep", action="store_true", help="No cancelar las reservas creadas")
+    args = parser.parse_args()
+
+    used = set()
+    if args.mode == "sync":
+        loop_times, batch_times, ids = bench_sync(args, CourtCrud(), used)
+    else:
+        loop_times, batch_times, ids = asyncio.run(bench_async(args, AsyncCourtCrud(), used))
+
+    print(f"{args.slots} horarios x {args.repeat} repeticiones, modo {args.mode}")
+    report("bucle", loop_times, args.slots)
+    report("lote", batch_times, args.slots)
+    print(f"speedup x{statistics.median(loop_times) / statistics.median(batch_times):.1f}")
+
+    if not args.keep:
+        crud = CourtCrud()
+        for id_booking in ids:
+            crud.update_booking_status(id_booking, "cancelled")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,67 @@
+"""
+Mide cuánto ahorra la coalescencia de reportes (singleflight.py) cuando muchos
+administradores piden el mismo reporte a la vez.
+
+Levanta un uvicorn con COALESCE_ENABLED=0 y otro con COALESCE_ENABLED=1 (los dos sin
+caché de lecturas, para que cada request llegue al reporte) y en cada uno corre
+--clients conexiones pidiendo los mismos reportes (--path) con el token del
+administrador. Reporta req/s y percentiles y, con coalescencia, cuántas llamadas se
+resolvieron con una ejecución ajena (GET /cache).
+
+Uso (desde la raíz del repo, con la BD sembrada por scripts/seed.py):
+
+    python -m scripts.bench_coalesce
+    python -m scripts.bench_coalesce --clients 20 --duration 20 --mode async --path /api/usuarios
+"""
+import argparse
+import asyncio
+import json
+
+from scripts.bench_async import start_server
+from scripts.loadgen import HttpClient, admin_headers, format_summary, run_load
+
+PATHS = [
+    "/api/reports/reservas-por-estado",
+    "/api/reports/ingresos-mes",
+    "/api/reports/reservas-por-usuario",
+]
+
+
+async def dashboard_load(port, paths, clients, duration):
+    headers = await admin_headers(port)
+    routes = [(path, 1, "GET", path, None) for path in paths]
+    result = await run_load("127.0.0.1", port, routes, clients, duration, headers=headers)
+    client = HttpClient("127.0.0.1", port)
+    try:
+        _, _, body = await client.request("GET", "/api/cache", headers=headers)
+    finally:
+        await client.close()
+    return result, json.loads(body)["coalescing"]
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--path", action="append", help="Reporte a pedir (se puede repetir)")
+    parser.add_argument("--clients", type=int, default=10, help="Conexiones simultáneas (default 10)")
+    parser.add_argument("--duration", type=float, default=15.0)
+    parser.add_argument("--mode", default="sync", choices=["sync", "async"])
+    parser.add_argument("--port", type=int, default=8771)
+    args = parser.parse_args()
+    paths = args.path or PATHS
+
+    for coalesce in ("0", "1"):
+        proc = start_server(args.mode, args.port, {"COALESCE_ENABLED": coalesce, "CACHE_ENABLED": "0"})
+        try:
+            result, coalescing = asyncio.run(dashboard_load(args.port, paths, args.clients, args.duration))
+        finally:
+            proc.terminate()
+            proc.wait()
+        label = "con coalescencia" if coalesce == "1" else "sin coalescencia"
+        print(format_summary(f"[{label}]", result["total"]))
+        for name, counts in coalescing["reports"].items():
+            print(f"    {name:<40} {counts['calls']:>6} llamadas  {counts['executions']:>6} ejecuciones  "
+                  f"{counts['coalesced']:>6} coalescidas")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,99 @@
+"""
+Mide filas/segundo y memoria máxima del servidor al bajar un reporte completo como
+JSON (endpoint de siempre), CSV (/export, COPY) y Parquet (/export, si hay pyarrow).
+
+Levanta un uvicorn nuevo por formato para que el pico de memoria (VmHWM, solo Linux)
+corresponda a esa descarga.
+
+Uso (desde la raíz del repo, con el .env apuntando a una BD con datos):
+
+    python -m scripts.bench_export --report reservas --json-path /api/reservas
+    python -m scripts.bench_export --report facturacion-por-usuario \\
+        --json-path /api/reports/facturacion-por-usuario --mode async
+"""
+import argparse
+import asyncio
+import io
+import json
+import time
+
+from scripts.bench_async import start_server
+from access import required_roles
+from scripts.loadgen import HttpClient, admin_headers
+
+try:
+    import pyarrow.parquet
+except ImportError:
+    pyarrow = None
+
+
+def peak_rss_mb(pid):
+    try:
+        with open(f"/proc/{pid}/status") as status:
+            for line in status:
+                if line.startswith("VmHWM:"):
+                    return int(line.split()[1]) / 1024
+    except OSError:
+        pass
+    return None
+
+
+def count_rows(formato, body):
+    if formato == "json":
+        return len(json.loads(body)["data"])
+    if formato == "csv":
+        return body.count(b"\n") - 1
+    return pyarrow.parquet.ParquetFile(io.BytesIO(body)).metadata.num_rows
+
+
+async def download(port, path, headers=None):
+    client = HttpClient("127.0.0.1", port)
+    try:
+        start = time.perf_counter()
+        status, _, body = await client.request("GET", path, headers=headers)
+        return status, body, time.perf_counter() - start
+    finally:
+        await client.close()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--report", default="reservas", help="Nombre del reporte en /api/export")
+    parser.add_argument("--json-path", default="/api/reservas", help="Endpoint JSON del mismo reporte")
+    parser.add_argument("--query", default="", help="Filtros, p. ej. estado=confirmed")
+    parser.add_argument("--mode", choices=["sync", "async"], default="sync")
+    parser.add_argument("--port", type=int, default=8766)
+    args = parser.parse_args()
+
+    query = f"?{args.query}" if args.query else ""
+    sep = "&" if query else "?"
+    paths = {
+        "json": f"{args.json_path}{query}",
+        "csv": f"/api/export/{args.report}{query}",
+    }
+    if pyarrow is not None:
+        paths["parquet"] = f"/api/export/{args.report}{query}{sep}formato=parquet"
+
+    print(f"{args.report}, modo {args.mode}")
+    for formato, path in paths.items():
+        proc = start_server(args.mode, args.port)
+        try:
+            # Las rutas de administrador (/api/reports) necesitan token
+            headers = asyncio.run(admin_headers(args.port)) if required_roles("GET", path) else None
+            base = peak_rss_mb(proc.pid)
+            status, body, elapsed = asyncio.run(download(args.port, path, headers))
+            peak = peak_rss_mb(proc.pid)
+        finally:
+            proc.terminate()
+            proc.wait()
+        if status != 200:
+            print(f"{formato:<8} HTTP {status}: {body[:200]!r}")
+            continue
+        rows = count_rows(formato, body)
+        memory = f"   pico {peak:7.1f} MB (+{peak - base:.1f})" if peak is not None else ""
+        print(f"{formato:<8} {rows:>9} filas  {elapsed:7.2f} s  {rows / elapsed:>10.0f} filas/s  "
+              f"{len(body) / 1e6:8.1f} MB{memory}")
+
+
+if __name__ == "__main__":
+    main()
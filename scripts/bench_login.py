@@ -0,0 +1,128 @@
+"""
+Mide cuántos logins por segundo y por núcleo aguanta el backend con argon2id.
+
+Tres etapas, cada una durante --seconds:
+
+- verify: passwords.verify_password en un solo hilo; es el costo de CPU de un login
+  con los parámetros ARGON2_* actuales (logins/s por núcleo como cota superior).
+- pool: --concurrency hilos verificando a la vez a través del pool de hash; muestra
+  cuánto escala con PASSWORD_HASH_WORKERS y cuántos pedidos rechaza por lleno.
+- login: Auth.login completo (búsqueda por lower(email), verificación y token) con
+  --concurrency hilos sobre usuarios de scripts/seed.py (contraseña SEED_PASSWORD).
+
+Uso (desde la raíz del repo, con la migración 0006 aplicada y la BD sembrada):
+
+    python -m scripts.bench_login
+    python -m scripts.bench_login --seconds 10 --concurrency 8
+    ARGON2_TIME_COST=3 ARGON2_MEMORY_KIB=65536 python -m scripts.bench_login --skip-login
+"""
+import argparse
+import os
+import random
+import sys
+import threading
+import time
+
+from auth import Auth
+from bd import Database
+from passwords import (
+    ARGON2_MEMORY_KIB, ARGON2_PARALLELISM, ARGON2_TIME_COST, PASSWORD_HASH_QUEUE, PASSWORD_HASH_WORKERS,
+    HasherBusy, hash_password, verify_password,
+)
+from scripts.seed import SEED_PASSWORD
+
+
+def _percentile(values, q):
+    values = sorted(values)
+    return values[min(len(values) - 1, int(q * len(values)))] if values else 0.0
+
+
+def run(task, seconds, concurrency):
+    """
+    Llama a task() desde `concurrency` hilos durante `seconds`. Retorna
+    (latencias de las llamadas correctas, rechazos por pool lleno, errores, duración real).
+    """
+    latencies, lock = [], threading.Lock()
+    counts = {"busy": 0, "errors": 0}
+    deadline = time.perf_counter() + seconds
+
+    def worker():
+        local, busy, errors = [], 0, 0
+        while time.perf_counter() < deadline:
+            start = time.perf_counter()
+            try:
+                ok = task()
+            except HasherBusy:
+                busy += 1
+                continue
+            if ok:
+                local.append(time.perf_counter() - start)
+            else:
+                errors += 1
+        with lock:
+            latencies.extend(local)
+            counts["busy"] += busy
+            counts["errors"] += errors
+
+    start = time.perf_counter()
+    threads = [threading.Thread(target=worker) for _ in range(concurrency)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    return latencies, counts["busy"], counts["errors"], time.perf_counter() - start
+
+
+def report(name, result, cores):
+    latencies, busy, errors, elapsed = result
+    rate = len(latencies) / elapsed
+    line = (f"{name:<8} {rate:8.1f} logins/s  {rate / cores:8.1f} por núcleo  "
+            f"p50 {_percentile(latencies, 0.5) * 1000:7.1f} ms  p99 {_percentile(latencies, 0.99) * 1000:7.1f} ms")
+    if busy:
+        line += f"  {busy} rechazados (pool lleno)"
+    if errors:
+        line += f"  {errors} fallidos"
+    print(line)
+    return errors
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--seconds", type=float, default=5, help="Duración de cada etapa (default 5)")
+    parser.add_argument("--concurrency", type=int, default=4, help="Hilos en las etapas pool y login (default 4)")
+    parser.add_argument("--skip-login", action="store_true", help="Solo mide el hash, sin la BD")
+    args = parser.parse_args()
+
+    cores = os.cpu_count() or 1
+    print(f"argon2id t={ARGON2_TIME_COST} m={ARGON2_MEMORY_KIB} KiB p={ARGON2_PARALLELISM}; "
+          f"pool de {PASSWORD_HASH_WORKERS} hilos + {PASSWORD_HASH_QUEUE} en espera; {cores} núcleos\n")
+
+    stored = hash_password(SEED_PASSWORD)
+    failed = report("verify", run(lambda: verify_password(stored, SEED_PASSWORD)[0], args.seconds, 1), 1)
+    workers = min(PASSWORD_HASH_WORKERS, cores)
+    failed += report("pool", run(lambda: verify_password(stored, SEED_PASSWORD)[0], args.seconds, args.concurrency),
+                     workers)
+
+    if not args.skip_login:
+        with Database().get_cursor() as cur:
+            cur.execute("SELECT MAX(id_user) AS max_id FROM users WHERE email LIKE 'usuario%@example.com';")
+            max_id = cur.fetchone()["max_id"]
+        if max_id is None:
+            print("La BD no tiene usuarios sembrados; cárgala con python -m scripts.seed")
+            sys.exit(1)
+        auth = Auth()
+
+        def login():
+            email = f"usuario{random.randint(1, max_id)}@example.com"
+            result = auth.login(email, SEED_PASSWORD)
+            if result.get("busy"):
+                raise HasherBusy(result["error"])
+            return result["success"]
+
+        failed += report("login", run(login, args.seconds, args.concurrency), workers)
+
+    sys.exit(1 if failed else 0)
+
+
+if __name__ == "__main__":
+    main()
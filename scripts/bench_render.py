@@ -0,0 +1,72 @@
+"""
+Compara los modos de render JSON de los reportes (ver rendering.py): filas/segundo y
+latencia de un mismo endpoint con JSON_RENDER=python, orjson y db.
+
+Levanta un uvicorn nuevo por modo y hace `--requests` peticiones seguidas con una sola
+conexión, para medir el costo de armar la respuesta y no la concurrencia.
+
+Uso (desde la raíz del repo, con el .env apuntando a una BD con datos):
+
+    python -m scripts.bench_render --path /api/reservas
+    python -m scripts.bench_render --path /api/reports/facturacion-por-usuario --mode async
+"""
+import argparse
+import asyncio
+import json
+import statistics
+import time
+
+from rendering import RENDER_MODES
+from scripts.bench_async import start_server
+from access import required_roles
+from scripts.loadgen import HttpClient, admin_headers
+
+
+async def measure(port, path, requests):
+    # Las rutas de administrador (/api/reports) necesitan token
+    headers = await admin_headers(port) if required_roles("GET", path) else None
+    client = HttpClient("127.0.0.1", port)
+    try:
+        # La primera petición prepara las consultas y llena los caches de la BD
+        status, _, body = await client.request("GET", path, headers=headers)
+        if status != 200:
+            return status, body, []
+        timings = []
+        for _ in range(requests):
+            start = time.perf_counter()
+            status, _, body = await client.request("GET", path, headers=headers)
+            timings.append(time.perf_counter() - start)
+        return status, body, timings
+    finally:
+        await client.close()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--path", default="/api/reservas")
+    parser.add_argument("--requests", type=int, default=30)
+    parser.add_argument("--mode", choices=["sync", "async"], default="sync")
+    parser.add_argument("--renders", default=",".join(RENDER_MODES))
+    parser.add_argument("--port", type=int, default=8767)
+    args = parser.parse_args()
+
+    print(f"{args.path}, modo {args.mode}, {args.requests} peticiones")
+    for render in args.renders.split(","):
+        proc = start_server(args.mode, args.port, {"JSON_RENDER": render})
+        try:
+            status, body, timings = asyncio.run(measure(args.port, args.path, args.requests))
+        finally:
+            proc.terminate()
+            proc.wait()
+        if status != 200:
+            print(f"{render:<8} HTTP {status}: {body[:200]!r}")
+            continue
+        rows = len(json.loads(body)["data"])
+        median = statistics.median(timings)
+        p95 = sorted(timings)[int(len(timings) * 0.95) - 1]
+        print(f"{render:<8} {rows:>8} filas  p50 {median * 1000:8.1f} ms  p95 {p95 * 1000:8.1f} ms  "
+              f"{rows / median:>10.0f} filas/s  {len(body) / 1e6:6.2f} MB")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,75 @@
+"""
+Mide cuánto protege el descarte de carga (limits.py) a las rutas de reservas cuando
+un pico de reportes satura el pool.
+
+Levanta un uvicorn con SHED_ENABLED=0 y otro con SHED_ENABLED=1 (los dos con un pool
+chico en los dos carriles, --pool) y en cada uno corre a la vez:
+
+- --heavy conexiones pidiendo reportes completos con el token del administrador;
+- --light conexiones pidiendo las reservas pendientes de usuarios al azar.
+
+Reporta req/s y percentiles de las dos cargas; en la de reportes, los 503 (descartes)
+figuran como errores. El límite por cliente queda desactivado para que no se mezcle.
+
+Uso (desde la raíz del repo, con la BD sembrada por scripts/seed.py):
+
+    python -m scripts.bench_shedding
+    python -m scripts.bench_shedding --heavy 40 --light 10 --duration 20 --mode async
+"""
+import argparse
+import asyncio
+
+from bd import Database
+from scripts.bench_async import start_server
+from scripts.loadgen import admin_headers, format_summary, run_load
+
+REPORTS = [
+    "/api/reports/ingresos-mes",
+    "/api/reports/reservas-por-usuario",
+    "/api/reports/facturacion-por-usuario",
+    "/api/reports/reservas-por-dia",
+    "/api/reports/usuarios-con-mas-reservas",
+]
+
+
+async def mixed_load(port, heavy, light, duration, max_user):
+    headers = await admin_headers(port)
+    heavy_routes = [(path, 1, "GET", path, None) for path in REPORTS]
+    light_routes = [("reservas pendientes", 1, "GET",
+                     lambda rng: f"/api/users/{rng.randint(1, max_user)}/bookings/pending", None)]
+    return await asyncio.gather(
+        run_load("127.0.0.1", port, heavy_routes, heavy, duration, headers=headers),
+        run_load("127.0.0.1", port, light_routes, light, duration),
+    )
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--heavy", type=int, default=30, help="Conexiones pidiendo reportes (default 30)")
+    parser.add_argument("--light", type=int, default=5, help="Conexiones pidiendo reservas (default 5)")
+    parser.add_argument("--duration", type=float, default=15.0)
+    parser.add_argument("--pool", default="4",
+                        help="DB_POOL_MAX y DB_ANALYTICS_POOL_MAX de los servidores (default 4)")
+    parser.add_argument("--mode", default="sync", choices=["sync", "async"])
+    parser.add_argument("--port", type=int, default=8770)
+    args = parser.parse_args()
+
+    with Database().get_cursor() as cur:
+        cur.execute("SELECT MAX(id_user) AS max_id FROM users;")
+        max_user = cur.fetchone()["max_id"] or 1
+
+    for shed in ("0", "1"):
+        env = {"SHED_ENABLED": shed, "DB_POOL_MAX": args.pool, "DB_ANALYTICS_POOL_MAX": args.pool}
+        proc = start_server(args.mode, args.port, env)
+        try:
+            heavy, light = asyncio.run(mixed_load(args.port, args.heavy, args.light, args.duration, max_user))
+        finally:
+            proc.terminate()
+            proc.wait()
+        label = "con descarte" if shed == "1" else "sin descarte"
+        print(format_summary(f"[{label}] reportes", heavy["total"]))
+        print(format_summary(f"[{label}] reservas", light["total"]))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,231 @@
+"""
+Verifica y mide el reporte /usuarios (custom_reports.build_usuarios) contra la
+consulta anterior, que calculaba cancha_preferida con una subconsulta correlacionada
+por usuario sobre toda su historia, sin los filtros del reporte.
+
+Para cada combinación de filtros:
+
+- Compara la consulta nueva con una referencia calculada en Python sobre las filas
+  del join: total por usuario idéntico y cancha preferida = el tipo más reservado con
+  los mismos filtros (empate: el primero por nombre).
+- Compara con la consulta anterior: mismos usuarios y totales. Sin filtros, la misma
+  cancha preferida (salvo empates, que la anterior resolvía al azar). Con filtros
+  solo informa cuántas preferidas cambian por respetar los filtros.
+- Mide el tiempo de cada una (mejor de --repeat corridas).
+
+Termina con código 1 si alguna comparación falla. Conviene correrlo contra una BD
+cargada con scripts/seed.py, por ejemplo con 100 mil usuarios:
+
+    python -m scripts.seed --bookings 1000000 --users 100000 --truncate
+    python -m scripts.bench_usuarios
+    python -m scripts.bench_usuarios --skip-legacy --repeat 5
+"""
+import argparse
+import sys
+import time
+from datetime import timedelta
+
+from bd import Database
+from custom_reports import build_usuarios, get_time_range
+
+LEGACY_USUARIOS = """
+    SELECT u.id_user, u.name, COUNT(b.id_booking) AS cantidad_reservas,
+        (SELECT ct.type_name
+         FROM bookings b2
+         JOIN booking_details bd2 ON b2.id_booking = bd2.id_booking
+         JOIN schedules s2 ON bd2.id_schedule = s2.id_schedule
+         JOIN courts c2 ON s2.id_court = c2.id_court
+         JOIN court_types ct ON c2.id_type = ct.id_type
+         WHERE b2.id_user = u.id_user
+         GROUP BY ct.type_name
+         ORDER BY COUNT(*) DESC
+         LIMIT 1
+        ) AS cancha_preferida
+    FROM users u
+    JOIN bookings b ON u.id_user = b.id_user
+    JOIN booking_details bd ON b.id_booking = bd.id_booking
+    JOIN schedules s ON bd.id_schedule = s.id_schedule
+    WHERE 1=1
+"""
+
+# Filas del join con los filtros, para la referencia en Python
+RAW_ROWS = """
+    SELECT b.id_user, ct.type_name
+    FROM bookings b
+    JOIN booking_details bd ON b.id_booking = bd.id_booking
+    JOIN schedules s ON bd.id_schedule = s.id_schedule
+    JOIN courts c ON s.id_court = c.id_court
+    JOIN court_types ct ON c.id_type = ct.id_type
+    WHERE 1=1
+"""
+
+# Tipos reservados por usuario sin filtros, para reconocer empates de la consulta anterior
+ALL_TYPES = """
+    SELECT b.id_user, ct.type_name, COUNT(*) AS reservas
+    FROM bookings b
+    JOIN booking_details bd ON b.id_booking = bd.id_booking
+    JOIN schedules s ON bd.id_schedule = s.id_schedule
+    JOIN courts c ON s.id_court = c.id_court
+    JOIN court_types ct ON c.id_type = ct.id_type
+    GROUP BY b.id_user, ct.type_name
+"""
+
+
+def _filters(fecha_inicio, fecha_fin, horario_dia):
+    sql, params = "", []
+    if fecha_inicio:
+        sql += " AND s.schedule_date >= %s"
+        params.append(fecha_inicio)
+    if fecha_fin:
+        sql += " AND s.schedule_date <= %s"
+        params.append(fecha_fin)
+    start, end = get_time_range(horario_dia)
+    if start and end:
+        sql += " AND s.start_time >= %s AND s.end_time < %s"
+        params.extend([start, end])
+    return sql, params
+
+
+def build_legacy(fecha_inicio=None, fecha_fin=None, horario_dia=None, min_reservas=1):
+    sql, params = _filters(fecha_inicio, fecha_fin, horario_dia)
+    query = LEGACY_USUARIOS + sql + " GROUP BY u.id_user, u.name"
+    if min_reservas and min_reservas > 0:
+        query += " HAVING COUNT(b.id_booking) >= %s"
+        params.append(min_reservas)
+    return query + " ORDER BY cantidad_reservas DESC", tuple(params)
+
+
+def with_user_id(query):
+    # La salida del reporte no trae id_user (los nombres se repiten); para comparar se agrega
+    return query.replace("SELECT u.name,", "SELECT u.id_user, u.name,", 1)
+
+
+def reference(cur, fecha_inicio, fecha_fin, horario_dia, min_reservas):
+    """
+    id_user -> (total, tipos más reservados) contando en Python las filas del join.
+    """
+    sql, params = _filters(fecha_inicio, fecha_fin, horario_dia)
+    counts = {}
+    # Cursor del lado del servidor: con millones de filas no se cargan todas juntas
+    with cur.connection.cursor(name="referencia") as rows:
+        rows.execute(RAW_ROWS + sql, params)
+        for id_user, type_name in rows:
+            per_type = counts.setdefault(id_user, {})
+            per_type[type_name] = per_type.get(type_name, 0) + 1
+    expected = {}
+    for id_user, per_type in counts.items():
+        total = sum(per_type.values())
+        if min_reservas and total < min_reservas:
+            continue
+        top = max(per_type.values())
+        expected[id_user] = (total, {name for name, count in per_type.items() if count == top})
+    return expected
+
+
+def timed(cur, query, params, repeat):
+    best, rows = None, None
+    for _ in range(repeat):
+        start = time.perf_counter()
+        cur.execute(query, params)
+        rows = cur.fetchall()
+        elapsed = time.perf_counter() - start
+        best = elapsed if best is None else min(best, elapsed)
+    return best, rows
+
+
+def check_case(cur, name, filters, args, all_types):
+    """
+    Retorna la lista de diferencias encontradas (vacía si todo coincide).
+    """
+    problems = []
+    query, params = build_usuarios(*filters)
+    new_time, new_rows = timed(cur, with_user_id(query), params, args.repeat)
+
+    expected = reference(cur, *filters)
+    got = {row["id_user"]: row for row in new_rows}
+    if set(got) != set(expected):
+        problems.append(f"usuarios distintos: {len(got)} vs {len(expected)} en la referencia")
+    for id_user, (total, top) in expected.items():
+        row = got.get(id_user)
+        if row is None:
+            continue
+        if row["cantidad_reservas"] != total:
+            problems.append(f"usuario {id_user}: {row['cantidad_reservas']} reservas, se esperaban {total}")
+        if row["cancha_preferida"] != min(top):
+            problems.append(f"usuario {id_user}: prefiere {row['cancha_preferida']}, se esperaba {min(top)}")
+    order = [(-row["cantidad_reservas"], row["id_user"]) for row in new_rows]
+    if order != sorted(order):
+        problems.append("el orden no es cantidad_reservas DESC, id_user")
+
+    line = f"{name:<28} {len(new_rows):>8} filas  nueva {new_time * 1000:10.1f} ms"
+    if not args.skip_legacy:
+        legacy_time, legacy_rows = timed(cur, *build_legacy(*filters), 1)
+        line += f"  anterior {legacy_time * 1000:10.1f} ms  ({legacy_time / new_time:.0f}x)"
+        legacy = {row["id_user"]: row for row in legacy_rows}
+        if set(legacy) != set(got):
+            problems.append("la consulta anterior devuelve otros usuarios")
+        changed = 0
+        for id_user, row in legacy.items():
+            new = got.get(id_user)
+            if new is None:
+                continue
+            if new["cantidad_reservas"] != row["cantidad_reservas"]:
+                problems.append(f"usuario {id_user}: total distinto a la consulta anterior")
+            if new["cancha_preferida"] == row["cancha_preferida"]:
+                continue
+            if not any(filters[:3]):
+                # Sin filtros solo puede diferir en un empate
+                counts = all_types.get(id_user, {})
+                top = max(counts.values())
+                if counts.get(row["cancha_preferida"]) != top or counts.get(new["cancha_preferida"]) != top:
+                    problems.append(f"usuario {id_user}: preferida distinta a la consulta anterior sin empate")
+            else:
+                changed += 1
+        if changed:
+            line += f"  [{changed} preferidas cambian por los filtros]"
+    print(("ok   " if not problems else "FALLA") + "  " + line)
+    for problem in problems[:10]:
+        print("         ", problem)
+    return problems
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--repeat", type=int, default=3, help="Corridas de la consulta nueva (se toma la mejor)")
+    parser.add_argument("--skip-legacy", action="store_true", help="No corre la consulta anterior (lenta)")
+    args = parser.parse_args()
+
+    with Database().get_cursor() as cur:
+        cur.execute("SELECT MIN(schedule_date) AS desde, MAX(schedule_date) AS hasta FROM schedules;")
+        dates = cur.fetchone()
+        if dates["desde"] is None:
+            print("La BD no tiene horarios; cárgala con python -m scripts.seed")
+            sys.exit(1)
+        cur.execute("SELECT COUNT(*) AS usuarios FROM users;")
+        print(f"{cur.fetchone()['usuarios']} usuarios, horarios de {dates['desde']} a {dates['hasta']}\n")
+
+        middle = dates["desde"] + (dates["hasta"] - dates["desde"]) / 2
+        desde, hasta = str(middle - timedelta(days=30)), str(middle + timedelta(days=30))
+        cases = [
+            ("sin filtros", (None, None, None, 1)),
+            ("60 días", (desde, hasta, None, 1)),
+            ("tarde", (None, None, "tarde", 1)),
+            ("60 días, noche, min 2", (desde, hasta, "noche", 2)),
+        ]
+
+        all_types = {}
+        if not args.skip_legacy:
+            cur.execute(ALL_TYPES)
+            for row in cur:
+                all_types.setdefault(row["id_user"], {})[row["type_name"]] = row["reservas"]
+
+        failed = 0
+        for name, filters in cases:
+            failed += bool(check_case(cur, name, filters, args, all_types))
+
+    print(f"\n{failed} casos con diferencias" if failed else "\nTodos los casos coinciden")
+    sys.exit(1 if failed else 0)
+
+
+if __name__ == "__main__":
+    main()
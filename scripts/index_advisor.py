@@ -0,0 +1,242 @@
+"""
+Corre EXPLAIN (ANALYZE, BUFFERS) sobre todas las consultas del backend contra una BD
+con datos y marca los Seq Scan que un índice podría evitar.
+
+Se revisan todas las consultas con nombre (bd.STATEMENTS), las consultas armadas por
+los reportes personalizados (con y sin filtros, y una página por clave), las de
+reconciliación de rollups y las definiciones de las vistas materializadas. Los
+parámetros salen de una reserva real de la BD.
+
+Cada consulta corre dentro de una transacción que se deshace al terminar, así que las
+escrituras (INSERT/UPDATE/DELETE) no dejan rastro; solo las secuencias avanzan.
+
+Un Seq Scan se marca cuando lee al menos --min-rows filas y su filtro descarta la
+mayoría, o cuando se repite (loops > 1, típico del lado interno de un join). Los
+recorridos completos de los reportes sobre toda la historia (incluidos los paralelos)
+no se marcan: un índice no los haría más baratos.
+
+Uso (desde la raíz del repo):
+
+    python -m scripts.index_advisor
+    python -m scripts.index_advisor --min-rows 100 --verbose
+    python -m scripts.index_advisor --only reservas
+"""
+import argparse
+import sys
+from datetime import timedelta
+
+import psycopg2
+from psycopg2.extras import RealDictCursor
+
+import auth  # noqa: F401  (registra sus Statement)
+import crud  # noqa: F401
+import reportsCrud  # noqa: F401
+import userCrud  # noqa: F401
+from availability import free_courts_params, free_slots_params
+from bd import MAINTENANCE, STATEMENTS, Database
+from custom_reports import (
+    RESERVAS_KEYSET, build_cuantas_veces, build_disponibilidad_canchas, build_ingresos,
+    build_promociones_aplicadas, build_reservas, build_usuarios,
+)
+from materialized import VIEWS
+from pagination import encode_cursor
+from rollups import EXPECTED
+
+SAMPLE = """
+    SELECT b.id_booking, b.id_user, b.status, s.id_schedule, s.id_court, s.schedule_date,
+           s.start_time, s.end_time, c.id_type, u.email,
+           (SELECT name FROM promotions ORDER BY id_promotion LIMIT 1) AS promocion
+    FROM bookings b
+    JOIN booking_details bd ON b.id_booking = bd.id_booking
+    JOIN schedules s ON bd.id_schedule = s.id_schedule
+    JOIN courts c ON s.id_court = c.id_court
+    JOIN users u ON b.id_user = u.id_user
+    WHERE b.status <> 'cancelled'
+    ORDER BY b.id_booking
+    LIMIT 1 OFFSET (SELECT COUNT(*) / 2 FROM bookings WHERE status <> 'cancelled');
+"""
+
+
+def _batch(s):
+    return [s["schedule_date"]], [str(s["start_time"])], [str(s["end_time"])]
+
+
+def _free_slots(s):
+    return free_slots_params(str(s["schedule_date"]), str(s["schedule_date"] + timedelta(days=6)))
+
+
+def _free_courts(s):
+    return free_courts_params(str(s["schedule_date"]), str(s["start_time"]), str(s["end_time"]))
+
+
+# Nombre del Statement -> parámetros a partir de la fila de SAMPLE
+PARAMS = {
+    "rollup_apply_new_bookings": lambda s: ([s["id_booking"]], [s["id_booking"]]),
+    "rollup_move_booking_status": lambda s: (
+        s["id_booking"], s["id_booking"], s["status"], "cancelled", s["status"], "cancelled"
+    ),
+    "get_courts_by_type": lambda s: (s["id_type"],),
+    "get_court_details": lambda s: (s["id_court"],),
+    "get_unavailable_schedules": lambda s: (s["id_court"],),
+    "insert_schedule": lambda s: (s["id_court"], s["schedule_date"], s["start_time"], s["end_time"]),
+    "insert_booking": lambda s: (s["id_user"],),
+    "insert_booking_detail": lambda s: (s["id_booking"], s["id_schedule"]),
+    "lock_court_day": lambda s: (s["id_court"], s["schedule_date"]),
+    "find_overlaps": lambda s: (s["id_court"], s["schedule_date"], s["end_time"], s["start_time"]),
+    "get_booking_court_days": lambda s: (s["id_booking"],),
+    "find_booking_overlaps": lambda s: (s["id_booking"], s["id_booking"]),
+    "lock_court_days": lambda s: (s["id_court"], [s["schedule_date"]]),
+    "find_batch_overlaps": lambda s: _batch(s) + (s["id_court"],),
+    "insert_bookings_batch": lambda s: _batch(s) + ([0], s["id_court"], s["id_user"]),
+    "update_booking_status": lambda s: (s["id_booking"], "cancelled"),
+    "get_user_pending_bookings": lambda s: (s["id_user"],),
+    "get_user_confirmed_bookings": lambda s: (s["id_user"],),
+    "get_available_schedules": lambda s: (s["id_court"],),
+    "get_user_by_id": lambda s: (s["id_user"],),
+    "delete_user": lambda s: (s["id_user"],),
+    "user_exists": lambda s: (s["id_user"],),
+    "get_principal": lambda s: (s["id_user"],),
+    "insert_phone": lambda s: (s["id_user"], "55550000"),
+    "get_phones": lambda s: (s["id_user"],),
+    "auth_insert_user": lambda s: ("Index", "Advisor", "index.advisor@example.com", "x", 2),
+    "auth_login": lambda s: (s["email"],),
+    "auth_rehash_password": lambda s: ("x", s["id_user"], "y"),
+    "mv_get_refreshed_at": lambda s: ("mv_reservas_por_usuario",),
+    "mv_save_refresh": lambda s: ("mv_reservas_por_usuario", 0),
+    "reports_reservas_por_rango_fechas": lambda s: (s["schedule_date"] - timedelta(days=30), s["schedule_date"]),
+    "reports_rollup_reservas_por_rango_fechas": lambda s: (
+        s["schedule_date"] - timedelta(days=30), s["schedule_date"]
+    ),
+    "availability_free_slots": _free_slots,
+    "availability_free_slots_default_hours": _free_slots,
+    "availability_free_courts": _free_courts,
+    "availability_free_courts_default_hours": _free_courts,
+}
+
+
+def cases(sample):
+    """
+    Lista de (nombre, sql, params) con todo lo que se va a explicar.
+    """
+    found = []
+    for name, statement in STATEMENTS.items():
+        if statement.param_count == 0:
+            found.append((name, str(statement), None))
+        elif name in PARAMS:
+            found.append((name, str(statement), PARAMS[name](sample)))
+        else:
+            print(f"Sin parámetros de ejemplo para {name}, se omite", file=sys.stderr)
+
+    desde = str(sample["schedule_date"] - timedelta(days=30))
+    hasta = str(sample["schedule_date"])
+    reservas = build_reservas(desde, hasta, sample["id_type"], "confirmed")
+    cursor = encode_cursor([hasta, sample["id_booking"], sample["id_schedule"]])
+    found += [
+        ("custom_reservas", *build_reservas()),
+        ("custom_reservas_filtros", *reservas),
+        ("custom_reservas_pagina", *RESERVAS_KEYSET.page_query(*build_reservas(paginado=True), cursor=cursor)[:2]),
+        ("custom_ingresos", *build_ingresos()),
+        ("custom_ingresos_filtros", *build_ingresos(desde, hasta, "mes", sample["id_type"])),
+        ("custom_usuarios", *build_usuarios()),
+        ("custom_usuarios_filtros", *build_usuarios(desde, hasta, "tarde", 2)),
+        ("custom_promociones_aplicadas", *build_promociones_aplicadas(desde, hasta, sample["promocion"])),
+        ("custom_cuantas_veces", *build_cuantas_veces(sample["promocion"])),
+        ("custom_disponibilidad_canchas", *build_disponibilidad_canchas(desde, hasta, sample["id_type"])),
+    ]
+    found += [(f"reconcile_{table}", query, None) for table, (query, _, _) in EXPECTED.items()]
+    found += [(f"refresh_{view}", definition, None) for view, (definition, _) in VIEWS.items()]
+    return found
+
+
+def _walk(node, copies=1):
+    # Debajo de un Gather cada proceso (workers + líder) ejecuta su copia del subplan
+    yield node, copies
+    if node["Node Type"] in ("Gather", "Gather Merge"):
+        copies = node.get("Workers Launched", 0) + 1
+    for child in node.get("Plans", ()):
+        yield from _walk(child, copies)
+
+
+def seq_scans(plan, min_rows):
+    """
+    Retorna (marcados, otros): los Seq Scan del plan como dicts con tabla, filtro,
+    filas leídas por vuelta y vueltas.
+    """
+    flagged, others = [], []
+    for node, copies in _walk(plan["Plan"]):
+        if node["Node Type"] != "Seq Scan":
+            continue
+        loops = node.get("Actual Loops", 1) or 1
+        kept = node.get("Actual Rows", 0)
+        removed = node.get("Rows Removed by Filter", 0)
+        if node.get("Parallel Aware"):
+            # Un solo recorrido repartido entre los procesos
+            kept, removed, loops = kept * loops, removed * loops, 1
+        else:
+            loops = max(1, round(loops / copies))
+        scan = {
+            "table": node["Relation Name"],
+            "filter": node.get("Filter"),
+            "rows": kept + removed,
+            "loops": loops,
+        }
+        # Un filtro que descarta la mayoría de la tabla o un scan repetido por un join
+        if scan["rows"] >= min_rows and ((scan["filter"] and removed > kept) or loops > 1):
+            flagged.append(scan)
+        else:
+            others.append(scan)
+    return flagged, others
+
+
+def explain(cur, sql, params):
+    cur.execute("EXPLAIN (ANALYZE, BUFFERS, FORMAT JSON) " + sql.strip().rstrip(";"), params)
+    return cur.fetchone()[0][0]
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--min-rows", type=int, default=1000,
+                        help="Filas mínimas de un Seq Scan para marcarlo (default 1000)")
+    parser.add_argument("--only", help="Solo las consultas cuyo nombre contiene este texto")
+    parser.add_argument("--verbose", action="store_true", help="Muestra también los Seq Scan no marcados")
+    args = parser.parse_args()
+
+    db = Database(MAINTENANCE)
+    marked = 0
+    with db.get_connection() as conn:
+        with conn.cursor(cursor_factory=RealDictCursor) as cur:
+            cur.execute(SAMPLE)
+            sample = cur.fetchone()
+        conn.rollback()
+        if sample is None:
+            print("La BD no tiene reservas activas; cárgala primero")
+            sys.exit(1)
+
+        with conn.cursor() as cur:
+            for name, sql, params in cases(sample):
+                if args.only and args.only not in name:
+                    continue
+                try:
+                    plan = explain(cur, sql, params)
+                except psycopg2.Error as e:
+                    print(f"ERROR  {name}: {str(e).splitlines()[0]}")
+                    continue
+                finally:
+                    conn.rollback()
+                flagged, others = seq_scans(plan, args.min_rows)
+                root = plan["Plan"]
+                buffers = root.get("Shared Hit Blocks", 0) + root.get("Shared Read Blocks", 0)
+                status = "SEQ" if flagged else "ok "
+                print(f"{status}    {name:<48} {plan['Execution Time']:9.2f} ms  {buffers:>7} buffers")
+                for scan in flagged + (others if args.verbose else []):
+                    mark = "  !" if scan in flagged else "   "
+                    detail = f" filtro: {scan['filter']}" if scan["filter"] else ""
+                    print(f"{mark}    Seq Scan {scan['table']} ({scan['rows']} filas x {scan['loops']}){detail}")
+                marked += bool(flagged)
+
+    print(f"\n{marked} consultas con Seq Scan marcados (--min-rows {args.min_rows})")
+    sys.exit(1 if marked else 0)
+
+
+if __name__ == "__main__":
+    main()
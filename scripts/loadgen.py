@@ -0,0 +1,181 @@
+"""
+Generador de carga HTTP mínimo basado en asyncio (solo librería estándar).
+
+Abre `concurrency` conexiones keep-alive contra el servidor y cada una lanza
+requests en bucle durante `duration` segundos, eligiendo la ruta según su peso.
+Lo usan los benchmarks de scripts/ para medir req/s y percentiles de latencia.
+"""
+import asyncio
+import json
+import random
+import time
+
+from scripts.seed import ADMIN_EMAIL, SEED_PASSWORD
+
+
+class HttpClient:
+    """
+    Cliente HTTP/1.1 keep-alive sobre una sola conexión TCP.
+    """
+    def __init__(self, host, port):
+        self.host = host
+        self.port = port
+        self.reader = None
+        self.writer = None
+
+    async def connect(self):
+        self.reader, self.writer = await asyncio.open_connection(self.host, self.port)
+
+    async def close(self):
+        if self.writer:
+            self.writer.close()
+            try:
+                await self.writer.wait_closed()
+            except ConnectionError:
+                pass
+            self.writer = None
+
+    async def request(self, method, path, body=None, headers=None):
+        """
+        Envía un request y retorna (status, headers, body).
+        """
+        if self.writer is None:
+            await self.connect()
+        lines = [f"{method} {path} HTTP/1.1", f"Host: {self.host}:{self.port}"]
+        for name, value in (headers or {}).items():
+            lines.append(f"{name}: {value}")
+        if body is not None:
+            lines.append("Content-Type: application/json")
+            lines.append(f"Content-Length: {len(body)}")
+        payload = ("\r\n".join(lines) + "\r\n\r\n").encode() + (body or b"")
+        self.writer.write(payload)
+        await self.writer.drain()
+
+        status_line = await self.reader.readline()
+        if not status_line:
+            raise ConnectionError("El servidor cerró la conexión")
+        status = int(status_line.split()[1])
+        resp_headers = {}
+        while True:
+            line = await self.reader.readline()
+            if line in (b"\r\n", b""):
+                break
+            name, _, value = line.decode("latin-1").partition(":")
+            resp_headers[name.strip().lower()] = value.strip()
+        if resp_headers.get("transfer-encoding") == "chunked":
+            chunks = []
+            while True:
+                size = int((await self.reader.readline()).strip(), 16)
+                if size == 0:
+                    await self.reader.readline()
+                    break
+                chunks.append(await self.reader.readexactly(size))
+                await self.reader.readline()
+            data = b"".join(chunks)
+        else:
+            data = await self.reader.readexactly(int(resp_headers.get("content-length", 0)))
+        if resp_headers.get("connection") == "close":
+            await self.close()
+        return status, resp_headers, data
+
+
+def percentile(values, p):
+    if not values:
+        return 0.0
+    values = sorted(values)
+    k = min(len(values) - 1, max(0, int(round(p / 100 * len(values))) - 1))
+    return values[k]
+
+
+def summarize(latencies, errors, elapsed):
+    """
+    Resume una lista de latencias (segundos) en req/s y percentiles en ms.
+    """
+    total = len(latencies)
+    return {
+        "requests": total,
+        "errors": errors,
+        "rps": total / elapsed if elapsed else 0.0,
+        "p50_ms": percentile(latencies, 50) * 1000,
+        "p90_ms": percentile(latencies, 90) * 1000,
+        "p99_ms": percentile(latencies, 99) * 1000,
+        "max_ms": max(latencies) * 1000 if latencies else 0.0,
+    }
+
+
+async def login(host, port, email, password):
+    """
+    Inicia sesión con POST /api/login y retorna el encabezado Authorization con el
+    token, o {} si no se pudo (las rutas de administrador responderán 401).
+    """
+    client = HttpClient(host, port)
+    try:
+        status, _, body = await client.request(
+            "POST", "/api/login", json.dumps({"email": email, "password": password}).encode()
+        )
+    finally:
+        await client.close()
+    if status != 200:
+        return {}
+    return {"Authorization": f"Bearer {json.loads(body)['token']}"}
+
+
+async def admin_headers(port, host="127.0.0.1"):
+    """
+    login() con el administrador de scripts/seed.py, para medir /api/reports.
+    """
+    return await login(host, port, ADMIN_EMAIL, SEED_PASSWORD)
+
+
+async def run_load(host, port, routes, concurrency=50, duration=10.0, seed=None, headers=None):
+    """
+    Ejecuta la carga. `routes` es una lista de tuplas (nombre, peso, método, path, body);
+    path y body pueden ser funciones que reciben el random.Random y retornan el valor.
+    `headers` se agregan a todos los requests. Retorna {"total": resumen, "routes": {nombre: resumen}}.
+    """
+    rng = random.Random(seed)
+    names = [r[0] for r in routes]
+    weights = [r[1] for r in routes]
+    by_name = {r[0]: r for r in routes}
+    latencies = {name: [] for name in names}
+    errors = {name: 0 for name in names}
+    deadline = time.monotonic() + duration
+
+    async def worker():
+        client = HttpClient(host, port)
+        try:
+            while time.monotonic() < deadline:
+                name = rng.choices(names, weights)[0]
+                _, _, method, path, body = by_name[name]
+                if callable(path):
+                    path = path(rng)
+                if callable(body):
+                    body = body(rng)
+                start = time.perf_counter()
+                try:
+                    status, _, _ = await client.request(method, path, body, headers)
+                    if status >= 500:
+                        errors[name] += 1
+                except (ConnectionError, asyncio.IncompleteReadError, ValueError):
+                    errors[name] += 1
+                    await client.close()
+                    continue
+                latencies[name].append(time.perf_counter() - start)
+        finally:
+            await client.close()
+
+    started = time.monotonic()
+    await asyncio.gather(*(worker() for _ in range(concurrency)))
+    elapsed = time.monotonic() - started
+    all_latencies = [x for values in latencies.values() for x in values]
+    return {
+        "total": summarize(all_latencies, sum(errors.values()), elapsed),
+        "routes": {name: summarize(latencies[name], errors[name], elapsed) for name in names},
+    }
+
+
+def format_summary(title, summary):
+    return (
+        f"{title:<40} {summary['requests']:>8} req  {summary['rps']:>9.1f} req/s  "
+        f"p50 {summary['p50_ms']:>8.1f} ms  p99 {summary['p99_ms']:>8.1f} ms  errores {summary['errors']}"
+    )
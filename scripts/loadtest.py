@@ -0,0 +1,224 @@
+"""
+Prueba de carga de toda la API: repite una mezcla ponderada de las rutas de main.py
+(catálogos, canchas, disponibilidad, usuarios, login, reservas, reportes) contra un
+uvicorn local y reporta req/s y percentiles de latencia por ruta.
+
+Los ids, fechas y correos se toman de la BD al empezar, así que conviene cargarla antes
+con scripts/seed.py (los logins usan sus correos y SEED_PASSWORD; todas las requests
+llevan el token de usuario1@example.com, administrador, para poder medir /reports). Las escrituras
+(crear reservas y cambiarles el estado) modifican la BD; --read-only las quita de la
+mezcla. Los 4xx (por ejemplo 409 por un horario ocupado) cuentan como respuestas
+válidas; los 5xx y las conexiones caídas, como errores.
+
+Con --save se guarda el resultado en JSON, y con --baseline se compara contra uno
+guardado antes: termina con código 1 si alguna ruta bajó su req/s o subió su p99 más
+de --tolerance.
+
+Uso (desde la raíz del repo):
+
+    python -m scripts.loadtest --start sync --duration 30 --save base.json
+    python -m scripts.loadtest --start async --duration 30 --baseline base.json
+    python -m scripts.loadtest --port 8000 --read-only --concurrency 100   # servidor ya levantado
+"""
+import argparse
+import asyncio
+import json
+import random
+import sys
+from datetime import timedelta
+
+from bd import Database
+from scripts.bench_async import start_server
+from scripts.loadgen import admin_headers, format_summary, run_load
+from scripts.seed import ADMIN_EMAIL, OPEN_HOUR, SEED_PASSWORD, SLOTS_PER_DAY
+
+SAMPLE = """
+    SELECT (SELECT array_agg(id_court ORDER BY id_court) FROM courts) AS courts,
+           (SELECT array_agg(id_type ORDER BY id_type) FROM court_types) AS court_types,
+           (SELECT MAX(id_user) FROM users) AS max_user,
+           (SELECT MIN(id_booking) FROM bookings) AS min_booking,
+           (SELECT MAX(id_booking) FROM bookings) AS max_booking,
+           (SELECT MIN(schedule_date) FROM schedules) AS first_date,
+           (SELECT MAX(schedule_date) FROM schedules) AS last_date;
+"""
+
+# Rutas de solo lectura que no dependen de los datos: (nombre, peso, path)
+FIXED_ROUTES = [
+    ("GET /courts", 10, "/api/courts"),
+    ("GET /court-types", 4, "/api/court-types"),
+    ("GET /courts-type", 3, "/api/courts-type"),
+    ("GET /promociones", 3, "/api/promociones"),
+    ("GET /reports/promociones-activas-hoy", 2, "/api/reports/promociones-activas-hoy"),
+    ("GET /reports/reservas-por-estado", 2, "/api/reports/reservas-por-estado"),
+    ("GET /reports/reservas-por-dia", 2, "/api/reports/reservas-por-dia"),
+    ("GET /reports/ingresos-mes", 2, "/api/reports/ingresos-mes"),
+    ("GET /reports/reservas-por-hora", 1, "/api/reports/reservas-por-hora"),
+    ("GET /reports/facturacion-por-usuario", 1, "/api/reports/facturacion-por-usuario"),
+    ("GET /reports/canchas-mas-rentadas", 1, "/api/reports/canchas-mas-rentadas"),
+    ("GET /ingresos", 1, "/api/ingresos?agrupar=mes"),
+]
+
+
+class Sample:
+    """
+    Valores reales de la BD para armar paths y bodies.
+    """
+    def __init__(self, row):
+        self.courts = row["courts"] or [1]
+        self.court_types = row["court_types"] or [1]
+        self.max_user = row["max_user"] or 1
+        self.min_booking = row["min_booking"] or 1
+        self.max_booking = row["max_booking"] or 1
+        self.first_date = row["first_date"]
+        self.last_date = row["last_date"]
+
+    def court(self, rng):
+        return rng.choice(self.courts)
+
+    def user(self, rng):
+        return rng.randint(1, self.max_user)
+
+    def booking(self, rng):
+        return rng.randint(self.min_booking, self.max_booking)
+
+    def date(self, rng, span=0):
+        days = max(0, (self.last_date - self.first_date).days - span)
+        return self.first_date + timedelta(days=rng.randint(0, days))
+
+    def hour(self, rng):
+        return OPEN_HOUR + rng.randrange(SLOTS_PER_DAY)
+
+
+def _json(value):
+    return json.dumps(value).encode()
+
+
+def build_routes(sample, read_only=False):
+    """
+    Lista de (nombre, peso, método, path, body) para run_load.
+    """
+    def free_courts(rng):
+        hour = sample.hour(rng)
+        return (f"/api/availability/courts?fecha={sample.date(rng)}"
+                f"&hora_inicio={hour:02d}:00&hora_fin={hour + 1:02d}:00")
+
+    def date_range(path, days, extra=""):
+        def build(rng):
+            start = sample.date(rng, days)
+            return f"{path}?fecha_inicio={start}&fecha_fin={start + timedelta(days=days)}{extra}"
+        return build
+
+    def login(rng):
+        return _json({"email": f"usuario{sample.user(rng)}@example.com", "password": SEED_PASSWORD})
+
+    def booking(rng):
+        hour = sample.hour(rng)
+        return _json({
+            "id_user": sample.user(rng), "id_court": sample.court(rng),
+            "schedule_date": str(sample.date(rng)),
+            "start_time": f"{hour:02d}:00", "end_time": f"{hour + 1:02d}:00",
+        })
+
+    routes = [(name, weight, "GET", path, None) for name, weight, path in FIXED_ROUTES]
+    routes += [
+        ("GET /courts/{id}", 8, "GET", lambda rng: f"/api/courts/{sample.court(rng)}", None),
+        ("GET /courts/type/{id}", 3, "GET",
+         lambda rng: f"/api/courts/type/{rng.choice(sample.court_types)}", None),
+        ("GET /availability", 6, "GET",
+         lambda rng: f"/api/availability?fecha_inicio={sample.date(rng)}&id_court={sample.court(rng)}", None),
+        ("GET /availability/courts", 3, "GET", free_courts, None),
+        ("GET /users/{id}", 5, "GET", lambda rng: f"/api/users/{sample.user(rng)}", None),
+        ("GET /users/{id}/phones", 2, "GET", lambda rng: f"/api/users/{sample.user(rng)}/phones", None),
+        ("GET /users/{id}/bookings/pending", 5, "GET",
+         lambda rng: f"/api/users/{sample.user(rng)}/bookings/pending", None),
+        ("GET /users/{id}/bookings/confirmed", 3, "GET",
+         lambda rng: f"/api/users/{sample.user(rng)}/bookings/confirmed", None),
+        ("POST /login", 3, "POST", "/api/login", login),
+        ("GET /reports/reservas-por-rango-fechas", 1, "GET",
+         date_range("/api/reports/reservas-por-rango-fechas", 30), None),
+        ("GET /reservas", 3, "GET", date_range("/api/reservas", 7, "&limit=50"), None),
+        ("GET /usuarios", 1, "GET", date_range("/api/usuarios", 30), None),
+    ]
+    if not read_only:
+        routes += [
+            ("POST /bookings", 3, "POST", "/api/bookings", booking),
+            ("PUT /bookings/{id}/status", 1, "PUT",
+             lambda rng: f"/api/bookings/{sample.booking(rng)}/status",
+             lambda rng: _json({"new_status": rng.choice(["confirmed", "cancelled"])})),
+        ]
+    return routes
+
+
+def regressions(result, baseline, tolerance, min_requests=20):
+    """
+    Rutas cuyo req/s bajó o cuyo p99 subió más de `tolerance` (fracción) respecto a la
+    línea base. Se ignoran las rutas con menos de `min_requests` requests en alguno.
+    """
+    found = []
+    for name, summary in result["routes"].items():
+        before = baseline["routes"].get(name)
+        if not before or min(before["requests"], summary["requests"]) < min_requests:
+            continue
+        if summary["rps"] < before["rps"] * (1 - tolerance):
+            found.append(f"{name}: {before['rps']:.1f} -> {summary['rps']:.1f} req/s")
+        if summary["p99_ms"] > before["p99_ms"] * (1 + tolerance):
+            found.append(f"{name}: p99 {before['p99_ms']:.1f} -> {summary['p99_ms']:.1f} ms")
+    return found
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--start", choices=["sync", "async"], help="Levanta un uvicorn en ese modo")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8768)
+    parser.add_argument("--concurrency", type=int, default=50)
+    parser.add_argument("--duration", type=float, default=30.0)
+    parser.add_argument("--warmup", type=float, default=3.0, help="Segundos de calentamiento (no se miden)")
+    parser.add_argument("--read-only", action="store_true", help="Sin crear ni modificar reservas")
+    parser.add_argument("--seed", type=int, default=1)
+    parser.add_argument("--save", help="Guarda el resultado en este JSON")
+    parser.add_argument("--baseline", help="JSON de una corrida anterior para comparar")
+    parser.add_argument("--tolerance", type=float, default=0.2)
+    args = parser.parse_args()
+
+    with Database().get_cursor() as cur:
+        cur.execute(SAMPLE)
+        row = cur.fetchone()
+    if row["first_date"] is None:
+        print("La BD no tiene horarios; cárgala con python -m scripts.seed")
+        sys.exit(1)
+    routes = build_routes(Sample(row), args.read_only)
+
+    proc = start_server(args.start, args.port) if args.start else None
+    try:
+        headers = asyncio.run(admin_headers(args.port, args.host))
+        if not headers:
+            print(f"No se pudo iniciar sesión como {ADMIN_EMAIL}; /reports responderá 401", file=sys.stderr)
+        if args.warmup:
+            asyncio.run(run_load(args.host, args.port, routes, min(10, args.concurrency), args.warmup, random.random(),
+                                 headers))
+        result = asyncio.run(run_load(args.host, args.port, routes, args.concurrency, args.duration, args.seed,
+                                      headers))
+    finally:
+        if proc:
+            proc.terminate()
+            proc.wait()
+
+    print(format_summary("total", result["total"]))
+    for name, summary in sorted(result["routes"].items(), key=lambda item: -item[1]["requests"]):
+        print(format_summary(f"  {name}", summary) + f"  p90 {summary['p90_ms']:.1f} ms")
+
+    if args.save:
+        with open(args.save, "w") as f:
+            json.dump(result, f, indent=2)
+    if args.baseline:
+        with open(args.baseline) as f:
+            found = regressions(result, json.load(f), args.tolerance)
+        for line in found:
+            print("REGRESIÓN", line)
+        if found:
+            sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
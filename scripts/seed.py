@@ -0,0 +1,338 @@
+"""
+Genera datos sintéticos a escala (de 10 mil a decenas de millones de reservas) con COPY.
+
+Crea tipos de cancha, canchas, usuarios con teléfonos, promociones y, para cada día
+del rango, horarios de 06:00 a 22:00 con una ocupación dada; cada horario ocupado es
+una reserva con su detalle, con una mezcla de estados según si la fecha ya pasó, una
+factura si está confirmada y, a veces, una promoción vigente. Los horarios de una
+misma cancha no se solapan, igual que en la API.
+
+La cantidad de canchas sale de --bookings, --days y --occupancy. Los ids de horarios,
+reservas y facturas se derivan de la posición (día, cancha, hora), así que cada día se
+genera de forma independiente y reproducible (--seed) y los días se reparten entre
+--jobs procesos, cada uno con su conexión y un COPY por tabla y lote de días.
+
+Las tablas deben estar vacías (--truncate las vacía antes). Durante la carga se
+desactiva el trigger de rollups de invoices; al final se ajustan las secuencias, se
+hace ANALYZE y se reconstruyen los rollups y las vistas materializadas si están
+instalados. La caché de la API no se entera: reiniciar la app o POST /cache/invalidate.
+
+Uso (desde la raíz del repo, con el esquema creado: python migrate.py up):
+
+    python -m scripts.seed --bookings 10000 --truncate
+    python -m scripts.seed --bookings 5000000 --days 730 --jobs 8 --truncate --defer-indexes
+"""
+import argparse
+import io
+import math
+import multiprocessing
+import os
+import random
+import sys
+import time
+from datetime import date, timedelta
+
+from bd import MAINTENANCE, Database
+from materialized import MaterializedViews
+from passwords import hash_password
+from rollups import CHECK_INSTALLED, rebuild_rollups
+
+# Contraseña de todos los usuarios generados, para poder probar /login. Se guarda un
+# solo hash argon2 para todos: calcular uno por usuario tardaría horas
+SEED_PASSWORD = "canchas123"
+# El usuario 1 es administrador (id_role 1); el resto, clientes
+ADMIN_EMAIL = "usuario1@example.com"
+
+OPEN_HOUR = 6
+SLOTS_PER_DAY = 16  # 06:00 - 22:00 en slots de una hora
+
+# (nombre, precio por hora base)
+COURT_TYPES = [
+    ("Fútbol 5", 250), ("Fútbol 7", 350), ("Tenis", 120),
+    ("Pádel", 150), ("Básquetbol", 180), ("Voleibol", 100),
+]
+
+FIRST_NAMES = [
+    "Ana", "Luis", "María", "José", "Carla", "Diego", "Lucía", "Jorge", "Sofía", "Pablo",
+    "Valeria", "Andrés", "Gabriela", "Miguel", "Daniela", "Fernando", "Paula", "Ricardo",
+    "Camila", "Javier",
+]
+LAST_NAMES = [
+    "García", "López", "Martínez", "Rodríguez", "Pérez", "González", "Hernández", "Sánchez",
+    "Ramírez", "Flores", "Morales", "Castillo", "Ortiz", "Reyes", "Cruz", "Mendoza",
+    "Aguilar", "Herrera", "Vásquez", "Rojas",
+]
+PROMOTION_NAMES = ["Verano", "Invierno", "Madrugadores", "Fin de semana", "Nocturna", "Aniversario"]
+
+# Probabilidad acumulada de cada estado según si la fecha de la reserva ya pasó
+PAST_STATUS = [("confirmed", 0.75), ("cancelled", 0.90), ("pending", 1.0)]
+FUTURE_STATUS = [("pending", 0.55), ("confirmed", 0.90), ("cancelled", 1.0)]
+
+# Probabilidad de que una reserva en la vigencia de una promoción la use
+PROMOTION_RATE = 0.2
+
+# Tablas que se cargan, en orden de dependencias
+TABLES = [
+    "court_types", "courts", "users", "user_phones", "promotions",
+    "schedules", "bookings", "booking_details", "booking_promotions", "invoices",
+]
+
+SEQUENCES = [
+    ("court_types", "id_type"), ("courts", "id_court"), ("users", "id_user"),
+    ("user_phones", "id_user_phone"), ("promotions", "id_promotion"),
+    ("schedules", "id_schedule"), ("bookings", "id_booking"),
+    ("booking_details", "id_booking_detail"), ("invoices", "id_invoice"),
+]
+
+COLUMNS = {
+    "court_types": "id_type, type_name",
+    "courts": "id_court, description, price_per_hour, id_type",
+    "users": "id_user, name, last_name, email, password, id_role",
+    "user_phones": "id_user, phone_number",
+    "promotions": "id_promotion, name, description, discount_percentage, start_date, end_date",
+    "schedules": "id_schedule, id_court, schedule_date, start_time, end_time",
+    "bookings": "id_booking, id_user, booking_date, status",
+    "booking_details": "id_booking_detail, id_booking, id_schedule",
+    "booking_promotions": "id_booking, id_promotion",
+    "invoices": "id_invoice, id_booking, issue_date, total_amount",
+}
+
+# Índices propios (no de constraints) de las tablas que se cargan, para --defer-indexes
+SECONDARY_INDEXES = """
+    SELECT i.indexrelid::regclass::text AS name, pg_get_indexdef(i.indexrelid) AS definition
+    FROM pg_index i
+    WHERE i.indrelid = ANY(%s::regclass[])
+      AND NOT EXISTS (SELECT 1 FROM pg_constraint c WHERE c.conindid = i.indexrelid);
+"""
+
+_HOURS = [
+    (f"{OPEN_HOUR + h:02d}:00:00", f"{OPEN_HOUR + h + 1:02d}:00:00") for h in range(SLOTS_PER_DAY)
+]
+
+
+class Plan:
+    """
+    Tamaños derivados de los argumentos; se pasa tal cual a los procesos de carga.
+    """
+    def __init__(self, bookings, days, future_days, occupancy, users, promotions, seed):
+        self.days = days + future_days
+        self.start = date.today() - timedelta(days=days)
+        self.today_index = days
+        self.occupancy = occupancy
+        self.courts = max(4, math.ceil(bookings / (self.days * SLOTS_PER_DAY * occupancy)))
+        self.users = users or max(50, bookings // 25)
+        self.promotions = promotions
+        self.seed = seed
+        rng = random.Random(seed)
+        self.court_prices = []
+        for _ in range(self.courts):
+            id_type = rng.randrange(len(COURT_TYPES)) + 1
+            base = COURT_TYPES[id_type - 1][1]
+            self.court_prices.append((id_type, round(base * rng.uniform(0.8, 1.3), 2)))
+        # Promociones repartidas en el rango: (id, primer día, último día, descuento)
+        self.promotion_windows = []
+        for i in range(promotions):
+            first = rng.randrange(self.days)
+            self.promotion_windows.append(
+                (i + 1, first, min(self.days - 1, first + rng.randrange(7, 45)), rng.choice([5, 10, 15, 20, 25]))
+            )
+
+    def position_id(self, day, court, hour):
+        return (day * self.courts + court) * SLOTS_PER_DAY + hour + 1
+
+
+def _line(*values):
+    return "\t".join(r"\N" if v is None else str(v) for v in values) + "\n"
+
+
+def _copy(cur, table, buffer):
+    buffer.seek(0)
+    cur.copy_expert(f"COPY {table} ({COLUMNS[table]}) FROM STDIN", buffer)
+
+
+def _status(rng, past):
+    roll = rng.random()
+    for status, limit in (PAST_STATUS if past else FUTURE_STATUS):
+        if roll < limit:
+            return status
+    return "pending"
+
+
+def generate_days(plan, first_day, last_day):
+    """
+    Genera las filas de los días [first_day, last_day) y retorna {tabla: StringIO} y
+    la cantidad de reservas.
+    """
+    buffers = {table: io.StringIO() for table in
+               ("schedules", "bookings", "booking_details", "booking_promotions", "invoices")}
+    schedules, bookings, details = buffers["schedules"], buffers["bookings"], buffers["booking_details"]
+    promos, invoices = buffers["booking_promotions"], buffers["invoices"]
+    count = 0
+    for day in range(first_day, last_day):
+        rng = random.Random(plan.seed * 1_000_003 + day)
+        current = plan.start + timedelta(days=day)
+        day_str = current.isoformat()
+        past = day < plan.today_index
+        active = [w for w in plan.promotion_windows if w[1] <= day <= w[2]]
+        for court in range(plan.courts):
+            id_court = court + 1
+            price = plan.court_prices[court][1]
+            for hour, (start, end) in enumerate(_HOURS):
+                if rng.random() >= plan.occupancy:
+                    continue
+                pid = plan.position_id(day, court, hour)
+                # Usuarios con muchas reservas y usuarios ocasionales
+                id_user = int(plan.users * rng.random() ** 2) + 1
+                booked = (current - timedelta(days=rng.randrange(15))).isoformat()
+                status = _status(rng, past)
+                schedules.write(_line(pid, id_court, day_str, start, end))
+                bookings.write(_line(pid, id_user, booked, status))
+                details.write(_line(pid, pid, pid))
+                discount = 0
+                if active and rng.random() < PROMOTION_RATE:
+                    id_promotion, _, _, discount = rng.choice(active)
+                    promos.write(_line(pid, id_promotion))
+                if status == "confirmed":
+                    invoices.write(_line(pid, pid, day_str, round(price * (100 - discount) / 100, 2)))
+                count += 1
+    return buffers, count
+
+
+def load_days(task):
+    """
+    Proceso de carga: genera y copia un lote de días en una transacción.
+    """
+    plan, first_day, last_day = task
+    buffers, count = generate_days(plan, first_day, last_day)
+    with Database(MAINTENANCE).get_cursor() as cur:
+        for table in ("schedules", "bookings", "booking_details", "booking_promotions", "invoices"):
+            _copy(cur, table, buffers[table])
+    return last_day - first_day, count
+
+
+def load_catalogs(cur, plan):
+    buffer = io.StringIO()
+    for i, (name, _) in enumerate(COURT_TYPES):
+        buffer.write(_line(i + 1, name))
+    _copy(cur, "court_types", buffer)
+
+    buffer = io.StringIO()
+    for court, (id_type, price) in enumerate(plan.court_prices):
+        buffer.write(_line(court + 1, f"Cancha {court + 1} ({COURT_TYPES[id_type - 1][0]})", price, id_type))
+    _copy(cur, "courts", buffer)
+
+    buffer = io.StringIO()
+    for id_promotion, first, last, discount in plan.promotion_windows:
+        name = f"{PROMOTION_NAMES[(id_promotion - 1) % len(PROMOTION_NAMES)]} {id_promotion}"
+        buffer.write(_line(
+            id_promotion, name, f"{discount}% de descuento", discount,
+            (plan.start + timedelta(days=first)).isoformat(), (plan.start + timedelta(days=last)).isoformat(),
+        ))
+    _copy(cur, "promotions", buffer)
+
+
+def load_users(cur, plan, chunk=200_000):
+    rng = random.Random(plan.seed)
+    password_hash = hash_password(SEED_PASSWORD)
+    for first_id in range(1, plan.users + 1, chunk):
+        users, phones = io.StringIO(), io.StringIO()
+        for id_user in range(first_id, min(plan.users + 1, first_id + chunk)):
+            name, last_name = rng.choice(FIRST_NAMES), rng.choice(LAST_NAMES)
+            email = f"usuario{id_user}@example.com"
+            users.write(_line(id_user, name, last_name, email, password_hash, 1 if id_user == 1 else 2))
+            for _ in range(rng.choice((0, 1, 1, 2))):
+                phones.write(_line(id_user, f"5{rng.randrange(10_000_000):07d}"))
+        _copy(cur, "users", users)
+        _copy(cur, "user_phones", phones)
+
+
+def _tasks(plan, per_task=50_000):
+    per_day = max(1, plan.courts * SLOTS_PER_DAY * plan.occupancy)
+    days = max(1, int(per_task // per_day))
+    return [(plan, first, min(plan.days, first + days)) for first in range(0, plan.days, days)]
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--bookings", type=int, default=10_000, help="Reservas aproximadas a generar")
+    parser.add_argument("--days", type=int, default=365, help="Días de historia hasta hoy")
+    parser.add_argument("--future-days", type=int, default=30, help="Días de reservas futuras")
+    parser.add_argument("--occupancy", type=float, default=0.6, help="Fracción de horarios reservados")
+    parser.add_argument("--users", type=int, help="Usuarios (default: una vigésimo quinta parte de las reservas)")
+    parser.add_argument("--promotions", type=int, default=12)
+    parser.add_argument("--jobs", type=int, default=min(8, os.cpu_count() or 1))
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("--truncate", action="store_true", help="Vacía las tablas antes de cargar")
+    parser.add_argument("--defer-indexes", action="store_true",
+                        help="Borra los índices secundarios durante la carga y los recrea al final")
+    args = parser.parse_args()
+    if not 0 < args.occupancy <= 1:
+        parser.error("--occupancy debe estar entre 0 y 1")
+
+    plan = Plan(args.bookings, args.days, args.future_days, args.occupancy, args.users, args.promotions, args.seed)
+    db = Database(MAINTENANCE)
+    started = time.monotonic()
+    print(f"{plan.courts} canchas, {plan.users} usuarios, {plan.days} días, ~{args.bookings} reservas")
+
+    with db.get_cursor() as cur:
+        if args.truncate:
+            cur.execute(f"TRUNCATE {', '.join(TABLES)} RESTART IDENTITY CASCADE;")
+        else:
+            cur.execute("SELECT EXISTS (SELECT 1 FROM bookings) OR EXISTS (SELECT 1 FROM users) AS used;")
+            if cur.fetchone()["used"]:
+                print("Las tablas ya tienen datos; usa --truncate para vaciarlas")
+                sys.exit(1)
+        cur.execute(CHECK_INSTALLED)
+        rollups = cur.fetchone()["installed"]
+        if rollups:
+            # Un trigger por factura haría la carga mucho más lenta; al final se reconstruye todo
+            cur.execute("ALTER TABLE invoices DISABLE TRIGGER invoices_rollup;")
+        indexes = []
+        if args.defer_indexes:
+            cur.execute(SECONDARY_INDEXES, (TABLES,))
+            indexes = cur.fetchall()
+            for index in indexes:
+                cur.execute(f"DROP INDEX {index['name']};")
+        load_catalogs(cur, plan)
+        load_users(cur, plan)
+    print(f"Catálogos y usuarios: {time.monotonic() - started:.1f} s")
+
+    try:
+        total = done_days = 0
+        loading = time.monotonic()
+        with multiprocessing.get_context("spawn").Pool(args.jobs) as pool:
+            for days, count in pool.imap_unordered(load_days, _tasks(plan)):
+                done_days += days
+                total += count
+                elapsed = time.monotonic() - loading
+                print(f"\r{done_days}/{plan.days} días  {total} reservas  {total / elapsed:,.0f} reservas/s",
+                      end="", flush=True)
+        print()
+    finally:
+        with db.get_cursor() as cur:
+            if rollups:
+                cur.execute("ALTER TABLE invoices ENABLE TRIGGER invoices_rollup;")
+            for index in indexes:
+                print("Recreando", index["name"])
+                cur.execute(index["definition"])
+
+    with db.get_cursor() as cur:
+        for table, column in SEQUENCES:
+            cur.execute(
+                f"SELECT setval(pg_get_serial_sequence('{table}', '{column}'), "
+                f"COALESCE((SELECT MAX({column}) FROM {table}), 0) + 1, false);"
+            )
+        if rollups:
+            print("Reconstruyendo rollups")
+            rebuild_rollups(cur)
+        cur.execute(f"ANALYZE {', '.join(TABLES)};")
+        cur.execute("SELECT to_regclass('report_refreshes') IS NOT NULL AS installed;")
+        views = cur.fetchone()["installed"]
+    if views:
+        print("Refrescando vistas materializadas")
+        MaterializedViews().refresh_all(concurrently=False)
+    print(f"Listo: {total} reservas en {time.monotonic() - started:.1f} s")
+
+
+if __name__ == "__main__":
+    main()
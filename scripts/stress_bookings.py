@@ -0,0 +1,186 @@
+"""
+Prueba de concurrencia de reservas: lanza en paralelo muchas reservas que compiten
+por los mismos horarios de una cancha y verifica que por cada horario gane
+exactamente una, que el resto reciba conflicto (409 por HTTP) y que en la BD no
+queden reservas activas solapadas.
+
+Cada "slot" es un rango de una hora; los contendientes de un slot piden el mismo
+rango o uno corrido 30 minutos, así que todos se solapan entre sí pero no con
+los de otros slots. Se usa una fecha lejana al azar para no chocar con datos reales.
+
+Uso (desde la raíz del repo, con el .env apuntando a una BD con datos):
+
+    python -m scripts.stress_bookings --slots 20 --contenders 25 --mode async
+    python -m scripts.stress_bookings --mode http --port 8000   # contra un uvicorn levantado
+
+Al terminar cancela las reservas creadas, salvo que se pase --keep.
+"""
+import argparse
+import asyncio
+import json
+import random
+import sys
+import time
+from collections import Counter
+from concurrent.futures import ThreadPoolExecutor
+from datetime import date, timedelta
+
+from bd import Database, Statement, close_async_pool
+from crud import AsyncCourtCrud, CourtCrud
+from scripts.loadgen import HttpClient
+
+# Pares de reservas activas de la misma cancha y día cuyos horarios se solapan
+FIND_OVERLAPPING_PAIRS = Statement("stress_find_overlapping_pairs", """
+    SELECT b1.id_booking AS a, b2.id_booking AS b, s1.schedule_date, s1.start_time, s1.end_time
+    FROM schedules s1
+    JOIN booking_details d1 ON d1.id_schedule = s1.id_schedule
+    JOIN bookings b1 ON b1.id_booking = d1.id_booking
+    JOIN schedules s2 ON s2.id_court = s1.id_court
+                     AND s2.schedule_date = s1.schedule_date
+                     AND s2.start_time < s1.end_time
+                     AND s2.end_time > s1.start_time
+    JOIN booking_details d2 ON d2.id_schedule = s2.id_schedule
+    JOIN bookings b2 ON b2.id_booking = d2.id_booking
+    WHERE s1.id_court = %s
+      AND s1.schedule_date BETWEEN %s AND %s
+      AND b1.id_booking < b2.id_booking
+      AND b1.status <> 'cancelled'
+      AND b2.status <> 'cancelled';
+""")
+
+SLOTS_PER_DAY = 8
+
+
+def build_requests(slots, contenders, first_day):
+    """
+    Retorna [(slot, schedule_date, start_time, end_time)] mezclados al azar.
+    """
+    requests = []
+    for slot in range(slots):
+        day = first_day + timedelta(days=slot // SLOTS_PER_DAY)
+        hour = 6 + 2 * (slot % SLOTS_PER_DAY)
+        for i in range(contenders):
+            minute = 30 if i % 2 else 0
+            start = f"{hour:02d}:{minute:02d}"
+            end = f"{hour + 1:02d}:{minute:02d}"
+            requests.append((slot, day.isoformat(), start, end))
+    random.shuffle(requests)
+    return requests
+
+
+def run_sync(requests, id_user, id_court, workers):
+    crud = CourtCrud()
+
+    def book(req):
+        slot, day, start, end = req
+        return slot, crud.make_booking_with_schedule(id_user, id_court, day, start, end)
+
+    with ThreadPoolExecutor(max_workers=workers) as executor:
+        return list(executor.map(book, requests))
+
+
+async def run_async(requests, id_user, id_court):
+    crud = AsyncCourtCrud()
+
+    async def book(req):
+        slot, day, start, end = req
+        return slot, await crud.make_booking_with_schedule(id_user, id_court, day, start, end)
+
+    try:
+        return await asyncio.gather(*(book(req) for req in requests))
+    finally:
+        await close_async_pool()
+
+
+async def run_http(requests, id_user, id_court, host, port):
+    async def book(req):
+        slot, day, start, end = req
+        body = json.dumps({
+            "id_user": id_user, "id_court": id_court,
+            "schedule_date": day, "start_time": start, "end_time": end,
+        }).encode()
+        client = HttpClient(host, port)
+        try:
+            status, _, data = await client.request("POST", "/api/bookings", body)
+        finally:
+            await client.close()
+        result = json.loads(data or b"{}")
+        if status == 200:
+            return slot, result
+        return slot, {"success": False, "conflict": status == 409, "error": result.get("detail", status)}
+
+    return await asyncio.gather(*(book(req) for req in requests))
+
+
+def check(results, slots):
+    """
+    Retorna (winners, errores) validando un ganador por slot y conflictos en el resto.
+    """
+    winners = Counter()
+    errors = []
+    booking_ids = []
+    for slot, result in results:
+        if result["success"]:
+            winners[slot] += 1
+            booking_ids.append(result["id_booking"])
+        elif not result.get("conflict"):
+            errors.append(result["error"])
+    problems = [f"slot {slot}: {winners[slot]} ganadores" for slot in range(slots) if winners[slot] != 1]
+    return booking_ids, problems, errors
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--slots", type=int, default=20)
+    parser.add_argument("--contenders", type=int, default=25, help="Reservas que compiten por cada slot")
+    parser.add_argument("--mode", choices=["sync", "async", "http"], default="async")
+    parser.add_argument("--workers", type=int, default=200, help="Hilos en modo sync")
+    parser.add_argument("--user", type=int, default=1)
+    parser.add_argument("--court", type=int, default=1)
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8000)
+    parser.add_argument("--keep", action="store_true", help="No cancelar las reservas creadas")
+    args = parser.parse_args()
+
+    first_day = date(2100, 1, 1) + timedelta(days=random.randrange(0, 300 * 365))
+    last_day = first_day + timedelta(days=(args.slots - 1) // SLOTS_PER_DAY)
+    requests = build_requests(args.slots, args.contenders, first_day)
+    print(f"{len(requests)} reservas en paralelo, {args.slots} slots, cancha {args.court}, "
+          f"{first_day} a {last_day}, modo {args.mode}")
+
+    start = time.perf_counter()
+    if args.mode == "sync":
+        results = run_sync(requests, args.user, args.court, args.workers)
+    elif args.mode == "async":
+        results = asyncio.run(run_async(requests, args.user, args.court))
+    else:
+        results = asyncio.run(run_http(requests, args.user, args.court, args.host, args.port))
+    elapsed = time.perf_counter() - start
+
+    booking_ids, problems, errors = check(results, args.slots)
+    conflicts = sum(1 for _, result in results if result.get("conflict"))
+    print(f"{elapsed:.2f}s: {len(booking_ids)} ganadores, {conflicts} conflictos, {len(errors)} errores")
+    for error in Counter(errors).most_common(5):
+        print(f"  error: {error[0]} (x{error[1]})")
+
+    with Database().get_cursor() as cur:
+        cur.execute(FIND_OVERLAPPING_PAIRS, (args.court, first_day, last_day))
+        overlaps = cur.fetchall()
+    for row in overlaps[:5]:
+        problems.append(f"reservas {row['a']} y {row['b']} solapadas el {row['schedule_date']}")
+
+    if not args.keep:
+        crud = CourtCrud()
+        for id_booking in booking_ids:
+            crud.update_booking_status(id_booking, "cancelled")
+
+    if problems or errors:
+        print("FALLÓ")
+        for problem in problems:
+            print(f"  {problem}")
+        sys.exit(1)
+    print("OK: exactamente un ganador por slot y sin solapes en la BD")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,108 @@
+"""
+Muestra las trazas que tracing.py escribe en TRACE_FILE: cada una como árbol de
+spans con su desfase desde el inicio de la request y su duración. Para el span raíz
+también muestra el tiempo sin spans antes del primer hijo (validación de parámetros)
+y después del último (serialización de FastAPI y envío).
+
+Uso (desde la raíz del repo):
+
+    python -m scripts.trace_view                          # las 10 más lentas
+    python -m scripts.trace_view --slowest 3 --route usuarios
+    python -m scripts.trace_view 4bf92f3577b34da6a3ce929d0e0e4736
+    python -m scripts.trace_view --file /var/log/canchas/traces.jsonl --last 5
+"""
+import argparse
+import json
+import sys
+
+from tracing import TRACE_FILE
+
+
+def load(path):
+    traces = []
+    with open(path, encoding="utf-8") as f:
+        for line in f:
+            if line.strip():
+                traces.append(json.loads(line))
+    return traces
+
+
+def _children(spans):
+    children = {}
+    for span in spans:
+        children.setdefault(span["parent_id"], []).append(span)
+    for group in children.values():
+        group.sort(key=lambda span: span["start"])
+    return children
+
+
+def _line(offset_ms, duration_ms, depth, name, detail=""):
+    return f"{offset_ms:+10.1f} {duration_ms:10.1f} ms  {'  ' * depth}{name}{detail}"
+
+
+def render(trace):
+    spans = trace["spans"]
+    root = spans[0]
+    children = _children(spans[1:])
+    origin = root["start"]
+    lines = [f"{trace['name']}  {trace['duration_ms']:.1f} ms  trace {trace['trace_id']}"]
+    if trace.get("dropped_spans"):
+        lines.append(f"  ({trace['dropped_spans']} spans descartados)")
+
+    def walk(span, depth):
+        attributes = span.get("attributes", {})
+        detail = ""
+        if "db.rows" in attributes:
+            detail += f"  [{attributes['db.rows']} filas]"
+        if span.get("error"):
+            detail += f"  ERROR: {span['error']}"
+        lines.append(_line((span["start"] - origin) * 1000, span["duration_ms"], depth, span["name"], detail))
+        for child in children.get(span["span_id"], ()):
+            walk(child, depth + 1)
+
+    top = children.get(root["span_id"], [])
+    if top:
+        before = (top[0]["start"] - origin) * 1000
+        lines.append(_line(0, before, 1, "(sin span: validación)"))
+    for child in top:
+        walk(child, 1)
+    if top:
+        last_end = max(child["start"] * 1000 + child["duration_ms"] for child in top)
+        after = origin * 1000 + root["duration_ms"] - last_end
+        lines.append(_line(last_end - origin * 1000, after, 1, "(sin span: serialización y envío)"))
+    return "\n".join(lines)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("trace_id", nargs="?", help="Muestra solo esta traza")
+    parser.add_argument("--file", default=TRACE_FILE)
+    parser.add_argument("--route", help="Solo trazas cuyo nombre contiene este texto")
+    parser.add_argument("--slowest", type=int, default=10, help="Las N más lentas (default 10)")
+    parser.add_argument("--last", type=int, help="Las N más recientes en vez de las más lentas")
+    args = parser.parse_args()
+
+    try:
+        traces = load(args.file)
+    except FileNotFoundError:
+        print(f"No existe {args.file}; ¿el backend corre con TRACING=1?")
+        sys.exit(1)
+
+    if args.trace_id:
+        traces = [trace for trace in traces if trace["trace_id"] == args.trace_id]
+        if not traces:
+            print(f"No se encontró la traza {args.trace_id}")
+            sys.exit(1)
+    else:
+        if args.route:
+            traces = [trace for trace in traces if args.route in trace["name"]]
+        if args.last:
+            traces = traces[-args.last:][::-1]
+        else:
+            traces = sorted(traces, key=lambda trace: -trace["duration_ms"])[:args.slowest]
+
+    print("\n\n".join(render(trace) for trace in traces))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,178 @@
+"""
+Coalescencia de llamadas simultáneas a los reportes (single-flight).
+
+Cuando varios administradores abren el panel a la vez llegan N pedidos iguales del
+mismo reporte. Los métodos de Reports y CustomReports marcados con @coalesced
+ejecutan una sola vez la consulta por cada clave (método, argumentos y modo de
+render de rendering.py) que esté en curso, y todas las llamadas que llegan mientras
+tanto reciben el mismo resultado. No es una caché: apenas termina la ejecución la
+clave se libera y la siguiente llamada vuelve a consultar.
+
+- Modo sync: el primer hilo ejecuta y los demás esperan en un Event. Si al primero
+  se le canceló la consulta porque su cliente se desconectó (cancellation.py), los
+  que esperaban no heredan ese error: uno de ellos vuelve a ejecutarla.
+- Modo async: la ejecución corre en su propia tarea y cada llamada la espera con
+  asyncio.shield, así que la desconexión de uno no cancela a los demás. Si se van
+  todos, la tarea se cancela (y psycopg 3 cancela la consulta).
+
+El resultado es el mismo objeto para todas las llamadas, como con query_cache: no
+se debe modificar. COALESCE_ENABLED=0 lo desactiva.
+"""
+import asyncio
+import functools
+import inspect
+import os
+import threading
+
+from cancellation import current_cancel
+from rendering import render_mode
+
+COALESCE_ENABLED = os.getenv("COALESCE_ENABLED", "1").lower() in ("1", "true", "yes")
+
+
+class _Call:
+    def __init__(self):
+        self.done = threading.Event()
+        self.result = None
+        self.error = None
+        self.retry = False
+
+
+class _AsyncCall:
+    def __init__(self, task):
+        self.task = task
+        self.waiters = 0
+
+
+class SingleFlight:
+    """
+    Ejecuciones en curso por clave y contadores por nombre de reporte: llamadas,
+    ejecuciones y llamadas que se sumaron a una ejecución ajena (coalesced).
+    """
+    def __init__(self, enabled=COALESCE_ENABLED):
+        self.enabled = enabled
+        self._calls = {}
+        self._async_calls = {}
+        self._lock = threading.Lock()
+        self._counts = {}
+
+    def _count(self, name, *fields):
+        # Con el lock tomado
+        counts = self._counts.get(name)
+        if counts is None:
+            counts = self._counts[name] = {"calls": 0, "executions": 0, "coalesced": 0}
+        for field in fields:
+            counts[field] += 1
+
+    def do(self, name, key, fn):
+        """
+        Retorna fn(), o el resultado de la ejecución de `key` que ya está en curso.
+        """
+        with self._lock:
+            self._count(name, "calls")
+        while True:
+            with self._lock:
+                call = self._calls.get(key)
+                leader = call is None
+                if leader:
+                    call = self._calls[key] = _Call()
+                    self._count(name, "executions")
+            if leader:
+                break
+            call.done.wait()
+            if call.retry:
+                # Al líder se le canceló la consulta: esta llamada vuelve a intentarlo
+                continue
+            with self._lock:
+                self._count(name, "coalesced")
+            if call.error is not None:
+                raise call.error
+            return call.result
+
+        try:
+            call.result = fn()
+            return call.result
+        except BaseException as e:
+            call.error = e
+            raise
+        finally:
+            cancel_scope = current_cancel.get()
+            call.retry = cancel_scope is not None and cancel_scope.cancelled
+            with self._lock:
+                del self._calls[key]
+            call.done.set()
+
+    async def do_async(self, name, key, fn):
+        """
+        Equivalente asyncio de do: `fn` es una función que retorna la corrutina.
+        Solo se usa desde el event loop; el lock protege los contadores que lee stats().
+        """
+        call = self._async_calls.get(key)
+        leader = call is None
+        if leader:
+            call = self._async_calls[key] = _AsyncCall(asyncio.ensure_future(fn()))
+            call.task.add_done_callback(lambda _: self._forget(key, call))
+        with self._lock:
+            self._count(name, "calls", "executions" if leader else "coalesced")
+
+        call.waiters += 1
+        try:
+            return await asyncio.shield(call.task)
+        except asyncio.CancelledError:
+            call.waiters -= 1
+            if call.waiters == 0 and not call.task.done():
+                # Nadie más espera el resultado; las llamadas nuevas empiezan otra ejecución
+                self._forget(key, call)
+                call.task.cancel()
+            raise
+
+    def _forget(self, key, call):
+        if self._async_calls.get(key) is call:
+            del self._async_calls[key]
+
+    def stats(self):
+        with self._lock:
+            reports = {name: dict(counts) for name, counts in sorted(self._counts.items())}
+            in_flight = len(self._calls) + len(self._async_calls)
+        return {"enabled": self.enabled, "in_flight": in_flight, "reports": reports}
+
+
+single_flight = SingleFlight()
+
+
+def _key(name, args, kwargs):
+    """
+    Clave de la llamada, o None si algún argumento no se puede usar como clave.
+    """
+    key = (name, args, tuple(sorted(kwargs.items())), render_mode.get())
+    try:
+        hash(key)
+    except TypeError:
+        return None
+    return key
+
+
+def coalesced(method):
+    """
+    Decorador para los métodos (sync o async) de las clases de reportes. El nombre en
+    las estadísticas es el del método sin el prefijo Async de la clase.
+    """
+    owner, _, attr = method.__qualname__.rpartition(".")
+    name = f"{owner.removeprefix('Async')}.{attr}"
+
+    if inspect.iscoroutinefunction(method):
+        @functools.wraps(method)
+        async def wrapper(self, *args, **kwargs):
+            key = _key(name, args, kwargs) if single_flight.enabled else None
+            if key is None:
+                return await method(self, *args, **kwargs)
+            return await single_flight.do_async(name, key, lambda: method(self, *args, **kwargs))
+        return wrapper
+
+    @functools.wraps(method)
+    def wrapper(self, *args, **kwargs):
+        key = _key(name, args, kwargs) if single_flight.enabled else None
+        if key is None:
+            return method(self, *args, **kwargs)
+        return single_flight.do(name, key, lambda: method(self, *args, **kwargs))
+    return wrapper
@@ -0,0 +1,70 @@
+"""
+Tokens de sesión firmados, sin estado en el servidor.
+
+El token es `<datos>.<firma>`: los datos son JSON en base64url con el usuario (sub),
+su rol (role), la versión de sus sesiones (ver, ver access.py), cuándo se emitió
+(iat) y cuándo vence (exp); la firma es HMAC-SHA256 de los datos con AUTH_SECRET.
+Verificarlo solo necesita el secreto, así que las requests autenticadas no consultan
+la tabla users.
+
+AUTH_SECRET debe ser el mismo en todos los workers y sobrevivir a los reinicios. Si
+no está definido se genera uno al azar por proceso (con un aviso): sirve para
+desarrollo, pero cada worker rechaza los tokens de los demás.
+"""
+import base64
+import hashlib
+import hmac
+import json
+import logging
+import os
+import secrets
+import time
+
+logger = logging.getLogger(__name__)
+
+AUTH_TOKEN_TTL = int(os.getenv("AUTH_TOKEN_TTL", "3600"))
+
+_secret = os.getenv("AUTH_SECRET")
+if not _secret:
+    logger.warning("AUTH_SECRET no está definido; los tokens solo valen en este proceso")
+    _secret = secrets.token_hex(32)
+SECRET = _secret.encode()
+
+
+def _b64encode(data):
+    return base64.urlsafe_b64encode(data).rstrip(b"=").decode("ascii")
+
+
+def _b64decode(text):
+    return base64.urlsafe_b64decode(text + "=" * (-len(text) % 4))
+
+
+def _sign(payload):
+    return _b64encode(hmac.new(SECRET, payload.encode(), hashlib.sha256).digest())
+
+
+def issue_token(user, ttl=AUTH_TOKEN_TTL):
+    """
+    Token para `user` (dict con id_user, id_role y token_version) válido por `ttl` segundos.
+    """
+    now = int(time.time())
+    claims = {"sub": user["id_user"], "role": user["id_role"], "ver": user.get("token_version", 0),
+              "iat": now, "exp": now + ttl}
+    payload = _b64encode(json.dumps(claims, separators=(",", ":")).encode())
+    return f"{payload}.{_sign(payload)}"
+
+
+def verify_token(token):
+    """
+    Retorna los datos del token si la firma es válida y no venció; si no, None.
+    """
+    payload, _, signature = token.partition(".")
+    if not signature or not hmac.compare_digest(signature.encode(), _sign(payload).encode()):
+        return None
+    try:
+        claims = json.loads(_b64decode(payload))
+    except ValueError:
+        return None
+    if not isinstance(claims, dict) or claims.get("exp", 0) < time.time():
+        return None
+    return claims
@@ -0,0 +1,290 @@
+"""
+Trazas por request: request HTTP -> método del CRUD -> consultas SQL.
+
+Con TRACING=1, TracingMiddleware abre un span raíz por request muestreada y lo deja
+en una ContextVar; call_db abre un span por método del CRUD (la ContextVar viaja al
+threadpool con el resto del contexto), Database agrega uno por espera de conexión
+("db.acquire"), por consulta ("db.query <huella>") y por lectura de filas
+("db.fetch"), y call_rendered uno por serialización ("serialize"). El tiempo del
+span raíz que no cubre ningún hijo es del framework: antes del primer hijo, la
+validación de parámetros; después del último, la serialización de FastAPI.
+
+Muestreo:
+- Si la request trae `traceparent` (W3C Trace Context), se respeta su decisión y se
+  continúa la misma traza.
+- Si no, se muestrea una fracción TRACE_SAMPLE_RATE de las requests.
+- Solo se exportan las trazas que duran al menos TRACE_MIN_MS.
+
+Las requests muestreadas responden con `traceparent` y `X-Trace-Id`. Las que no se
+muestrean no pagan más que una lectura de la ContextVar por span.
+
+Las trazas terminadas se guardan en memoria (las últimas TRACE_KEEP, para
+GET /api/traces) y, si TRACE_FILE no está vacío, un hilo las agrega a ese archivo
+como una línea JSON por traza. scripts/trace_view.py lo lee y muestra cada traza
+como árbol.
+"""
+import contextvars
+import json
+import os
+import queue
+import random
+import re
+import threading
+import time
+from collections import deque
+from contextlib import contextmanager
+
+TRACING_ENABLED = os.getenv("TRACING", "0").lower() in ("1", "true", "yes")
+TRACE_SAMPLE_RATE = float(os.getenv("TRACE_SAMPLE_RATE", "0.01"))
+TRACE_MIN_MS = float(os.getenv("TRACE_MIN_MS", "0"))
+TRACE_FILE = os.getenv("TRACE_FILE", "traces.jsonl")
+TRACE_KEEP = int(os.getenv("TRACE_KEEP", "100"))
+
+# Spans que se guardan por traza; el resto se cuenta como descartado
+MAX_SPANS = 2000
+EXPORT_QUEUE_SIZE = 1000
+
+_TRACEPARENT = re.compile(r"^00-([0-9a-f]{32})-([0-9a-f]{16})-([0-9a-f]{2})$")
+
+# Span activo del contexto (request o tarea) en curso; None si no se está trazando
+current_span = contextvars.ContextVar("current_span", default=None)
+
+
+def _new_id(bits):
+    return f"{random.getrandbits(bits):0{bits // 4}x}"
+
+
+class Trace:
+    __slots__ = ("trace_id", "remote_parent", "spans", "dropped")
+
+    def __init__(self, trace_id=None, remote_parent=None):
+        self.trace_id = trace_id or _new_id(128)
+        self.remote_parent = remote_parent
+        self.spans = []
+        self.dropped = 0
+
+    def start_span(self, name, parent_id, attributes):
+        span = Span(self, name, parent_id, attributes)
+        if len(self.spans) < MAX_SPANS:
+            # list.append es atómico: los hilos del threadpool pueden agregar a la vez
+            self.spans.append(span)
+        else:
+            self.dropped += 1
+        return span
+
+    def to_dict(self):
+        root = self.spans[0]
+        return {
+            "trace_id": self.trace_id,
+            "name": root.name,
+            "start": root.start,
+            "duration_ms": root.duration_ms(),
+            "dropped_spans": self.dropped,
+            "spans": [span.to_dict() for span in self.spans],
+        }
+
+
+class Span:
+    __slots__ = ("trace", "span_id", "parent_id", "name", "start", "end", "attributes", "error")
+
+    def __init__(self, trace, name, parent_id, attributes, start=None):
+        self.trace = trace
+        self.span_id = _new_id(64)
+        self.parent_id = parent_id
+        self.name = name
+        self.start = start if start is not None else time.time()
+        self.end = None
+        self.attributes = attributes
+        self.error = None
+
+    def set(self, **attributes):
+        self.attributes.update(attributes)
+
+    def finish(self, end=None):
+        self.end = end if end is not None else time.time()
+
+    def duration_ms(self):
+        return ((self.end or time.time()) - self.start) * 1000
+
+    def traceparent(self):
+        return f"00-{self.trace.trace_id}-{self.span_id}-01"
+
+    def to_dict(self):
+        data = {
+            "span_id": self.span_id,
+            "parent_id": self.parent_id,
+            "name": self.name,
+            "start": self.start,
+            "duration_ms": round(self.duration_ms(), 3),
+            "attributes": self.attributes,
+        }
+        if self.error:
+            data["error"] = self.error
+        return data
+
+
+def start_trace(name, traceparent=None, sample_rate=TRACE_SAMPLE_RATE):
+    """
+    Span raíz de una traza nueva o continuada desde `traceparent`, o None si la
+    request no se muestrea.
+    """
+    match = _TRACEPARENT.match(traceparent.strip().lower()) if traceparent else None
+    if match:
+        trace_id, parent_id, flags = match.groups()
+        if not int(flags, 16) & 1:
+            return None
+        trace = Trace(trace_id, parent_id)
+    else:
+        if random.random() >= sample_rate:
+            return None
+        trace, parent_id = Trace(), None
+    return trace.start_span(name, parent_id, {})
+
+
+@contextmanager
+def span(name, **attributes):
+    """
+    Span hijo del activo mientras dura el bloque. Si no hay traza en curso no hace
+    nada y entrega None.
+    """
+    parent = current_span.get()
+    if parent is None:
+        yield None
+        return
+    child = parent.trace.start_span(name, parent.span_id, attributes)
+    token = current_span.set(child)
+    try:
+        yield child
+    except BaseException as e:
+        child.error = str(e).split('\n')[0] or type(e).__name__
+        raise
+    finally:
+        child.finish()
+        current_span.reset(token)
+
+
+def record(name, seconds, error=None, **attributes):
+    """
+    Agrega como hijo del span activo un intervalo ya medido que termina ahora.
+    """
+    parent = current_span.get()
+    if parent is None:
+        return
+    end = time.time()
+    child = parent.trace.start_span(name, parent.span_id, attributes)
+    child.start = end - seconds
+    child.finish(end)
+    if error is not None:
+        child.error = str(error).split('\n')[0]
+
+
+class TraceExporter:
+    """
+    Guarda las trazas terminadas: las últimas `keep` en memoria y, si hay `path`,
+    las agrega a ese archivo desde un hilo propio con una cola acotada (si se llena,
+    se descartan en vez de frenar las requests).
+    """
+    def __init__(self, path=TRACE_FILE, keep=TRACE_KEEP, min_ms=TRACE_MIN_MS):
+        self.path = path
+        self.min_ms = min_ms
+        self.recent = deque(maxlen=keep)
+        self.dropped = 0
+        self._queue = queue.Queue(maxsize=EXPORT_QUEUE_SIZE)
+        self._thread = None
+        self._pid = None
+        self._lock = threading.Lock()
+
+    def export(self, trace):
+        data = trace.to_dict()
+        if data["duration_ms"] < self.min_ms:
+            return
+        self.recent.append(data)
+        if not self.path:
+            return
+        self._ensure_thread()
+        try:
+            self._queue.put_nowait(data)
+        except queue.Full:
+            self.dropped += 1
+
+    def _ensure_thread(self):
+        # Un hilo por proceso (tras un fork el del padre no existe)
+        if self._thread is not None and self._pid == os.getpid():
+            return
+        with self._lock:
+            if self._thread is None or self._pid != os.getpid():
+                self._pid = os.getpid()
+                self._thread = threading.Thread(target=self._run, name="trace-exporter", daemon=True)
+                self._thread.start()
+
+    def _run(self):
+        with open(self.path, "a", encoding="utf-8") as f:
+            while True:
+                data = self._queue.get()
+                f.write(json.dumps(data, default=str) + "\n")
+                if self._queue.empty():
+                    f.flush()
+
+    def get(self, trace_id):
+        for data in self.recent:
+            if data["trace_id"] == trace_id:
+                return data
+        return None
+
+    def summaries(self):
+        return [
+            {key: data[key] for key in ("trace_id", "name", "start", "duration_ms")} | {"spans": len(data["spans"])}
+            for data in reversed(self.recent)
+        ]
+
+
+exporter = TraceExporter()
+
+
+class TracingMiddleware:
+    """
+    Middleware ASGI: abre el span raíz de cada request muestreada, lo nombra con la
+    plantilla de la ruta al terminar y agrega `traceparent`/`X-Trace-Id` a la respuesta.
+    """
+    def __init__(self, app, exporter=exporter, sample_rate=TRACE_SAMPLE_RATE):
+        self.app = app
+        self.exporter = exporter
+        self.sample_rate = sample_rate
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+        traceparent = None
+        for name, value in scope["headers"]:
+            if name == b"traceparent":
+                traceparent = value.decode("latin-1")
+                break
+        root = start_trace(scope["method"], traceparent, self.sample_rate)
+        if root is None:
+            await self.app(scope, receive, send)
+            return
+
+        root.set(**{"http.method": scope["method"], "http.target": scope["path"]})
+
+        async def send_with_trace(message):
+            if message["type"] == "http.response.start":
+                root.set(**{"http.status_code": message["status"]})
+                headers = list(message.get("headers", ()))
+                headers.append((b"traceparent", root.traceparent().encode()))
+                headers.append((b"x-trace-id", root.trace.trace_id.encode()))
+                message = {**message, "headers": headers}
+            await send(message)
+
+        token = current_span.set(root)
+        try:
+            await self.app(scope, receive, send_with_trace)
+        except BaseException as e:
+            root.error = str(e).split('\n')[0] or type(e).__name__
+            raise
+        finally:
+            current_span.reset(token)
+            root.finish()
+            route = scope.get("route")
+            root.name = f"{scope['method']} {getattr(route, 'path', None) or 'unmatched'}"
+            self.exporter.export(root.trace)
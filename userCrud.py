@@ -1,31 +1,136 @@
+import psycopg
 import psycopg2
-from bd import Database
+from bd import AsyncDatabase, Database, SensitiveQuery, Statement
+from cache import SCHEDULES, USERS, invalidate, invalidate_async, query_cache, user_bookings_tag, user_tag
+from pagination import Keyset, paged
+from access import principal_cache
+from passwords import RETRY_AFTER, HasherBusy, hash_password, hash_password_async
+from rollups import remove_user_bookings, remove_user_bookings_async
+
+GET_ALL_USERS = Statement("get_all_users", """
+    SELECT id_user, name, last_name, email, id_role
+    FROM users
+    ORDER BY id_user;
+""")
+USERS_KEYSET = Keyset("id_user")
+
+GET_USER_BY_ID = Statement("get_user_by_id", """
+    SELECT id_user, name, last_name, email, id_role
+    FROM users
+    WHERE id_user = %s;
+""")
+
+DELETE_USER = Statement("delete_user", """
+    DELETE FROM users
+    WHERE id_user = %s
+    RETURNING id_user;
+""")
+
+USER_EXISTS = Statement("user_exists", "SELECT id_user FROM users WHERE id_user = %s;")
+
+# Lo que AuthMiddleware necesita de un usuario para validar su token (ver access.py)
+GET_PRINCIPAL = Statement("get_principal", """
+    SELECT id_user, id_role, token_version
+    FROM users
+    WHERE id_user = %s;
+""")
+
+INSERT_PHONE = Statement("insert_phone", """
+    INSERT INTO user_phones (id_user, phone_number)
+    VALUES (%s, %s)
+    RETURNING id_user_phone, phone_number;
+""")
+
+GET_PHONES = Statement("get_phones", """
+    SELECT id_user_phone, phone_number
+    FROM user_phones
+    WHERE id_user = %s
+    ORDER BY id_user_phone;
+""")
+
+
+def build_update_user(id_user, name=None, last_name=None, email=None, password=None, id_role=None):
+    """
+    Arma el UPDATE con los campos enviados (solo los que no sean None).
+    Retorna (query, params) o (None, None) si no hay nada que actualizar.
+    Si cambian la contraseña, el email o el rol, incrementa token_version para
+    revocar los tokens emitidos antes. Los parámetros (hash de la contraseña, email)
+    no se registran en el log de consultas lentas.
+    """
+    fields = []
+    values = []
+    if name is not None:
+        fields.append("name = %s")
+        values.append(name)
+    if last_name is not None:
+        fields.append("last_name = %s")
+        values.append(last_name)
+    if email is not None:
+        fields.append("email = %s")
+        values.append(email)
+    if password is not None:
+        fields.append("password = %s")
+        values.append(password)
+    if id_role is not None:
+        fields.append("id_role = %s")
+        values.append(id_role)
+    if not fields:
+        return None, None
+    if password is not None or email is not None or id_role is not None:
+        fields.append("token_version = token_version + 1")
+    values.append(id_user)
+    query = SensitiveQuery(f"""
+        UPDATE users
+        SET {', '.join(fields)}
+        WHERE id_user = %s
+        RETURNING id_user, name, last_name, email, id_role;
+    """)
+    return query, tuple(values)
+
+
+def _deleted_user_tags(id_user):
+    # Borrar el usuario puede borrar en cascada sus reservas y liberar horarios
+    return USERS, user_tag(id_user), user_bookings_tag(id_user), SCHEDULES
+
 
 class UserCrud:
     def __init__(self):
         self.db = Database()
 
-    def get_all_users(self):
+    def get_all_users(self, cursor=None, limit=None):
+        if cursor is None and limit is None:
+            return query_cache.get_or_load(("get_all_users",), self._get_all_users, (USERS,))
+        try:
+            query, params, limit = USERS_KEYSET.page_query(GET_ALL_USERS, None, cursor, limit)
+        except ValueError as e:
+            return {"success": False, "error": str(e)}
+        return query_cache.get_or_load(
+            ("get_all_users", cursor, limit),
+            lambda: paged(self._get_all_users(query, params), USERS_KEYSET, limit, key="users"),
+            (USERS,),
+        )
+
+    def get_all_users_stream(self):
+        return self.db.stream(GET_ALL_USERS)
+
+    def _get_all_users(self, query=GET_ALL_USERS, params=None):
         try:
             with self.db.get_cursor() as cur:
-                cur.execute("""
-                    SELECT id_user, name, last_name, email, id_role
-                    FROM users
-                    ORDER BY id_user;
-                """)
+                cur.execute(query, params)
                 users = cur.fetchall()
                 return {"success": True, "users": users}
         except psycopg2.Error as e:
             return {"success": False, "error": str(e).split('\n')[0]}
 
     def get_user_by_id(self, id_user):
+        return query_cache.get_or_load(
+            ("get_user_by_id", id_user), lambda: self._get_user_by_id(id_user), (user_tag(id_user),)
+        )
+
+    def _get_user_by_id(self, id_user):
         try:
             with self.db.get_cursor() as cur:
-                cur.execute("""
-                    SELECT id_user, name, last_name, email, id_role
-                    FROM users
-                    WHERE id_user = %s;
-                """, (id_user,))
+                cur.execute(GET_USER_BY_ID, (id_user,))
                 user = cur.fetchone()
                 if user:
                     return {"success": True, "user": user}
@@ -34,60 +139,54 @@ class UserCrud:
         except psycopg2.Error as e:
             return {"success": False, "error": str(e).split('\n')[0]}
 
+    def get_principal(self, id_user):
+        """
+        id_user, id_role y token_version del usuario (principal None si no existe).
+        Sin caché de lecturas: AuthMiddleware tiene la suya.
+        """
+        try:
+            with self.db.get_cursor() as cur:
+                cur.execute(GET_PRINCIPAL, (id_user,))
+                return {"success": True, "principal": cur.fetchone()}
+        except psycopg2.Error as e:
+            return {"success": False, "error": str(e).split('\n')[0]}
+
     def update_user(self, id_user, name=None, last_name=None, email=None, password=None, id_role=None):
         """
         Actualiza los campos enviados (solo los que no sean None).
         """
         try:
-            fields = []
-            values = []
-            if name is not None:
-                fields.append("name = %s")
-                values.append(name)
-            if last_name is not None:
-                fields.append("last_name = %s")
-                values.append(last_name)
-            if email is not None:
-                fields.append("email = %s")
-                values.append(email)
             if password is not None:
-                fields.append("password = %s")
-                values.append(password)
-            if id_role is not None:
-                fields.append("id_role = %s")
-                values.append(id_role)
-            if not fields:
+                password = hash_password(password)
+            query, values = build_update_user(id_user, name, last_name, email, password, id_role)
+            if query is None:
                 return {"success": False, "error": "No hay campos para actualizar."}
-            values.append(id_user)
-            query = f"""
-                UPDATE users
-                SET {', '.join(fields)}
-                WHERE id_user = %s
-                RETURNING id_user, name, last_name, email, id_role;
-            """
             with self.db.get_cursor() as cur:
-                cur.execute(query, tuple(values))
+                cur.execute(query, values)
                 user = cur.fetchone()
-                if user:
-                    return {"success": True, "user": user}
-                else:
-                    return {"success": False, "error": "Usuario no encontrado"}
+            if user:
+                invalidate(USERS, user_tag(id_user))
+                principal_cache.invalidate(id_user)
+                return {"success": True, "user": user}
+            else:
+                return {"success": False, "error": "Usuario no encontrado"}
+        except HasherBusy as e:
+            return {"success": False, "error": str(e), "busy": True, "retry_after": RETRY_AFTER}
         except psycopg2.Error as e:
             return {"success": False, "error": str(e).split('\n')[0]}
 
     def delete_user(self, id_user):
         try:
             with self.db.get_cursor() as cur:
-                cur.execute("""
-                    DELETE FROM users
-                    WHERE id_user = %s
-                    RETURNING id_user;
-                """, (id_user,))
+                remove_user_bookings(cur, id_user)
+                cur.execute(DELETE_USER, (id_user,))
                 result = cur.fetchone()
-                if result:
-                    return {"success": True, "deleted_id": result["id_user"]}
-                else:
-                    return {"success": False, "error": "Usuario no encontrado"}
+            if result:
+                invalidate(*_deleted_user_tags(id_user))
+                principal_cache.invalidate(id_user)
+                return {"success": True, "deleted_id": result["id_user"]}
+            else:
+                return {"success": False, "error": "Usuario no encontrado"}
         except psycopg2.Error as e:
             return {"success": False, "error": str(e).split('\n')[0]}
 
@@ -95,30 +194,147 @@ class UserCrud:
         try:
             with self.db.get_cursor() as cur:
                 # Verifica si el usuario existe
-                cur.execute("SELECT id_user FROM users WHERE id_user = %s;", (id_user,))
+                cur.execute(USER_EXISTS, (id_user,))
                 if not cur.fetchone():
                     return {"success": False, "error": "Usuario no encontrado"}
                 # Inserta el teléfono
-                cur.execute("""
-                    INSERT INTO user_phones (id_user, phone_number)
-                    VALUES (%s, %s)
-                    RETURNING id_user_phone, phone_number;
-                """, (id_user, phone_number))
+                cur.execute(INSERT_PHONE, (id_user, phone_number))
                 phone = cur.fetchone()
-                return {"success": True, "phone": phone}
+            invalidate(user_tag(id_user))
+            return {"success": True, "phone": phone}
         except psycopg2.Error as e:
             return {"success": False, "error": str(e).split('\n')[0]}
 
     def get_phones(self, id_user):
+        return query_cache.get_or_load(
+            ("get_phones", id_user), lambda: self._get_phones(id_user), (user_tag(id_user),)
+        )
+
+    def _get_phones(self, id_user):
         try:
             with self.db.get_cursor() as cur:
-                cur.execute("""
-                    SELECT id_user_phone, phone_number
-                    FROM user_phones
-                    WHERE id_user = %s
-                    ORDER BY id_user_phone;
-                """, (id_user,))
+                cur.execute(GET_PHONES, (id_user,))
                 phones = cur.fetchall()
                 return {"success": True, "phones": phones}
         except psycopg2.Error as e:
             return {"success": False, "error": str(e).split('\n')[0]}
+
+
+class AsyncUserCrud:
+    """
+    Versión asyncio de UserCrud. Usa el mismo SQL sobre el pool asíncrono.
+    """
+    def __init__(self):
+        self.db = AsyncDatabase()
+
+    async def get_all_users(self, cursor=None, limit=None):
+        if cursor is None and limit is None:
+            return await query_cache.get_or_load_async(("get_all_users",), self._get_all_users, (USERS,))
+        try:
+            query, params, limit = USERS_KEYSET.page_query(GET_ALL_USERS, None, cursor, limit)
+        except ValueError as e:
+            return {"success": False, "error": str(e)}
+
+        async def load():
+            return paged(await self._get_all_users(query, params), USERS_KEYSET, limit, key="users")
+        return await query_cache.get_or_load_async(("get_all_users", cursor, limit), load, (USERS,))
+
+    def get_all_users_stream(self):
+        return self.db.stream(GET_ALL_USERS)
+
+    async def _get_all_users(self, query=GET_ALL_USERS, params=None):
+        try:
+            async with self.db.get_cursor() as cur:
+                await cur.execute(query, params)
+                users = await cur.fetchall()
+                return {"success": True, "users": users}
+        except psycopg.Error as e:
+            return {"success": False, "error": str(e).split('\n')[0]}
+
+    async def get_user_by_id(self, id_user):
+        return await query_cache.get_or_load_async(
+            ("get_user_by_id", id_user), lambda: self._get_user_by_id(id_user), (user_tag(id_user),)
+        )
+
+    async def _get_user_by_id(self, id_user):
+        try:
+            async with self.db.get_cursor() as cur:
+                await cur.execute(GET_USER_BY_ID, (id_user,))
+                user = await cur.fetchone()
+                if user:
+                    return {"success": True, "user": user}
+                else:
+                    return {"success": False, "error": "Usuario no encontrado"}
+        except psycopg.Error as e:
+            return {"success": False, "error": str(e).split('\n')[0]}
+
+    async def get_principal(self, id_user):
+        try:
+            async with self.db.get_cursor() as cur:
+                await cur.execute(GET_PRINCIPAL, (id_user,))
+                return {"success": True, "principal": await cur.fetchone()}
+        except psycopg.Error as e:
+            return {"success": False, "error": str(e).split('\n')[0]}
+
+    async def update_user(self, id_user, name=None, last_name=None, email=None, password=None, id_role=None):
+        try:
+            if password is not None:
+                password = await hash_password_async(password)
+            query, values = build_update_user(id_user, name, last_name, email, password, id_role)
+            if query is None:
+                return {"success": False, "error": "No hay campos para actualizar."}
+            async with self.db.get_cursor() as cur:
+                await cur.execute(query, values)
+                user = await cur.fetchone()
+            if user:
+                await invalidate_async(USERS, user_tag(id_user))
+                principal_cache.invalidate(id_user)
+                return {"success": True, "user": user}
+            else:
+                return {"success": False, "error": "Usuario no encontrado"}
+        except HasherBusy as e:
+            return {"success": False, "error": str(e), "busy": True, "retry_after": RETRY_AFTER}
+        except psycopg.Error as e:
+            return {"success": False, "error": str(e).split('\n')[0]}
+
+    async def delete_user(self, id_user):
+        try:
+            async with self.db.get_cursor() as cur:
+                await remove_user_bookings_async(cur, id_user)
+                await cur.execute(DELETE_USER, (id_user,))
+                result = await cur.fetchone()
+            if result:
+                await invalidate_async(*_deleted_user_tags(id_user))
+                principal_cache.invalidate(id_user)
+                return {"success": True, "deleted_id": result["id_user"]}
+            else:
+                return {"success": False, "error": "Usuario no encontrado"}
+        except psycopg.Error as e:
+            return {"success": False, "error": str(e).split('\n')[0]}
+
+    async def add_phone(self, id_user, phone_number):
+        try:
+            async with self.db.get_cursor() as cur:
+                await cur.execute(USER_EXISTS, (id_user,))
+                if not await cur.fetchone():
+                    return {"success": False, "error": "Usuario no encontrado"}
+                await cur.execute(INSERT_PHONE, (id_user, phone_number))
+                phone = await cur.fetchone()
+            await invalidate_async(user_tag(id_user))
+            return {"success": True, "phone": phone}
+        except psycopg.Error as e:
+            return {"success": False, "error": str(e).split('\n')[0]}
+
+    async def get_phones(self, id_user):
+        return await query_cache.get_or_load_async(
+            ("get_phones", id_user), lambda: self._get_phones(id_user), (user_tag(id_user),)
+        )
+
+    async def _get_phones(self, id_user):
+        try:
+            async with self.db.get_cursor() as cur:
+                await cur.execute(GET_PHONES, (id_user,))
+                phones = await cur.fetchall()
+                return {"success": True, "phones": phones}
+        except psycopg.Error as e:
+            return {"success": False, "error": str(e).split('\n')[0]}